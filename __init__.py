@@ -132,21 +132,24 @@ Eg
 __version__ = '1.2'
 
 import os
-from distutils.version import LooseVersion
+import re
 import numpy
-if LooseVersion(numpy.__version__) <= LooseVersion('1.8.0'):
+# Not to use distutils.version.LooseVersion which is slow to import
+if tuple(int(x) for x in re.findall(r'\d+', numpy.__version__)[:3]) <= (1, 8, 0):
     raise SystemError("You're using an old version of Numpy (%s). "
                       "It is recommended to upgrad numpy to 1.8.0 or newer. \n"
                       "You still can use all features of PySCF with the old numpy by removing this warning msg. "
                       "Some modules (DFT, CC, MRPT) might be affected because of the bug in old numpy." %
                       numpy.__version__)
-from pyscf import gto
 from pyscf import lib
-from pyscf import scf
-from pyscf import ao2mo
 
 __path__.append(os.path.join(os.path.dirname(__file__), 'future'))
 __path__.append(os.path.join(os.path.dirname(__file__), 'tools'))
 
 DEBUG = False
 
+# Submodules are imported when they are accessed at the first time, eg
+# "import pyscf; pyscf.scf.RHF(mol)".  "from pyscf import gto, scf" imports
+# only gto and scf.
+lib.import_lazily(__name__, ('gto', 'scf', 'ao2mo'))
+
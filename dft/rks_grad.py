@@ -15,7 +15,7 @@ from pyscf.scf import rhf_grad
 from pyscf.dft import numint
 
 
-def get_veff(ks_grad, mol=None, dm=None):
+def get_veff(ks_grad, mol=None, dm=None, atmlst=None, with_df=False):
     '''Coulomb + XC functional
     '''
     if mol is None: mol = ks_grad.mol
@@ -39,14 +39,28 @@ def get_veff(ks_grad, mol=None, dm=None):
     t0 = logger.timer(ks_grad, 'vxc', *t0)
 
     if abs(hyb) < 1e-10:
-        vj = ks_grad.get_j(mol, dm)
+        vj = ks_grad.get_j(mol, dm, atmlst=atmlst, with_df=with_df)
         vhf = vj
     else:
-        vj, vk = ks_grad.get_jk(mol, dm)
+        vj, vk = ks_grad.get_jk(mol, dm, atmlst=atmlst, with_df=with_df)
         vhf = vj - vk * (hyb * .5)
 
     return vhf + vxc
 
+def get_veff_aux(ks_grad, mol=None, dm=None, atmlst=None):
+    '''The auxiliary basis contributions of density fitting DFT to the
+    nuclear gradients
+    '''
+    if mol is None: mol = ks_grad.mol
+    if dm is None: dm = ks_grad._scf.make_rdm1()
+    mf = ks_grad._scf
+    hyb = mf._numint.libxc.hybrid_coeff(mf.xc, spin=(mol.spin>0)+1)
+    if abs(hyb) < 1e-10:
+        return rhf_grad.get_jk_df_aux(ks_grad, mol, dm, atmlst, with_k=False)[0]
+    else:
+        ej, ek = rhf_grad.get_jk_df_aux(ks_grad, mol, dm, atmlst)
+        return ej - ek * (hyb * .5)
+
 
 def get_vxc(ni, mol, grids, xc_code, dms, relativity=0, hermi=1,
             max_memory=2000, verbose=None):
@@ -146,6 +160,7 @@ class Gradients(rhf_grad.Gradients):
         return self
 
     get_veff = get_veff
+    get_veff_aux = get_veff_aux
 
 
 if __name__ == '__main__':
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+
+'''
+Startup time of the Python processes which import pyscf.  Each statement is
+executed in a fresh interpreter for a number of times.  The native libraries
+and the submodules are loaded when they are used at the first time, so that
+a short job does not pay for the modules it does not use.
+
+Run "python -X importtime -c 'import pyscf'" (Python 3.7 or newer) for the
+breakdown of the import time.
+'''
+
+import sys
+import time
+import subprocess
+
+NREPEAT = 10
+
+statements = (
+    'pass',
+    'import numpy',
+    'import pyscf',
+    'from pyscf import gto',
+    'from pyscf import gto, scf',
+    'from pyscf import gto, scf, dft',
+    'from pyscf import gto; gto.M(atom="H 0 0 0; F 0 0 1", basis="ccpvdz")',
+)
+
+for stmt in statements:
+    t0 = time.time()
+    for i in range(NREPEAT):
+        subprocess.check_call([sys.executable, '-c', stmt])
+    print('%-72s %8.3f s' % (stmt, (time.time() - t0) / NREPEAT))
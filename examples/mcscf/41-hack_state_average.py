@@ -41,6 +41,9 @@ solver2.nroots = 2
 
 mc = mcscf.CASSCF(mf, 8, 8)
 mc.fcisolver = mcscf.state_average_mix(mc, [solver1, solver2], weights)
+# The triplet and singlet solvers are independent in the CI step.  They can
+# be executed in separate processes
+#mc.fcisolver = mcscf.state_average_mix(mc, [solver1, solver2], weights, nproc=2)
 
 # Mute warning msgs
 mc.check_sanity = lambda *args: None
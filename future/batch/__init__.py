@@ -0,0 +1,12 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+'''
+Throughput mode to run many small molecules through SCF in one pool of
+processes with shared setup
+'''
+
+from pyscf.batch import runner
+from pyscf.batch.runner import BatchSCF, kernel
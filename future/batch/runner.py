@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+'''
+Run a batch of small-molecule SCF calculations in a pool of processes.
+
+The fixed per-job cost is shared across the batch:
+
+* The basis sets of all elements are parsed once in the parent process.  The
+  parsed basis (cached in :mod:`pyscf.gto.basis`) and the imported modules are
+  inherited by the worker processes.
+* In each worker, the molecules of the same composition (the same atoms in
+  the same order, basis, charge and spin) are generated from a template
+  molecule by :func:`Mole.set_geom_`.  The libcint optimizer of the template
+  is reused by the direct SCF of these molecules.
+* The DFT atomic grids are generated once for each element.
+
+The jobs are dynamically scheduled over the processes and the results are
+streamed back as soon as each job finishes.
+'''
+
+import time
+from pyscf import lib
+from pyscf.lib import logger
+from pyscf import gto
+from pyscf import scf
+from pyscf.scf import _vhf
+
+
+def _mol_key(mol):
+    if mol._built:
+        symbols = tuple(a[0] for a in mol._atom)
+    else:
+        symbols = tuple(a[0] for a in mol.format_atom(mol.atom, unit=mol.unit))
+    if isinstance(mol.basis, dict):
+        basis = repr(sorted(mol.basis.items()))
+    else:
+        basis = repr(mol.basis)
+    return symbols, basis, repr(mol.ecp), mol.charge, mol.spin, mol.symmetry
+
+def _preload_basis(mols):
+    '''Parse the basis of all elements in the batch'''
+    loaded = set()
+    for mol in mols:
+        symbols, basis = _mol_key(mol)[:2]
+        for symb in set(symbols):
+            if (symb, basis) not in loaded:
+                if isinstance(mol.basis, dict):
+                    if symb in mol.basis:
+                        gto.format_basis({symb: mol.basis[symb]})
+                else:
+                    gto.format_basis({symb: mol.basis})
+                loaded.add((symb, basis))
+
+
+class BatchSCF(lib.StreamObject):
+    '''Run SCF for a list of molecules in a pool of processes
+
+    Attributes:
+        method : function or class
+            To create the mean-field object for a molecule, eg scf.RHF,
+            dft.RKS.  Default is scf.RHF
+        nproc : int
+            Number of worker processes.  Default is lib.num_threads().
+            Each worker runs with one OpenMP thread.
+        post : function(mf) => result
+            To extract the result from the SCF object in the worker process.
+            Default returns (mf.converged, mf.e_tot)
+        mol_kwargs : dict
+            Attributes to build the molecule if the item of the batch is a
+            geometry (in the format of :attr:`Mole.atom`) rather than a
+            :class:`Mole` object.
+
+    Examples:
+
+    >>> geoms = ['H 0 0 0; F 0 0 %g' % r for r in numpy.arange(0.8, 1.5, .01)]
+    >>> batch = BatchSCF(scf.RHF, mol_kwargs={'basis': 'ccpvdz'})
+    >>> for i, (conv, e) in batch.iter_kernel(geoms):
+    ...     print(i, e)
+    '''
+    def __init__(self, method=None, nproc=None, post=None, mol_kwargs=None):
+        if method is None:
+            method = scf.RHF
+        self.method = method
+        self.nproc = nproc
+        if post is None:
+            post = lambda mf: (mf.converged, mf.e_tot)
+        self.post = post
+        if mol_kwargs is None:
+            mol_kwargs = {'verbose': 0}
+        self.mol_kwargs = mol_kwargs
+
+##################################################
+# don't modify the following attributes, they are not input options
+        self._templates = {}
+        self._atom_grids = {}
+        self._keys = set(self.__dict__.keys())
+
+    def make_mol(self, mol):
+        '''Create the molecule.  If a template molecule of the same
+        composition exists, the molecule is generated from the template
+        without parsing the basis set again.'''
+        if not isinstance(mol, gto.Mole):
+            mol = gto.Mole(atom=mol, **self.mol_kwargs)
+        key = _mol_key(mol)
+        if key in self._templates:
+            template, cintopt = self._templates[key]
+            mol1 = template.copy()
+            mol1.set_geom_(mol.atom, unit=mol.unit)
+            return mol1, cintopt
+        if not mol._built:
+            mol.build(False, False)
+        self._templates[key] = (mol, None)
+        return mol, None
+
+    def make_scf(self, mol, cintopt=None):
+        '''Create the mean-field object and attach the shared setup'''
+        mf = self.method(mol)
+        key = _mol_key(mol)
+        if (mf.__class__.init_direct_scf == scf.hf.SCF.init_direct_scf and
+            not mol.incore_anyway):
+            if cintopt is None:
+                cintopt = gto.moleintor.make_cintopt(mol._atm, mol._bas,
+                                                     mol._env, 'cint2e_sph')
+                self._templates[key] = (self._templates[key][0], cintopt)
+            def init_direct_scf(mol=None):
+                if mol is None: mol = mf.mol
+                opt = _vhf.VHFOpt(mol, 'cint2e_sph', 'CVHFnrs8_prescreen',
+                                  'CVHFsetnr_direct_scf',
+                                  'CVHFsetnr_direct_scf_dm', cintopt=cintopt)
+                opt.direct_scf_tol = mf.direct_scf_tol
+                return opt
+            mf.init_direct_scf = init_direct_scf
+
+        if hasattr(mf, 'grids'):
+            grids = mf.grids
+            grids_key = (grids.level, grids.prune, grids.radi_method,
+                         repr(sorted(grids.atom_grid.items())))
+            tab = self._atom_grids.setdefault(grids_key, {})
+            def gen_atomic_grids(mol, atom_grid=None, radi_method=None,
+                                 level=None, prune=None):
+                if any(mol.atom_symbol(ia) not in tab for ia in range(mol.natm)):
+                    tab.update(grids.__class__.gen_atomic_grids(
+                        grids, mol, atom_grid, radi_method, level, prune))
+                return tab
+            grids.gen_atomic_grids = gen_atomic_grids
+        return mf
+
+    def run_job(self, mol):
+        '''Run SCF for one molecule and return the result of :attr:`post`'''
+        mol, cintopt = self.make_mol(mol)
+        mf = self.make_scf(mol, cintopt)
+        mf.kernel()
+        return self.post(mf)
+
+    def iter_kernel(self, mols):
+        '''Run the batch.  The results are yielded as soon as they are
+        available, which can be in a different order to mols.
+
+        Returns:
+            A generator of (index, result)
+        '''
+        cput0 = (time.clock(), time.time())
+        mols = list(mols)
+        mol_objs = [m if isinstance(m, gto.Mole)
+                    else gto.Mole(atom=m, **self.mol_kwargs) for m in mols]
+        _preload_basis(mol_objs)
+        cput0 = logger.timer(self, 'preload basis', *cput0)
+
+# Jobs of the same composition are put next to each other so that the
+# templates are likely to be reused in the worker processes.
+        keys = [_mol_key(m) for m in mol_objs]
+        order = sorted(range(len(mols)), key=lambda i: repr(keys[i]))
+        jobs = [(mol_objs[i],) for i in order]
+        for k, res in lib.imap_processes(self.run_job, jobs, self.nproc):
+            yield order[k], res
+        logger.timer(self, 'batch SCF', *cput0)
+
+    def kernel(self, mols):
+        '''Run the batch.
+
+        Returns:
+            A list of results in the order of mols
+        '''
+        mols = list(mols)
+        results = [None] * len(mols)
+        for i, res in self.iter_kernel(mols):
+            results[i] = res
+        return results
+
+def kernel(mols, method=None, nproc=None, post=None, mol_kwargs=None):
+    '''Run SCF for a list of molecules in a pool of processes.
+    See :class:`BatchSCF`'''
+    return BatchSCF(method, nproc, post, mol_kwargs).kernel(mols)
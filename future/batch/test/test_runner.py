@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+
+import unittest
+from pyscf import gto
+from pyscf import scf
+from pyscf import dft
+from pyscf import batch
+
+geoms = ['H 0 0 0; F 0 0 %g' % r for r in (0.9, 1.0, 1.1)]
+geoms.append('O 0 0 0; H 0 .757 .587; H 0 -.757 .587')
+
+def ref_energy(geom, method):
+    mol = gto.M(atom=geom, basis='631g', verbose=0)
+    return method(mol).kernel()
+
+class KnowValues(unittest.TestCase):
+    def test_rhf(self):
+        b = batch.BatchSCF(scf.RHF, nproc=2, mol_kwargs={'basis': '631g', 'verbose': 0})
+        results = b.kernel(geoms)
+        for geom, (conv, e) in zip(geoms, results):
+            self.assertTrue(conv)
+            self.assertAlmostEqual(e, ref_energy(geom, scf.RHF), 9)
+
+    def test_rks_serial(self):
+        mols = [gto.Mole(atom=geom, basis='631g', verbose=0) for geom in geoms]
+        results = batch.kernel(mols, dft.RKS, nproc=1, post=lambda mf: mf.e_tot)
+        for geom, e in zip(geoms, results):
+            self.assertAlmostEqual(e, ref_energy(geom, dft.RKS), 9)
+
+    def test_iter_kernel(self):
+        b = batch.BatchSCF(nproc=2, mol_kwargs={'basis': '631g', 'verbose': 0})
+        idx = sorted(i for i, res in b.iter_kernel(geoms))
+        self.assertEqual(idx, list(range(len(geoms))))
+
+
+if __name__ == "__main__":
+    print("Full Tests for batch SCF")
+    unittest.main()
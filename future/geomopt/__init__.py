@@ -0,0 +1,11 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+'''
+Geometry optimization in redundant internal coordinates
+'''
+
+from pyscf.geomopt import optimizer
+from pyscf.geomopt.optimizer import GeometryOptimizer
@@ -0,0 +1,502 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+'''
+Geometry optimization in redundant internal coordinates
+
+The primitive internal coordinates (bonds, angles, dihedral angles) are
+generated from the covalent radii.  The steps are determined by the rational
+function optimization (RFO) with the BFGS updated Hessian and a trust radius.
+
+The SCF object and its molecule are updated in place (see
+:class:`pyscf.scan.PESScanner`).  The orbitals of the previous step are the
+initial guess of the next step, the DIIS subspace is carried over, and for
+DFT the atomic grids are generated only once.  The energies and gradients are
+cached by geometry, so that a rejected step does not trigger the calculation
+of the previous geometry again.
+
+Ref: C. Peng, P. Y. Ayala, H. B. Schlegel, M. J. Frisch, J. Comput. Chem. 17,
+49 (1996)
+'''
+
+import time
+from functools import reduce
+import numpy
+from pyscf import lib
+from pyscf.lib import logger
+from pyscf.lib.parameters import BOHR
+from pyscf import gto
+from pyscf.dft import radi
+from pyscf.scan.pes import PESScanner
+
+BOND, ANGLE, DIHEDRAL, CARTESIAN = 0, 1, 2, 3
+# The angles close to 180 degree are excluded from the primitives
+LINEAR_ANGLE = numpy.radians(175.)
+
+
+def make_internals(mol, coords=None, bond_scale=1.3):
+    '''Primitive redundant internal coordinates.
+
+    Two atoms are bonded if their distance is smaller than bond_scale times
+    the sum of the covalent radii.  Disconnected fragments are connected by
+    their shortest inter-fragment distance.  If the primitives do not span the
+    internal degrees of freedom (e.g. linear molecules), the Cartesian
+    coordinates are added.
+
+    Returns:
+        A list of tuples.  The first item of the tuple is the type of the
+        coordinate (BOND, ANGLE, DIHEDRAL, CARTESIAN), the rest are the atom
+        indices (and the component of the Cartesian coordinate).
+    '''
+    if coords is None:
+        coords = mol.atom_coords()
+    natm = len(coords)
+    radii = numpy.array([radi.COVALENT_RADII[gto.mole._charge(mol.atom_pure_symbol(i))]
+                         for i in range(natm)])
+    dist = numpy.linalg.norm(coords[:,None] - coords, axis=2)
+    bonded = dist < (radii[:,None] + radii) * bond_scale
+    bonded[numpy.diag_indices(natm)] = False
+
+    # connect the fragments
+    frag = numpy.arange(natm)
+    def merge(i, j):
+        frag[frag == frag[j]] = frag[i]
+    for i, j in zip(*numpy.where(numpy.triu(bonded))):
+        merge(i, j)
+    while len(set(frag)) > 1:
+        d = numpy.where(frag[:,None] != frag, dist, numpy.inf)
+        i, j = numpy.unravel_index(numpy.argmin(d), d.shape)
+        bonded[i,j] = bonded[j,i] = True
+        merge(i, j)
+
+    prims = [(BOND, i, j) for i, j in zip(*numpy.where(numpy.triu(bonded)))]
+    neighbors = [list(numpy.where(bonded[i])[0]) for i in range(natm)]
+    for j in range(natm):
+        for n, i in enumerate(neighbors[j]):
+            for k in neighbors[j][n+1:]:
+                if _angle(coords, i, j, k) < LINEAR_ANGLE:
+                    prims.append((ANGLE, i, j, k))
+    for ib in prims:
+        if ib[0] != BOND:
+            continue
+        j, k = ib[1:]
+        for i in neighbors[j]:
+            if i == k or _angle(coords, i, j, k) > LINEAR_ANGLE:
+                continue
+            for l in neighbors[k]:
+                if l == j or l == i or _angle(coords, j, k, l) > LINEAR_ANGLE:
+                    continue
+                prims.append((DIHEDRAL, i, j, k, l))
+
+    b = wilson_b(coords, prims)
+    nint = max(1, 3*natm - 6)
+    if natm > 1 and numpy.linalg.matrix_rank(b, 1e-6) < nint:
+        prims.extend([(CARTESIAN, i, x) for i in range(natm) for x in range(3)])
+    return prims
+
+def eval_internals(coords, prims):
+    '''Values of the primitive internal coordinates'''
+    q = numpy.empty(len(prims))
+    for n, p in enumerate(prims):
+        if p[0] == BOND:
+            q[n] = numpy.linalg.norm(coords[p[1]] - coords[p[2]])
+        elif p[0] == ANGLE:
+            q[n] = _angle(coords, *p[1:])
+        elif p[0] == DIHEDRAL:
+            q[n] = _dihedral(coords, *p[1:])
+        else:
+            q[n] = coords[p[1],p[2]]
+    return q
+
+def wilson_b(coords, prims):
+    '''Wilson B matrix dq/dx, shape (len(prims),natm*3)'''
+    natm = len(coords)
+    b = numpy.zeros((len(prims),natm,3))
+    for n, p in enumerate(prims):
+        if p[0] == BOND:
+            i, j = p[1:]
+            u = coords[i] - coords[j]
+            u /= numpy.linalg.norm(u)
+            b[n,i] = u
+            b[n,j] = -u
+        elif p[0] == ANGLE:
+            i, j, k = p[1:]
+            u = coords[i] - coords[j]
+            v = coords[k] - coords[j]
+            lu = numpy.linalg.norm(u)
+            lv = numpy.linalg.norm(v)
+            u /= lu
+            v /= lv
+            cos = numpy.dot(u, v)
+            sin = numpy.sqrt(max(1 - cos**2, 1e-12))
+            b[n,i] = (cos * u - v) / (lu * sin)
+            b[n,k] = (cos * v - u) / (lv * sin)
+            b[n,j] = -b[n,i] - b[n,k]
+        elif p[0] == DIHEDRAL:
+            i, j, k, l = p[1:]
+            f = coords[i] - coords[j]
+            g = coords[j] - coords[k]
+            h = coords[l] - coords[k]
+            a = numpy.cross(f, g)
+            c = numpy.cross(h, g)
+            a2 = numpy.dot(a, a)
+            c2 = numpy.dot(c, c)
+            lg = numpy.linalg.norm(g)
+            fg = numpy.dot(f, g) / (a2 * lg)
+            hg = numpy.dot(h, g) / (c2 * lg)
+            b[n,i] = -lg / a2 * a
+            b[n,l] = lg / c2 * c
+            b[n,j] = lg / a2 * a + fg * a - hg * c
+            b[n,k] = -lg / c2 * c - fg * a + hg * c
+        else:
+            b[n,p[1],p[2]] = 1
+    return b.reshape(len(prims),-1)
+
+def model_hess(prims):
+    '''Diagonal model Hessian in the primitive internal coordinates'''
+    h = numpy.array((.5, .2, .1, .05))
+    return numpy.diag(h[[p[0] for p in prims]])
+
+def _angle(coords, i, j, k):
+    u = coords[i] - coords[j]
+    v = coords[k] - coords[j]
+    cos = numpy.dot(u, v) / (numpy.linalg.norm(u) * numpy.linalg.norm(v))
+    return numpy.arccos(min(1, max(-1, cos)))
+
+def _dihedral(coords, i, j, k, l):
+    f = coords[i] - coords[j]
+    g = coords[j] - coords[k]
+    h = coords[l] - coords[k]
+    a = numpy.cross(f, g)
+    c = numpy.cross(h, g)
+    y = numpy.dot(numpy.cross(c, a), g) / numpy.linalg.norm(g)
+    return numpy.arctan2(y, numpy.dot(a, c))
+
+def _geom_in_unit(mol, coords):
+    if mol.unit.startswith(('B','b','au','AU')):
+        return coords
+    else:
+        return coords * BOHR
+
+def _diff_internals(q1, q0, prims):
+    '''q1 - q0 with the dihedral angles wrapped to [-pi,pi)'''
+    dq = q1 - q0
+    for n, p in enumerate(prims):
+        if p[0] == DIHEDRAL:
+            dq[n] = (dq[n] + numpy.pi) % (2*numpy.pi) - numpy.pi
+    return dq
+
+def _ginv(b):
+    '''Generalized inverse of G = B B^T'''
+    e, v = numpy.linalg.eigh(numpy.dot(b, b.T))
+    mask = e > 1e-8 * max(1, e[-1])
+    return numpy.dot(v[:,mask] / e[mask], v[:,mask].T)
+
+def internal_to_cartesian(coords, prims, dq, max_cycle=25, tol=1e-7):
+    '''Iterative back transformation of the internal coordinate step dq to
+    the Cartesian coordinates.  The first-order step is returned if the
+    iterations do not converge.
+    '''
+    natm = len(coords)
+    x0 = coords.ravel()
+    q_target = eval_internals(coords, prims) + dq
+    b = wilson_b(coords, prims)
+    x1 = x0 + numpy.dot(b.T, numpy.dot(_ginv(b), dq))
+    x = x1.copy()
+    dx_last = numpy.inf
+    for cycle in range(max_cycle):
+        c = x.reshape(natm,3)
+        b = wilson_b(c, prims)
+        dqi = _diff_internals(q_target, eval_internals(c, prims), prims)
+        dx = numpy.dot(b.T, numpy.dot(_ginv(b), dqi))
+        x += dx
+        dx_norm = abs(dx).max()
+        if dx_norm < tol:
+            break
+        elif dx_norm > dx_last:
+            x = x1
+            break
+        dx_last = dx_norm
+    return x.reshape(natm,3)
+
+def rfo_step(g, h, trust):
+    '''Rational function optimization step, scaled to the trust radius
+
+    Returns:
+        step, predicted energy change
+    '''
+    n = g.size
+    aug = numpy.zeros((n+1,n+1))
+    aug[:n,:n] = h
+    aug[:n,n] = aug[n,:n] = g
+    e, v = numpy.linalg.eigh(aug)
+    if abs(v[n,0]) > 1e-8:
+        dq = v[:n,0] / v[n,0]
+    else:
+        dq = -g
+    norm = numpy.linalg.norm(dq)
+    if norm > trust:
+        dq *= trust / norm
+    de = numpy.dot(g, dq) + .5 * numpy.dot(dq, numpy.dot(h, dq))
+    return dq, de
+
+
+class _DIISCache(object):
+    '''Keep the DIIS object (and its subspace) across the SCF calculations'''
+    def __init__(self, DIIS):
+        self.DIIS = DIIS
+        self.adiis = None
+    def __call__(self, mf, filename):
+        if self.adiis is None:
+            self.adiis = self.DIIS(mf, filename)
+        return self.adiis
+
+
+class GeometryOptimizer(lib.StreamObject):
+    '''Geometry optimization with the SCF object updated in place
+
+    Attributes:
+        max_cycle : int
+            Max number of optimization steps.  Default is 50
+        trust : float
+            Initial trust radius of the internal coordinate step.  Default
+            is 0.3
+        max_trust : float
+            Default is 0.5
+        min_trust : float
+            Default is 0.01
+        conv_tol_grad_max, conv_tol_grad_rms : float
+            Convergence thresholds of the Cartesian gradients (Hartree/Bohr).
+            Default is 4.5e-4 and 3e-4
+        conv_tol_step_max, conv_tol_step_rms : float
+            Convergence thresholds of the Cartesian steps (Bohr).  Default is
+            1.8e-3 and 1.2e-3
+        conv_tol_energy : float
+            The optimization is also converged if the gradients are converged
+            and the energy change is smaller than this value.  Default is 1e-6
+        reuse_diis : bool
+            Whether to carry the DIIS subspace over the geometry steps.
+            Default is True
+
+    Saved results:
+        converged : bool
+        e_tot : float
+            The energy of the optimized geometry
+        de : ndarray
+            The gradients of the optimized geometry
+        history : list
+            (energy, max gradient) of the steps
+
+    Examples:
+
+    >>> mol = gto.M(atom='O 0 0 0; H 0 -0.757 0.587; H 0 0.757 0.587', basis='631g')
+    >>> mf = scf.RHF(mol)
+    >>> geomopt.GeometryOptimizer(mf).kernel()
+    >>> print(mol.atom_coords())
+    '''
+    def __init__(self, method):
+        if hasattr(method, 'grad_elec'):  # gradients object
+            self.grad_method = method
+            self._scf = method._scf
+        else:
+            self._scf = method
+            self.grad_method = None
+        self.mol = self._scf.mol
+        self.stdout = self.mol.stdout
+        self.verbose = self.mol.verbose
+        self.max_cycle = 50
+        self.trust = .3
+        self.max_trust = .5
+        self.min_trust = .01
+        self.conv_tol_grad_max = 4.5e-4
+        self.conv_tol_grad_rms = 3e-4
+        self.conv_tol_step_max = 1.8e-3
+        self.conv_tol_step_rms = 1.2e-3
+        self.conv_tol_energy = 1e-6
+        self.reuse_diis = True
+
+##################################################
+# don't modify the following attributes, they are not input options
+        self.converged = False
+        self.e_tot = None
+        self.de = None
+        self.history = []
+        self._cache = []
+        self._keys = set(self.__dict__.keys())
+
+    def dump_flags(self):
+        log = logger.Logger(self.stdout, self.verbose)
+        log.info('\n')
+        log.info('******** %s flags ********', self.__class__)
+        log.info('method = %s', self._scf.__class__)
+        log.info('max_cycle = %d', self.max_cycle)
+        log.info('trust = %g  (min %g, max %g)', self.trust, self.min_trust,
+                 self.max_trust)
+        log.info('conv_tol_grad max = %g  rms = %g', self.conv_tol_grad_max,
+                 self.conv_tol_grad_rms)
+        log.info('conv_tol_step max = %g  rms = %g', self.conv_tol_step_max,
+                 self.conv_tol_step_rms)
+        log.info('conv_tol_energy = %g', self.conv_tol_energy)
+        log.info('reuse_diis = %s', self.reuse_diis)
+        return self
+
+    def get_grad_method(self):
+        if self.grad_method is None:
+            from pyscf import grad
+            if hasattr(self._scf, 'xc'):
+                self.grad_method = grad.RKS(self._scf)
+            else:
+                self.grad_method = grad.RHF(self._scf)
+            self.grad_method.verbose = self.verbose - 1
+        return self.grad_method
+
+    def energy_and_grad(self, coords, scanner):
+        '''Energy and Cartesian gradients (natm,3) of the given geometry (in
+        Bohr).  The results of the visited geometries are cached.'''
+        for c, e, g in self._cache:
+            if abs(c - coords).max() < 1e-9:
+                logger.debug(self, 'Use cached energy and gradients')
+                return e, g
+
+        e = scanner.scan_point(_geom_in_unit(self.mol, coords))
+        if not self._scf.converged:
+            logger.warn(self, 'SCF not converged')
+        g = self.get_grad_method().grad()
+        self._cache.append((coords.copy(), e, g))
+        return e, g
+
+    def kernel(self):
+        '''Optimize the geometry.  The molecule is updated in place.
+
+        Returns:
+            The energy of the optimized geometry
+        '''
+        cput0 = (time.clock(), time.time())
+        if self.verbose >= logger.WARN:
+            self.check_sanity()
+        self.dump_flags()
+        log = logger.Logger(self.stdout, self.verbose)
+        mol = self.mol
+        mf = self._scf
+
+        scanner = PESScanner(mf)
+        scanner.verbose = self.verbose - 1
+        if mf.mo_coeff is not None:
+            scanner._last = {'mol': mol.copy(), 'mo_coeff': mf.mo_coeff,
+                             'mo_occ': mf.mo_occ}
+        diis_class = mf.DIIS
+        if self.reuse_diis and mf.DIIS:
+            mf.DIIS = _DIISCache(mf.DIIS)
+
+        try:
+            self.converged = self._optimize(scanner, log)
+        finally:
+            mf.DIIS = diis_class
+
+        if self.converged:
+            log.note('Geometry optimization converged in %d steps, E = %.15g',
+                     len(self.history), self.e_tot)
+        else:
+            log.note('Geometry optimization not converged, E = %.15g',
+                     self.e_tot)
+        log.timer('geometry optimization', *cput0)
+        return self.e_tot
+
+    def _optimize(self, scanner, log):
+        mol = self.mol
+        coords = mol.atom_coords()
+        prims = make_internals(mol, coords)
+        log.debug('%d primitive internal coordinates', len(prims))
+        trust = self.trust
+        hess = model_hess(prims)
+        self.history = []
+        self._cache = []
+
+        e, g = self.energy_and_grad(coords, scanner)
+        self.e_tot = e
+        self.de = g
+        gmax = abs(g).max()
+        grms = numpy.sqrt((g**2).mean())
+        log.info('initial geometry  E = %.15g  |g|max = %.6g  |g|rms = %.6g',
+                 e, gmax, grms)
+        if gmax < self.conv_tol_grad_max and grms < self.conv_tol_grad_rms:
+            return True
+
+        q = eval_internals(coords, prims)
+        b = wilson_b(coords, prims)
+        ginv = _ginv(b)
+        gq = numpy.dot(ginv, numpy.dot(b, g.ravel()))
+        for cycle in range(self.max_cycle):
+            cput1 = (time.clock(), time.time())
+            proj = numpy.dot(numpy.dot(b, b.T), ginv)
+            hproj = reduce_hess(hess, proj)
+            dq, de_pred = rfo_step(numpy.dot(proj, gq), hproj, trust)
+            new_coords = internal_to_cartesian(coords, prims, dq)
+            e1, g1 = self.energy_and_grad(new_coords, scanner)
+
+            ratio = (e1 - e) / de_pred if abs(de_pred) > 1e-12 else 1
+            step_norm = numpy.linalg.norm(dq)
+            if ratio < .25:
+                trust = max(self.min_trust, step_norm * .5)
+            elif ratio > .75 and step_norm > trust * .8:
+                trust = min(self.max_trust, trust * 2)
+            if e1 > e + 1e-5 and trust > self.min_trust:
+                log.info('cycle %d  E = %.15g rejected, trust = %g',
+                         cycle+1, e1, trust)
+# Go back to the previous geometry.  Its energy and gradients are cached.
+                self.history.append((e1, abs(g1).max()))
+                continue
+
+            q1 = eval_internals(new_coords, prims)
+            b1 = wilson_b(new_coords, prims)
+            ginv1 = _ginv(b1)
+            gq1 = numpy.dot(ginv1, numpy.dot(b1, g1.ravel()))
+            hess = update_bfgs(hess, _diff_internals(q1, q, prims), gq1 - gq)
+
+            dx = new_coords - coords
+            gmax = abs(g1).max()
+            grms = numpy.sqrt((g1**2).mean())
+            dmax = abs(dx).max()
+            drms = numpy.sqrt((dx**2).mean())
+            log.info('cycle %d  E = %.15g  dE = %.6g  |g|max = %.6g  '
+                     '|g|rms = %.6g  |dx|max = %.6g  trust = %g',
+                     cycle+1, e1, e1-e, gmax, grms, dmax, trust)
+            self.history.append((e1, gmax))
+            de = e1 - e
+            coords, e, g, q, b, ginv, gq = new_coords, e1, g1, q1, b1, ginv1, gq1
+            self.e_tot = e
+            self.de = g
+            log.timer('geometry optimization cycle %d'%(cycle+1), *cput1)
+
+            if gmax < self.conv_tol_grad_max and grms < self.conv_tol_grad_rms:
+                if ((dmax < self.conv_tol_step_max and
+                     drms < self.conv_tol_step_rms) or
+                    abs(de) < self.conv_tol_energy):
+                    return True
+        else:
+            self.e_tot = e
+            self.de = g
+# Move the molecule back if the last step was rejected
+        if abs(mol.atom_coords() - coords).max() > 1e-9:
+            scanner.scan_point(_geom_in_unit(mol, coords))
+        return False
+
+def reduce_hess(hess, proj):
+    '''Project the Hessian onto the non-redundant space.  The redundant
+    directions get large curvature so that they are not stepped along.'''
+    n = hess.shape[0]
+    return (reduce(numpy.dot, (proj, hess, proj))
+            + (numpy.eye(n) - proj) * 1000)
+
+def update_bfgs(hess, dq, dg):
+    '''BFGS update of the Hessian.  The update is skipped if the curvature
+    condition dq.dg > 0 does not hold.'''
+    dqdg = numpy.dot(dq, dg)
+    hdq = numpy.dot(hess, dq)
+    dqhdq = numpy.dot(dq, hdq)
+    if dqdg > 1e-10 and dqhdq > 1e-10:
+        hess = (hess + numpy.einsum('i,j->ij', dg, dg) / dqdg
+                - numpy.einsum('i,j->ij', hdq, hdq) / dqhdq)
+    return hess
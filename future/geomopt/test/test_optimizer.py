@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+import unittest
+from pyscf import gto
+from pyscf import scf
+from pyscf import dft
+from pyscf import grad
+from pyscf import geomopt
+
+mol = gto.M(
+    verbose = 5,
+    output = '/dev/null',
+    atom = '''O  0   0       0
+              H  0   -0.8    0.6
+              H  0   0.75    0.55''',
+    basis = '631g')
+
+class KnowValues(unittest.TestCase):
+    def test_internals(self):
+        coords = mol.atom_coords()
+        prims = geomopt.optimizer.make_internals(mol)
+        self.assertEqual(len(prims), 3)
+        b = geomopt.optimizer.wilson_b(coords, prims)
+        x = coords.ravel()
+        for k in range(x.size):
+            x1 = x.copy()
+            x2 = x.copy()
+            x1[k] += 1e-5
+            x2[k] -= 1e-5
+            q1 = geomopt.optimizer.eval_internals(x1.reshape(-1,3), prims)
+            q2 = geomopt.optimizer.eval_internals(x2.reshape(-1,3), prims)
+            self.assertAlmostEqual(abs((q1-q2)/2e-5 - b[:,k]).max(), 0, 7)
+
+    def test_rhf_opt(self):
+        mf = scf.RHF(mol.copy())
+        mf.conv_tol = 1e-11
+        opt = geomopt.GeometryOptimizer(mf)
+        e = opt.kernel()
+        self.assertTrue(opt.converged)
+        self.assertTrue(abs(opt.de).max() < opt.conv_tol_grad_max)
+        mol1 = mf.mol.copy()
+        self.assertAlmostEqual(e, scf.RHF(mol1).run(conv_tol=1e-11).e_tot, 8)
+        g = grad.RHF(scf.RHF(mol1).run(conv_tol=1e-11)).grad()
+        self.assertAlmostEqual(abs(g).max(), 0, 3)
+
+    def test_rks_opt(self):
+        mf = dft.RKS(mol.copy())
+        mf.xc = 'lda,vwn'
+        mf.conv_tol = 1e-11
+        mf.kernel()
+        opt = geomopt.GeometryOptimizer(grad.RKS(mf))
+        e = opt.kernel()
+        self.assertTrue(opt.converged)
+        self.assertTrue(abs(opt.de).max() < opt.conv_tol_grad_max)
+
+        # Restarting from the optimized geometry converges without any step
+        opt = geomopt.GeometryOptimizer(grad.RKS(mf))
+        self.assertAlmostEqual(opt.kernel(), e, 9)
+        self.assertTrue(opt.converged)
+        self.assertEqual(len(opt.history), 0)
+
+
+if __name__ == "__main__":
+    print("Full Tests for geometry optimizer")
+    unittest.main()
@@ -38,7 +38,8 @@ def hess_elec(hess_mf, mo_energy=None, mo_coeff=None, mo_occ=None,
     nocc = mocc.shape[1]
     dm0 = numpy.dot(mocc, mocc.T) * 2
 
-    h1aos = hess_mf.make_h1(mo_coeff, mo_occ, hess_mf.chkfile, atmlst, log)
+    h1aos = hess_mf.make_h1(mo_coeff, mo_occ, _h1_chkfile(hess_mf, atmlst),
+                            atmlst, log)
     t1 = log.timer('making H1', *time0)
     mo1s, e1s = hess_mf.solve_mo1(mo_energy, mo_coeff, mo_occ, h1aos,
                                   None, atmlst, max_memory, log)
@@ -110,8 +111,7 @@ def hess_elec(hess_mf, mo_energy=None, mo_coeff=None, mo_occ=None,
         for j0, ja in enumerate(atmlst):
             q0, q1 = offsetdic[ja][2:]
 # *2 for double occupancy, *2 for +c.c.
-            mo1  = pyscf.lib.chkfile.load(hess_mf.chkfile, 'scf_mo1/%d'%ja)
-            h1ao = pyscf.lib.chkfile.load(hess_mf.chkfile, 'scf_h1ao/%d'%ia)
+            mo1, h1ao = _load_mo1_h1ao(mo1s, h1aos, i0, ia, j0, ja)
             dm1 = numpy.einsum('ypi,qi->ypq', mo1, mocc)
             de  = numpy.einsum('xpq,ypq->xy', h1ao, dm1) * 4
             dm1 = numpy.einsum('ypi,qi,i->ypq', mo1, mocc, mo_energy[:nocc])
@@ -140,7 +140,12 @@ def hess_elec(hess_mf, mo_energy=None, mo_coeff=None, mo_occ=None,
     log.timer('RHF hessian', *time0)
     return de2
 
-def make_h1(mf, mo_coeff, mo_occ, chkfile=None, atmlst=None, verbose=logger.WARN):
+def make_h1(mf, mo_coeff, mo_occ, chkfile=None, atmlst=None, verbose=logger.WARN,
+            nproc=1):
+    '''First order Fock matrices of the nuclear displacements.  The atoms are
+    distributed over nproc processes.  The matrices are returned in memory if
+    chkfile is None, otherwise they are saved in chkfile.
+    '''
     if isinstance(verbose, logger.Logger):
         log = verbose
     else:
@@ -157,8 +162,7 @@ def make_h1(mf, mo_coeff, mo_occ, chkfile=None, atmlst=None, verbose=logger.WARN
            mol.intor('cint1e_ipnuc_sph', comp=3))
 
     offsetdic = mol.offset_nr_by_atom()
-    h1aos = []
-    for i0, ia in enumerate(atmlst):
+    def get_h1(ia):
         shl0, shl1, p0, p1 = offsetdic[ia]
 
         mol.set_rinv_origin(mol.atom_coord(ia))
@@ -178,12 +182,17 @@ def make_h1(mf, mo_coeff, mo_occ, chkfile=None, atmlst=None, verbose=logger.WARN
         vhf = vj1 - vk1*.5
         vhf[:,p0:p1] += vj2 - vk2*.5
         vhf = vhf + vhf.transpose(0,2,1)
+        return h1ao + vhf
 
+    h1aos = [None] * len(atmlst)
+    for i0, h1ao in pyscf.lib.imap_processes(get_h1, [(ia,) for ia in atmlst],
+                                             nproc):
         if chkfile is None:
-            h1aos.append(h1ao+vhf)
+            h1aos[i0] = h1ao
         else:
-            key = 'scf_h1ao/%d' % ia
-            pyscf.lib.chkfile.save(chkfile, key, h1ao+vhf)
+            key = 'scf_h1ao/%d' % atmlst[i0]
+            pyscf.lib.chkfile.save(chkfile, key, h1ao)
+        log.debug1('h1ao for atom %d', atmlst[i0])
     if chkfile is None:
         return h1aos
     else:
@@ -211,8 +220,14 @@ def solve_mo1(mf, mo_energy, mo_coeff, mo_occ, h1ao_or_chkfile,
 
     offsetdic = mol.offset_nr_by_atom()
     mem_now = pyscf.lib.current_memory()[0]
-    max_memory = max(4000, max_memory*.9-mem_now)
-    blksize = max(2, int(max_memory*1e6/8 / (nmo*nocc*3*6)))
+    max_memory = max_memory*.9 - mem_now
+    # The block Krylov solver keeps the trial vectors and their products with
+    # the response operator (2*max_cycle vectors) of all perturbations in a
+    # batch.  fx builds the AO density matrices and potentials of the batch.
+    max_cycle = 20
+    mem_atom = 3 * (nmo*nocc*(2*max_cycle+6) + nao**2*4) * 8/1e6
+    blksize = max(1, int(max_memory/mem_atom))
+    log.debug1('solve_mo1: %d atoms per block Krylov solve', blksize)
     s1a =-mol.intor('cint1e_ipovlp_sph', comp=3)
     mo1s = []
     e1s = []
@@ -234,13 +249,15 @@ def solve_mo1(mf, mo_energy, mo_coeff, mo_occ, h1ao_or_chkfile,
             h1vo.append(numpy.einsum('xpq,pi,qj->xij', h1ao, mo_coeff, mocc))
         h1vo = numpy.vstack(h1vo)
         s1vo = numpy.vstack(s1vo)
-        mo1, e1 = cphf.solve(fx, mo_energy, mo_occ, h1vo, s1vo)
+        # The perturbations of the atoms in the batch share one block Krylov
+        # subspace
+        mo1, e1 = cphf.solve(fx, mo_energy, mo_occ, h1vo, s1vo,
+                             max_cycle=max_cycle, block=True)
         mo1 = numpy.einsum('pq,xqi->xpi', mo_coeff, mo1).reshape(-1,3,nmo,nocc)
         if isinstance(h1ao_or_chkfile, str):
             for k in range(ia1-ia0):
                 key = 'scf_mo1/%d' % atmlst[k+ia0]
                 pyscf.lib.chkfile.save(h1ao_or_chkfile, key, mo1[k])
-                mo1s.append(key)
         else:
             mo1s.append(mo1)
         e1s.append(e1.reshape(-1,3,nocc,nocc))
@@ -251,6 +268,27 @@ def solve_mo1(mf, mo_energy, mo_coeff, mo_occ, h1ao_or_chkfile,
     else:
         return numpy.vstack(mo1s), e1s
 
+def _h1_chkfile(hess_mf, atmlst):
+    '''Keep h1ao and mo1 in memory if they fit, otherwise in hess_mf.chkfile'''
+    mol = hess_mf.mol
+    nao = mol.nao_nr()
+    mem_now = pyscf.lib.current_memory()[0]
+    # h1ao and mo1 of all atoms, and the block Krylov space of CPHF
+    mem_h1 = len(atmlst) * 3 * nao**2 * 8 * 4 / 1e6
+    if mem_h1 < hess_mf.max_memory*.5 - mem_now:
+        return None
+    else:
+        return hess_mf.chkfile
+
+def _load_mo1_h1ao(mo1s, h1aos, i0, ia, j0, ja):
+    if isinstance(mo1s, str):
+        mo1  = pyscf.lib.chkfile.load(mo1s, 'scf_mo1/%d'%ja)
+        h1ao = pyscf.lib.chkfile.load(h1aos, 'scf_h1ao/%d'%ia)
+    else:
+        mo1 = mo1s[j0]
+        h1ao = h1aos[i0]
+    return mo1, h1ao
+
 def hess_nuc(mol, atmlst=None):
     gs = numpy.zeros((mol.natm,mol.natm,3,3))
     qs = numpy.asarray([mol.atom_charge(i) for i in range(mol.natm)])
@@ -286,12 +324,17 @@ class Hessian(pyscf.lib.StreamObject):
         self._scf = scf_method
         self.chkfile = scf_method.chkfile
         self.max_memory = self.mol.max_memory
+        self.nproc = 1
 
         self.de = numpy.zeros((0,0,3,3))
         self._keys = set(self.__dict__.keys())
 
     hess_elec = hess_elec
-    make_h1 = make_h1
+
+    def make_h1(self, mo_coeff, mo_occ, chkfile=None, atmlst=None,
+                verbose=None):
+        return make_h1(self, mo_coeff, mo_occ, chkfile, atmlst, verbose,
+                       self.nproc)
 
     def solve_mo1(self, mo_energy, mo_coeff, mo_occ, h1ao_or_chkfile,
                   fx=None, atmlst=None, max_memory=4000, verbose=None):
@@ -62,7 +62,8 @@ def hess_elec(hess_mf, mo_energy=None, mo_coeff=None, mo_occ=None,
     hyb = ni.libxc.hybrid_coeff(mf.xc)
     max_memory = 4000
 
-    h1aos = hess_mf.make_h1(mo_coeff, mo_occ, hess_mf.chkfile, atmlst, log)
+    h1aos = hess_mf.make_h1(mo_coeff, mo_occ, rhf._h1_chkfile(hess_mf, atmlst),
+                            atmlst, log)
     t1 = log.timer('making H1', *time0)
     def fx(mo1):
         # *2 for alpha + beta
@@ -353,8 +354,7 @@ def hess_elec(hess_mf, mo_energy=None, mo_coeff=None, mo_occ=None,
         for j0, ja in enumerate(atmlst):
             q0, q1 = offsetdic[ja][2:]
 # *2 for double occupancy, *2 for +c.c.
-            mo1  = pyscf.lib.chkfile.load(hess_mf.chkfile, 'scf_mo1/%d'%ja)
-            h1ao = pyscf.lib.chkfile.load(hess_mf.chkfile, 'scf_h1ao/%d'%ia)
+            mo1, h1ao = rhf._load_mo1_h1ao(mo1s, h1aos, i0, ia, j0, ja)
             dm1 = numpy.einsum('ypi,qi->ypq', mo1, mocc)
             de  = numpy.einsum('xpq,ypq->xy', h1ao, dm1) * 4
             dm1 = numpy.einsum('ypi,qi,i->ypq', mo1, mocc, mo_energy[:nocc])
@@ -383,7 +383,8 @@ def hess_elec(hess_mf, mo_energy=None, mo_coeff=None, mo_occ=None,
     log.timer('RHF hessian', *time0)
     return de2
 
-def make_h1(mf, mo_coeff, mo_occ, chkfile=None, atmlst=None, verbose=logger.WARN):
+def make_h1(mf, mo_coeff, mo_occ, chkfile=None, atmlst=None, verbose=logger.WARN,
+            nproc=1):
     if isinstance(verbose, logger.Logger):
         log = verbose
     else:
@@ -414,8 +415,7 @@ def make_h1(mf, mo_coeff, mo_occ, chkfile=None, atmlst=None, verbose=logger.WARN
            mol.intor('cint1e_ipnuc_sph', comp=3))
 
     offsetdic = mol.offset_nr_by_atom()
-    h1aos = []
-    for i0, ia in enumerate(atmlst):
+    def get_h1(ia):
         shl0, shl1, p0, p1 = offsetdic[ia]
 
         mol.set_rinv_origin(mol.atom_coord(ia))
@@ -534,12 +534,17 @@ def make_h1(mf, mo_coeff, mo_occ, chkfile=None, atmlst=None, verbose=logger.WARN
             raise NotImplementedError('meta-GGA')
 
         veff = veff + veff.transpose(0,2,1)
+        return h1ao + veff
 
+    h1aos = [None] * len(atmlst)
+    for i0, h1ao in pyscf.lib.imap_processes(get_h1, [(ia,) for ia in atmlst],
+                                             nproc):
         if chkfile is None:
-            h1aos.append(h1ao+veff)
+            h1aos[i0] = h1ao
         else:
-            key = 'scf_h1ao/%d' % ia
-            pyscf.lib.chkfile.save(chkfile, key, h1ao+veff)
+            key = 'scf_h1ao/%d' % atmlst[i0]
+            pyscf.lib.chkfile.save(chkfile, key, h1ao)
+        log.debug1('h1ao for atom %d', atmlst[i0])
     if chkfile is None:
         return h1aos
     else:
@@ -616,7 +621,8 @@ class Hessian(rhf.Hessian):
     '''Non-relativistic restricted Hartree-Fock hessian'''
     def make_h1(self, mo_coeff, mo_occ, chkfile=None, atmlst=None,
                 verbose=None):
-        return make_h1(self._scf, mo_coeff, mo_occ, chkfile, atmlst, verbose)
+        return make_h1(self._scf, mo_coeff, mo_occ, chkfile, atmlst, verbose,
+                       self.nproc)
 
     hess_elec = hess_elec
 
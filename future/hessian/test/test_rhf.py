@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+import unittest
+import numpy
+from pyscf import gto, scf
+from pyscf.scf import cphf
+from pyscf.scf import rhf_grad
+from pyscf.hessian import rhf
+
+mol = gto.Mole()
+mol.verbose = 0
+mol.output = None
+mol.atom = [
+    ['H' , (0. , 0. , 1.804)],
+    ['F' , (0. , 0. , 0.)], ]
+mol.unit = 'B'
+mol.basis = '631g'
+mol.build()
+
+mf = scf.RHF(mol)
+mf.conv_tol = 1e-14
+mf.scf()
+
+def grad_at(coords):
+    mol1 = mol.copy()
+    mol1.atom = [[mol.atom_symbol(i), coords[i]] for i in range(mol.natm)]
+    mol1.build(0, 0)
+    mf1 = scf.RHF(mol1)
+    mf1.conv_tol = 1e-14
+    mf1.conv_tol_grad = 1e-10
+    mf1.scf()
+    return rhf_grad.Gradients(mf1).kernel()
+
+class KnowValues(unittest.TestCase):
+    def test_solve_mo1(self):
+        hess = rhf.Hessian(mf)
+        mo_energy = mf.mo_energy
+        mo_coeff = mf.mo_coeff
+        mo_occ = mf.mo_occ
+        atmlst = range(mol.natm)
+        h1aos = hess.make_h1(mo_coeff, mo_occ, None, atmlst)
+        mo1, e1 = hess.solve_mo1(mo_energy, mo_coeff, mo_occ, h1aos)
+
+        # Reference: the perturbations of each atom solved separately
+        mocc = mo_coeff[:,mo_occ>0]
+        nocc = mocc.shape[1]
+        def fx(x):
+            dm1 = numpy.einsum('xai,pa,qi->xpq', x, mo_coeff, mocc*2)
+            dm1 = dm1 + dm1.transpose(0,2,1)
+            v1 = mf.get_veff(mol, dm1)
+            return numpy.einsum('xpq,pa,qi->xai', v1, mo_coeff, mocc)
+        s1a =-mol.intor('cint1e_ipovlp_sph', comp=3)
+        offsetdic = mol.offset_nr_by_atom()
+        for ia in atmlst:
+            p0, p1 = offsetdic[ia][2:]
+            s1ao = numpy.zeros_like(h1aos[ia])
+            s1ao[:,p0:p1] += s1a[:,p0:p1]
+            s1ao[:,:,p0:p1] += s1a[:,p0:p1].transpose(0,2,1)
+            s1vo = numpy.einsum('xpq,pi,qj->xij', s1ao, mo_coeff, mocc)
+            h1vo = numpy.einsum('xpq,pi,qj->xij', h1aos[ia], mo_coeff, mocc)
+            ref, e1ref = cphf.solve(fx, mo_energy, mo_occ, h1vo, s1vo)
+            ref = numpy.einsum('pq,xqi->xpi', mo_coeff, ref)
+            self.assertAlmostEqual(abs(mo1[ia]-ref).max(), 0, 6)
+            self.assertAlmostEqual(abs(e1[ia]-e1ref.reshape(3,nocc,nocc)).max(), 0, 6)
+
+        # One atom per block Krylov solve
+        mo1b, e1b = hess.solve_mo1(mo_energy, mo_coeff, mo_occ, h1aos,
+                                   max_memory=1)
+        self.assertAlmostEqual(abs(mo1b-mo1).max(), 0, 6)
+        self.assertAlmostEqual(abs(e1b-e1).max(), 0, 6)
+
+    def test_finite_diff(self):
+        e2 = rhf.Hessian(mf).kernel()
+        coords = mol.atom_coords()
+        disp = 1e-3
+        coords[1,2] += disp
+        g1 = grad_at(coords)
+        coords[1,2] -= disp * 2
+        g2 = grad_at(coords)
+        self.assertAlmostEqual(abs((g1-g2)/(disp*2) - e2[1,:,2,:]).max(), 0, 4)
+
+    def test_nproc(self):
+        hess = rhf.Hessian(mf)
+        e2ref = hess.kernel()
+        hess.nproc = 2
+        self.assertAlmostEqual(abs(hess.kernel()-e2ref).max(), 0, 9)
+
+
+if __name__ == "__main__":
+    print("Full Tests for RHF Hessian")
+    unittest.main()
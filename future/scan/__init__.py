@@ -0,0 +1,11 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+'''
+Potential energy surface scan with wavefunction and orbital propagation
+'''
+
+from pyscf.scan import pes
+from pyscf.scan.pes import PESScanner, project_mo
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+'''
+Potential energy surface scan
+
+The SCF (and CASSCF) object is updated in place along the scan path.  At
+each geometry the molecule is moved with :func:`Mole.set_geom_` (the basis set
+is not parsed again), the orbitals of the previous point are projected onto
+the new AO basis and orthonormalized in the new AO overlap, and the CI vectors
+of the previous point are used as the initial guess of the CASSCF solver.
+For DFT, the atomic grids are generated once and only the Becke partition is
+updated for the new geometry.  The libcint optimizers of the integral
+screening (which depend on the basis only) are kept, and the Schwarz
+conditions are regenerated for the new geometry.
+'''
+
+import time
+import tempfile
+import numpy
+from pyscf import lib
+from pyscf.lib import logger
+from pyscf import scf
+from pyscf import mcscf
+from pyscf.scf import _vhf
+
+
+def project_mo(mol0, mo0, mol1, s1=None):
+    '''Project the orbitals of mol0 onto the AO basis of mol1, then
+    orthonormalize them (Lowdin) in the AO overlap of mol1.  Lowdin
+    orthonormalization keeps the projected orbitals as close as possible to
+    the orbitals of the previous geometry.
+
+    Args:
+        mol0 : an instance of :class:`Mole`
+        mo0 : ndarray or a list of ndarray (for UHF)
+        mol1 : an instance of :class:`Mole`
+
+    Kwargs:
+        s1 : ndarray
+            AO overlap of mol1
+
+    Returns:
+        Orthonormal orbitals for mol1
+    '''
+    from pyscf.lo import orth
+    if s1 is None:
+        s1 = mol1.intor_symmetric('cint1e_ovlp_sph')
+    if isinstance(mo0, numpy.ndarray) and mo0.ndim == 2:
+        mo1 = scf.addons.project_mo_nr2nr(mol0, mo0, mol1)
+        return orth.vec_lowdin(mo1, s1)
+    else:
+        return [project_mo(mol0, x, mol1, s1) for x in mo0]
+
+
+class PESScanner(lib.StreamObject):
+    '''Scan the potential energy surface with wavefunction propagation
+
+    Attributes:
+        project_mo : bool
+            Whether to use the orbitals of the previous point as the initial
+            guess.  Default is True
+        reuse_ci : bool
+            Whether to use the CI vectors of the previous point as the initial
+            guess of CASSCF.  Default is True
+
+    Saved results:
+        e_tot : list
+            Total energies of the scanned geometries
+
+    Examples:
+
+    >>> mol = gto.M(atom='H 0 0 0; F 0 0 0.9', basis='ccpvdz', verbose=0)
+    >>> mc = mcscf.CASSCF(scf.RHF(mol), 4, 4)
+    >>> geoms = ['H 0 0 0; F 0 0 %g' % r for r in numpy.arange(0.9, 3., .1)]
+    >>> e = scan.PESScanner(mc).kernel(geoms)
+    '''
+    def __init__(self, method):
+        self.method = method
+        if isinstance(method, mcscf.casci.CASCI):
+            self._scf = method._scf
+        else:
+            self._scf = method
+        self.mol = self._scf.mol
+        self.stdout = self.mol.stdout
+        self.verbose = self.mol.verbose
+        self.project_mo = True
+        self.reuse_ci = True
+
+##################################################
+# don't modify the following attributes, they are not input options
+        self.e_tot = []
+        self._atom_grids_tab = None
+        self._last = None
+        self._keys = set(self.__dict__.keys())
+
+    def dump_flags(self):
+        log = logger.Logger(self.stdout, self.verbose)
+        log.info('\n')
+        log.info('******** %s flags ********', self.__class__)
+        log.info('method = %s', self.method.__class__)
+        log.info('project_mo = %s', self.project_mo)
+        log.info('reuse_ci = %s', self.reuse_ci)
+        return self
+
+    def reset(self):
+        '''Remove the integrals and the intermediates which depend on the
+        geometry of the previous point'''
+        mf = self._scf
+        mf._eri = None
+        if isinstance(mf.opt, (tuple, list)):
+            mf.opt = type(mf.opt)([_renew_vhfopt(self.mol, x) for x in mf.opt])
+        else:
+            mf.opt = _renew_vhfopt(self.mol, mf.opt)
+        for obj in (mf, self.method):
+            if getattr(obj, 'with_df', None):
+                obj.with_df._cderi = None
+        if hasattr(mf, '_numint'):
+            mf._numint.non0tab = None
+        return self
+
+    def update_grids(self):
+        '''Update the DFT grids for the current geometry.  The atomic grids
+        are generated once.  The Becke partition is regenerated for the new
+        geometry.
+        '''
+        mf = self._scf
+        mol = self.mol
+        grids = mf.grids
+        if self._atom_grids_tab is None:
+            self._atom_grids_tab = grids.gen_atomic_grids(mol, grids.atom_grid,
+                                                          grids.radi_method,
+                                                          grids.level, grids.prune)
+        grids.coords, grids.weights = \
+                grids.gen_partition(mol, self._atom_grids_tab,
+                                    grids.radii_adjust, grids.atomic_radii,
+                                    grids.becke_scheme)
+        return grids
+
+    def prune_grids(self, dm):
+        '''Remove the grids of small density, as the first call of
+        get_veff does for the grids generated by :func:`Grids.build`.
+        '''
+        mf = self._scf
+        small_rho_cutoff = getattr(mf, 'small_rho_cutoff', 0)
+        if small_rho_cutoff > 1e-20:
+            grids = mf.grids
+            dm = numpy.asarray(dm)
+            if dm.ndim == 3:
+                dm = dm[0] + dm[1]
+            idx = mf._numint.large_rho_indices(self.mol, dm, grids, small_rho_cutoff)
+            logger.debug(self, 'Drop grids %d',
+                         grids.weights.size - numpy.count_nonzero(idx))
+            grids.coords  = numpy.asarray(grids.coords [idx], order='C')
+            grids.weights = numpy.asarray(grids.weights[idx], order='C')
+            mf._numint.non0tab = None
+        return self
+
+    def scan_point(self, geom):
+        '''Move the molecule to the given geometry and solve the SCF (and
+        CASSCF) with the propagated initial guess.
+
+        Returns:
+            Total energy
+        '''
+        cput0 = (time.clock(), time.time())
+        mol = self.mol
+        mf = self._scf
+        last = self._last
+        if last is not None:
+            prev_mol = last['mol']
+        else:
+            prev_mol = None
+
+        mol.set_geom_(geom)
+        self.reset()
+
+        if self.project_mo and last is not None:
+            s1 = mf.get_ovlp()
+            mo = project_mo(prev_mol, last['mo_coeff'], mol, s1)
+            dm0 = mf.make_rdm1(mo, last['mo_occ'])
+        else:
+            dm0 = mf.get_init_guess(mol, mf.init_guess)
+        if hasattr(mf, 'grids'):
+            self.update_grids()
+            self.prune_grids(dm0)
+        mf.kernel(dm0)
+        e_tot = mf.e_tot
+        current = {'mol': mol.copy(), 'mo_coeff': mf.mo_coeff,
+                   'mo_occ': mf.mo_occ}
+
+        if self.method is not mf:
+            mc = self.method
+            mo = ci0 = None
+            if last is not None:
+                if self.project_mo:
+                    mo = mcscf.project_init_guess(mc, last['cas_mo'], prev_mol)
+                if self.reuse_ci:
+                    ci0 = last['ci']
+            if mo is None:
+                mo = mf.mo_coeff
+            e_tot = mc.kernel(mo, ci0)[0]
+            current['cas_mo'] = mc.mo_coeff
+            current['ci'] = mc.ci
+
+        self._last = current
+        logger.timer(self, 'scan point', *cput0)
+        return e_tot
+
+    def kernel(self, geoms):
+        '''Scan the geometries in the given order.
+
+        Args:
+            geoms : list
+                Each item is a geometry in the format of :attr:`Mole.atom`
+
+        Returns:
+            An 1D array of total energies
+        '''
+        if self.verbose >= logger.WARN:
+            self.check_sanity()
+        self.dump_flags()
+        self.e_tot = []
+        for i, geom in enumerate(geoms):
+            self.e_tot.append(self.scan_point(geom))
+            logger.note(self, 'scan point %d  E = %.15g', i, self.e_tot[-1])
+        return numpy.asarray(self.e_tot)
+
+    def scan_branches(self, branches, nproc=1):
+        '''Scan independent branches of the surface.  Each branch starts
+        from the current state of the scanner.  The branches are scanned in
+        separate processes.  The state of the scanner, the molecule and the
+        SCF (CASSCF) object is restored after each branch, for both the
+        serial and the parallel execution.
+
+        Args:
+            branches : list
+                Each item is a list of geometries for :func:`kernel`
+
+        Kwargs:
+            nproc : int
+                Number of processes.  Default is 1, the branches are scanned
+                one after another.  The branches are forked from the current
+                process and each runs with one OpenMP thread.
+
+        Returns:
+            A list of 1D arrays of total energies, one for each branch
+        '''
+        mol = self.mol
+        mf = self._scf
+        objs = [self, mf, self.method]
+        for key in ('grids', '_numint'):
+            if hasattr(mf, key):
+                objs.append(getattr(mf, key))
+        def run_branch(geoms):
+            saved = [(obj, obj.__dict__.copy()) for obj in objs]
+            atom, unit = mol.atom, mol.unit
+# Each branch writes its own chkfile which is removed at the end of the branch
+            with tempfile.NamedTemporaryFile() as ftmp:
+                mf.chkfile = ftmp.name
+                if hasattr(self.method, 'chkfile'):
+                    self.method.chkfile = ftmp.name
+                try:
+                    return self.kernel(geoms)
+                finally:
+                    for obj, d in saved:
+                        obj.__dict__.clear()
+                        obj.__dict__.update(d)
+                    mol.set_geom_(atom, unit)
+        branches = [(geoms,) for geoms in branches]
+        return lib.map_processes(run_branch, branches, nproc)
+
+
+def _renew_vhfopt(mol, opt):
+    '''Regenerate the Schwarz conditions of the integral screening for the
+    new geometry.  The libcint optimizer only depends on the basis and is
+    shared with the new VHFOpt.'''
+    if isinstance(opt, _vhf.VHFOpt) and getattr(opt, '_args', None):
+        opt1 = _vhf.VHFOpt(mol, *opt._args, cintopt=opt._cintopt)
+        opt1.direct_scf_tol = opt.direct_scf_tol
+        opt1._this.contents.r_vkscreen = opt._this.contents.r_vkscreen
+        return opt1
+    else:
+        return None
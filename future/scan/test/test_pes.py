@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+import unittest
+import numpy
+from pyscf import gto
+from pyscf import scf
+from pyscf import dft
+from pyscf import mcscf
+from pyscf import scan
+
+def geom(r):
+    return 'H 0 0 0; F 0 0 %g' % r
+
+mol = gto.M(
+    verbose = 5,
+    output = '/dev/null',
+    atom = geom(0.9),
+    basis = '631g')
+
+class KnowValues(unittest.TestCase):
+    def test_rhf_scan(self):
+        rs = (0.9, 1.0, 1.1)
+        mf = scf.RHF(mol.copy())
+        mf.conv_tol = 1e-11
+        e = scan.PESScanner(mf).kernel([geom(r) for r in rs])
+        for i, r in enumerate(rs):
+            mf1 = scf.RHF(gto.M(atom=geom(r), basis='631g', verbose=0))
+            mf1.conv_tol = 1e-11
+            self.assertAlmostEqual(e[i], mf1.kernel(), 8)
+
+    def test_rks_scan(self):
+        rs = (0.9, 1.0)
+        mf = dft.RKS(mol.copy())
+        e = scan.PESScanner(mf).kernel([geom(r) for r in rs])
+        mf1 = dft.RKS(gto.M(atom=geom(0.9), basis='631g', verbose=0))
+        self.assertAlmostEqual(e[0], mf1.kernel(), 9)
+        self.assertEqual(mf.grids.weights.size, mf1.grids.weights.size)
+        mf1 = dft.RKS(gto.M(atom=geom(1.0), basis='631g', verbose=0))
+        # The grids are pruned with the projected density of the previous point
+        self.assertAlmostEqual(e[1], mf1.kernel(), 6)
+
+    def test_reuse_vhfopt(self):
+        mf = scf.RHF(mol.copy())
+        scanner = scan.PESScanner(mf)
+        scanner.kernel([geom(0.9)])
+        opt0 = mf.opt
+        scanner.reset()
+        self.assertTrue(mf.opt is not None)
+        self.assertTrue(mf.opt._cintopt is opt0._cintopt)
+
+    def test_casscf_scan_branches(self):
+        mc = mcscf.CASSCF(scf.RHF(mol.copy()), 4, 4)
+        scanner = scan.PESScanner(mc)
+        scanner.kernel([geom(0.9)])
+        branches = [[geom(r) for r in (1.0, 1.1)],
+                    [geom(r) for r in (0.85, 0.8)]]
+        chkfile = mc._scf.chkfile
+        coords = mc.mol.atom_coords()
+        e_par = scanner.scan_branches(branches, nproc=2)
+        e_ser = scanner.scan_branches(branches, nproc=1)
+        self.assertAlmostEqual(abs(numpy.array(e_par)-numpy.array(e_ser)).max(), 0, 7)
+        self.assertEqual(mc._scf.chkfile, chkfile)
+        self.assertAlmostEqual(abs(mc.mol.atom_coords()-coords).max(), 0, 12)
+        e_ser1 = scanner.scan_branches(branches[::-1], nproc=1)
+        self.assertAlmostEqual(abs(numpy.array(e_ser1[::-1])-numpy.array(e_ser)).max(), 0, 7)
+
+        mc1 = mcscf.CASSCF(scf.RHF(gto.M(atom=geom(1.1), basis='631g', verbose=0)).run(), 4, 4)
+        self.assertAlmostEqual(e_ser[0][1], mc1.kernel()[0], 7)
+
+
+if __name__ == "__main__":
+    print("Full Tests for PES scan")
+    unittest.main()
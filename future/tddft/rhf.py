@@ -7,13 +7,146 @@
 # J. Mol. Struct. THEOCHEM, 914, 3
 #
 
-from functools import reduce
+import time
 import numpy
 import pyscf.lib
+from pyscf.lib import logger
 from pyscf.tddft import davidson
 from pyscf.ao2mo import _ao2mo
 
 
+def _vo2ao(orbv, zs, orbo):
+    '''Transform a stack of vo amplitudes to AO matrices C_v z C_o^T.  All
+    amplitudes go through two matrix multiplications instead of two per
+    amplitude.
+    '''
+    nao, nvir = orbv.shape
+    nocc = orbo.shape[1]
+    zs = numpy.asarray(zs).reshape(-1,nvir,nocc)
+    nz = len(zs)
+    # (nao,nvir) x (nvir,nz*nocc) -> (nao,nz,nocc)
+    t = numpy.dot(orbv, zs.transpose(1,0,2).reshape(nvir,nz*nocc))
+    t = t.reshape(nao,nz,nocc).transpose(1,0,2).reshape(nz*nao,nocc)
+    return numpy.dot(t, orbo.T).reshape(nz,nao,nao)
+
+
+def _df_enabled(mf):
+    from pyscf import df
+    with_df = getattr(mf, 'with_df', None)
+    return isinstance(with_df, df.DF) and not isinstance(with_df, df.DF4C)
+
+def _df_mo_cderi(td, max_memory=2000):
+    '''DF tensor of the ground state in the MO blocks needed by the response:
+    L_oo, L_vo and, if it fits in memory, L_vv.  They are transformed once and
+    cached on td until the SCF orbitals change.
+    '''
+    mf = td._scf
+    mo_coeff = mf.mo_coeff
+    cache = getattr(td, '_df_cderi', None)
+    if cache is not None and cache[0] is mo_coeff:
+        return cache[1:]
+
+    log = logger.Logger(td.stdout, td.verbose)
+    t0 = (time.clock(), time.time())
+    with_df = mf.with_df
+    naux = with_df.get_naoaux()
+    nao, nmo = mo_coeff.shape
+    nocc = (mf.mo_occ>0).sum()
+    nvir = nmo - nocc
+    mo = numpy.asarray(mo_coeff, order='F')
+
+    mem_now = pyscf.lib.current_memory()[0]
+    if naux*(nmo**2+nao**2)*8/1e6 < max(0, td.max_memory*.8-mem_now):
+        Lvv = numpy.empty((naux,nvir,nvir))
+        shape = (0,nmo,0,nmo)
+    else:
+        Lvv = None
+        shape = (0,nmo,0,nocc)
+        log.debug('L_vv does not fit in memory.  '
+                  'Exchange of the response is built in AO basis')
+    Loo = numpy.empty((naux,nocc,nocc))
+    Lvo = numpy.empty((naux,nvir,nocc))
+    p1 = 0
+    for eri1 in with_df.loop():
+        buf = _ao2mo.nr_e2(eri1, mo, shape, 's2', 's1')
+        buf = buf.reshape(-1,nmo,shape[3])
+        p0, p1 = p1, p1 + buf.shape[0]
+        Loo[p0:p1] = buf[:,:nocc,:nocc]
+        Lvo[p0:p1] = buf[:,nocc:,:nocc]
+        if Lvv is not None:
+            Lvv[p0:p1] = buf[:,nocc:,nocc:]
+        buf = None
+    td._df_cderi = (mo_coeff, Loo, Lvo, Lvv)
+    log.timer_debug1('transform DF tensor for response', *t0)
+    return Loo, Lvo, Lvv
+
+def _df_get_jk_vo(td, zvo, zov=None, with_k=True):
+    '''The vo blocks of J and K of the transition densities with the vo block
+    zvo and the ov block zov^T in MO representation.  J and K of all vectors
+    are computed with the MO DF tensor by matrix multiplications in the ov
+    space.
+
+    Returns:
+        vj, vk of shape (nz,nvir*nocc).  vk is None if with_k is False
+    '''
+    mf = td._scf
+    nmo = mf.mo_coeff.shape[1]
+    nocc = (mf.mo_occ>0).sum()
+    nvir = nmo - nocc
+    nov = nvir * nocc
+    zvo = numpy.asarray(zvo).reshape(-1,nvir,nocc)
+    nz = len(zvo)
+    if zov is not None:
+        zov = numpy.asarray(zov).reshape(nz,nvir,nocc)
+    mem_now = pyscf.lib.current_memory()[0]
+    max_memory = max(2000, td.max_memory*.9-mem_now)
+    Loo, Lvo, Lvv = _df_mo_cderi(td, max_memory)
+    naux = len(Lvo)
+    Lvo2d = Lvo.reshape(naux,nov)
+
+    if zov is None:
+        zs = zvo.reshape(nz,nov)
+    else:
+        zs = (zvo + zov).reshape(nz,nov)
+    rho = pyscf.lib.dot(Lvo2d, zs.T)
+    vj = pyscf.lib.dot(rho.T, Lvo2d)
+    if not with_k:
+        return vj, None
+
+    if Lvv is None:
+        mo_coeff = mf.mo_coeff
+        orbo = mo_coeff[:,:nocc]
+        orbv = mo_coeff[:,nocc:]
+        dms = _vo2ao(orbv, zvo, orbo)
+        if zov is not None:
+            dms += _vo2ao(orbv, zov, orbo).transpose(0,2,1)
+        vk = mf.with_df.get_jk(dms, hermi=0, with_j=False)[1]
+        vk = _ao2mo.nr_e2(vk, mo_coeff, (nocc,nmo,0,nocc)).reshape(nz,nov)
+        return vj, vk
+
+    vk = numpy.zeros((nvir,nz*nocc))
+    blksize = max(1, int(max_memory*.5e6/8/(nz*nov*2+nvir**2+nov)))
+    zvo = zvo.reshape(nz*nvir,nocc)
+    if zov is not None:
+        zov = numpy.asarray(zov.transpose(0,2,1).reshape(nz*nocc,nvir), order='C')
+    for p0, p1 in pyscf.lib.prange(0, naux, blksize):
+        nblk = p1 - p0
+        # (ab|ji) z_{bj}
+        tmp = pyscf.lib.dot(zvo, Loo[p0:p1].transpose(1,0,2).reshape(nocc,-1))
+        tmp = tmp.reshape(nz,nvir,nblk,nocc).transpose(2,1,0,3)
+        tmp = tmp.reshape(nblk*nvir,nz*nocc)
+        pyscf.lib.dot(Lvv[p0:p1].transpose(1,0,2).reshape(nvir,-1), tmp, 1, vk, 1)
+        if zov is not None:
+            # (aj|bi) z_{jb}
+            Lbpi = Lvo[p0:p1].transpose(1,0,2).reshape(nvir,-1)
+            tmp = pyscf.lib.dot(zov, Lbpi).reshape(nz,nocc,nblk,nocc)
+            tmp = tmp.transpose(2,1,0,3).reshape(nblk*nocc,nz*nocc)
+            pyscf.lib.dot(Lbpi, tmp, 1, vk, 1)
+        tmp = None
+    vk = vk.reshape(nvir,nz,nocc).transpose(1,0,2).reshape(nz,nov)
+    return vj, vk
+
+
 class TDA(pyscf.lib.StreamObject):
     def __init__(self, mf):
         self.verbose = mf.verbose
@@ -70,22 +203,25 @@ class TDA(pyscf.lib.StreamObject):
         orbv = mo_coeff[:,nocc:]
         orbo = mo_coeff[:,:nocc]
         nz = len(zs)
-        dmvo = numpy.empty((nz,nao,nao))
-        for i, z in enumerate(zs):
-            dmvo[i] = reduce(numpy.dot, (orbv, z.reshape(nvir,nocc), orbo.T))
-        vj, vk = self._scf.get_jk(self.mol, dmvo, hermi=0)
-
-        if self.singlet:
-            vhf = vj*2 - vk
+        if _df_enabled(self._scf):
+            vj, vk = _df_get_jk_vo(self, zs)
+            if self.singlet:
+                v1vo = vj*2 - vk
+            else:
+                v1vo = -vk
         else:
-            vhf = -vk
+            dmvo = _vo2ao(orbv, zs, orbo)
+            vj, vk = self._scf.get_jk(self.mol, dmvo, hermi=0)
+
+            if self.singlet:
+                vhf = vj*2 - vk
+            else:
+                vhf = -vk
 
-        #v1vo = numpy.asarray([reduce(numpy.dot, (orbv.T, v, orbo)) for v in vhf])
-        v1vo = _ao2mo.nr_e2(vhf, mo_coeff, (nocc,nmo,0,nocc)).reshape(-1,nvir*nocc)
+            #v1vo = numpy.asarray([reduce(numpy.dot, (orbv.T, v, orbo)) for v in vhf])
+            v1vo = _ao2mo.nr_e2(vhf, mo_coeff, (nocc,nmo,0,nocc)).reshape(-1,nvir*nocc)
         eai = pyscf.lib.direct_sum('a-i->ai', mo_energy[nocc:], mo_energy[:nocc])
-        eai = eai.ravel()
-        for i, z in enumerate(zs):
-            v1vo[i] += eai * z
+        v1vo += eai.ravel() * numpy.asarray(zs).reshape(nz,-1)
         return v1vo.reshape(nz,-1)
 
     def get_precond(self, hdiag):
@@ -144,27 +280,31 @@ class TDHF(TDA):
         orbv = mo_coeff[:,nocc:]
         orbo = mo_coeff[:,:nocc]
         nz = len(xys)
-        dms = numpy.empty((nz*2,nao,nao))
-        for i in range(nz):
-            x, y = xys[i].reshape(2,nvir,nocc)
-            dmx = reduce(numpy.dot, (orbv, x, orbo.T))
-            dmy = reduce(numpy.dot, (orbv, y, orbo.T))
-            dms[i   ] = dmx + dmy.T  # AX + BY
-            dms[i+nz] = dms[i].T # = dmy + dmx.T  # AY + BX
-        vj, vk = self._scf.get_jk(self.mol, dms, hermi=0)
-
-        if self.singlet:
-            vhf = vj*2 - vk
+        xys = numpy.asarray(xys).reshape(nz,2,nvir,nocc)
+        if _df_enabled(self._scf):
+            x, y = xys.transpose(1,0,2,3)
+            vj, vk = _df_get_jk_vo(self, numpy.vstack((x,y)), numpy.vstack((y,x)))
+            if self.singlet:
+                vhf = vj*2 - vk
+            else:
+                vhf = -vk
         else:
-            vhf = -vk
-        #vhf = numpy.asarray([reduce(numpy.dot, (orbv.T, v, orbo)) for v in vhf])
-        vhf = _ao2mo.nr_e2(vhf, mo_coeff, (nocc,nmo,0,nocc)).reshape(-1,nvir*nocc)
+            dmx, dmy = _vo2ao(orbv, xys.transpose(1,0,2,3), orbo).reshape(2,nz,nao,nao)
+            dms = numpy.empty((nz*2,nao,nao))
+            dms[:nz] = dmx + dmy.transpose(0,2,1)  # AX + BY
+            dms[nz:] = dms[:nz].transpose(0,2,1)  # = dmy + dmx.T  # AY + BX
+            vj, vk = self._scf.get_jk(self.mol, dms, hermi=0)
+
+            if self.singlet:
+                vhf = vj*2 - vk
+            else:
+                vhf = -vk
+            #vhf = numpy.asarray([reduce(numpy.dot, (orbv.T, v, orbo)) for v in vhf])
+            vhf = _ao2mo.nr_e2(vhf, mo_coeff, (nocc,nmo,0,nocc)).reshape(-1,nvir*nocc)
         eai = pyscf.lib.direct_sum('a-i->ai', mo_energy[nocc:], mo_energy[:nocc])
         eai = eai.ravel()
-        for i, z in enumerate(xys):
-            x, y = z.reshape(2,-1)
-            vhf[i   ] += eai * x  # AX
-            vhf[i+nz] += eai * y  # AY
+        vhf[:nz] += eai * xys[:,0].reshape(nz,-1)  # AX
+        vhf[nz:] += eai * xys[:,1].reshape(nz,-1)  # AY
         hx = numpy.hstack((vhf[:nz], -vhf[nz:]))
         return hx.reshape(nz,-1)
 
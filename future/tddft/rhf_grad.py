@@ -20,6 +20,21 @@ from pyscf.scf import cphf
 #
 def kernel(td_grad, x_y, singlet=True, atmlst=None,
            max_memory=2000, verbose=logger.INFO):
+    return kernel_states(td_grad, [x_y], singlet, atmlst, max_memory, verbose)[0]
+
+def kernel_states(td_grad, xys, singlet=True, atmlst=None,
+                  max_memory=2000, verbose=logger.INFO):
+    '''Nuclear gradients of several excited states.  The Z-vector equations
+    of all states are solved in one block Krylov subspace.  The J/K matrices
+    and the J/K derivatives of all states are computed in one call, and the
+    derivative integrals of the ground state are shared by all states.
+
+    Args:
+        xys : a list of (X,Y) of the excited states
+
+    Returns:
+        An array of shape (len(xys),len(atmlst),3)
+    '''
     if isinstance(verbose, logger.Logger):
         log = verbose
     else:
@@ -34,109 +49,130 @@ def kernel(td_grad, x_y, singlet=True, atmlst=None,
     nao, nmo = mo_coeff.shape
     nocc = (mo_occ>0).sum()
     nvir = nmo - nocc
-    x, y = x_y
-    xpy = (x+y).reshape(nvir,nocc)
-    xmy = (x-y).reshape(nvir,nocc)
+    nstates = len(xys)
+    xpy = numpy.asarray([(x+y).reshape(nvir,nocc) for x, y in xys])
+    xmy = numpy.asarray([(x-y).reshape(nvir,nocc) for x, y in xys])
     orbv = mo_coeff[:,nocc:]
     orbo = mo_coeff[:,:nocc]
 
-    dvv = numpy.einsum('ai,bi->ab', xpy, xpy) + numpy.einsum('ai,bi->ab', xmy, xmy)
-    doo =-numpy.einsum('ai,aj->ij', xpy, xpy) - numpy.einsum('ai,aj->ij', xmy, xmy)
-    dmzvop = reduce(numpy.dot, (orbv, xpy, orbo.T))
-    dmzvom = reduce(numpy.dot, (orbv, xmy, orbo.T))
-    dmzoo = reduce(numpy.dot, (orbo, doo, orbo.T))
-    dmzoo+= reduce(numpy.dot, (orbv, dvv, orbv.T))
-
-    vj, vk = mf.get_jk(mol, (dmzoo, dmzvop+dmzvop.T, dmzvom-dmzvom.T), hermi=0)
+    dvv = numpy.einsum('sai,sbi->sab', xpy, xpy) + numpy.einsum('sai,sbi->sab', xmy, xmy)
+    doo =-numpy.einsum('sai,saj->sij', xpy, xpy) - numpy.einsum('sai,saj->sij', xmy, xmy)
+    dmzvop = _mo2ao(orbv, xpy, orbo)
+    dmzvom = _mo2ao(orbv, xmy, orbo)
+    dmzoo = _mo2ao(orbo, doo, orbo)
+    dmzoo+= _mo2ao(orbv, dvv, orbv)
+
+    vj, vk = mf.get_jk(mol, numpy.vstack((dmzoo, _sym(dmzvop), _asym(dmzvom))),
+                       hermi=0)
+    vj = vj.reshape(3,nstates,nao,nao)
+    vk = vk.reshape(3,nstates,nao,nao)
     veff0doo = vj[0] * 2 - vk[0]
-    wvo = reduce(numpy.dot, (orbv.T, veff0doo, orbo)) * 2
+    wvo = _ao2mo(orbv, veff0doo, orbo) * 2
     if singlet:
         veff = vj[1] * 2 - vk[1]
     else:
         veff = -vk[1]
-    veff0mop = reduce(numpy.dot, (mo_coeff.T, veff, mo_coeff))
-    wvo -= numpy.einsum('ki,ai->ak', veff0mop[:nocc,:nocc], xpy) * 2
-    wvo += numpy.einsum('ac,ai->ci', veff0mop[nocc:,nocc:], xpy) * 2
+    veff0mop = _ao2mo(mo_coeff, veff, mo_coeff)
+    wvo -= numpy.einsum('ski,sai->sak', veff0mop[:,:nocc,:nocc], xpy) * 2
+    wvo += numpy.einsum('sac,sai->sci', veff0mop[:,nocc:,nocc:], xpy) * 2
     veff = -vk[2]
-    veff0mom = reduce(numpy.dot, (mo_coeff.T, veff, mo_coeff))
-    wvo -= numpy.einsum('ki,ai->ak', veff0mom[:nocc,:nocc], xmy) * 2
-    wvo += numpy.einsum('ac,ai->ci', veff0mom[nocc:,nocc:], xmy) * 2
+    veff0mom = _ao2mo(mo_coeff, veff, mo_coeff)
+    wvo -= numpy.einsum('ski,sai->sak', veff0mom[:,:nocc,:nocc], xmy) * 2
+    wvo += numpy.einsum('sac,sai->sci', veff0mom[:,nocc:,nocc:], xmy) * 2
     def fvind(x):  # For singlet, closed shell ground state
-        dm = reduce(numpy.dot, (orbv, x.reshape(nvir,nocc), orbo.T))
-        vj, vk = mf.get_jk(mol, (dm+dm.T))
-        return reduce(numpy.dot, (orbv.T, vj*2-vk, orbo)).ravel()
+        dm = _sym(_mo2ao(orbv, x.reshape(-1,nvir,nocc), orbo))
+        vj, vk = mf.get_jk(mol, dm)
+        return _ao2mo(orbv, vj*2-vk, orbo).ravel()
+# The Z-vector equations of all states share one block Krylov subspace
     z1 = cphf.solve(fvind, mo_energy, mo_occ, wvo,
-                    max_cycle=td_grad.max_cycle_cphf, tol=td_grad.conv_tol)[0]
-    z1 = z1.reshape(nvir,nocc)
+                    max_cycle=td_grad.max_cycle_cphf, tol=td_grad.conv_tol,
+                    block=True)[0]
+    z1 = z1.reshape(nstates,nvir,nocc)
     time1 = log.timer('Z-vector using CPHF solver', *time0)
 
-    z1ao = reduce(numpy.dot, (orbv, z1, orbo.T))
+    z1ao = _mo2ao(orbv, z1, orbo)
     vj, vk = mf.get_jk(mol, z1ao, hermi=0)
     veff = vj * 2 - vk
 
-    im0 = numpy.zeros((nmo,nmo))
-    im0[:nocc,:nocc] = reduce(numpy.dot, (orbo.T, veff0doo+veff, orbo))
-    im0[:nocc,:nocc]+= numpy.einsum('ak,ai->ki', veff0mop[nocc:,:nocc], xpy)
-    im0[:nocc,:nocc]+= numpy.einsum('ak,ai->ki', veff0mom[nocc:,:nocc], xmy)
-    im0[nocc:,nocc:] = numpy.einsum('ci,ai->ac', veff0mop[nocc:,:nocc], xpy)
-    im0[nocc:,nocc:]+= numpy.einsum('ci,ai->ac', veff0mom[nocc:,:nocc], xmy)
-    im0[nocc:,:nocc] = numpy.einsum('ki,ai->ak', veff0mop[:nocc,:nocc], xpy)*2
-    im0[nocc:,:nocc]+= numpy.einsum('ki,ai->ak', veff0mom[:nocc,:nocc], xmy)*2
+    im0 = numpy.zeros((nstates,nmo,nmo))
+    im0[:,:nocc,:nocc] = _ao2mo(orbo, veff0doo+veff, orbo)
+    im0[:,:nocc,:nocc]+= numpy.einsum('sak,sai->ski', veff0mop[:,nocc:,:nocc], xpy)
+    im0[:,:nocc,:nocc]+= numpy.einsum('sak,sai->ski', veff0mom[:,nocc:,:nocc], xmy)
+    im0[:,nocc:,nocc:] = numpy.einsum('sci,sai->sac', veff0mop[:,nocc:,:nocc], xpy)
+    im0[:,nocc:,nocc:]+= numpy.einsum('sci,sai->sac', veff0mom[:,nocc:,:nocc], xmy)
+    im0[:,nocc:,:nocc] = numpy.einsum('ski,sai->sak', veff0mop[:,:nocc,:nocc], xpy)*2
+    im0[:,nocc:,:nocc]+= numpy.einsum('ski,sai->sak', veff0mom[:,:nocc,:nocc], xmy)*2
 
     zeta = pyscf.lib.direct_sum('i+j->ij', mo_energy, mo_energy) * .5
     zeta[nocc:,:nocc] = mo_energy[:nocc]
     zeta[:nocc,nocc:] = mo_energy[nocc:]
-    dm1 = numpy.zeros((nmo,nmo))
-    dm1[:nocc,:nocc] = doo
-    dm1[nocc:,nocc:] = dvv
-    dm1[nocc:,:nocc] = z1
-    dm1[:nocc,:nocc] += numpy.eye(nocc)*2 # for ground state
-    im0 = reduce(numpy.dot, (mo_coeff, im0+zeta*dm1, mo_coeff.T))
+    dm1 = numpy.zeros((nstates,nmo,nmo))
+    dm1[:,:nocc,:nocc] = doo
+    dm1[:,nocc:,nocc:] = dvv
+    dm1[:,nocc:,:nocc] = z1
+    dm1[:,:nocc,:nocc] += numpy.eye(nocc)*2 # for ground state
+    im0 = _mo2ao(mo_coeff, im0+zeta*dm1, mo_coeff)
 
     h1 = td_grad.get_hcore(mol)
     s1 = td_grad.get_ovlp(mol)
 
     dmz1doo = z1ao + dmzoo
     oo0 = reduce(numpy.dot, (orbo, orbo.T))
-    vj, vk = td_grad.get_jk(mol, (oo0, dmz1doo+dmz1doo.T, dmzvop+dmzvop.T,
-                                  dmzvom-dmzvom.T))
+    vj, vk = td_grad.get_jk(mol, numpy.vstack((oo0[None], _sym(dmz1doo),
+                                               _sym(dmzvop), _asym(dmzvom))))
     vj = vj.reshape(-1,3,nao,nao)
     vk = vk.reshape(-1,3,nao,nao)
     if singlet:
         vhf1 = vj * 2 - vk
     else:
-        vhf1 = numpy.vstack((vj[:2]*2-vk[:2], -vk[2:]))
+        vhf1 = numpy.vstack((vj[:nstates+1]*2-vk[:nstates+1], -vk[nstates+1:]))
+    vhf1oo0 = vhf1[0]
+    vhf1 = vhf1[1:].reshape(3,nstates,3,nao,nao)
     time1 = log.timer('2e AO integral derivatives', *time1)
 
     if atmlst is None:
         atmlst = range(mol.natm)
     offsetdic = mol.offset_nr_by_atom()
-    de = numpy.zeros((len(atmlst),3))
+    de = numpy.zeros((nstates,len(atmlst),3))
     for k, ia in enumerate(atmlst):
         shl0, shl1, p0, p1 = offsetdic[ia]
 
         mol.set_rinv_origin(mol.atom_coord(ia))
         h1ao = -mol.atom_charge(ia) * mol.intor('cint1e_iprinv_sph', comp=3)
-        h1ao[:,p0:p1] += h1[:,p0:p1] + vhf1[0,:,p0:p1]
+        h1ao[:,p0:p1] += h1[:,p0:p1] + vhf1oo0[:,p0:p1]
 
         # Ground state gradients
         # h1ao*2 for +c.c, oo0*2 for doubly occupied orbitals
-        de[k] = numpy.einsum('xpq,pq->x', h1ao, oo0) * 4
+        de[:,k] = numpy.einsum('xpq,pq->x', h1ao, oo0) * 4
 
-        de[k] += numpy.einsum('xpq,pq->x', h1ao, dmz1doo)
-        de[k] += numpy.einsum('xqp,pq->x', h1ao, dmz1doo)
-        de[k] -= numpy.einsum('xpq,pq->x', s1[:,p0:p1], im0[p0:p1])
-        de[k] -= numpy.einsum('xqp,pq->x', s1[:,p0:p1], im0[:,p0:p1])
+        de[:,k] += numpy.einsum('xpq,spq->sx', h1ao, dmz1doo)
+        de[:,k] += numpy.einsum('xqp,spq->sx', h1ao, dmz1doo)
+        de[:,k] -= numpy.einsum('xpq,spq->sx', s1[:,p0:p1], im0[:,p0:p1])
+        de[:,k] -= numpy.einsum('xqp,spq->sx', s1[:,p0:p1], im0[:,:,p0:p1])
 
-        de[k] += numpy.einsum('xij,ij->x', vhf1[1,:,p0:p1], oo0[p0:p1])
-        de[k] += numpy.einsum('xij,ij->x', vhf1[2,:,p0:p1], dmzvop[p0:p1,:]) * 2
-        de[k] += numpy.einsum('xij,ij->x', vhf1[3,:,p0:p1], dmzvom[p0:p1,:]) * 2
-        de[k] += numpy.einsum('xji,ij->x', vhf1[2,:,p0:p1], dmzvop[:,p0:p1]) * 2
-        de[k] -= numpy.einsum('xji,ij->x', vhf1[3,:,p0:p1], dmzvom[:,p0:p1]) * 2
+        de[:,k] += numpy.einsum('sxij,ij->sx', vhf1[0,:,:,p0:p1], oo0[p0:p1])
+        de[:,k] += numpy.einsum('sxij,sij->sx', vhf1[1,:,:,p0:p1], dmzvop[:,p0:p1,:]) * 2
+        de[:,k] += numpy.einsum('sxij,sij->sx', vhf1[2,:,:,p0:p1], dmzvom[:,p0:p1,:]) * 2
+        de[:,k] += numpy.einsum('sxji,sij->sx', vhf1[1,:,:,p0:p1], dmzvop[:,:,p0:p1]) * 2
+        de[:,k] -= numpy.einsum('sxji,sij->sx', vhf1[2,:,:,p0:p1], dmzvom[:,:,p0:p1]) * 2
 
     log.timer('TDHF nuclear gradients', *time0)
     return de
 
+def _mo2ao(c1, mats, c2):
+    '''c1 mats[i] c2^T for each matrix of the stack'''
+    return numpy.asarray([reduce(numpy.dot, (c1, x, c2.T)) for x in mats])
+
+def _ao2mo(c1, mats, c2):
+    '''c1^T mats[i] c2 for each matrix of the stack'''
+    return numpy.asarray([reduce(numpy.dot, (c1.T, x, c2)) for x in mats])
+
+def _sym(mats):
+    return mats + mats.transpose(0,2,1)
+
+def _asym(mats):
+    return mats - mats.transpose(0,2,1)
+
 
 class Gradients(rhf_grad.Gradients):
     def __init__(self, td):
@@ -169,6 +205,10 @@ class Gradients(rhf_grad.Gradients):
     def grad_elec(self, xy, singlet, atmlst=None):
         return kernel(self, xy, singlet, atmlst, self.max_memory, self.verbose)
 
+    def grad_elec_states(self, xys, singlet, atmlst=None):
+        return kernel_states(self, xys, singlet, atmlst, self.max_memory,
+                             self.verbose)
+
     def kernel(self, xy=None, state=0, singlet=None, atmlst=None):
         cput0 = (time.clock(), time.time())
         if xy is None: xy = self._td.xy[state]
@@ -187,6 +227,38 @@ class Gradients(rhf_grad.Gradients):
         logger.timer(self, 'TD gradients', *cput0)
         return self.de
 
+    def kernel_states(self, states=None, xys=None, singlet=None, atmlst=None):
+        '''Gradients of several excited states, computed together.
+
+        Kwargs:
+            states : list of int
+                The indices of the states in td.xy.  Default is all states.
+            xys : list of (X,Y)
+                If given, states is ignored.
+
+        Returns:
+            An array of shape (nstates,len(atmlst),3)
+        '''
+        cput0 = (time.clock(), time.time())
+        if xys is None:
+            if states is None: states = range(len(self._td.xy))
+            xys = [self._td.xy[i] for i in states]
+        if singlet is None: singlet = self._td.singlet
+        if atmlst is None: atmlst = range(self.mol.natm)
+        self.check_sanity()
+        de = self.grad_elec_states(xys, singlet, atmlst)
+        self.de = de = de + self.grad_nuc(atmlst=atmlst)
+
+        for i in range(len(xys)):
+            logger.note(self, '-------------- state %d', i)
+            logger.note(self, '           x                y                z')
+            for k, ia in enumerate(atmlst):
+                logger.note(self, '%d %s  %15.9f  %15.9f  %15.9f', ia,
+                            self.mol.atom_symbol(ia), de[i,k,0], de[i,k,1], de[i,k,2])
+        logger.note(self, '--------------')
+        logger.timer(self, 'TD gradients of %d states' % len(xys), *cput0)
+        return self.de
+
 
 if __name__ == '__main__':
     from pyscf import gto
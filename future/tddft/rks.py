@@ -9,7 +9,6 @@
 
 import time
 import copy
-from functools import reduce
 import numpy
 import pyscf.lib
 from pyscf.lib import logger
@@ -23,12 +22,7 @@ from pyscf.ao2mo import _ao2mo
 #
 USE_XCFUN = True
 
-# dmvo = (X+Y) in AO representation
-def _contract_xc_kernel(td, xc_code, dmvo, singlet=True, max_memory=2000):
-    mf = td._scf
-    mol = td.mol
-    grids = mf.grids
-
+def _gen_numint(mf, xc_code):
     if USE_XCFUN:
         ni = copy.copy(mf._numint)
         try:
@@ -40,85 +34,147 @@ def _contract_xc_kernel(td, xc_code, dmvo, singlet=True, max_memory=2000):
     else:
         ni = mf._numint
         xctype = ni._xc_type(xc_code)
+    return ni, xctype
+
+def _spin_adapted_kernel(td, xc_code, singlet=True, max_memory=2000):
+    '''Ground state density and the spin-adapted XC kernel on all grids.
+
+    Returns:
+        ni, xctype, rho0, fxc.  rho0 is the alpha density (and its gradients
+        for GGA).  fxc is the singlet or triplet kernel frho for LDA, and
+        (frho, fgamma, fgg, frhogamma) for GGA.
+    '''
+    mf = td._scf
+    ni, xctype = _gen_numint(mf, xc_code)
+    if xctype not in ('LDA', 'GGA'):
+        raise NotImplementedError('meta-GGA')
 
     mo_coeff = mf.mo_coeff
-    mo_occ = mf.mo_occ
-    nao, nmo = mo_coeff.shape
-    ndm = len(dmvo)
+    mo_occ = mf.mo_occ * .5
+    # Spin-unrestricted kernel of the closed shell density, from which the
+    # singlet and triplet combinations are formed
+    rho, vxc, fxc = ni.cache_xc_kernel(td.mol, mf.grids, xc_code,
+                                       (mo_coeff,mo_coeff), (mo_occ,mo_occ),
+                                       1, max_memory)
+    rho = rho[0]
 
-    dmvo = numpy.asarray(dmvo)
-    dmvo = (dmvo + dmvo.transpose(0,2,1)) * .5
-    v1ao = numpy.zeros((ndm,nao,nao))
     if xctype == 'LDA':
-        ao_deriv = 0
-        for ao, mask, weight, coords \
-                in ni.block_loop(mol, grids, nao, ao_deriv, max_memory, ni.non0tab):
-            rho = ni.eval_rho2(mol, ao, mo_coeff, mo_occ, mask, 'LDA')
-            rho *= .5  # alpha density
-            fxc = ni.eval_xc(xc_code, (rho,rho), 1, deriv=2)[2]
-            u_u, u_d, d_d = v2rho2 = fxc[0].T
-            if singlet:
-                frho = u_u + u_d
-            else:
-                frho = u_u - u_d
+        u_u, u_d, d_d = fxc[0].T
+        if singlet:
+            frho = u_u + u_d
+        else:
+            frho = u_u - u_d
+        return ni, xctype, rho, frho
+
+    vsigma = vxc[1].T
+    u_u, u_d, d_d = fxc[0].T  # v2rho2
+    u_uu, u_ud, u_dd, d_uu, d_ud, d_dd = fxc[1].T  # v2rhosigma
+    uu_uu, uu_ud, uu_dd, ud_ud, ud_dd, dd_dd = fxc[2].T  # v2sigma2
+    if singlet:
+        fgamma = 2*vsigma[0] + vsigma[1]
+        frho = u_u + u_d
+        fgg = uu_uu + .5*ud_ud + 2*uu_ud + uu_dd
+        frhogamma = u_uu + u_dd + u_ud
+    else:
+        fgamma = 2*vsigma[0] - vsigma[1]
+        frho = u_u - u_d
+        fgg = uu_uu - uu_dd
+        frhogamma = u_uu - u_dd
+    return ni, xctype, rho, (frho, fgamma, fgg, frhogamma)
+
+def _get_xc_kernel(td, xc_code, singlet, max_memory):
+    '''The XC kernel is cached on td and reused by all Davidson iterations
+    until the functional, the spin symmetry, the grids or the SCF orbitals
+    change.'''
+    mo_coeff = td._scf.mo_coeff
+    grids = td._scf.grids
+    key = (xc_code, singlet, USE_XCFUN)
+    cache = getattr(td, '_xc_kernel', None)
+    if (cache is None or cache[0] != key or cache[1] is not mo_coeff or
+        cache[2] is not grids.coords or cache[3] is not grids.weights):
+        log = logger.Logger(td.stdout, td.verbose)
+        t0 = (time.clock(), time.time())
+        cache = (key, mo_coeff, grids.coords, grids.weights,
+                 _spin_adapted_kernel(td, xc_code, singlet, max_memory))
+        td._xc_kernel = cache
+        log.timer_debug1('cache XC kernel', *t0)
+    return cache[4]
 
-            for i, dm in enumerate(dmvo):
-                rho1 = ni.eval_rho(mol, ao, dm, mask, xctype)
-                aow = numpy.einsum('pi,p->pi', ao, weight*frho*rho1)
-                v1ao[i] += numint._dot_ao_ao(mol, aow, ao, nao, weight.size, mask)
-                rho1 = aow = None
+# dmvo = (X+Y) in AO representation
+def _contract_xc_kernel(td, xc_code, dmvo, singlet=True, max_memory=2000):
+    '''Contract the XC kernel with a stack of density matrices.  All
+    matrices share one AO evaluation per grid block, and their densities and
+    potentials are computed with one matrix multiplication per block.
+    '''
+    mf = td._scf
+    mol = td.mol
+    grids = mf.grids
+    ni, xctype, rho0, fxc = _get_xc_kernel(td, xc_code, singlet, max_memory)
 
-        for i in range(ndm):
-            v1ao[i] = (v1ao[i] + v1ao[i].T) * .5
+    nao = mf.mo_coeff.shape[0]
+    dmvo = numpy.asarray(dmvo).reshape(-1,nao,nao)
+    ndm = len(dmvo)
+    dmvo = (dmvo + dmvo.transpose(0,2,1)) * .5
+    # (nao,ndm*nao) so that AO values are contracted with all matrices at once
+    dms = numpy.asarray(dmvo.transpose(1,0,2).reshape(nao,ndm*nao), order='C')
+    v1ao = numpy.zeros((nao,ndm,nao))
+
+    ngrids = grids.weights.size
+    comp = (1, 4)[xctype == 'GGA']
+    blksize = int(max_memory*1e6/8/(nao*(comp*2+ndm*2)))
+    blksize = max(numint.BLKSIZE, blksize//numint.BLKSIZE*numint.BLKSIZE)
+    blksize = min(blksize, ngrids)
+    ip0 = 0
+    if xctype == 'LDA':
+        for ao, mask, weight, coords \
+                in ni.block_loop(mol, grids, nao, 0, max_memory, ni.non0tab,
+                                 blksize=blksize):
+            ngrid = weight.size
+            ip1 = ip0 + ngrid
+            c0 = numint._dot_ao_dm(mol, ao, dms, nao, ngrid, mask)
+            rho1 = numpy.einsum('pzi,pi->zp', c0.reshape(ngrid,ndm,nao), ao)
+            wv = rho1 * (weight * fxc[ip0:ip1])
+            aow = numpy.einsum('zp,pi->zpi', wv, ao)
+            for i in range(ndm):
+                v1ao[:,i] += numint._dot_ao_ao(mol, ao, aow[i], nao, ngrid, mask)
+            c0 = rho1 = aow = None
+            ip0 = ip1
 
     elif xctype == 'GGA':
-        ao_deriv = 1
+        frho, fgamma, fgg, frhogamma = fxc
         for ao, mask, weight, coords \
-                in ni.block_loop(mol, grids, nao, ao_deriv, max_memory, ni.non0tab):
-            rho = ni.eval_rho2(mol, ao, mo_coeff, mo_occ, mask, 'GGA')
-            rho *= .5  # alpha density
-            vxc, fxc = ni.eval_xc(xc_code, (rho,rho), 1, deriv=2)[1:3]
-
-            vsigma = vxc[1].T
-            u_u, u_d, d_d = fxc[0].T  # v2rho2
-            u_uu, u_ud, u_dd, d_uu, d_ud, d_dd = fxc[1].T  # v2rhosigma
-            uu_uu, uu_ud, uu_dd, ud_ud, ud_dd, dd_dd = fxc[2].T  # v2sigma2
-            if singlet:
-                fgamma = 2*vsigma[0] + vsigma[1]
-                frho = u_u + u_d
-                fgg = uu_uu + .5*ud_ud + 2*uu_ud + uu_dd
-                frhogamma = u_uu + u_dd + u_ud
-            else:
-                fgamma = 2*vsigma[0] - vsigma[1]
-                frho = u_u - u_d
-                fgg = uu_uu - uu_dd
-                frhogamma = u_uu - u_dd
-
+                in ni.block_loop(mol, grids, nao, 1, max_memory, ni.non0tab,
+                                 blksize=blksize):
             ngrid = weight.size
-            wv = numpy.empty((4,ngrid))
-            for i, dm in enumerate(dmvo):
-                # rho1[0 ] = |b><j| z_{bj}
-                # rho1[1:] = \nabla(|b><j|) z_{bj}
-                rho1 = ni.eval_rho(mol, ao, dm, mask, 'GGA')
-                # sigma1 = \nabla(\rho_\alpha+\rho_\beta) dot \nabla(|b><j|) z_{bj}
-                # *2 for alpha + beta
-                sigma1 = numpy.einsum('xi,xi->i', rho[1:], rho1[1:]) * 2
-
-                wv[0 ]  = frho * rho1[0]
-                wv[0 ] += frhogamma * sigma1
-                wv[1:]  = (fgg * sigma1 + frhogamma * rho1[0]) * rho[1:]
-                wv[1:] *= 2  # because \nabla\rho = \nabla(\rho_\alpha+\rho_\beta)
-                wv[1:] += fgamma * rho1[1:]
-                wv[1:] *= 2  # because +h.c for (\nabla\mu) \nu, which are symmetrized at the end
-                wv *= weight
-                aow = numpy.einsum('nip,ni->ip', ao, wv)
-                v1ao[i] += numint._dot_ao_ao(mol, ao[0], aow, nao, ngrid, mask)
-
-        for i in range(ndm):
-            v1ao[i] = (v1ao[i] + v1ao[i].T) * .5
+            ip1 = ip0 + ngrid
+            rho = rho0[:,ip0:ip1]
+            c0 = pyscf.lib.dot(ao[0], dms).reshape(ngrid,ndm,nao)
+            # rho1[:,0 ] = |b><j| z_{bj}
+            # rho1[:,1:] = \nabla(|b><j|) z_{bj}
+            rho1 = numpy.einsum('pzi,xpi->zxp', c0, ao[:4])
+            rho1[:,1:] *= 2
+            # sigma1 = \nabla(\rho_\alpha+\rho_\beta) dot \nabla(|b><j|) z_{bj}
+            # *2 for alpha + beta
+            sigma1 = numpy.einsum('xp,zxp->zp', rho[1:], rho1[:,1:]) * 2
+
+            wv = numpy.empty((ndm,4,ngrid))
+            wv[:,0 ]  = frho[ip0:ip1] * rho1[:,0]
+            wv[:,0 ] += frhogamma[ip0:ip1] * sigma1
+            wv[:,1:]  = (fgg[ip0:ip1] * sigma1 +
+                         frhogamma[ip0:ip1] * rho1[:,0])[:,None] * rho[1:]
+            wv[:,1:] *= 2  # because \nabla\rho = \nabla(\rho_\alpha+\rho_\beta)
+            wv[:,1:] += fgamma[ip0:ip1] * rho1[:,1:]
+            wv[:,1:] *= 2  # because +h.c for (\nabla\mu) \nu, which are symmetrized at the end
+            wv *= weight
+            aow = numpy.einsum('npi,znp->pzi', ao[:4], wv).reshape(ngrid,-1)
+            v1ao += pyscf.lib.dot(ao[0].T, aow).reshape(nao,ndm,nao)
+            c0 = rho1 = sigma1 = wv = aow = None
+            ip0 = ip1
     else:
         raise NotImplementedError('meta-GGA')
 
+    v1ao = v1ao.transpose(1,0,2)
+    v1ao = (v1ao + v1ao.transpose(0,2,1)) * .5
     return v1ao
 
 
@@ -135,9 +191,7 @@ class TDA(rhf.TDA):
         orbv = mo_coeff[:,nocc:]
         orbo = mo_coeff[:,:nocc]
         nz = len(zs)
-        dmvo = numpy.empty((nz,nao,nao))
-        for i, z in enumerate(zs):
-            dmvo[i] = reduce(numpy.dot, (orbv, z.reshape(nvir,nocc), orbo.T))
+        dmvo = rhf._vo2ao(orbv, zs, orbo)
 
         mem_now = pyscf.lib.current_memory()[0]
         max_memory = max(2000, self.max_memory*.9-mem_now)
@@ -145,22 +199,29 @@ class TDA(rhf.TDA):
                                    singlet=self.singlet, max_memory=max_memory)
 
         hyb = self._scf._numint.hybrid_coeff(self._scf.xc, spin=(mol.spin>0)+1)
-        if abs(hyb) > 1e-10:
-            vj, vk = self._scf.get_jk(self.mol, dmvo, hermi=0)
-            if self.singlet:
-                v1ao += vj * 2 - hyb * vk
-            else:
-                v1ao += -hyb * vk
+        if rhf._df_enabled(self._scf):
+            v1vo = _ao2mo.nr_e2(v1ao, mo_coeff, (nocc,nmo,0,nocc)).reshape(-1,nvir*nocc)
+            if abs(hyb) > 1e-10 or self.singlet:
+                vj, vk = rhf._df_get_jk_vo(self, zs, with_k=abs(hyb)>1e-10)
+                if self.singlet:
+                    v1vo += vj * 2
+                if vk is not None:
+                    v1vo -= hyb * vk
         else:
-            if self.singlet:
-                vj = self._scf.get_j(self.mol, dmvo, hermi=1)
-                v1ao += vj * 2
+            if abs(hyb) > 1e-10:
+                vj, vk = self._scf.get_jk(self.mol, dmvo, hermi=0)
+                if self.singlet:
+                    v1ao += vj * 2 - hyb * vk
+                else:
+                    v1ao += -hyb * vk
+            else:
+                if self.singlet:
+                    vj = self._scf.get_j(self.mol, dmvo, hermi=1)
+                    v1ao += vj * 2
 
-        v1vo = _ao2mo.nr_e2(v1ao, mo_coeff, (nocc,nmo,0,nocc)).reshape(-1,nvir*nocc)
+            v1vo = _ao2mo.nr_e2(v1ao, mo_coeff, (nocc,nmo,0,nocc)).reshape(-1,nvir*nocc)
         eai = pyscf.lib.direct_sum('a-i->ai', mo_energy[nocc:], mo_energy[:nocc])
-        eai = eai.ravel()
-        for i, z in enumerate(zs):
-            v1vo[i] += eai * z
+        v1vo += eai.ravel() * numpy.asarray(zs).reshape(nz,-1)
         return v1vo.reshape(nz,-1)
 
 
@@ -179,43 +240,52 @@ class TDDFT(rhf.TDHF):
         orbv = mo_coeff[:,nocc:]
         orbo = mo_coeff[:,:nocc]
         nz = len(xys)
+        xys = numpy.asarray(xys).reshape(nz,2,nvir,nocc)
+        dmx, dmy = rhf._vo2ao(orbv, xys.transpose(1,0,2,3), orbo).reshape(2,nz,nao,nao)
         dms = numpy.empty((nz*2,nao,nao))
-        for i in range(nz):
-            x, y = xys[i].reshape(2,nvir,nocc)
-            dmx = reduce(numpy.dot, (orbv, x, orbo.T))
-            dmy = reduce(numpy.dot, (orbv, y, orbo.T))
-            dms[i   ] = dmx + dmy.T  # AX + BY
-            dms[i+nz] = dms[i].T # = dmy + dmx.T  # AY + BX
+        dms[:nz] = dmx + dmy.transpose(0,2,1)  # AX + BY
+        dms[nz:] = dms[:nz].transpose(0,2,1)  # = dmy + dmx.T  # AY + BX
 
         hyb = self._scf._numint.hybrid_coeff(self._scf.xc, spin=(mol.spin>0)+1)
 
-        if abs(hyb) > 1e-10:
-            vj, vk = self._scf.get_jk(self.mol, dms, hermi=0)
-            if self.singlet:
-                veff = vj * 2 - hyb * vk
-            else:
-                veff = -hyb * vk
-        else:
-            if self.singlet:
-                vj = self._scf.get_j(self.mol, dms, hermi=1)
-                veff = vj * 2
-            else:
-                veff = numpy.zeros((nz*2,nao,nao))
-
         mem_now = pyscf.lib.current_memory()[0]
         max_memory = max(2000, self.max_memory*.9-mem_now)
         v1xc = _contract_xc_kernel(self, self._scf.xc, dms[:nz],
                                    singlet=self.singlet, max_memory=max_memory)
-        veff[:nz] += v1xc
-        veff[nz:] += v1xc
 
-        veff = _ao2mo.nr_e2(veff, mo_coeff, (nocc,nmo,0,nocc)).reshape(-1,nvir*nocc)
+        if rhf._df_enabled(self._scf):
+            v1xc = _ao2mo.nr_e2(v1xc, mo_coeff, (nocc,nmo,0,nocc)).reshape(-1,nvir*nocc)
+            veff = numpy.vstack((v1xc, v1xc))
+            if abs(hyb) > 1e-10 or self.singlet:
+                x, y = xys.transpose(1,0,2,3)
+                vj, vk = rhf._df_get_jk_vo(self, numpy.vstack((x,y)),
+                                           numpy.vstack((y,x)),
+                                           with_k=abs(hyb)>1e-10)
+                if self.singlet:
+                    veff += vj * 2
+                if vk is not None:
+                    veff -= hyb * vk
+        else:
+            if abs(hyb) > 1e-10:
+                vj, vk = self._scf.get_jk(self.mol, dms, hermi=0)
+                if self.singlet:
+                    veff = vj * 2 - hyb * vk
+                else:
+                    veff = -hyb * vk
+            else:
+                if self.singlet:
+                    vj = self._scf.get_j(self.mol, dms, hermi=1)
+                    veff = vj * 2
+                else:
+                    veff = numpy.zeros((nz*2,nao,nao))
+            veff[:nz] += v1xc
+            veff[nz:] += v1xc
+
+            veff = _ao2mo.nr_e2(veff, mo_coeff, (nocc,nmo,0,nocc)).reshape(-1,nvir*nocc)
         eai = pyscf.lib.direct_sum('a-i->ai', mo_energy[nocc:], mo_energy[:nocc])
         eai = eai.ravel()
-        for i, z in enumerate(xys):
-            x, y = z.reshape(2,-1)
-            veff[i   ] += eai * x  # AX
-            veff[i+nz] += eai * y  # AY
+        veff[:nz] += eai * xys[:,0].reshape(nz,-1)  # AX
+        veff[nz:] += eai * xys[:,1].reshape(nz,-1)  # AY
         hx = numpy.hstack((veff[:nz], -veff[nz:]))
         return hx.reshape(nz,-1)
 
@@ -236,26 +306,30 @@ class TDDFTNoHybrid(TDA):
         dai = numpy.sqrt(eai).ravel()
 
         nz = len(zs)
-        dmvo = numpy.empty((nz,nao,nao))
-        for i, z in enumerate(zs):
-            dm = reduce(numpy.dot, (orbv, (dai*z).reshape(nvir,nocc), orbo.T))
-            dmvo[i] = dm + dm.T # +cc for A+B and K_{ai,jb} in A == K_{ai,bj} in B
+        zs = numpy.asarray(zs).reshape(nz,-1)
+        dmvo = rhf._vo2ao(orbv, dai*zs, orbo)
+        dmvo = dmvo + dmvo.transpose(0,2,1) # +cc for A+B and K_{ai,jb} in A == K_{ai,bj} in B
 
         mem_now = pyscf.lib.current_memory()[0]
         max_memory = max(2000, self.max_memory*.9-mem_now)
         v1ao = _contract_xc_kernel(self, self._scf.xc, dmvo,
                                    singlet=self.singlet, max_memory=max_memory)
 
-        if self.singlet:
-            vj = self._scf.get_j(mol, dmvo, hermi=1)
-            v1ao += vj * 2
+        if rhf._df_enabled(self._scf):
+            v1vo = _ao2mo.nr_e2(v1ao, mo_coeff, (nocc,nmo,0,nocc)).reshape(-1,nvir*nocc)
+            if self.singlet:
+                z = dai * zs
+                v1vo += rhf._df_get_jk_vo(self, z, z, with_k=False)[0] * 2
+        else:
+            if self.singlet:
+                vj = self._scf.get_j(mol, dmvo, hermi=1)
+                v1ao += vj * 2
 
-        v1vo = _ao2mo.nr_e2(v1ao, mo_coeff, (nocc,nmo,0,nocc)).reshape(-1,nvir*nocc)
+            v1vo = _ao2mo.nr_e2(v1ao, mo_coeff, (nocc,nmo,0,nocc)).reshape(-1,nvir*nocc)
         edai = eai.ravel() * dai
-        for i, z in enumerate(zs):
-            # numpy.sqrt(eai) * (eai*dai*z + v1vo)
-            v1vo[i] += edai*z
-            v1vo[i] *= dai
+        # numpy.sqrt(eai) * (eai*dai*z + v1vo)
+        v1vo += edai*zs
+        v1vo *= dai
         return v1vo.reshape(nz,-1)
 
     def kernel(self, x0=None):
@@ -3,6 +3,7 @@
 # Author: Qiming Sun <osirpt.sun@gmail.com>
 #
 import unittest
+import copy
 import numpy
 from pyscf import gto, scf, dft
 from pyscf.tddft import rks
@@ -111,6 +112,43 @@ class KnowValues(unittest.TestCase):
         es = td.kernel()[0] * 27.2114
         self.assertAlmostEqual(finger(es), -41.201828219760415, 7)
 
+    def test_batch_vind(self):
+        mf = dft.RKS(mol)
+        mf.xc = 'b88,p86'
+        mf.grids.prune = None
+        mf.scf()
+        td = rks.TDDFT(mf)
+        nocc = numpy.count_nonzero(mf.mo_occ > 0)
+        nov = nocc * (mf.mo_coeff.shape[1] - nocc)
+        numpy.random.seed(1)
+        xys = numpy.random.random((4,nov*2))
+        ax = td.get_vind(xys)
+        kernel = td._xc_kernel
+        for i in range(4):
+            self.assertAlmostEqual(abs(td.get_vind(xys[i:i+1])[0]-ax[i]).max(), 0, 9)
+        self.assertTrue(td._xc_kernel is kernel)
+
+    def test_df_vind(self):
+        from pyscf.tddft import rhf
+        mf = scf.density_fit(dft.RKS(mol))
+        mf.xc = 'b3lyp'
+        mf.grids.prune = None
+        mf.scf()
+        # reference: the same DF integrals through AO J/K builds
+        mf1 = copy.copy(mf)
+        mf1.with_df = None
+        mf1.get_jk = lambda mol, dm, hermi=1: mf.with_df.get_jk(dm, hermi)
+        mf1.get_j = lambda mol, dm, hermi=1: mf.with_df.get_jk(dm, hermi, with_k=False)[0]
+        nocc = numpy.count_nonzero(mf.mo_occ > 0)
+        nov = nocc * (mf.mo_coeff.shape[1] - nocc)
+        xys = numpy.random.random((3,nov*2))
+        for td, td1 in ((rks.TDDFT(mf), rks.TDDFT(mf1)),
+                        (rhf.TDHF(mf), rhf.TDHF(mf1))):
+            self.assertAlmostEqual(abs(td.get_vind(xys)-td1.get_vind(xys)).max(), 0, 8)
+        td, td1 = rks.TDA(mf), rks.TDA(mf1)
+        td.singlet = td1.singlet = False
+        self.assertAlmostEqual(abs(td.get_vind(xys[:,:nov])-td1.get_vind(xys[:,:nov])).max(), 0, 8)
+
 #NOTE b3lyp by libxc is quite different to b3lyp from xcfun
     def test_tddft_b3lyp_xcfun(self):
         dft.numint._NumInt.libxc = dft.xcfun
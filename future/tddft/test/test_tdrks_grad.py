@@ -63,6 +63,62 @@ class KnowValues(unittest.TestCase):
         g1 = tdg.kernel(state=2)
         self.assertAlmostEqual(g1[0,2], -1.55778110e-01, 8)
 
+    def test_multi_states(self):
+        mf = dft.RKS(mol)
+        mf.xc = 'b3lyp'
+        mf.grids.prune = False
+        mf.scf()
+        td = tddft.TDDFT(mf).run(nstates=3)
+        tdg = rks_grad.Gradients(td)
+        g1 = tdg.kernel_states([0,2])
+        self.assertEqual(g1.shape, (2,mol.natm,3))
+        self.assertAlmostEqual(g1[1,0,2], -1.55778110e-01, 7)
+        self.assertAlmostEqual(abs(g1[0]-tdg.kernel(state=0)).max(), 0, 7)
+
+        mf = dft.RKS(mol)
+        mf.xc = 'LDA'
+        mf.grids.prune = False
+        mf.scf()
+        td = tddft.TDA(mf).run(nstates=3)
+        tdg = rks_grad.Gradients(td)
+        g1 = tdg.kernel_states()
+        self.assertAlmostEqual(g1[2,0,2], -9.23916667e-02, 7)
+        self.assertAlmostEqual(abs(g1[1]-tdg.kernel(state=1)).max(), 0, 7)
+
+    def test_block_zvector(self):
+        from pyscf.scf import cphf
+        from pyscf.tddft import rks
+        from pyscf.tddft.rhf_grad import _mo2ao, _ao2mo, _sym
+        mf = dft.RKS(mol)
+        mf.xc = 'LDA'
+        mf.grids.prune = False
+        mf.scf()
+        td = tddft.TDA(mf)
+        mo_coeff = mf.mo_coeff
+        mo_energy = mf.mo_energy
+        mo_occ = mf.mo_occ
+        nocc = numpy.count_nonzero(mo_occ > 0)
+        nvir = mo_coeff.shape[1] - nocc
+        orbo = mo_coeff[:,:nocc]
+        orbv = mo_coeff[:,nocc:]
+        def fvind(x):
+            dm = _sym(_mo2ao(orbv, x.reshape(-1,nvir,nocc), orbo))
+            vindxc = rks._contract_xc_kernel(td, mf.xc, dm, True)
+            veff = mf.get_j(mol, dm) * 2 + vindxc
+            return _ao2mo(orbv, veff, orbo).ravel()
+        numpy.random.seed(1)
+        wvo = numpy.random.random((3,nvir,nocc))
+        wvo[2] *= 1e-3
+        z1 = cphf.solve(fvind, mo_energy, mo_occ, wvo, max_cycle=30,
+                        tol=1e-8, block=True)[0]
+        e_ai = mo_energy[nocc:,None] - mo_energy[:nocc]
+        r = z1*e_ai + fvind(z1).reshape(-1,nvir,nocc) + wvo
+        for i in range(3):
+            self.assertAlmostEqual(abs(r[i]).max(), 0, 6)
+            z = cphf.solve(fvind, mo_energy, mo_occ, wvo[i:i+1], max_cycle=30,
+                           tol=1e-8)[0]
+            self.assertAlmostEqual(abs(z[0]-z1[i]).max(), 0, 7)
+
 
 if __name__ == "__main__":
     print("Full Tests for TD-RKS gradients")
@@ -18,9 +18,11 @@ import pyscf.grad.rhf
 import pyscf.grad.dhf
 import pyscf.grad.rks
 import pyscf.grad.ccsd
+import pyscf.grad.dfmp2
 from pyscf.grad.rhf  import Gradients as RHF
 from pyscf.grad.dhf  import Gradients as DHF
 from pyscf.grad.rks  import Gradients as RKS
 #from pyscf.grad.ccsd import Gradients as CCSD
+from pyscf.grad.dfmp2 import Gradients as DFMP2
 
 from pyscf.grad.rhf import grad_nuc
@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+'''
+Analytical nuclear gradients of density fitting MP2 (RHF reference)
+
+(ia|jb) = \sum_PQ (ia|P) (V^{-1})_{PQ} (Q|jb).  The amplitudes are generated
+for batches of occupied orbitals and contracted immediately to the one-particle
+density P_ij, P_ab and the 3-center two-particle density
+
+    Gamma_{ia,P} = \sum_jbQ theta_{iajb} (V^{-1})_{PQ} (Q|jb)
+    theta_{iajb} = (ps+pt) t_{iajb} - pt t_{ibja}
+
+so that no intermediate is larger than O(N^3).  The orbital response is
+solved with the Z-vector (scf.cphf).  The SCF reference is the conventional
+(4-center) RHF.
+
+Ref: F. Weigend and M. Haser, Theor. Chem. Acc. 97, 331 (1997)
+'''
+
+import time
+from functools import reduce
+import numpy
+import scipy.linalg
+from pyscf import lib
+from pyscf.lib import logger
+from pyscf import df
+from pyscf.df import _ri
+from pyscf.scf import cphf
+from pyscf.grad import rhf as rhf_grad
+
+
+def kernel(mp, mo_energy=None, mo_coeff=None, mo_occ=None, atmlst=None,
+           mf_grad=None, verbose=None):
+    '''DF-MP2 nuclear gradients (the HF part included)'''
+    if mo_energy is None: mo_energy = mp._scf.mo_energy
+    if mo_coeff is None: mo_coeff = mp._scf.mo_coeff
+    if mo_occ is None: mo_occ = mp._scf.mo_occ
+    if mf_grad is None:
+        mf_grad = rhf_grad.Gradients(mp._scf)
+    if verbose is None:
+        verbose = mp.verbose
+    if isinstance(verbose, logger.Logger):
+        log = verbose
+    else:
+        log = logger.Logger(mp.stdout, verbose)
+    if getattr(mp._scf, 'with_df', None) is not None:
+        raise NotImplementedError('DF-MP2 gradients for density fitting SCF')
+    if mp.laplace_points > 0:
+        raise NotImplementedError('Laplace transformed MP2 gradients')
+
+    time0 = (time.clock(), time.time())
+    mol = mp.mol
+    nocc = int(numpy.count_nonzero(mo_occ > 0))
+    Lov = mp.ao2mo(mo_coeff, nocc)
+    naux = Lov.shape[1]
+    # L_{P,ia} as a (naux,nocc*nvir) matrix
+    Lov = numpy.asarray(Lov.transpose(1,0,2).reshape(naux,-1), order='C')
+    time1 = log.timer('Integral transformation (P|ia)', *time0)
+
+    emp2, doo, dvv, gamma = make_rdm1_gamma(mp, Lov, mo_energy, nocc, log)
+    mp.emp2 = emp2
+    log.info('DF-MP2 energy = %.15g', emp2)
+    time1 = log.timer('DF-MP2 density intermediates', *time1)
+
+    auxmol = df.incore.format_aux_basis(mol, mp.auxbasis)
+    dm1ao, im1, gamma3c, gamma2c = \
+            response_dms(mp, mo_energy, mo_coeff, mo_occ, doo, dvv, gamma,
+                         Lov, auxmol, log)
+    Lov = gamma = None
+    time1 = log.timer('DF-MP2 response', *time1)
+
+    de = grad_elec(mf_grad, auxmol, dm1ao, im1, gamma3c, gamma2c,
+                   mo_energy, mo_coeff, mo_occ, atmlst, log)
+    de += mf_grad.grad_nuc(mol, atmlst)
+    log.timer('DF-MP2 gradients', *time0)
+    return de
+
+def make_rdm1_gamma(mp, Lov, mo_energy, nocc, verbose=None):
+    '''The MP2 energy, the occupied and virtual blocks of the (unrelaxed)
+    one-particle density matrix and the 3-center two-particle density
+    \sum_jb theta_{iajb} L_{P,jb} in the Cholesky basis.  The amplitudes are
+    generated for batches of occupied orbitals.
+    '''
+    if isinstance(verbose, logger.Logger):
+        log = verbose
+    else:
+        log = logger.Logger(mp.stdout, verbose)
+    naux = Lov.shape[0]
+    nvir = Lov.shape[1] // nocc
+    eia = lib.direct_sum('i-a->ia', mo_energy[:nocc], mo_energy[nocc:nocc+nvir])
+    ps = mp.ps
+    pt = mp.pt
+
+    max_memory = max(0, mp.max_memory - lib.current_memory()[0])
+    # g, t2, theta and their transposed copies
+    blksize = int(max_memory*.8e6/8 / (nocc*nvir**2*5))
+    blksize = max(1, min(nocc, blksize))
+    log.debug('DF-MP2 gradients occupied block size %d', blksize)
+
+    emp2 = 0
+    doo = numpy.zeros((nocc,nocc))
+    dvv = numpy.zeros((nvir,nvir))
+    gamma = numpy.empty((naux,nocc*nvir))
+    for i0, i1 in lib.prange(0, nocc, blksize):
+        ni = i1 - i0
+        gi = lib.dot(_cp(Lov[:,i0*nvir:i1*nvir]).T, Lov)
+        gi = gi.reshape(ni,nvir,nocc,nvir)
+        t2i = gi / lib.direct_sum('ia+jb->iajb', eia[i0:i1], eia)
+        theta = t2i * (ps+pt) - t2i.transpose(0,3,2,1) * pt
+        emp2 += numpy.einsum('iajb,iajb', theta, gi)
+        gi = None
+        gamma[:,i0*nvir:i1*nvir] = lib.dot(Lov, theta.reshape(ni*nvir,-1).T)
+        #:doo -= numpy.einsum('kbia,kbja->ij', t2i, theta) * 2
+        #:dvv += numpy.einsum('iajc,ibjc->ab', t2i, theta) * 2
+        lib.dot(_cp(t2i.transpose(2,0,1,3)).reshape(nocc,-1),
+                _cp(theta.transpose(2,0,1,3)).reshape(nocc,-1).T, -2, doo, 1)
+        lib.dot(_cp(t2i.transpose(1,0,2,3)).reshape(nvir,-1),
+                _cp(theta.transpose(1,0,2,3)).reshape(nvir,-1).T, 2, dvv, 1)
+        t2i = theta = None
+    return emp2, doo, dvv, gamma
+
+def response_dms(mp, mo_energy, mo_coeff, mo_occ, doo, dvv, gamma, Lov,
+                 auxmol, verbose=None):
+    '''The relaxed one-particle density matrix, the energy-weighted density
+    matrix, and the 3-center and 2-center two-particle densities in AO basis.
+
+    Returns:
+        dm1ao : (nao,nao) relaxed MP2 density matrix (HF part excluded)
+        im1 : (nao,nao) energy-weighted density matrix (HF part excluded)
+        gamma3c : (naux,nao,nao) Gamma_{P,mu nu} + Gamma_{P,nu mu}, to be
+            contracted with (mu nu|P)^x
+        gamma2c : (naux,naux) to be contracted with -(P|Q)^x
+    '''
+    if isinstance(verbose, logger.Logger):
+        log = verbose
+    else:
+        log = logger.Logger(mp.stdout, verbose)
+    mol = mp.mol
+    mf = mp._scf
+    nocc = doo.shape[0]
+    nvir = dvv.shape[0]
+    nao, nmo = mo_coeff.shape
+    naux = Lov.shape[0]
+    orbo = numpy.asarray(mo_coeff[:,:nocc], order='C')
+    orbv = numpy.asarray(mo_coeff[:,nocc:], order='C')
+
+    # (V^{-1})_{PQ} (Q|ia) = L^{-T} L_{P,ia},  V = L L^T
+    j2c = df.incore.fill_2c2e(mol, auxmol)
+    low = scipy.linalg.cholesky(j2c, lower=True)
+    j2c = None
+    gamma = scipy.linalg.solve_triangular(low.T, gamma, lower=False)
+    cLov = scipy.linalg.solve_triangular(low.T, Lov, lower=False)
+    gamma2c = lib.dot(cLov, gamma.T) * 2
+    cLov = None
+
+    # Orbital gradients of the 2-electron part
+    #   R_{pi} = 4 \sum_aP (pa|P) Gamma_{ia,P}
+    #   R_{pa} = 4 \sum_iP (pi|P) Gamma_{ia,P}
+    j3c = df.incore.aux_e2(mol, auxmol, intor='cint3c2e_sph', aosym='s2ij')
+    rao_o = numpy.zeros((nao,nocc))
+    rao_v = numpy.zeros((nao,nvir))
+    gamma3c = numpy.empty((naux,nao,nao))
+    max_memory = max(0, mp.max_memory - lib.current_memory()[0])
+    blksize = int(max_memory*.5e6/8 / (nao**2*4))
+    blksize = max(1, min(naux, blksize))
+    for p0, p1 in lib.prange(0, naux, blksize):
+        nblk = p1 - p0
+        eri1 = lib.unpack_tril(_cp(j3c[:,p0:p1].T))
+        eri1 = _cp(eri1.transpose(1,0,2)).reshape(nao,-1)
+        gbuf = gamma[p0:p1].reshape(-1,nvir)
+        # \sum_a C_{nu a} Gamma_{ia,P} -> [P,nu,i]
+        gv = _cp(lib.dot(gbuf, orbv.T).reshape(nblk,nocc,nao).transpose(0,2,1))
+        # \sum_i C_{nu i} Gamma_{ia,P} -> [P,nu,a]
+        go = lib.dot(orbo, _cp(gamma[p0:p1].reshape(nblk,nocc,nvir)
+                               .transpose(1,0,2)).reshape(nocc,-1))
+        go = _cp(go.reshape(nao,nblk,nvir).transpose(1,0,2))
+        lib.dot(eri1, gv.reshape(-1,nocc), 4, rao_o, 1)
+        lib.dot(eri1, go.reshape(-1,nvir), 4, rao_v, 1)
+        eri1 = go = None
+        # [P,nu,mu] = \sum_ia C_{mu i} Gamma_{ia,P} C_{nu a}
+        gao = lib.dot(gv.reshape(-1,nocc), orbo.T).reshape(nblk,nao,nao)
+        gamma3c[p0:p1] = gao + gao.transpose(0,2,1)
+        gv = gao = None
+    j3c = None
+    rmo = numpy.dot(mo_coeff.T, numpy.hstack((rao_o, rao_v)))
+    rao_o = rao_v = None
+
+    dm1 = numpy.zeros((nmo,nmo))
+    dm1[:nocc,:nocc] = doo
+    dm1[nocc:,nocc:] = dvv
+    dm1ao = reduce(numpy.dot, (mo_coeff, dm1, mo_coeff.T))
+    vhf = mf.get_veff(mol, dm1ao)
+    xvo = (rmo[nocc:,:nocc] - rmo[:nocc,nocc:].T
+           + reduce(numpy.dot, (orbv.T, vhf, orbo)) * 4)
+
+    # Z-vector
+    def fvind(x):
+        x = x.reshape(xvo.shape)
+        dm = reduce(numpy.dot, (orbv, x, orbo.T))
+        dm = (dm + dm.T) * 2
+        return reduce(numpy.dot, (orbv.T, mf.get_veff(mol, dm), orbo))
+    dvo = cphf.solve(fvind, mo_energy, mo_occ, xvo*.5, max_cycle=30,
+                     verbose=log)[0]
+    dm1[nocc:,:nocc] = dvo
+    dm1[:nocc,nocc:] = dvo.T
+    dm1ao = reduce(numpy.dot, (mo_coeff, dm1, mo_coeff.T))
+
+    # Energy-weighted density matrix
+    e_o = mo_energy[:nocc]
+    e_v = mo_energy[nocc:]
+    im1 = numpy.zeros((nmo,nmo))
+    im1[:nocc,:nocc] = (rmo[:nocc,:nocc] + rmo[:nocc,:nocc].T) * .25
+    im1[:nocc,:nocc] += doo * lib.direct_sum('i+j->ij', e_o, e_o) * .5
+    im1[:nocc,:nocc] += reduce(numpy.dot, (orbo.T, mf.get_veff(mol, dm1ao),
+                                           orbo)) * 2
+    im1[nocc:,nocc:] = (rmo[nocc:,nocc:] + rmo[nocc:,nocc:].T) * .25
+    im1[nocc:,nocc:] += dvv * lib.direct_sum('a+b->ab', e_v, e_v) * .5
+    im1[nocc:,:nocc] = rmo[:nocc,nocc:].T * .5 + dvo * e_o
+    im1[:nocc,nocc:] = im1[nocc:,:nocc].T
+    im1 = reduce(numpy.dot, (mo_coeff, im1, mo_coeff.T))
+    return dm1ao, im1, gamma3c, gamma2c
+
+def grad_elec(mf_grad, auxmol, dm1ao, im1, gamma3c, gamma2c,
+              mo_energy=None, mo_coeff=None, mo_occ=None, atmlst=None,
+              verbose=logger.INFO):
+    '''Contract the MP2 densities (and the HF densities) with the AO
+    derivative integrals'''
+    if isinstance(verbose, logger.Logger):
+        log = verbose
+    else:
+        log = logger.Logger(mf_grad.stdout, verbose)
+    mf = mf_grad._scf
+    mol = mf_grad.mol
+    if mo_energy is None: mo_energy = mf.mo_energy
+    if mo_occ is None:    mo_occ = mf.mo_occ
+    if mo_coeff is None:  mo_coeff = mf.mo_coeff
+    time1 = (time.clock(), time.time())
+
+    dm0 = mf.make_rdm1(mo_coeff, mo_occ)
+    dme0 = mf_grad.make_rdm1e(mo_energy, mo_coeff, mo_occ)
+    h1 = mf_grad.get_hcore(mol)
+    s1 = mf_grad.get_ovlp(mol)
+    vhf0 = mf_grad.get_veff(mol, dm0)
+    vhf1 = mf_grad.get_veff(mol, dm1ao)
+    time1 = log.timer('gradients of 1e and 4c-2e part', *time1)
+
+    atm, bas, env, ao_loc = df.incore._env_and_aoloc('cint3c2e_ip1_sph',
+                                                     mol, auxmol)
+    nao = mol.nao_nr()
+    naux = auxmol.nao_nr()
+    nbas = mol.nbas
+    int2c = auxmol.intor('cint2c2e_ip1_sph', comp=3)
+    aux_offset = auxmol.offset_nr_by_atom()
+
+    if atmlst is None:
+        atmlst = range(mol.natm)
+    offsetdic = mol.offset_nr_by_atom()
+    max_memory = max(0, mf_grad.max_memory - lib.current_memory()[0])
+    blksize = max(1, int(max_memory*.5e6/8 / (nao*naux*3)))
+    de = numpy.zeros((len(atmlst),3))
+    for k, ia in enumerate(atmlst):
+        shl0, shl1, p0, p1 = offsetdic[ia]
+        h1ao = mf_grad._grad_rinv(mol, ia)
+        h1ao[:,p0:p1] += h1[:,p0:p1]
+        de[k] += numpy.einsum('xij,ij->x', h1ao, dm0+dm1ao) * 2
+        de[k] += numpy.einsum('xij,ij->x', vhf0[:,p0:p1],
+                              dm0[p0:p1]+dm1ao[p0:p1]) * 2
+        de[k] += numpy.einsum('xij,ij->x', vhf1[:,p0:p1], dm0[p0:p1]) * 2
+        de[k] -= numpy.einsum('xij,ij->x', s1[:,p0:p1],
+                              dme0[p0:p1]+im1[p0:p1]) * 2
+
+# 3-center integrals (nabla mu nu|P), mu on atom ia
+        ip0 = p0
+        for b0, b1, nf in _shell_prange(mol, shl0, shl1, blksize):
+            shls_slice = (b0, b1, 0, nbas, nbas, nbas+auxmol.nbas)
+            eri1 = _ri.nr_auxe2('cint3c2e_ip1_sph', atm, bas, env, shls_slice,
+                                ao_loc, 's1', 3).reshape(3,nf,nao,naux)
+            de[k] -= numpy.einsum('xijp,pij->x', eri1,
+                                  gamma3c[:,ip0:ip0+nf]) * 4
+            eri1 = None
+            ip0 += nf
+
+# 3-center integrals (mu nu|nabla P) and 2-center integrals (nabla P|Q),
+# P on atom ia
+        ash0, ash1, q0, q1 = aux_offset[ia]
+        shls_slice = (0, nbas, 0, nbas, nbas+ash0, nbas+ash1)
+        eri1 = _ri.nr_auxe2('cint3c2e_ip2_sph', atm, bas, env, shls_slice,
+                            ao_loc, 's1', 3).reshape(3,nao,nao,q1-q0)
+        de[k] -= numpy.einsum('xijp,pij->x', eri1, gamma3c[q0:q1])
+        eri1 = None
+        de[k] += numpy.einsum('xpq,pq->x', int2c[:,q0:q1], gamma2c[q0:q1]) * 2
+        log.debug('grad of atom %d %s = %s', ia, mol.atom_symbol(ia), de[k])
+        time1 = log.timer_debug1('grad of atom %d'%ia, *time1)
+    return de
+
+def _shell_prange(mol, start, stop, blksize):
+    nao = 0
+    ib0 = start
+    for ib in range(start, stop):
+        now = (mol.bas_angular(ib)*2+1) * mol.bas_nctr(ib)
+        nao += now
+        if nao > blksize and nao > now:
+            yield (ib0, ib, nao-now)
+            ib0 = ib
+            nao = now
+    yield (ib0, stop, nao)
+
+def _cp(a):
+    return numpy.array(a, copy=False, order='C')
+
+
+class Gradients(lib.StreamObject):
+    '''Non-relativistic DF-MP2 gradients
+
+    Attributes:
+        max_memory : float or int
+            Allowed memory in MB.  Default is mp.max_memory
+
+    Examples:
+
+    >>> mol = gto.M(atom='O 0 0 0; H 0 -0.757 0.587; H 0 0.757 0.587', basis='ccpvdz')
+    >>> mf = scf.RHF(mol).run()
+    >>> pt = mp.dfmp2.MP2(mf)
+    >>> grad.dfmp2.Gradients(pt).kernel()
+    '''
+    def __init__(self, mp):
+        self.mp = mp
+        self.mol = mp.mol
+        self.stdout = mp.stdout
+        self.verbose = mp.verbose
+        self.max_memory = mp.max_memory
+
+        self.de = None
+        self._keys = set(self.__dict__.keys())
+
+    def dump_flags(self):
+        log = logger.Logger(self.stdout, self.verbose)
+        log.info('\n')
+        log.info('******** %s for %s ********',
+                 self.__class__, self.mp.__class__)
+        log.info('ps = %g  pt = %g', self.mp.ps, self.mp.pt)
+        log.info('max_memory %d MB (current use %d MB)',
+                 self.max_memory, lib.current_memory()[0])
+        return self
+
+    def kernel(self, mo_energy=None, mo_coeff=None, mo_occ=None, atmlst=None):
+        cput0 = (time.clock(), time.time())
+        if atmlst is None:
+            atmlst = range(self.mol.natm)
+        if self.verbose >= logger.INFO:
+            self.dump_flags()
+
+        mf_grad = rhf_grad.Gradients(self.mp._scf)
+        mf_grad.max_memory = self.max_memory
+        self.de = kernel(self.mp, mo_energy, mo_coeff, mo_occ, atmlst,
+                         mf_grad, self.verbose)
+        logger.note(self, '--------------')
+        logger.note(self, '           x                y                z')
+        for k, ia in enumerate(atmlst):
+            logger.note(self, '%d %s  %15.9f  %15.9f  %15.9f', ia,
+                        self.mol.atom_symbol(ia),
+                        self.de[k,0], self.de[k,1], self.de[k,2])
+        logger.note(self, '--------------')
+        logger.timer(self, 'DF-MP2 gradients', *cput0)
+        return self.de
+
+
+if __name__ == '__main__':
+    from pyscf import gto
+    from pyscf import scf
+    from pyscf.mp import dfmp2
+    mol = gto.M(
+        atom = [
+            ['O' , (0. , 0.     , 0.)],
+            [1   , (0. ,-0.757  , 0.587)],
+            [1   , (0. , 0.757  , 0.587)]],
+        basis = '631g',
+        verbose = 0)
+    mf = scf.RHF(mol)
+    mf.conv_tol = 1e-14
+    mf.scf()
+    pt = dfmp2.MP2(mf)
+    g1 = Gradients(pt).kernel()
+    print(g1)
+
+    # finite difference
+    def emp2(z):
+        mol1 = gto.M(atom=[['O', (0., 0., z)],
+                           [1  , (0.,-0.757, 0.587)],
+                           [1  , (0., 0.757, 0.587)]], basis='631g', verbose=0)
+        mf1 = scf.RHF(mol1)
+        mf1.conv_tol = 1e-14
+        e = mf1.scf()
+        return e + dfmp2.MP2(mf1).kernel()[0]
+    print((emp2(1e-4) - emp2(-1e-4)) / 2e-4 * 0.52917721092 - g1[0,2])
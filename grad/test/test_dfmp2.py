@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+import unittest
+from pyscf import gto
+from pyscf import scf
+from pyscf import grad
+from pyscf.mp import dfmp2
+
+def make_mol(z=0):
+    mol = gto.Mole()
+    mol.verbose = 0
+    mol.output = None
+    mol.atom = [
+        [8 , (0. , 0.     , z)],
+        [1 , (0. , -0.757 , 0.587)],
+        [1 , (0. , 0.757  , 0.587)]]
+    mol.basis = '631g'
+    mol.build()
+    return mol
+
+def run_mp2(mol, method=dfmp2.MP2):
+    mf = scf.RHF(mol)
+    mf.conv_tol = 1e-14
+    mf.scf()
+    pt = method(mf)
+    pt.kernel()
+    return mf, pt
+
+mol = make_mol()
+mf, pt = run_mp2(mol)
+
+def finite_diff(method):
+    e = []
+    for z in (1e-4, -1e-4):
+        mf1, pt1 = run_mp2(make_mol(z), method)
+        e.append(mf1.e_tot + pt1.emp2)
+    return (e[0] - e[1]) / 2e-4 * 0.52917721092
+
+
+class KnowValues(unittest.TestCase):
+    def test_dfmp2_grad(self):
+        g1 = grad.DFMP2(pt).kernel()
+        self.assertAlmostEqual(abs(g1.sum(axis=0)).max(), 0, 6)
+        self.assertAlmostEqual(g1[0,2], finite_diff(dfmp2.MP2), 6)
+
+    def test_scsmp2_grad(self):
+        mf1, pt1 = run_mp2(mol, dfmp2.SCSMP2)
+        g1 = grad.DFMP2(pt1).kernel()
+        self.assertAlmostEqual(g1[0,2], finite_diff(dfmp2.SCSMP2), 6)
+
+    def test_sosmp2_laplace(self):
+        mf1, pt1 = run_mp2(mol, dfmp2.SOSMP2)
+        self.assertRaises(NotImplementedError, grad.DFMP2(pt1).kernel)
+
+
+if __name__ == "__main__":
+    print("Full Tests for DF-MP2 gradients")
+    unittest.main()
@@ -28,6 +28,48 @@ class KnowValues(unittest.TestCase):
         self.assertAlmostEqual(finger(g.grad_elec()), 7.9210392362911595, 7)
         self.assertAlmostEqual(finger(g.grad()), 0.367743084803, 7)
 
+    def test_nr_rhf_nproc_atmlst(self):
+        rhf = scf.RHF(mol)
+        rhf.conv_tol = 1e-14
+        rhf.scf()
+        g = grad.RHF(rhf)
+        ref = g.grad()
+        g.nproc = 2
+        self.assertAlmostEqual(abs(g.grad()-ref).max(), 0, 9)
+        self.assertAlmostEqual(abs(g.grad(atmlst=[1])-ref[1]).max(), 0, 9)
+        dm = rhf.make_rdm1()
+        rhf.direct_scf = False
+        vj, vk = g.get_jk(mol, dm)
+        rhf.direct_scf = True
+        vj1, vk1 = g.get_jk(mol, dm)
+        self.assertAlmostEqual(abs(vj1-vj).max(), 0, 9)
+        self.assertAlmostEqual(abs(vk1-vk).max(), 0, 9)
+
+    def test_df_rhf(self):
+        mf = scf.density_fit(scf.RHF(mol))
+        mf.conv_tol = 1e-14
+        mf.scf()
+        g = grad.RHF(mf).grad()
+        def df_energy(dz):
+            mol1 = mol.copy()
+            coords = mol.atom_coords()
+            coords[0,2] += dz
+            mol1.set_geom_(coords, unit='Bohr')
+            mf1 = scf.density_fit(scf.RHF(mol1))
+            mf1.conv_tol = 1e-14
+            return mf1.kernel()
+        e1 = df_energy(1e-4)
+        e2 = df_energy(-1e-4)
+        self.assertAlmostEqual(g[0,2], (e1-e2)/2e-4, 6)
+
+        # Without with_df=True, get_jk of a DF SCF object is exact, e.g. for
+        # the TDDFT gradients which do not have the auxiliary basis terms
+        dm = mf.make_rdm1()
+        vj, vk = grad.RHF(mf).get_jk(mol, dm)
+        vjref, vkref = grad.RHF(scf.RHF(mol)).get_jk(mol, dm)
+        self.assertAlmostEqual(abs(vj-vjref).max(), 0, 12)
+        self.assertAlmostEqual(abs(vk-vkref).max(), 0, 12)
+
     def test_r_uhf(self):
         uhf = scf.dhf.UHF(mol)
         uhf.conv_tol_grad = 1e-5
@@ -4,6 +4,7 @@
 
 import os
 import imp
+import copy
 from pyscf.gto.basis import parse_nwchem
 
 ALIAS = {
@@ -168,7 +169,7 @@ def load(filename_or_basisname, symb):
     if os.path.isfile(filename_or_basisname):
         # read basis from given file
         try:
-            return parse_nwchem.load(filename_or_basisname, symb)
+            return _load_cached(parse_nwchem.load, filename_or_basisname, symb)
         except RuntimeError:
             with open(filename_or_basisname, 'r') as fin:
                 return parse_nwchem.parse(fin.read())
@@ -177,13 +178,17 @@ def load(filename_or_basisname, symb):
     basmod = ALIAS[name]
     symb = ''.join([i for i in symb if i.isalpha()])
     if 'dat' in basmod:
-        b = parse_nwchem.load(os.path.join(os.path.dirname(__file__), basmod), symb)
+        b = _load_cached(parse_nwchem.load,
+                         os.path.join(os.path.dirname(__file__), basmod), symb)
     else:
-        fp, pathname, description = imp.find_module(basmod, __path__)
-        mod = imp.load_module(name, fp, pathname, description)
-        #mod = __import__(basmod, globals={'__path__': __path__, '__name__': __name__})
-        b = mod.__getattribute__(symb)
-        fp.close()
+        def load_module(path, symb):
+            fp, pathname, description = imp.find_module(basmod, __path__)
+            mod = imp.load_module(name, fp, pathname, description)
+            #mod = __import__(basmod, globals={'__path__': __path__, '__name__': __name__})
+            fp.close()
+            return mod.__getattribute__(symb)
+        pathname = imp.find_module(basmod, __path__)[1]
+        b = _load_cached(load_module, pathname, symb)
     return b
 
 def load_ecp(filename_or_basisname, symb):
@@ -193,7 +198,7 @@ def load_ecp(filename_or_basisname, symb):
     if os.path.isfile(filename_or_basisname):
         # read basis from given file
         try:
-            return parse_nwchem.load_ecp(filename_or_basisname, symb)
+            return _load_cached(parse_nwchem.load_ecp, filename_or_basisname, symb)
         except RuntimeError:
             with open(filename_or_basisname, 'r') as fin:
                 return parse_nwchem.parse_ecp(fin.read())
@@ -201,5 +206,17 @@ def load_ecp(filename_or_basisname, symb):
     name = filename_or_basisname.lower().replace(' ', '').replace('-', '').replace('_', '')
     basmod = ALIAS[name]
     symb = ''.join([i for i in symb if i.isalpha()])
-    return parse_nwchem.load_ecp(os.path.join(os.path.dirname(__file__), basmod), symb)
-
+    return _load_cached(parse_nwchem.load_ecp,
+                        os.path.join(os.path.dirname(__file__), basmod), symb)
+
+# The parsed basis sets are kept in memory, keyed by the loader, the basis
+# file, its modification time and the element.  The cache is inherited by
+# the processes forked afterwards.
+_PARSED_BASIS = {}
+def _load_cached(fload, filename, symb):
+    key = (fload.__name__, os.path.abspath(filename),
+           os.path.getmtime(filename), symb)
+    if key not in _PARSED_BASIS:
+        _PARSED_BASIS[key] = fload(filename, symb)
+# Return a copy because the caller may modify the basis in place
+    return copy.deepcopy(_PARSED_BASIS[key])
@@ -5,6 +5,18 @@
 # parse NWChem format
 #
 
+import os
+import json
+import tempfile
+import hashlib
+
+# The basis files are indexed (the file offset of the basis of each element)
+# in memory.  If this directory is set (by the environment variable
+# PYSCF_BASIS_CACHE), the index and the parsed basis of each element are also
+# saved in this directory in JSON format.  The cache of a basis file is
+# invalidated when the file is modified.
+BASIS_CACHE_DIR = os.environ.get('PYSCF_BASIS_CACHE', None)
+
 MAXL = 8
 SPDF = ('S', 'P', 'D', 'F', 'G', 'H', 'I', 'J')
 MAPSPDF = {'S': 0,
@@ -30,7 +42,24 @@ def parse(string):
     return _parse(bastxt)
 
 def load(basisfile, symb):
-    return _parse(search_seg(basisfile, symb))
+    '''Load the basis of the given element from the NWChem format basis file.
+    Only the segment of the element is read and parsed.  See also
+    :func:`index_basis` and :data:`BASIS_CACHE_DIR`.
+    '''
+    basisfile = os.path.abspath(basisfile)
+    stamp, index = _get_index(basisfile)
+    if symb not in index:
+        raise RuntimeError('Basis not found for  %s  in  %s' % (symb, basisfile))
+    basis = _read_cache(basisfile, symb, stamp)
+    if basis is None or not _is_basis(basis):
+        start, end = index[symb]
+        with open(basisfile, 'rb') as fin:
+            fin.seek(start)
+            seg = fin.read(end-start).decode()
+        seg = [x.strip() for x in seg.splitlines() if x.strip()]
+        basis = _parse(seg)
+        _save_cache(basisfile, symb, stamp, basis)
+    return basis
 
 def parse_ecp(string):
     ecptxt = []
@@ -69,6 +98,112 @@ def search_seg(basisfile, symb):
             dat = fin.readline().lstrip(' ')
     raise RuntimeError('Basis not found for  %s  in  %s' % (symb, basisfile))
 
+def index_basis(basisfile):
+    '''Scan the basis file once and return a dict which maps the element to
+    the (start, end) file offsets of its basis segment.  Same to
+    :func:`search_seg`, the first segment is taken if an element has multiple
+    segments.
+    '''
+    index = {}
+    with open(basisfile, 'rb') as fin:
+        # ignore head
+        dat = fin.readline().lstrip(b' ')
+        while dat and not dat.startswith(b'#BASIS SET'):
+            dat = fin.readline().lstrip(b' ')
+        start = fin.tell()
+        dat = fin.readline().lstrip(b' ')
+        while dat and not dat.startswith(b'END'):
+            if dat[:1].isalpha():
+                symb = dat.split()[0].decode()
+            else:
+                symb = None
+            while (dat and
+                   not dat.startswith(b'#BASIS SET') and
+                   not dat.startswith(b'END')):
+                end = fin.tell()
+                dat = fin.readline().lstrip(b' ')
+            if symb is not None and symb not in index:
+                index[symb] = (start, end)
+            if dat.startswith(b'#BASIS SET'):
+                start = fin.tell()
+                dat = fin.readline().lstrip(b' ')
+    return index
+
+# The index of the basis files, keyed by the absolute path of the basis file.
+# The parsed basis are kept in memory by gto.basis.load
+_BASIS_INDEX = {}
+def _get_index(basisfile):
+    stat = os.stat(basisfile)
+    stamp = [stat.st_mtime, stat.st_size]
+    if basisfile in _BASIS_INDEX and _BASIS_INDEX[basisfile][0] == stamp:
+        return _BASIS_INDEX[basisfile]
+    index = _read_cache(basisfile, 'index', stamp)
+    if not (isinstance(index, dict) and
+            all(_is_int_pair(x) for x in index.values())):
+        index = index_basis(basisfile)
+        _save_cache(basisfile, 'index', stamp, index)
+    _BASIS_INDEX[basisfile] = (stamp, index)
+    return stamp, index
+
+def _is_int_pair(x):
+    return (isinstance(x, (tuple, list)) and len(x) == 2 and
+            all(isinstance(i, int) for i in x))
+
+def _is_basis(basis):
+    '''Check the data loaded from the cache file'''
+    number = (int, float)
+    try:
+        return (isinstance(basis, list) and
+                all(isinstance(b[0], int) and
+                    all(isinstance(x, list) and
+                        all(isinstance(c, number) for c in x) for x in b[1:])
+                    for b in basis))
+    except (TypeError, IndexError):
+        return False
+
+def _cache_file(basisfile, key):
+    # Different files of the same name are distinguished by the hash of path
+    tag = hashlib.md5(basisfile.encode()).hexdigest()[:8]
+    return os.path.join(BASIS_CACHE_DIR, '%s.%s' % (os.path.basename(basisfile), tag),
+                        key + '.json')
+
+def _read_cache(basisfile, key, stamp):
+    '''Load the cached item.  None is returned if the disk cache is not
+    enabled, or the cache is out of date.'''
+    if not BASIS_CACHE_DIR:
+        return None
+    try:
+        with open(_cache_file(basisfile, key), 'r') as f:
+            cache = json.load(f)
+        if cache['path'] == basisfile and cache['stamp'] == stamp:
+            return cache['data']
+    except Exception:
+        pass
+    return None
+
+def _save_cache(basisfile, key, stamp, data):
+    '''Save one item (the index or the basis of one element) in its own
+    file'''
+    if not BASIS_CACHE_DIR:
+        return
+    filename = _cache_file(basisfile, key)
+    try:
+        dirname = os.path.dirname(filename)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+# Write to a temporary file then rename it, so that the processes which run
+# simultaneously do not read a partially written cache
+        fd, tmpname = tempfile.mkstemp(dir=dirname)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'path': basisfile, 'stamp': stamp, 'data': data}, f)
+            os.rename(tmpname, filename)
+        except:
+            os.remove(tmpname)
+            raise
+    except (IOError, OSError):
+        pass
+
 def search_ecp(basisfile, symb):
     with open(basisfile, 'r') as fin:
         # ignore head
@@ -1707,6 +1707,58 @@ Note when symmetry attributes is assigned, the molecule needs to be put in the p
         return self
     kernel = build
 
+    def set_geom_(self, atoms, unit=None, symmetry=None):
+        '''Replace the geometry in place.  The basis set data (the basis
+        functions in :attr:`_bas` and :attr:`_env`) are kept, so the basis
+        set files are not parsed again.  The new geometry must have the same
+        atoms in the same order.
+
+        Args:
+            atoms : list, str or (natm,3) ndarray
+                Same format to :attr:`Mole.atom`, or the array of the new
+                coordinates.
+
+        Kwargs:
+            unit : str
+                Unit of the new coordinates.  Default is :attr:`Mole.unit`
+            symmetry : bool or str
+                If given, overwrite :attr:`Mole.symmetry`.  When symmetry is
+                enabled, the molecule is rebuilt to regenerate the symmetry
+                adapted basis.
+
+        Examples:
+
+        >>> mol = gto.M(atom='H 0 0 0; F 0 0 1.1', basis='ccpvdz')
+        >>> mol.set_geom_('H 0 0 0; F 0 0 1.2')
+        >>> mol.atom_coord(1)
+        [ 0.          0.          2.26767096]
+        '''
+        if unit is None: unit = self.unit
+        if symmetry is not None: self.symmetry = symmetry
+        if isinstance(atoms, numpy.ndarray) and atoms.ndim == 2:
+            atoms = [(a[0], c) for a, c in zip(self._atom, atoms)]
+        self.atom = atoms
+        self.unit = unit
+
+        if self.symmetry:
+            basis, self.basis = self.basis, self._basis
+            try:
+                self.build(False, False)
+            finally:
+                self.basis = basis
+            return self
+
+        _atom = self.format_atom(atoms, unit=unit)
+        if [a[0] for a in _atom] != [a[0] for a in self._atom]:
+            raise ValueError('The atoms of the new geometry do not match the '
+                             'atoms of the molecule')
+        self._atom = _atom
+        ptr = self._atm[:,PTR_COORD]
+        coords = numpy.asarray([a[1] for a in _atom])
+        for i in range(3):
+            self._env[ptr+i] = coords[:,i]
+        return self
+
     @pyscf.lib.with_doc(format_atom.__doc__)
     def format_atom(self, atom, origin=0, axes=1, unit='Ang'):
         return format_atom(atom, origin, axes, unit)
@@ -7,10 +7,9 @@ import numpy
 import ctypes
 import pyscf.lib
 
+# CINTcgto_cart, CINTcgto_spheric, CINTcgto_spinor return int, which is the
+# default restype of ctypes.  The library is not touched at import time.
 libcgto = pyscf.lib.load_library('libcgto')
-libcgto.CINTcgto_cart.restype = ctypes.c_int
-libcgto.CINTcgto_spheric.restype = ctypes.c_int
-libcgto.CINTcgto_spinor.restype = ctypes.c_int
 libcvhf = pyscf.lib.load_library('libcvhf')
 
 ANG_OF     = 1
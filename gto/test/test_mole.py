@@ -182,6 +182,52 @@ C    SP
                             H -0.9444878100 0.0000000000 -1.3265673200''')
         self.assertTrue(gto.chiral_mol(mol1))
 
+    def test_set_geom(self):
+        mol1 = gto.M(atom='H 0 0 0; F 0 0 1.1', basis='ccpvdz')
+        mol2 = gto.M(atom='H 0 0 0; F 0 0 1.2', basis='ccpvdz')
+        mol1.set_geom_('H 0 0 0; F 0 0 1.2')
+        self.assertAlmostEqual(abs(mol1.atom_coords()-mol2.atom_coords()).max(), 0, 12)
+        self.assertAlmostEqual(abs(mol1._env-mol2._env).max(), 0, 12)
+        mol1.set_geom_(mol1.atom_coords()*2, unit='B')
+        self.assertAlmostEqual(mol1.atom_coord(1)[2], 4.5353426990, 9)
+        self.assertRaises(ValueError, mol1.set_geom_, 'F 0 0 0; H 0 0 1.2')
+
+    def test_load_basis_index(self):
+        import os
+        from pyscf.gto.basis import parse_nwchem
+        basfile = os.path.join(os.path.dirname(gto.basis.__file__), 'cc-pvdz.dat')
+        index = parse_nwchem.index_basis(basfile)
+        self.assertTrue('Zn' in index)
+        for symb in ('H', 'Zn', 'Ar'):
+            ref = parse_nwchem._parse(parse_nwchem.search_seg(basfile, symb))
+            self.assertEqual(parse_nwchem.load(basfile, symb), ref)
+        self.assertRaises(RuntimeError, parse_nwchem.load, basfile, 'Xx')
+
+    def test_basis_disk_cache(self):
+        import os
+        import shutil
+        import tempfile
+        from pyscf.gto.basis import parse_nwchem
+        basfile = os.path.join(os.path.dirname(gto.basis.__file__), 'cc-pvdz.dat')
+        ref = parse_nwchem.load(basfile, 'Zn')
+        cache_dir = tempfile.mkdtemp()
+        cache_dir_bak = parse_nwchem.BASIS_CACHE_DIR
+        parse_nwchem.BASIS_CACHE_DIR = cache_dir
+        try:
+            parse_nwchem._BASIS_INDEX.clear()
+            self.assertEqual(parse_nwchem.load(basfile, 'Zn'), ref)
+            cache_file = parse_nwchem._cache_file(os.path.abspath(basfile), 'Zn')
+            self.assertTrue(os.path.isfile(cache_file))
+            self.assertEqual(parse_nwchem.load(basfile, 'Zn'), ref)
+            # Invalid data in the cache are not used
+            with open(cache_file, 'r') as f:
+                dat = f.read()
+            with open(cache_file, 'w') as f:
+                f.write(dat.replace('"data": [[0', '"data": [["s"'))
+            self.assertEqual(parse_nwchem.load(basfile, 'Zn'), ref)
+        finally:
+            parse_nwchem.BASIS_CACHE_DIR = cache_dir_bak
+            shutil.rmtree(cache_dir)
 
 if __name__ == "__main__":
     print("test mole.py")
@@ -9,9 +9,10 @@ from pyscf.lib import logger
 from pyscf.lib.misc import *
 from pyscf.lib.numpy_helper import *
 from pyscf.lib.linalg_helper import *
-from pyscf.lib import chkfile
-from pyscf.lib import diis
 from pyscf.lib.misc import StreamObject
+# chkfile and diis import h5py which is slow.  They are imported when
+# lib.chkfile or lib.diis is accessed
+import_lazily(__name__, ('chkfile', 'diis'))
 
 '''
 C code and some fundamental functions
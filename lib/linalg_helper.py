@@ -12,7 +12,6 @@ import tempfile
 from functools import reduce
 import numpy
 import scipy.linalg
-import h5py
 from pyscf.lib import logger
 from pyscf.lib import numpy_helper
 
@@ -534,6 +533,113 @@ def krylov(aop, b, x0=None, tol=1e-10, max_cycle=30, dot=numpy.dot,
     return x
 
 
+def krylov_block(aop, b, x0=None, tol=1e-10, max_cycle=30, lindep=1e-14,
+                 verbose=logger.WARN):
+    '''Block Krylov subspace method to solve  (1+a) x = b  for many
+    right-hand sides.  All right-hand sides share one subspace.  In each
+    iteration the residuals of the unconverged equations are added to the
+    subspace and aop is called once for the whole block of new trial vectors.
+
+    Args:
+        aop : function(x) => array_like_x
+            x is a 2D array, each row is a trial vector.  The returned value
+            is a 2D array of the same shape.
+        b : 2D array
+            Each row is a right-hand side.
+
+    Kwargs:
+        x0 : 2D array
+            Initial guess
+        tol : float
+            Convergence threshold for the norm of the residual of each
+            equation.
+        max_cycle : int
+            max number of iterations.
+        lindep : float
+            Linear dependency threshold.  Trial vectors whose norm after
+            orthogonalization (relative to the input) is lower than
+            sqrt(lindep) are discarded.
+
+    Returns:
+        x : 2D array like b
+
+    Examples:
+
+    >>> from pyscf import lib
+    >>> a = numpy.random.random((10,10)) * 1e-2
+    >>> b = numpy.random.random((3,10))
+    >>> aop = lambda x: numpy.dot(x, a.T)
+    >>> x = lib.krylov_block(aop, b)
+    >>> numpy.allclose(numpy.dot(x, a.T)+x, b)
+    True
+    '''
+    if isinstance(verbose, logger.Logger):
+        log = verbose
+    else:
+        log = logger.Logger(sys.stdout, verbose)
+
+    b = numpy.asarray(b)
+    nrhs, n = b.shape
+    if x0 is None:
+        r0 = b
+    else:
+        r0 = b - (x0 + aop(x0))
+
+    xs = numpy.empty((0,n), dtype=b.dtype)
+    # (1+a) acting on the orthonormal trial vectors
+    axs = numpy.empty((0,n), dtype=b.dtype)
+    h = numpy.empty((0,0), dtype=b.dtype)
+    c = numpy.zeros((0,nrhs), dtype=b.dtype)
+    x1 = r0
+    for cycle in range(max_cycle):
+        x1 = _orthonormalize_block(xs, x1, lindep)
+        if len(x1) == 0:
+            break
+        ax1 = x1 + aop(x1)
+        nsub = len(xs)
+        h1 = numpy.empty((nsub+len(x1),)*2, dtype=b.dtype)
+        h1[:nsub,:nsub] = h
+        h1[:nsub,nsub:] = numpy.dot(xs.conj(), ax1.T)
+        h1[nsub:,:nsub] = numpy.dot(x1.conj(), axs.T)
+        h1[nsub:,nsub:] = numpy.dot(x1.conj(), ax1.T)
+        h = h1
+        xs = numpy.vstack((xs, x1))
+        axs = numpy.vstack((axs, ax1))
+
+        c = numpy.linalg.solve(h, numpy.dot(xs.conj(), r0.T))
+        r = r0 - numpy.dot(c.T, axs)
+        rnorm = numpy.sqrt(numpy.einsum('ij,ij->i', r.conj(), r).real)
+        log.debug('krylov_block cycle %d  subspace %d  max|r| = %g  unconverged %d',
+                  cycle, len(xs), rnorm.max(), numpy.count_nonzero(rnorm >= tol))
+        if rnorm.max() < tol:
+            break
+        x1 = r[rnorm >= tol]
+    log.debug('final cycle = %d', cycle)
+
+    x = numpy.dot(c.T, xs)
+    if x0 is not None:
+        x += x0
+    return x
+
+def _orthonormalize_block(xs, x1, lindep):
+    '''Orthonormalize the rows of x1 against the orthonormal rows of xs and
+    among themselves.  Rows which are linearly dependent are dropped.'''
+    norm = numpy.sqrt(numpy.einsum('ij,ij->i', x1.conj(), x1).real)
+    x1 = x1[norm**2 > 1e-300] / norm[norm**2 > 1e-300,None]
+    for i in range(2):
+        if len(xs) > 0:
+            x1 = x1 - numpy.dot(numpy.dot(x1, xs.conj().T), xs)
+    basis = []
+    for v in x1:
+        for i in range(2):
+            for u in basis:
+                v -= numpy.dot(u.conj(), v) * u
+        norm = numpy_helper.norm(v)
+        if norm**2 > lindep:
+            basis.append(v / norm)
+    return numpy.asarray(basis).reshape(-1,x1.shape[1])
+
+
 def dsolve(aop, b, precond, tol=1e-14, max_cycle=30, dot=numpy.dot,
            lindep=1e-16, verbose=0):
     '''Davidson iteration to solve linear equation.  It works bad.
@@ -577,6 +683,7 @@ def cho_solve(a, b):
 
 class _Xlist(list):
     def __init__(self):
+        import h5py
         self._fd = tempfile.NamedTemporaryFile()
         self.scr_h5 = h5py.File(self._fd.name, 'w')
         self.index = []
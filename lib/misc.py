@@ -20,7 +20,7 @@ c_double_p = ctypes.POINTER(ctypes.c_double)
 c_int_p = ctypes.POINTER(ctypes.c_int)
 c_null_ptr = ctypes.POINTER(ctypes.c_void_p)
 
-def load_library(libname):
+def _load_library(libname):
 # numpy 1.6 has bug in ctypeslib.load_library, see numpy/distutils/misc_util.py
     if '1.6' in numpy.__version__:
         if (sys.platform.startswith('linux') or
@@ -38,6 +38,67 @@ def load_library(libname):
         _loaderpath = os.path.dirname(__file__)
         return numpy.ctypeslib.load_library(libname, _loaderpath)
 
+class _LazyLibrary(object):
+    '''A placeholder of the shared library.  The library is loaded when its
+    attribute (C function) is accessed at the first time.'''
+    def __init__(self, libname):
+        self._libname = libname
+        self._lib = None
+    def __getattr__(self, key):
+        if key.startswith('__') or key in ('_libname', '_lib'):
+            raise AttributeError(key)
+        if self._lib is None:
+            self._lib = _load_library(self._libname)
+        val = getattr(self._lib, key)
+# Save the C function in the placeholder to skip __getattr__ next time
+        setattr(self, key, val)
+        return val
+    def __repr__(self):
+        return '<%s %s, loaded=%s>' % (self.__class__.__name__,
+                                       self._libname, self._lib is not None)
+
+def load_library(libname):
+    '''Load the shared library libname from pyscf/lib.  The library is
+    loaded lazily, when its functions are accessed at the first time.  If
+    the library file does not exist, the error is raised immediately.'''
+    _loaderpath = os.path.dirname(__file__)
+    for so_ext in ('.so', '.dylib', '.dll'):
+        if os.path.isfile(os.path.join(_loaderpath, libname+so_ext)):
+            return _LazyLibrary(libname)
+    return _load_library(libname)
+
+def import_lazily(pkgname, submodules):
+    '''Import the submodules of package pkgname when they are accessed as
+    the attributes of the package at the first time, eg pyscf.scf after
+    "import pyscf".  This is a replacement of the statements
+    "from pkgname import submodule" in the __init__.py of the package.
+
+    The package is replaced in sys.modules by a copy of the module which
+    loads the submodules on demand.  It should be called at the end of the
+    __init__.py since the names defined afterwards are not copied.
+    '''
+    import importlib
+    import types
+    submodules = set(submodules)
+    class LazyPackage(types.ModuleType):
+        def __getattr__(self, key):
+            if key in submodules:
+                return importlib.import_module(pkgname + '.' + key)
+            raise AttributeError("module '%s' has no attribute '%s'" %
+                                 (pkgname, key))
+    module = sys.modules[pkgname]
+    lazy = LazyPackage(pkgname)
+    lazy.__dict__.update(module.__dict__)
+# Keep a reference to the original module.  On Python 2, the globals of a
+# module are cleared when the module object is released.
+    lazy.__dict__['_module_origin'] = module
+    sys.modules[pkgname] = lazy
+    if '.' in pkgname:
+        parent, name = pkgname.rsplit('.', 1)
+        if parent in sys.modules:
+            setattr(sys.modules[parent], name, lazy)
+    return lazy
+
 #Fixme, the standard resouce module gives wrong number when objects are released
 #see http://fa.bianp.net/blog/2013/different-ways-to-get-memory-consumption-or-lessons-learned-from-memory_profiler/#fn:1
 #or use slow functions as memory_profiler._get_memory did
@@ -53,7 +114,17 @@ def current_memory():
     else:
         return 0, 0
 
-def num_threads():
+def num_threads(n=None):
+    '''The number of OpenMP threads.  If n is given, the number of OpenMP
+    threads of the current process is set to n.'''
+    if n is not None:
+        n = int(n)
+        os.environ['OMP_NUM_THREADS'] = str(n)
+        try:
+            load_library('libnp_helper').omp_set_num_threads(n)
+        except (OSError, AttributeError):
+            pass  # the library is not compiled with OpenMP
+        return n
     if 'OMP_NUM_THREADS' in os.environ:
         return int(os.environ['OMP_NUM_THREADS'])
     else:
@@ -425,6 +496,118 @@ def background_process(func, *args, **kwargs):
 bg = background = bg_thread = background_thread
 bp = bg_process = background_process
 
+def shared_array(shape, dtype=numpy.double):
+    '''An ndarray allocated in anonymous shared memory.  The array is
+    visible (read and write) to the processes forked by :func:`map_processes`
+    without being pickled.
+    '''
+    import mmap
+    dtype = numpy.dtype(dtype)
+    nbytes = max(1, int(numpy.prod(shape)) * dtype.itemsize)
+    buf = mmap.mmap(-1, nbytes)
+    return numpy.ndarray(shape, dtype, buffer=buf)
+
+def _fork_context():
+    import multiprocessing
+    if hasattr(multiprocessing, 'get_context'):
+        try:
+            return multiprocessing.get_context('fork')
+        except ValueError:
+            return None
+    elif hasattr(os, 'fork'):
+        return multiprocessing
+    else:
+        return None
+
+def imap_processes(func, args_lst, nproc=None):
+    '''Evaluate func(*args) for each args in args_lst in forked processes.
+    The results are yielded as soon as they are available.
+
+    The tasks are dynamically scheduled over nproc worker processes.  Input
+    arrays are inherited by the children (copy-on-write) rather than pickled.
+    Only the return values are sent back to the parent.  func can be a
+    closure.  The tasks are executed serially when nproc == 1 or when the
+    platform does not support fork.
+
+    The worker processes run with one OpenMP thread.  The OpenMP thread pool
+    of the parent process cannot be used after fork, and nproc (default
+    lib.num_threads()) processes with multiple threads each would
+    oversubscribe the cores.
+
+    Returns:
+        A generator of (index, return value).  The index refers to args_lst.
+    '''
+    args_lst = list(args_lst)
+    ntasks = len(args_lst)
+    if nproc is None:
+        nproc = num_threads()
+    nproc = min(nproc, ntasks)
+    ctx = _fork_context()
+    if nproc <= 1 or ctx is None:
+        for i, args in enumerate(args_lst):
+            yield i, func(*args)
+        return
+
+    def worker(tasks, queue):
+        num_threads(1)
+        i = tasks.get()
+        while i is not None:
+            try:
+                queue.put((i, True, func(*args_lst[i])))
+            except BaseException:
+                import traceback
+                queue.put((i, False, traceback.format_exc()))
+            i = tasks.get()
+
+    try:
+        from queue import Empty
+    except ImportError:
+        from Queue import Empty
+    tasks = ctx.Queue()
+    for i in range(ntasks):
+        tasks.put(i)
+    for rank in range(nproc):
+        tasks.put(None)
+    queue = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(tasks, queue))
+             for rank in range(nproc)]
+    for p in procs:
+        p.start()
+# Drain the queue before join, otherwise the children may block on the pipe
+# when the results are large
+    finished = False
+    try:
+        k = 0
+        while k < ntasks:
+            try:
+                i, ok, res = queue.get(timeout=1)
+            except Empty:
+                if any(p.exitcode not in (None, 0) for p in procs):
+                    raise RuntimeError('Worker process terminated abnormally')
+                continue
+            k += 1
+            if not ok:
+                raise RuntimeError('Error in worker process\n%s' % res)
+            yield i, res
+        finished = True
+    finally:
+        for p in procs:
+            if not finished:
+                p.terminate()
+            p.join()
+
+def map_processes(func, args_lst, nproc=None):
+    '''Evaluate func(*args) for each args in args_lst in forked processes.
+    See :func:`imap_processes`.
+
+    Returns:
+        A list of the return values in the order of args_lst
+    '''
+    args_lst = list(args_lst)
+    results = [None] * len(args_lst)
+    for i, res in imap_processes(func, args_lst, nproc):
+        results[i] = res
+    return results
 
 if __name__ == '__main__':
     for i,j in tril_equal_pace(90, 30):
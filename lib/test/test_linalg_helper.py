@@ -25,6 +25,19 @@ class KnowValues(unittest.TestCase):
         e = myfci.kernel()[0]
         self.assertAlmostEqual(e, -11.579978414933732, 9)
 
+    def test_krylov_block(self):
+        from pyscf import lib
+        numpy.random.seed(1)
+        a = numpy.random.random((40,40)) * .05
+        b = numpy.random.random((6,40))
+        aop = lambda x: numpy.dot(x, a.T)
+        x = lib.krylov_block(aop, b, max_cycle=40)
+        self.assertAlmostEqual(abs(aop(x) + x - b).max(), 0, 9)
+        x1 = lib.krylov(lambda v: numpy.dot(a, v), b[2], max_cycle=40)
+        self.assertAlmostEqual(abs(x1 - x[2]).max(), 0, 8)
+        x1 = lib.krylov_block(aop, b, x[:,::-1], max_cycle=40)
+        self.assertAlmostEqual(abs(x1 - x).max(), 0, 9)
+
 if __name__ == "__main__":
     print("Full Tests for linalg_helper")
     unittest.main()
@@ -0,0 +1,34 @@
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+import sys
+import subprocess
+import unittest
+from pyscf import lib
+
+class KnowValues(unittest.TestCase):
+    def test_load_library(self):
+        libnp = lib.misc.load_library('libnp_helper')
+        self.assertTrue(libnp._lib is None)
+        fn = libnp.NPdpack_tril_2d
+        self.assertTrue(libnp._lib is not None)
+        self.assertTrue(libnp.NPdpack_tril_2d is fn)
+        self.assertRaises(OSError, lib.misc.load_library, 'libnot_exist')
+
+    def test_import_lazily(self):
+        script = ('import sys, pyscf; '
+                  'assert "pyscf.scf" not in sys.modules; '
+                  'assert "pyscf.lib.chkfile" not in sys.modules; '
+                  'pyscf.scf; '
+                  'assert "pyscf.scf" in sys.modules')
+        self.assertEqual(subprocess.call([sys.executable, '-c', script]), 0)
+    def test_map_processes(self):
+        res = lib.map_processes(lambda i: (i, lib.num_threads()),
+                                [(i,) for i in range(4)], 2)
+        self.assertEqual(res, [(i, 1) for i in range(4)])
+
+
+if __name__ == "__main__":
+    print("Full Tests for misc")
+    unittest.main()
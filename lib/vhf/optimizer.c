@@ -12,6 +12,8 @@
 
 #define MAX(I,J)        ((I) > (J) ? (I) : (J))
 
+int cint2e_ip1ip2_sph();
+
 
 void CVHFinit_optimizer(CVHFOpt **opt, int *atm, int natm,
                         int *bas, int nbas, double *env)
@@ -195,6 +197,95 @@ void CVHFsetnr_direct_scf_dm(CVHFOpt *opt, double *dm, int nset,
 }
 
 
+/*
+ * Screening for the (nabla i j|k l) integrals of the SCF gradients.
+ * q_cond has two blocks.  The first nbas*nbas elements are
+ * 1/sqrt(max(ij|ij)) as in CVHFsetnr_direct_scf, the second block is
+ * 1/sqrt(max(nabla i j|nabla i j)).  nabla acts on i only, the second block
+ * is not symmetric.
+ */
+int CVHFgrad_jk_prescreen(int *shls, CVHFOpt *opt,
+                          int *atm, int *bas, double *env)
+{
+        if (!opt) {
+                return 1; // no screen
+        }
+        int i = shls[0];
+        int j = shls[1];
+        int k = shls[2];
+        int l = shls[3];
+        int n = opt->nbas;
+        assert(opt->q_cond);
+        assert(opt->dm_cond);
+        assert(i < n);
+        assert(j < n);
+        assert(k < n);
+        assert(l < n);
+        double *q_ip = opt->q_cond + n*n;
+        double qijkl = q_ip[i*n+j] * opt->q_cond[k*n+l];
+        double dmin = opt->direct_scf_cutoff * qijkl;
+        // dm_cond is symmetrized in CVHFgrad_jk_direct_scf_dm
+        return (opt->dm_cond[l*n+k] > dmin)
+            || (opt->dm_cond[j*n+k] > dmin)
+            || (opt->dm_cond[j*n+l] > dmin);
+}
+
+void CVHFgrad_jk_direct_scf(CVHFOpt *opt, int *atm, int natm,
+                            int *bas, int nbas, double *env)
+{
+        CVHFsetnr_direct_scf(opt, atm, natm, bas, nbas, env);
+        // extend q_cond for the second block
+        opt->q_cond = (double *)realloc(opt->q_cond, sizeof(double)*nbas*nbas*2);
+        double *q_ip = opt->q_cond + nbas*nbas;
+
+        double qtmp;
+        int i, j, di, dj, dij, ish, jsh, ic;
+        int shls[4];
+        int di_max = 0;
+        for (ish = 0; ish < nbas; ish++) {
+                di_max = MAX(di_max, CINTcgto_spheric(ish, bas));
+        }
+        // one buffer for the largest shell quartet
+        double *buf = (double *)malloc(sizeof(double) * di_max*di_max*di_max*di_max*9);
+        for (ish = 0; ish < nbas; ish++) {
+                di = CINTcgto_spheric(ish, bas);
+                for (jsh = 0; jsh < nbas; jsh++) {
+                        dj = CINTcgto_spheric(jsh, bas);
+                        dij = di * dj;
+                        shls[0] = ish;
+                        shls[1] = jsh;
+                        shls[2] = ish;
+                        shls[3] = jsh;
+                        qtmp = 0;
+                        if (0 != cint2e_ip1ip2_sph(buf, shls, atm, natm, bas, nbas, env, NULL)) {
+                                // the diagonal components xx, yy, zz
+                                for (ic = 0; ic < 9; ic+=4) {
+                                for (i = 0; i < di; i++) {
+                                for (j = 0; j < dj; j++) {
+                                        qtmp = MAX(qtmp, fabs(buf[ic*dij*dij+i+di*j+dij*i+dij*di*j]));
+                                } } }
+                        }
+                        q_ip[ish*nbas+jsh] = 1./sqrt(qtmp);
+                }
+        }
+        free(buf);
+}
+
+void CVHFgrad_jk_direct_scf_dm(CVHFOpt *opt, double *dm, int nset,
+                               int *atm, int natm, int *bas, int nbas, double *env)
+{
+        CVHFsetnr_direct_scf_dm(opt, dm, nset, atm, natm, bas, nbas, env);
+        int i, j;
+        double dmax;
+        for (i = 0; i < nbas; i++) {
+        for (j = 0; j < i; j++) {
+                dmax = MAX(opt->dm_cond[i*nbas+j], opt->dm_cond[j*nbas+i]);
+                opt->dm_cond[i*nbas+j] = dmax;
+                opt->dm_cond[j*nbas+i] = dmax;
+        } }
+}
+
+
 
 /*
  *************************************************
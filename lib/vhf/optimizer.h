@@ -30,6 +30,9 @@ int CVHFnr_schwarz_cond(int *shls, CVHFOpt *opt,
 int CVHFnrs8_prescreen(int *shls, CVHFOpt *opt,
                        int *atm, int *bas, double *env);
 
+int CVHFgrad_jk_prescreen(int *shls, CVHFOpt *opt,
+                          int *atm, int *bas, double *env);
+
 int CVHFr_vknoscreen(int *shls, CVHFOpt *opt,
                      double **dms_cond, int n_dm, double *dm_atleast,
                      int *atm, int *bas, double *env);
@@ -39,5 +42,10 @@ void CVHFsetnr_direct_scf(CVHFOpt *opt, int *atm, int natm,
 void CVHFsetnr_direct_scf_dm(CVHFOpt *opt, double *dm, int nset,
                              int *atm, int natm, int *bas, int nbas, double *env);
 
+void CVHFgrad_jk_direct_scf(CVHFOpt *opt, int *atm, int natm,
+                            int *bas, int nbas, double *env);
+void CVHFgrad_jk_direct_scf_dm(CVHFOpt *opt, double *dm, int nset,
+                               int *atm, int natm, int *bas, int nbas, double *env);
+
 void CVHFnr_optimizer(CVHFOpt **vhfopt, int *atm, int natm,
                       int *bas, int nbas, double *env);
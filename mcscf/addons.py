@@ -635,8 +635,20 @@ def state_specific_(casscf, state=1):
     casscf.fcisolver = state_specific(casscf, state)
     return casscf
 
-def state_average_mix(casscf, fcisolvers, weights=(0.5,0.5)):
+def state_average_mix(casscf, fcisolvers, weights=(0.5,0.5), nproc=1):
     '''State-average CASSCF over multiple FCI solvers.
+
+    Kwargs:
+        nproc : int
+            Number of processes to run the FCI solvers.  The roots of
+            different solvers (e.g. the states of different spin or spatial
+            symmetry) are independent in the CI step.  If nproc > 1, the
+            solvers are executed simultaneously in forked processes.  The
+            active space Hamiltonian is inherited by the child processes
+            through shared memory.  The energies, the CI vectors and the
+            attributes ci, converged and e of the solvers are sent back.
+            The density matrices are computed in the parent process.  The
+            child processes run with one OpenMP thread.
     '''
     fcibase_class = casscf.fcisolver.__class__
     ci_response_space = casscf.ci_response_space
@@ -662,18 +674,22 @@ def state_average_mix(casscf, fcisolvers, weights=(0.5,0.5)):
                 log = verbose
             else:
                 log = logger.Logger(sys.stdout, verbose)
-            e, c = collect(solver.kernel(h1, h2, ncas, nelecas, ci0,
-                                         orbsym=self.orbsym, verbose=log, **kwargs)
-                           for solver in fcisolvers)
+            def solver_kernel(solver):
+                res = solver.kernel(h1, h2, ncas, nelecas, ci0,
+                                    orbsym=self.orbsym, verbose=log, **kwargs)
+                return res, (nproc > 1 and _solver_state(solver))
+            e, c = collect(_map_solvers(solver_kernel, fcisolvers, nproc))
             for i, ei in enumerate(e):
                 ss = fci.spin_op.spin_square0(c[i], ncas, nelecas)
                 log.info('state %d  E = %.15g S^2 = %.7f', i, ei, ss[0])
             return numpy.einsum('i,i', numpy.array(e), weights), c
 
         def approx_kernel(self, h1, h2, norb, nelec, ci0=None, **kwargs):
-            e, c = collect(solver.kernel(h1, h2, norb, nelec, ci0, orbsym=self.orbsym,
-                                         max_cycle=ci_response_space, **kwargs)
-                           for solver in fcisolvers)
+            def solver_kernel(solver):
+                res = solver.kernel(h1, h2, norb, nelec, ci0, orbsym=self.orbsym,
+                                    max_cycle=ci_response_space, **kwargs)
+                return res, (nproc > 1 and _solver_state(solver))
+            e, c = collect(_map_solvers(solver_kernel, fcisolvers, nproc))
             return numpy.einsum('i,i->', e, weights), c
         def make_rdm1(self, ci0, norb, nelec):
             dm1 = 0
@@ -698,8 +714,28 @@ def state_average_mix(casscf, fcisolvers, weights=(0.5,0.5)):
     fcisolver.__dict__.update(casscf.fcisolver.__dict__)
     return fcisolver
 
-def state_average_mix_(casscf, fcisolvers, weights=(0.5,0.5)):
-    casscf.fcisolver = state_average_mix(casscf, fcisolvers, weights)
+def _solver_state(solver):
+    '''The attributes which the FCI kernel updates, to be sent back from the
+    child process'''
+    return dict((k, solver.__dict__[k]) for k in ('ci', 'converged', 'e')
+                if k in solver.__dict__)
+
+def _map_solvers(solver_kernel, fcisolvers, nproc):
+    '''Run solver_kernel for each solver.  The attributes updated in the
+    child processes are copied back to the solvers, so that the solvers are
+    in the same state as in the serial run.'''
+    results = []
+    for solver, (res, state) in zip(fcisolvers,
+                                    lib.map_processes(solver_kernel,
+                                                      [(x,) for x in fcisolvers],
+                                                      nproc)):
+        if nproc > 1:
+            solver.__dict__.update(state)
+        results.append(res)
+    return results
+
+def state_average_mix_(casscf, fcisolvers, weights=(0.5,0.5), nproc=1):
+    casscf.fcisolver = state_average_mix(casscf, fcisolvers, weights, nproc)
     return casscf
 
 def hot_tuning_(casscf, configfile=None):
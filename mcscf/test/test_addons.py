@@ -147,6 +147,24 @@ class KnowValues(unittest.TestCase):
         e = mc.kernel()[0]
         self.assertAlmostEqual(e, -108.83342083775061, 7)
 
+    def test_state_average_mix_nproc(self):
+        solver1 = fci.addons.fix_spin(fci.direct_spin1.FCISolver(mol), ss_value=2)
+        solver1.nroots = 1
+        solver2 = fci.direct_spin0.FCISolver(mol)
+        solver2.nroots = 2
+        weights = numpy.ones(3) / 3
+        mc = mcscf.CASSCF(mfr, 4, 4)
+        mc.fcisolver = mcscf.state_average_mix(mc, [solver1, solver2], weights)
+        e1 = mc.kernel()[0]
+        dm1 = mc.fcisolver.make_rdm1(mc.ci, mc.ncas, mc.nelecas)
+        mc = mcscf.CASSCF(mfr, 4, 4)
+        mc.fcisolver = mcscf.state_average_mix(mc, [solver1, solver2], weights,
+                                               nproc=2)
+        e2 = mc.kernel()[0]
+        self.assertAlmostEqual(e1, e2, 9)
+        dm2 = mc.fcisolver.make_rdm1(mc.ci, mc.ncas, mc.nelecas)
+        self.assertAlmostEqual(abs(dm1-dm2).max(), 0, 6)
+
     def test_state_specific(self):
         mc = mcscf.CASSCF(mfr, 4, 4)
         mc.fcisolver = fci.solver(mol, singlet=False)
@@ -3,7 +3,22 @@
 # -*- coding: utf-8
 
 '''
-density fitting MP2,  3-center integrals incore.
+density fitting MP2
+
+(ia|jb) = \sum_P L_{P,ia} L_{P,jb}.  The DF tensor L_{P,ia} is held in memory
+if it fits in max_memory, otherwise in a memory-mapped file.  The energy is
+evaluated for the blocks of occupied pairs (I,J) with one GEMM per block, and
+the blocks are distributed over mp.nproc processes.
+
+Spin-component scaled variants:  E = ps * E_os + pt * E_ss.  SOS-MP2 (pt = 0)
+can be evaluated with the Laplace transform of the energy denominator
+
+    1/x = \sum_q w_q exp(-t_q x)
+
+    E_os = -\sum_q w_q \sum_PQ X^q_PQ X^q_PQ,
+    X^q_PQ = \sum_ia L_{P,ia} L_{Q,ia} exp(-t_q (e_a-e_i))
+
+which scales as O(N^4).
 '''
 
 import time
@@ -12,6 +27,7 @@ import numpy
 from pyscf import lib
 from pyscf.lib import logger
 from pyscf import df
+from pyscf.ao2mo import _ao2mo
 
 
 # the MO integral for MP2 is (ov|ov). The most efficient integral
@@ -20,34 +36,225 @@ from pyscf import df
 #   or    => (ij|ol) => (oj|ol) => (oj|ov) => (ov|ov)
 
 def kernel(mp, mo_energy, mo_coeff, nocc, ioblk=256, verbose=None):
+    '''DF-MP2 energy ps*E_os + pt*E_ss.  The t2 amplitudes are not
+    generated (t2 is None).
+    '''
+    e_os, e_ss = energy_components(mp, mo_energy, mo_coeff, nocc, ioblk,
+                                   verbose)
+    return _scale(mp, e_os, e_ss), None
+
+def energy_components(mp, mo_energy, mo_coeff, nocc, ioblk=256, verbose=None):
+    '''The opposite-spin and the same-spin MP2 correlation energies.  If
+    mp.laplace_points > 0, the opposite-spin energy is computed with the
+    Laplace transform and the same-spin energy is None.
+    '''
+    if verbose is None:
+        verbose = mp.verbose
+    if isinstance(verbose, logger.Logger):
+        log = verbose
+    else:
+        log = logger.Logger(mp.stdout, verbose)
+    time0 = (time.clock(), time.time())
+    Lov = mp.ao2mo(mo_coeff, nocc, ioblk)
+    time1 = log.timer('Integral transformation (P|ia)', *time0)
+
+    if mp.laplace_points > 0:
+        e_os = energy_os_laplace(mp, Lov, mo_energy, nocc, mp.laplace_points,
+                                 log)
+        e_ss = None
+    else:
+        e_os, e_ss = energy_os_ss(mp, Lov, mo_energy, nocc, log)
+    Lov = None
+    log.timer('DF-MP2', *time0)
+    return e_os, e_ss
+
+def ao2mo(mp, mo_coeff, nocc, ioblk=256):
+    '''The DF tensor L_{P,ia} as a (nocc,naux,nvir) array.  It is a
+    numpy.memmap of a temporary file if it does not fit in mp.max_memory.
+    '''
+    log = logger.Logger(mp.stdout, mp.verbose)
+    with_df = mp.with_df
+    if with_df is None:
+        with_df = mp.with_df = df.DF(mp.mol)
+        with_df.auxbasis = mp.auxbasis
+        with_df.max_memory = mp.max_memory
+        with_df.stdout = mp.stdout
+        with_df.verbose = mp.verbose
+    if with_df._cderi is None:
+        with_df.build()
+
     nmo = mo_coeff.shape[1]
     nvir = nmo - nocc
-    auxmol = df.incore.format_aux_basis(mp.mol, mp.auxbasis)
-    naoaux = auxmol.nao_nr()
+    nao = mo_coeff.shape[0]
+    nao_pair = nao * (nao+1) // 2
+    mo = numpy.asarray(mo_coeff, order='F')
+    with df.load(with_df._cderi) as feri:
+        naux = feri.shape[0]
+        mem_now = lib.current_memory()[0]
+        if nocc*naux*nvir*8/1e6 + mem_now < mp.max_memory*.8:
+            Lov = numpy.empty((nocc,naux,nvir))
+        else:
+            log.debug('DF tensor (P|ia) is stored in a memory-mapped file')
+            mp._lov_file = tempfile.NamedTemporaryFile()
+            Lov = numpy.memmap(mp._lov_file.name, dtype=numpy.double,
+                               mode='w+', shape=(nocc,naux,nvir))
+
+        max_memory = max(mp.max_memory - lib.current_memory()[0], ioblk)
+        blksize = int(min(ioblk, max_memory*.5)*1e6/8/(nao_pair+nocc*nvir*2))
+        blksize = max(1, min(naux, blksize))
+        for p0, p1 in lib.prange(0, naux, blksize):
+            eri1 = numpy.asarray(feri[p0:p1], order='C')
+            buf = _ao2mo.nr_e2(eri1, mo, (0,nocc,nocc,nmo), 's2', 's1')
+            Lov[:,p0:p1] = buf.reshape(p1-p0,nocc,nvir).transpose(1,0,2)
+            eri1 = buf = None
+    if isinstance(Lov, numpy.memmap):
+        Lov.flush()
+    return Lov
+
+def energy_os_ss(mp, Lov, mo_energy, nocc, verbose=None):
+    '''E_os and E_ss of the canonical MP2.  The blocks of occupied pairs
+    (I,J), J <= I, are distributed over mp.nproc processes.
+    '''
+    if verbose is None:
+        verbose = mp.verbose
+    if isinstance(verbose, logger.Logger):
+        log = verbose
+    else:
+        log = logger.Logger(mp.stdout, verbose)
+    nocc, naux, nvir = Lov.shape
+    eia = lib.direct_sum('i-a->ia', mo_energy[:nocc], mo_energy[nocc:])
+    nproc = getattr(mp, 'nproc', 1)
+    max_memory = max(0, mp.max_memory - lib.current_memory()[0]) / nproc
+    blksize = _occ_blksize(nocc, nvir, naux, max_memory)
+    if nproc > 1:
+        blksize = min(blksize, max(1, (nocc+nproc-1)//nproc))
+    log.debug('DF-MP2 occupied block size %d, nproc %d', blksize, nproc)
+
+    def load(i0, i1):
+        return numpy.asarray(Lov[i0:i1].transpose(1,0,2).reshape(naux,-1),
+                             order='C')
+
+    def energy_blk(i0, i1, j0, j1):
+        lia = load(i0, i1)
+        if j0 == i0:
+            ljb = lia
+        else:
+            ljb = load(j0, j1)
+        gi = lib.dot(lia.T, ljb).reshape(i1-i0,nvir,j1-j0,nvir)
+        lia = ljb = None
+        t2i = gi / lib.direct_sum('ia+jb->iajb', eia[i0:i1], eia[j0:j1])
+        e_os = numpy.einsum('iajb,iajb', t2i, gi)
+        e_ss = e_os - numpy.einsum('iajb,ibja', t2i, gi)
+        if j0 != i0:  # (J,I) block is identical to (I,J)
+            e_os *= 2
+            e_ss *= 2
+        return e_os, e_ss
 
-    iolen = max(int(ioblk*1e6/8/(nvir*nocc)), 160)
+    blks = list(lib.prange(0, nocc, blksize))
+    tasks = [(i0, i1, j0, j1) for i0, i1 in blks for j0, j1 in blks
+             if j0 <= i0]
+    e_os = e_ss = 0
+    time1 = (time.clock(), time.time())
+    for k, (eos, ess) in lib.imap_processes(energy_blk, tasks, nproc):
+        e_os += eos
+        e_ss += ess
+        time1 = log.timer_debug1('DF-MP2 pair block [%d:%d,%d:%d]' % tasks[k],
+                                 *time1)
+    return e_os, e_ss
 
+def energy_os_laplace(mp, Lov, mo_energy, nocc, npoints=20, verbose=None):
+    '''E_os with the Laplace transform of the energy denominator.  The
+    quadrature points are distributed over mp.nproc processes.
+    '''
+    if verbose is None:
+        verbose = mp.verbose
+    if isinstance(verbose, logger.Logger):
+        log = verbose
+    else:
+        log = logger.Logger(mp.stdout, verbose)
+    nocc, naux, nvir = Lov.shape
     eia = lib.direct_sum('i-a->ia', mo_energy[:nocc], mo_energy[nocc:])
-    t2 = None
-    emp2 = 0
-    with mp.ao2mo(mo_coeff, nocc) as fov:
-        for p0, p1 in prange(0, naoaux, iolen):
-            logger.debug(mp, 'Load cderi block %d:%d', p0, p1)
-            qov = numpy.array(fov[p0:p1], copy=False)
-            for i in range(nocc):
-                buf = numpy.dot(qov[:,i*nvir:(i+1)*nvir].T,
-                                qov).reshape(nvir,nocc,nvir)
-                gi = numpy.array(buf, copy=False)
-                gi = gi.reshape(nvir,nocc,nvir).transpose(1,2,0)
-                t2i = gi/lib.direct_sum('jb+a->jba', eia, eia[i])
-                # 2*ijab-ijba
-                theta = gi*2 - gi.transpose(0,2,1)
-                emp2 += numpy.einsum('jab,jab', t2i, theta)
-
-    return emp2, t2
-
-
-class MP2(object):
+    xmin = -eia.max() * 2
+    xmax = -eia.min() * 2
+    ts, ws = laplace_quadrature(xmin, xmax, npoints)
+    nproc = getattr(mp, 'nproc', 1)
+    max_memory = max(0, mp.max_memory - lib.current_memory()[0]) / nproc
+    blksize = int(max_memory*.5e6/8/(naux*nvir*3))
+    blksize = max(1, min(nocc, blksize))
+    log.debug('Laplace SOS-MP2 %d points, occupied block size %d, nproc %d',
+              npoints, blksize, nproc)
+
+    def xx_norm(t):
+        x = numpy.zeros((naux,naux))
+        for i0, i1 in lib.prange(0, nocc, blksize):
+            lt = Lov[i0:i1] * numpy.exp(eia[i0:i1]*(t*.5))[:,None,:]
+            lt = numpy.asarray(lt.transpose(1,0,2).reshape(naux,-1), order='C')
+            lib.dot(lt, lt.T, 1, x, 1)
+        return numpy.einsum('pq,pq', x, x)
+
+    e_os = 0
+    for q, xx in lib.imap_processes(xx_norm, [(t,) for t in ts], nproc):
+        e_os -= ws[q] * xx
+    return e_os
+
+def laplace_quadrature(xmin, xmax, npoints=20):
+    '''Points t and weights w of 1/x = \sum_q w_q exp(-t_q x) for x in
+    [xmin, xmax].  The points are distributed logarithmically and the
+    weights are fitted to the relative error of 1/x.
+    '''
+    r = max(xmax / xmin, 1.01)
+    t = numpy.logspace(numpy.log10(.05/r), numpy.log10(12.), npoints)
+    x = numpy.logspace(0, numpy.log10(r), npoints*20)
+    a = numpy.exp(-numpy.outer(x, t)) * x[:,None]
+    w = numpy.linalg.lstsq(a, numpy.ones_like(x), rcond=-1)[0]
+    return t/xmin, w/xmin
+
+def _occ_blksize(nocc, nvir, naux, max_memory):
+    '''Number of occupied orbitals in each block.  A pair block holds two
+    copies of L_{P,ia} and L_{P,jb}, and two copies of (ia|jb).'''
+    m = max_memory * .8e6/8
+    blksize = int((numpy.sqrt(naux**2 + m) - naux) / (2*nvir))
+    return max(1, min(nocc, blksize))
+
+def _scale(mp, e_os, e_ss):
+    if mp.pt == 0:
+        return mp.ps * e_os
+    if e_ss is None:
+        raise ValueError('Same-spin energy is not available in the Laplace '
+                         'transformed MP2.  Set pt = 0 or laplace_points = 0')
+    return mp.ps * e_os + mp.pt * e_ss
+
+
+class MP2(lib.StreamObject):
+    '''Density fitting MP2
+
+    Attributes:
+        auxbasis : str or basis dict
+            The auxiliary basis.  The DF integrals of the SCF object are
+            reused if it is a density fitting SCF object of the same
+            auxiliary basis.
+        ps : float
+            Scaling factor of the opposite-spin energy.  Default is 1.
+        pt : float
+            Scaling factor of the same-spin energy.  Default is 1.
+        laplace_points : int
+            If > 0, the opposite-spin energy is evaluated with the Laplace
+            transform of this number of quadrature points.  It requires
+            pt = 0.  Default is 0.
+        nproc : int
+            Number of processes to evaluate the occupied pair blocks.
+            Default is 1.
+
+    Saved results
+
+        emp2 : float
+            MP2 correlation energy
+        e_os : float
+            Opposite-spin correlation energy
+        e_ss : float
+            Same-spin correlation energy.  It is None in the Laplace
+            transformed MP2.
+    '''
     def __init__(self, mf):
         self.mol = mf.mol
         self._scf = mf
@@ -58,11 +265,23 @@ class MP2(object):
             self.auxbasis = mf.auxbasis
         else:
             self.auxbasis = 'weigend+etb'
-        self._cderi = None
+        with_df = getattr(mf, 'with_df', None)
+        if (isinstance(with_df, df.DF) and not isinstance(with_df, df.DF4C)
+            and with_df.auxbasis == self.auxbasis):
+            self.with_df = with_df
+        else:
+            self.with_df = None
         self.ioblk = 256
+        self.ps = 1.
+        self.pt = 1.
+        self.laplace_points = 0
+        self.nproc = 1
 
         self.emp2 = None
+        self.e_os = None
+        self.e_ss = None
         self.t2 = None
+        self._lov_file = None
 
     def kernel(self, mo_energy=None, mo_coeff=None, nocc=None):
         if mo_coeff is None:
@@ -71,26 +290,41 @@ class MP2(object):
             mo_energy = self._scf.mo_energy
         if nocc is None:
             nocc = self.mol.nelectron // 2
+        if self.laplace_points > 0 and self.pt != 0:
+            raise ValueError('Laplace transformed MP2 requires pt = 0')
 
-        self.emp2, self.t2 = \
-                kernel(self, mo_energy, mo_coeff, nocc, self.ioblk,
-                       verbose=self.verbose)
+        self.e_os, self.e_ss = \
+                energy_components(self, mo_energy, mo_coeff, nocc, self.ioblk,
+                                  verbose=self.verbose)
+        self._lov_file = None
+        self.emp2 = _scale(self, self.e_os, self.e_ss)
+        logger.log(self, 'E(OS) = %.15g  E(SS) = %s', self.e_os, self.e_ss)
         logger.log(self, 'RMP2 energy = %.15g', self.emp2)
         return self.emp2, self.t2
 
-    # MO integral transformation for cderi[auxstart:auxcount,:nao,:nao]
-    def ao2mo(self, mo_coeff, nocc):
-        time0 = (time.clock(), time.time())
-        log = logger.Logger(self.stdout, self.verbose)
-        cderi_file = tempfile.NamedTemporaryFile()
-        df.outcore.general(self.mol, (mo_coeff[:,:nocc], mo_coeff[:,nocc:]),
-                           cderi_file.name, auxbasis=self.auxbasis, verbose=log)
-        time1 = log.timer('Integral transformation (P|ia)', *time0)
-        return df.load(cderi_file)
+    # MO integral transformation L[i,P,a] = (P|ia)
+    def ao2mo(self, mo_coeff, nocc, ioblk=None):
+        if ioblk is None:
+            ioblk = self.ioblk
+        return ao2mo(self, mo_coeff, nocc, ioblk)
+
+class SCSMP2(MP2):
+    '''Spin-component scaled MP2, ps = 6/5, pt = 1/3
+    (S. Grimme, J. Chem. Phys. 118, 9095)'''
+    def __init__(self, mf):
+        MP2.__init__(self, mf)
+        self.ps = 1.2
+        self.pt = 1./3
+
+class SOSMP2(MP2):
+    '''Scaled opposite-spin MP2, ps = 1.3, pt = 0, evaluated with the Laplace
+    transform (Y. Jung et al, J. Chem. Phys. 121, 9793)'''
+    def __init__(self, mf):
+        MP2.__init__(self, mf)
+        self.ps = 1.3
+        self.pt = 0
+        self.laplace_points = 20
 
-def prange(start, end, step):
-    for i in range(start, end, step):
-        yield i, min(i+step, end)
 
 if __name__ == '__main__':
     from pyscf import scf
@@ -117,5 +351,11 @@ if __name__ == '__main__':
     pt.max_memory = .05
     pt.ioblk = .05
     pt.verbose = 5
+    pt.nproc = 2
     emp2, t2 = pt.kernel()
     print(emp2 - -0.203986171133)
+
+    pt = SOSMP2(mf)
+    emp2 = pt.kernel()[0]
+    pt.laplace_points = 0
+    print(emp2 - pt.kernel()[0])
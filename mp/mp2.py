@@ -7,9 +7,11 @@ import tempfile
 from functools import reduce
 import warnings
 import numpy
+import h5py
 import pyscf.lib
 from pyscf.lib import logger
 from pyscf import ao2mo
+from pyscf.ao2mo import _ao2mo
 
 
 '''
@@ -22,24 +24,150 @@ t2[i,j,a,b] = (ia|jb) / D_ij^ab
 # (ij|kl) => (ij|ol) => (ol|ij) => (ol|oj) => (ol|ov) => (ov|ov)
 #   or    => (ij|ol) => (oj|ol) => (oj|ov) => (ov|ov)
 
-def kernel(mp, mo_energy, mo_coeff, verbose=logger.NOTE):
+def kernel(mp, mo_energy, mo_coeff, verbose=logger.NOTE, with_t2=True):
+    '''MP2 energy and (optionally) the t2 amplitudes.
+
+    (ia|jb) are generated for batches of occupied orbitals i and contracted
+    immediately.  No intermediate integral file is created.  If with_t2 is
+    False, only the energy is computed and t2 is None.  Otherwise t2 is held
+    in memory if it fits in mp.max_memory, or in an HDF5 dataset on disk.
+
+    With the incore AO integrals (mp._scf._eri), the batches are distributed
+    over mp.nproc processes.  The direct algorithm evaluates all AO integrals
+    for each batch.  Its batches are made as large as mp.max_memory allows
+    and run in one process, so that the AO integrals are computed once if
+    the half-transformed integrals of all occupied orbitals fit in memory.
+    '''
+    if isinstance(verbose, logger.Logger):
+        log = verbose
+    else:
+        log = logger.Logger(mp.stdout, verbose)
+    time0 = (time.clock(), time.time())
     nocc = mp.nocc
     nvir = mp.nmo - nocc
     eia = pyscf.lib.direct_sum('i-a->ia', mo_energy[:nocc], mo_energy[nocc:])
-    t2 = numpy.empty((nocc,nocc,nvir,nvir))
-    emp2 = 0
-
-    with mp.ao2mo(mo_coeff) as ovov:
-        for i in range(nocc):
-            gi = numpy.asarray(ovov[i*nvir:(i+1)*nvir])
-            gi = gi.reshape(nvir,nocc,nvir).transpose(1,0,2)
-            t2[i] = gi/pyscf.lib.direct_sum('jb+a->jba', eia, eia[i])
-            # 2*ijab-ijba
-            theta = gi*2 - gi.transpose(0,2,1)
-            emp2 += numpy.einsum('jab,jab', t2[i], theta)
+    nproc = getattr(mp, 'nproc', 1)
+
+    if mp._scf._eri is None:
+        nproc = 1  # Each process would evaluate all AO integrals
+
+    _close_t2file(mp)
+    mem_now = pyscf.lib.current_memory()[0]
+    if with_t2:
+        t2 = _alloc_t2(mp, nocc, nvir, mem_now)
+        if not isinstance(t2, numpy.ndarray):
+            nproc = 1  # t2 blocks are written to HDF5 by one process
+    else:
+        t2 = None
+    max_memory = max(0, mp.max_memory - pyscf.lib.current_memory()[0]) / nproc
+    blksize = _occ_blksize(mp.mol, nocc, nvir, max_memory, mp._scf._eri)
+    log.debug('MP2 occupied batch size %d, nproc %d', blksize, nproc)
+    if mp._scf._eri is None and blksize < nocc:
+        log.debug('MP2 direct algorithm: AO integrals are evaluated %d times',
+                  (nocc+blksize-1)//blksize)
+
+    def energy_blk(i0, i1):
+        gi = _ovov_block(mp, mo_coeff, i0, i1, max_memory)
+        gi = gi.reshape(i1-i0,nvir,nocc,nvir).transpose(0,2,1,3)
+        t2i = gi / pyscf.lib.direct_sum('ia+jb->ijab', eia[i0:i1], eia)
+        # 2*ijab-ijba
+        theta = gi*2 - gi.transpose(0,1,3,2)
+        e = numpy.einsum('ijab,ijab', t2i, theta)
+        if with_t2:
+            return e, t2i
+        else:
+            return e, None
 
+    emp2 = 0
+    time1 = time0
+    tasks = list(pyscf.lib.prange(0, nocc, blksize))
+    for k, (e, t2i) in pyscf.lib.imap_processes(energy_blk, tasks, nproc):
+        emp2 += e
+        if with_t2:
+            i0, i1 = tasks[k]
+            t2[i0:i1] = t2i
+        time1 = log.timer_debug1('MP2 occupied batch [%d:%d]' % tasks[k],
+                                 *time1)
+    log.timer('MP2', *time0)
     return emp2, t2
 
+def _alloc_t2(mp, nocc, nvir, mem_now):
+    '''t2 in memory if it fits in mp.max_memory, otherwise on disk'''
+    if nocc**2*nvir**2*8/1e6 + mem_now < mp.max_memory:
+        return numpy.empty((nocc,nocc,nvir,nvir))
+    mp._t2file = tempfile.NamedTemporaryFile()
+    mp._t2h5 = h5py.File(mp._t2file.name, 'w')
+    return mp._t2h5.create_dataset('t2', (nocc,nocc,nvir,nvir), 'f8',
+                                   chunks=(1,nocc,nvir,nvir))
+
+def _close_t2file(mp):
+    '''Release the HDF5 file of t2 created by the previous kernel call'''
+    if getattr(mp, '_t2h5', None) is not None:
+        mp._t2h5.close()
+        mp._t2h5 = None
+    mp._t2file = None
+
+def _occ_blksize(mol, nocc, nvir, max_memory, eri=None):
+    '''Number of occupied orbitals in each batch.  A batch holds the half
+    transformed integrals (iv|jb) (for the direct algorithm) and three
+    copies of (ia|jb).'''
+    if eri is None:
+        nao = mol.nao_nr()
+        unit = (nao + nvir*3) * nocc*nvir
+    else:
+        unit = nvir*3 * nocc*nvir
+    blksize = int(max_memory*.7e6/8 / unit)
+    return max(1, min(nocc, blksize))
+
+def _ovov_block(mp, mo_coeff, i0, i1, max_memory=2000):
+    '''(ia|jb) for i in [i0:i1] as a (i1-i0)*nvir x nocc*nvir array'''
+    nocc = mp.nocc
+    nmo = mp.nmo
+    co = mo_coeff[:,:nocc]
+    cv = mo_coeff[:,nocc:]
+    if mp._scf._eri is not None:
+        return ao2mo.incore.general(mp._scf._eri, (co[:,i0:i1],cv,co,cv),
+                                    compact=False)
+
+# Direct algorithm:
+#   (mu nu|lambda sigma) -> (mu nu|jb) -> (i nu|jb) -> (ia|jb)
+# The AO integrals are evaluated for a slice of shells mu at a time.
+    mol = mp.mol
+    nao = mo_coeff.shape[0]
+    nvir = nmo - nocc
+    ni = i1 - i0
+    ao_loc = mol.ao_loc_nr()
+    mo = numpy.asarray(mo_coeff, order='F')
+    coT = numpy.asarray(co[:,i0:i1].T, order='C')
+    cvT = numpy.asarray(cv.T, order='C')
+    half = numpy.zeros((ni,nao,nocc*nvir))
+    mem_left = max_memory - half.size*8/1e6 - ni*nvir*nocc*nvir*2*8/1e6
+    # AO integrals and the transformed (mu nu|jb) of a shell slice
+    max_rows = max(1, int(mem_left*1e6/8 / ((nao*(nao+1)//2+nocc*nvir)*nao)))
+    for sh0, sh1 in _shell_slices(ao_loc, max_rows):
+        p0, p1 = ao_loc[sh0], ao_loc[sh1]
+        eri = mol.intor('cint2e_sph', aosym='s2kl',
+                        shls_slice=(sh0, sh1, 0, mol.nbas))
+        eri = _ao2mo.nr_e2(eri, mo, (0,nocc,nocc,nmo), 's2kl', 's1')
+        pyscf.lib.dot(coT[:,p0:p1].copy(), eri.reshape(p1-p0,-1),
+                      1, half.reshape(ni,-1), 1)
+        eri = None
+    ovov = numpy.empty((ni,nvir,nocc*nvir))
+    for i in range(ni):
+        pyscf.lib.dot(cvT, half[i], c=ovov[i])
+    return ovov.reshape(ni*nvir,-1)
+
+def _shell_slices(ao_loc, max_aos):
+    '''Slices of shells, each has at most max_aos AOs (at least one shell)'''
+    nbas = len(ao_loc) - 1
+    sh0 = 0
+    while sh0 < nbas:
+        sh1 = sh0 + 1
+        while sh1 < nbas and ao_loc[sh1+1] - ao_loc[sh0] <= max_aos:
+            sh1 += 1
+        yield sh0, sh1
+        sh0 = sh1
+
 # Need less memory
 def make_rdm1_ao(mp, mo_energy, mo_coeff, verbose=logger.NOTE):
     nmo = mp.nmo
@@ -89,10 +217,11 @@ Given t2 amplitude, current function returns 1-RDM in MO basis''')
     dm1occ = numpy.zeros((nocc,nocc))
     dm1vir = numpy.zeros((nvir,nvir))
     for i in range(nocc):
-        dm1vir += numpy.einsum('jca,jcb->ab', t2[i], t2[i]) * 2 \
-                - numpy.einsum('jca,jbc->ab', t2[i], t2[i])
-        dm1occ += numpy.einsum('iab,jab->ij', t2[i], t2[i]) * 2 \
-                - numpy.einsum('iab,jba->ij', t2[i], t2[i])
+        t2i = numpy.asarray(t2[i])
+        dm1vir += numpy.einsum('jca,jcb->ab', t2i, t2i) * 2 \
+                - numpy.einsum('jca,jbc->ab', t2i, t2i)
+        dm1occ += numpy.einsum('iab,jab->ij', t2i, t2i) * 2 \
+                - numpy.einsum('iab,jba->ij', t2i, t2i)
     rdm1 = numpy.zeros((nmo,nmo))
 # *2 for beta electron
     rdm1[:nocc,:nocc] =-dm1occ * 2
@@ -111,7 +240,7 @@ def make_rdm2(mp, t2, verbose=logger.NOTE):
     #dm2[:nocc,nocc:,:nocc,nocc:] = t2.transpose(0,3,1,2)*2 - t2.transpose(0,2,1,3)
     #dm2[nocc:,:nocc,nocc:,:nocc] = t2.transpose(3,0,2,1)*2 - t2.transpose(2,0,3,1)
     for i in range(nocc):
-        t2i = t2[i]
+        t2i = numpy.asarray(t2[i])
         dm2[i,nocc:,:nocc,nocc:] = t2i.transpose(1,0,2)*2 - t2i.transpose(2,0,1)
         dm2[nocc:,i,nocc:,:nocc] = dm2[i,nocc:,:nocc,nocc:].transpose(0,2,1)
 
@@ -123,12 +252,25 @@ def make_rdm2(mp, t2, verbose=logger.NOTE):
 
 
 class MP2(pyscf.lib.StreamObject):
+    '''Restricted MP2
+
+    Attributes:
+        with_t2 : bool
+            Whether to compute and keep the t2 amplitudes.  If False, only
+            the energy is computed and the memory footprint is independent
+            of the size of t2.  Default is True.
+        nproc : int
+            Number of processes for the batches of occupied orbitals.
+            Default is 1.
+    '''
     def __init__(self, mf):
         self.mol = mf.mol
         self._scf = mf
         self.verbose = self.mol.verbose
         self.stdout = self.mol.stdout
         self.max_memory = mf.max_memory
+        self.with_t2 = True
+        self.nproc = 1
 
         self.nocc = self.mol.nelectron // 2
         self.nmo = len(mf.mo_energy)
@@ -136,8 +278,10 @@ class MP2(pyscf.lib.StreamObject):
         self.emp2 = None
         self.e_corr = None
         self.t2 = None
+        self._t2file = None
+        self._t2h5 = None
 
-    def kernel(self, mo_energy=None, mo_coeff=None):
+    def kernel(self, mo_energy=None, mo_coeff=None, with_t2=None):
         if mo_coeff is None:
             mo_coeff = self._scf.mo_coeff
         if mo_energy is None:
@@ -147,8 +291,11 @@ class MP2(pyscf.lib.StreamObject):
                      'You may need mf.kernel() to generate them.')
             raise RuntimeError
 
+        if with_t2 is None:
+            with_t2 = self.with_t2
+
         self.emp2, self.t2 = \
-                kernel(self, mo_energy, mo_coeff, verbose=self.verbose)
+                kernel(self, mo_energy, mo_coeff, self.verbose, with_t2)
         logger.log(self, 'RMP2 energy = %.15g', self.emp2)
         self.e_corr = self.emp2
         return self.emp2, self.t2
@@ -185,12 +332,19 @@ class MP2(pyscf.lib.StreamObject):
         time1 = log.timer('Integral transformation', *time0)
         return ao2mo.load(eri)
 
+    def __del__(self):
+        _close_t2file(self)
+
     def make_rdm1(self, t2=None):
         if t2 is None: t2 = self.t2
+        if t2 is None:
+            raise RuntimeError('t2 is not available.  Call kernel with with_t2=True')
         return make_rdm1(self, t2, self.verbose)
 
     def make_rdm2(self, t2=None):
         if t2 is None: t2 = self.t2
+        if t2 is None:
+            raise RuntimeError('t2 is not available.  Call kernel with with_t2=True')
         return make_rdm2(self, t2, self.verbose)
 
 def _mem_usage(nocc, nvir):
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+import unittest
+from pyscf import scf
+from pyscf import gto
+from pyscf.mp import dfmp2
+
+mol = gto.Mole()
+mol.verbose = 0
+mol.output = None
+mol.atom = [
+    [8 , (0. , 0.     , 0.)],
+    [1 , (0. , -0.757 , 0.587)],
+    [1 , (0. , 0.757  , 0.587)]]
+
+mol.basis = 'cc-pvdz'
+mol.build()
+mf = scf.density_fit(scf.RHF(mol))
+mf.conv_tol = 1e-12
+mf.scf()
+
+
+class KnowValues(unittest.TestCase):
+    def test_dfmp2(self):
+        pt = dfmp2.MP2(mf)
+        emp2, t2 = pt.kernel()
+        self.assertAlmostEqual(emp2, -0.203986171133, 8)
+        self.assertAlmostEqual(pt.e_os+pt.e_ss, emp2, 12)
+
+    def test_dfmp2_outcore_nproc(self):
+        pt = dfmp2.MP2(mf)
+        pt.max_memory = .05
+        pt.ioblk = .05
+        pt.nproc = 2
+        emp2, t2 = pt.kernel()
+        self.assertAlmostEqual(emp2, -0.203986171133, 8)
+
+    def test_scs_sos(self):
+        pt = dfmp2.MP2(mf)
+        pt.kernel()
+        scs = dfmp2.SCSMP2(mf)
+        self.assertAlmostEqual(scs.kernel()[0], pt.e_os*1.2+pt.e_ss/3, 12)
+        sos = dfmp2.SOSMP2(mf)
+        sos.nproc = 2
+        self.assertAlmostEqual(sos.kernel()[0], pt.e_os*1.3, 7)
+        self.assertTrue(sos.e_ss is None)
+
+        pt.laplace_points = 8
+        self.assertRaises(ValueError, pt.kernel)
+
+
+if __name__ == "__main__":
+    print("Full Tests for DF-MP2")
+    unittest.main()
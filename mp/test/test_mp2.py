@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 import unittest
+import copy
 from functools import reduce
 import numpy
 from pyscf import scf
@@ -47,6 +48,30 @@ class KnowValues(unittest.TestCase):
         self.assertAlmostEqual(e, -0.20401996728747132, 9)
         self.assertAlmostEqual(numpy.linalg.norm(t2), 0.19379397642098622, 9)
 
+        # The HDF5 file of the previous call is closed
+        f = pt._t2h5
+        e, t2 = pt.kernel()
+        self.assertFalse(bool(f))
+        self.assertAlmostEqual(numpy.linalg.norm(t2), 0.19379397642098622, 9)
+        e, t2 = pt.kernel(with_t2=False)
+        self.assertTrue(pt._t2h5 is None)
+
+    def test_mp2_energy_only(self):
+        pt = mp.mp2.MP2(mf)
+        pt.with_t2 = False
+        pt.max_memory = 1
+        pt.nproc = 2
+        e, t2 = pt.kernel()
+        self.assertAlmostEqual(e, -0.20401996728747132, 9)
+        self.assertTrue(t2 is None)
+
+        # integral-direct batches
+        mf1 = copy.copy(mf)
+        mf1._eri = None
+        pt = mp.mp2.MP2(mf1)
+        e, t2 = pt.kernel(with_t2=False)
+        self.assertAlmostEqual(e, -0.20401996728747132, 9)
+
     def test_mp2_dm(self):
         nocc = mol.nelectron//2
         nmo = mf.mo_energy.size
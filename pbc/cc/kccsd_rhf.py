@@ -5,8 +5,11 @@
 #
 
 import time
+import tempfile
 import numpy
 import numpy as np
+import scipy.linalg
+import h5py
 import kpoint_helper
 
 import pyscf.pbc.tools.pbc as tools
@@ -48,7 +51,10 @@ def kernel(cc, eris, t1=None, t2=None, max_cycle=50, tol=1e-8, tolnormt=1e-6,
     eold = 0.0
     eccsd = 0.0
     if cc.diis:
-        adiis = lib.diis.DIIS(cc, cc.diis_file)
+        if isinstance(t2, numpy.ndarray):
+            adiis = lib.diis.DIIS(cc, cc.diis_file)
+        else:
+            adiis = _OutcoreDIIS(cc, cc.diis_file)
         adiis.space = cc.diis_space
     else:
         adiis = lambda t1,t2,*args: (t1,t2)
@@ -56,7 +62,7 @@ def kernel(cc, eris, t1=None, t2=None, max_cycle=50, tol=1e-8, tolnormt=1e-6,
     conv = False
     for istep in range(max_cycle):
         t1new, t2new = cc.update_amps(t1, t2, eris, max_memory)
-        normt = numpy.linalg.norm(t1new-t1) + numpy.linalg.norm(t2new-t2)
+        normt = numpy.linalg.norm(t1new-t1) + _norm_diff(t2new, t2)
         t1, t2 = t1new, t2new
         t1new = t2new = None
         if cc.diis:
@@ -93,9 +99,27 @@ def update_amps(cc, t1, t2, eris, max_memory=2000):
     Loo = imdk.Loo(cc,t1,t2,eris)
     Lvv = imdk.Lvv(cc,t1,t2,eris)
     Woooo = imdk.cc_Woooo(cc,t1,t2,eris)
-    Wvvvv = imdk.cc_Wvvvv(cc,t1,t2,eris)
-    Wvoov = imdk.cc_Wvoov(cc,t1,t2,eris)
-    Wvovo = imdk.cc_Wvovo(cc,t1,t2,eris)
+
+    # Wvvvv is not stored.  Its blocks are generated in the T2 equation.
+    # Wvoov and Wvovo are as large as t2.  They are kept on disk if they do
+    # not fit in max_memory.
+    mem_now = lib.current_memory()[0]
+    if nkpts**3*nocc**2*nvir**2*16*2/1e6 + mem_now < max_memory:
+        fimd = None
+        Wvoov = imdk.cc_Wvoov(cc,t1,t2,eris)
+        Wvovo = imdk.cc_Wvovo(cc,t1,t2,eris)
+    else:
+        log.debug1('max_memory %d MB (current use %d MB).  Wvoov and Wvovo '
+                   'are kept on disk', max_memory, mem_now)
+        _tmpfile = tempfile.NamedTemporaryFile()
+        fimd = h5py.File(_tmpfile.name, 'w')
+        shape = (nkpts,nkpts,nkpts,nvir,nocc,nocc,nvir)
+        Wvoov = fimd.create_dataset('voov', shape, t2.dtype, chunks=(1,1,1)+shape[3:])
+        Wvoov = imdk.cc_Wvoov(cc,t1,t2,eris,out=Wvoov)
+        shape = (nkpts,nkpts,nkpts,nvir,nocc,nvir,nocc)
+        Wvovo = fimd.create_dataset('vovo', shape, t2.dtype, chunks=(1,1,1)+shape[3:])
+        Wvovo = imdk.cc_Wvovo(cc,t1,t2,eris,out=Wvovo)
+    time1 = log.timer_debug1('intermediates', *time0)
 
     # Move energy terms to the other side
     Foo -= foo
@@ -104,131 +128,201 @@ def update_amps(cc, t1, t2, eris, max_memory=2000):
     Lvv -= fvv
 
     kconserv = cc.kconserv
+    # The k-point blocks of t1new and t2new are distributed over nproc
+    # processes.  HDF5 datasets cannot be read by the forked processes.
+    if fimd is None:
+        nproc = imdk._nproc(cc, eris, t2)
+    else:
+        nproc = 1
 
     # T1 equation
     # TODO: Check this conj(). Hirata and Bartlett has
     # f_{vo}(a,i), which should be equal to f_{ov}^*(i,a)
-    t1new = np.empty((nkpts,nocc,nvir),dtype=t1.dtype)
-    t1new[:] = fov[:].conj().copy()
-    for ka in range(nkpts):
+    def t1_ka(ka):
         ki = ka
+        t1a = np.empty((nocc,nvir),dtype=t1.dtype)
+        t1a[:] = fov[ka].conj()
         # kc == ki; kk == ka
-        t1new[ka] += -2.*einsum('kc,ka,ic->ia',fov[ki],t1[ka],t1[ki])
-        t1new[ka] += einsum('ac,ic->ia',Fvv[ka],t1[ki])
-        t1new[ka] += -einsum('ki,ka->ia',Foo[ki],t1[ka])
+        t1a += -2.*einsum('kc,ka,ic->ia',fov[ki],t1[ka],t1[ki])
+        t1a += einsum('ac,ic->ia',Fvv[ka],t1[ki])
+        t1a += -einsum('ki,ka->ia',Foo[ki],t1[ka])
 
         tau_term = np.empty((nkpts,nocc,nocc,nvir,nvir),dtype=t1.dtype)
         for kk in range(nkpts):
             tau_term[kk] = 2*t2[kk,ki,kk] - t2[ki,kk,kk].transpose(1,0,2,3)
         tau_term[ka] += einsum('ic,ka->kica',t1[ki],t1[ka])
+        #:for kk: t1new[ka] += einsum('kc,kica->ia',Fov[kk],tau_term[kk])
+        t1a += einsum('Kkc,Kkica->ia',Fov,tau_term)
 
-        for kk in range(nkpts):
-            kc = kk
-            t1new[ka] += einsum('kc,kica->ia',Fov[kc],tau_term[kk])
-
-            t1new[ka] +=  einsum('akic,kc->ia',2*eris.voov[ka,kk,ki],t1[kc])
-            t1new[ka] +=  einsum('akci,kc->ia', -eris.vovo[ka,kk,kc],t1[kc])
+        # kc == kk
+        #:t1new[ka] += einsum('akic,kc->ia',2*eris.voov[ka,kk,ki],t1[kc])
+        #:t1new[ka] += einsum('akci,kc->ia', -eris.vovo[ka,kk,kc],t1[kc])
+        kidx = [(ka,kk,ki) for kk in range(nkpts)]
+        t1a += einsum('Kakic,Kkc->ia',2*_gather(eris.voov,kidx),t1)
+        kidx = [(ka,kk,kk) for kk in range(nkpts)]
+        t1a += einsum('Kakci,Kkc->ia', -_gather(eris.vovo,kidx),t1)
 
+        for kk in range(nkpts):
+            Svovv = np.empty((nkpts,nvir,nocc,nvir,nvir),dtype=t1.dtype)
+            Sooov = np.empty((nkpts,nocc,nocc,nocc,nvir),dtype=t1.dtype)
+            tau_term_1 = np.empty((nkpts,nocc,nocc,nvir,nvir),dtype=t1.dtype)
             for kc in range(nkpts):
                 kd = kconserv[ka,kc,kk]
-
-                Svovv = 2*eris.vovv[ka,kk,kc] - eris.vovv[ka,kk,kd].transpose(0,1,3,2)
-                tau_term_1 = t2[ki,kk,kc].copy()
-                if ki == kc and kk == kd:
-                    tau_term_1 += einsum('ic,kd->ikcd',t1[ki],t1[kk])
-                t1new[ka] += einsum('akcd,ikcd->ia',Svovv,tau_term_1)
-
+                Svovv[kc] = 2*eris.vovv[ka,kk,kc] - eris.vovv[ka,kk,kd].transpose(0,1,3,2)
                 # kk - ki + kl = kc
                 #  => kl = ki - kk + kc
                 kl = kconserv[ki,kk,kc]
-                Sooov = 2*eris.ooov[kk,kl,ki] - eris.ooov[kl,kk,ki].transpose(1,0,2,3)
-                tau_term_1 = t2[kk,kl,ka].copy()
-                if kk == ka and kl == kc:
-                    tau_term_1 += einsum('ka,lc->klac',t1[ka],t1[kc])
-                t1new[ka] += -einsum('klic,klac->ia',Sooov,tau_term_1)
+                Sooov[kc] = 2*eris.ooov[kk,kl,ki] - eris.ooov[kl,kk,ki].transpose(1,0,2,3)
+                tau_term_1[kc] = t2[kk,kl,ka]
+            # if kk == ka, kl == kc for all kc
+            if kk == ka:
+                tau_term_1 += einsum('ka,Clc->Cklac',t1[ka],t1)
+            #:for kc: t1new[ka] += -einsum('klic,klac->ia',Sooov[kc],tau_term_1[kc])
+            t1a += -einsum('Cklic,Cklac->ia',Sooov,tau_term_1)
+
+            tau_term_1 = t2[ki,kk].copy()
+            # kc == ki => kd == kk
+            tau_term_1[ki] += einsum('ic,kd->ikcd',t1[ki],t1[kk])
+            #:for kc: t1new[ka] += einsum('akcd,ikcd->ia',Svovv[kc],tau_term_1[kc])
+            t1a += einsum('Cakcd,Cikcd->ia',Svovv,tau_term_1)
+        return t1a
+
+    t1new = np.empty((nkpts,nocc,nvir),dtype=t1.dtype)
+    for ka, t1a in lib.imap_processes(t1_ka, [(ka,) for ka in range(nkpts)],
+                                      nproc):
+        t1new[ka] = t1a
+    time1 = log.timer_debug1('t1', *time1)
 
     # T2 equation
-    # For conj(), see Hirata and Bartlett, Eq. (36)
-    t2new = np.array(eris.oovv, copy=True).conj()
-    for ki in range(nkpts):
-      for kj in range(nkpts):
-        for ka in range(nkpts):
+    # The loops over kl and kk are contracted in one GEMM for each
+    # (ki,kj,ka).  Each process computes the slab t2new[ki].
+    def t2_ki(ki):
+        # For conj(), see Hirata and Bartlett, Eq. (36)
+        t2ki = np.array(eris.oovv[ki], dtype=t2.dtype).conj()
+        for kj in range(nkpts):
+          for ka in range(nkpts):
             # Chemist's notation for momentum conserving t2(ki,kj,ka,kb)
             kb = kconserv[ki,ka,kj]
-
-            for kl in range(nkpts):
-                # kk - ki + kl = kj
-                # => kk = kj - kl + ki
-                kk = kconserv[kj,kl,ki]
-                t2new[ki,kj,ka] += einsum('klij,klab->ijab',Woooo[kk,kl,ki],t2[kk,kl,ka])
-                if kl == kb and kk == ka:
-                    t2new[ki,kj,ka] += einsum('klij,ka,lb->ijab',Woooo[ka,kb,ki],t1[ka],t1[kb])
-
-            for kc in range(nkpts):
-                kd = kconserv[ka,kc,kb]
-                tau_term = t2[ki,kj,kc].copy()
-                if ki == kc and kj == kd:
-                    tau_term += einsum('ic,jd->ijcd',t1[ki],t1[kj])
-                t2new[ki,kj,ka] += einsum('abcd,ijcd->ijab',Wvvvv[ka,kb,kc],tau_term)
-
-            t2new[ki,kj,ka] += einsum('ac,ijcb->ijab',Lvv[ka],t2[ki,kj,ka])
+            t2ij = t2ki[kj,ka]
+
+            # kk - ki + kl = kj
+            # => kk = kj - kl + ki
+            kks = kconserv[kj,:,ki]
+            Wklij = _gather(Woooo, [(kks[kl],kl,ki) for kl in range(nkpts)])
+            tau_term = _gather(t2, [(kks[kl],kl,ka) for kl in range(nkpts)])
+            # kl == kb => kk == ka
+            tau_term[kb] += einsum('ka,lb->klab',t1[ka],t1[kb])
+            #:for kl: t2new[ki,kj,ka] += einsum('klij,klab->ijab',Woooo[kk,kl,ki],tau_term[kl])
+            t2ij += einsum('Lklij,Lklab->ijab',Wklij,tau_term)
+
+            t2ij += einsum('ac,ijcb->ijab',Lvv[ka],t2[ki,kj,ka])
             #P(ij)P(ab)
-            t2new[ki,kj,ka] += einsum('bc,jica->ijab',Lvv[kb],t2[kj,ki,kb])
+            t2ij += einsum('bc,jica->ijab',Lvv[kb],t2[kj,ki,kb])
 
-            t2new[ki,kj,ka] += einsum('ki,kjab->ijab',-Loo[ki],t2[ki,kj,ka])
+            t2ij += einsum('ki,kjab->ijab',-Loo[ki],t2[ki,kj,ka])
             #P(ij)P(ab)
-            t2new[ki,kj,ka] += einsum('kj,kiba->ijab',-Loo[kj],t2[kj,ki,kb])
+            t2ij += einsum('kj,kiba->ijab',-Loo[kj],t2[kj,ki,kb])
 
             tmp2 = eris.vvov[ka,kb,ki] - einsum('kbic,ka->abic',eris.ovov[ka,kb,ki],t1[ka])
             tmp  = einsum('abic,jc->ijab',tmp2,t1[kj])
-            t2new[ki,kj,ka] += tmp
+            t2ij += tmp
             #P(ij)P(ab)
             tmp2 = eris.vvov[kb,ka,kj] - einsum('kajc,kb->bajc',eris.ovov[kb,ka,kj],t1[kb])
             tmp  = einsum('bajc,ic->ijab',tmp2,t1[ki])
-            t2new[ki,kj,ka] += tmp
+            t2ij += tmp
 
             # ka - ki + kk = kj
             # => kk = ki - ka + kj
             kk = kconserv[ki,ka,kj]
             tmp2 = eris.vooo[ka,kk,ki] + einsum('akic,jc->akij',eris.voov[ka,kk,ki],t1[kj])
             tmp  = einsum('akij,kb->ijab',tmp2,t1[kb])
-            t2new[ki,kj,ka] -= tmp
+            t2ij -= tmp
             #P(ij)P(ab)
             kk = kconserv[kj,kb,ki]
             tmp2 = eris.vooo[kb,kk,kj] + einsum('bkjc,ic->bkji',eris.voov[kb,kk,kj],t1[ki])
             tmp  = einsum('bkji,ka->ijab',tmp2,t1[ka])
-            t2new[ki,kj,ka] -= tmp
-
-            for kk in range(nkpts):
-                kc = kconserv[ka,ki,kk]
-                tmp_voov = 2.*Wvoov[ka,kk,ki] - Wvovo[ka,kk,kc].transpose(0,1,3,2)
-                tmp = einsum('akic,kjcb->ijab',tmp_voov,t2[kk,kj,kc])
-                #tmp = 2*einsum('akic,kjcb->ijab',Wvoov[ka,kk,ki],t2[kk,kj,kc]) - \
-                #        einsum('akci,kjcb->ijab',Wvovo[ka,kk,kc],t2[kk,kj,kc])
-                t2new[ki,kj,ka] += tmp
-                #P(ij)P(ab)
-                kc = kconserv[kb,kj,kk]
-                tmp_voov = 2.*Wvoov[kb,kk,kj] - Wvovo[kb,kk,kc].transpose(0,1,3,2)
-                tmp = einsum('bkjc,kica->ijab',tmp_voov,t2[kk,ki,kc])
-                #tmp = 2*einsum('bkjc,kica->ijab',Wvoov[kb,kk,kj],t2[kk,ki,kc]) - \
-                #        einsum('bkcj,kica->ijab',Wvovo[kb,kk,kc],t2[kk,ki,kc])
-                t2new[ki,kj,ka] += tmp
-
-                kc = kconserv[ka,ki,kk]
-                tmp = einsum('akic,kjbc->ijab',Wvoov[ka,kk,ki],t2[kk,kj,kb])
-                t2new[ki,kj,ka] -= tmp
-                #P(ij)P(ab)
-                kc = kconserv[kb,kj,kk]
-                tmp = einsum('bkjc,kiac->ijab',Wvoov[kb,kk,kj],t2[kk,ki,ka])
-                t2new[ki,kj,ka] -= tmp
-
-                kc = kconserv[kk,ka,kj]
-                tmp = einsum('bkci,kjac->ijab',Wvovo[kb,kk,kc],t2[kk,kj,ka])
-                t2new[ki,kj,ka] -= tmp
-                #P(ij)P(ab)
-                kc = kconserv[kk,kb,ki]
-                tmp = einsum('akcj,kibc->ijab',Wvovo[ka,kk,kc],t2[kk,ki,kb])
-                t2new[ki,kj,ka] -= tmp
+            t2ij -= tmp
+
+            kkr = range(nkpts)
+            # kc = kconserv[ka,ki,kk]
+            kcs = kconserv[ka,ki,:]
+            Wvoov_a = _gather(Wvoov, [(ka,kk,ki) for kk in kkr])
+            tmp_voov = 2.*Wvoov_a - _gather(Wvovo, [(ka,kk,kcs[kk]) for kk in kkr]).transpose(0,1,2,4,3)
+            #:tmp = einsum('akic,kjcb->ijab',tmp_voov[kk],t2[kk,kj,kc])
+            t2ij += einsum('Kakic,Kkjcb->ijab',tmp_voov,
+                           _gather(t2, [(kk,kj,kcs[kk]) for kk in kkr]))
+            #P(ij)P(ab)
+            kcs = kconserv[kb,kj,:]
+            Wvoov_b = _gather(Wvoov, [(kb,kk,kj) for kk in kkr])
+            tmp_voov = 2.*Wvoov_b - _gather(Wvovo, [(kb,kk,kcs[kk]) for kk in kkr]).transpose(0,1,2,4,3)
+            #:tmp = einsum('bkjc,kica->ijab',tmp_voov[kk],t2[kk,ki,kc])
+            t2ij += einsum('Kbkjc,Kkica->ijab',tmp_voov,
+                           _gather(t2, [(kk,ki,kcs[kk]) for kk in kkr]))
+
+            #:tmp = einsum('akic,kjbc->ijab',Wvoov[ka,kk,ki],t2[kk,kj,kb])
+            t2ij -= einsum('Kakic,Kkjbc->ijab',Wvoov_a,t2[:,kj,kb])
+            #P(ij)P(ab)
+            #:tmp = einsum('bkjc,kiac->ijab',Wvoov[kb,kk,kj],t2[kk,ki,ka])
+            t2ij -= einsum('Kbkjc,Kkiac->ijab',Wvoov_b,t2[:,ki,ka])
+
+            # kc = kconserv[kk,ka,kj]
+            kcs = kconserv[:,ka,kj]
+            #:tmp = einsum('bkci,kjac->ijab',Wvovo[kb,kk,kc],t2[kk,kj,ka])
+            t2ij -= einsum('Kbkci,Kkjac->ijab',
+                           _gather(Wvovo, [(kb,kk,kcs[kk]) for kk in kkr]), t2[:,kj,ka])
+            #P(ij)P(ab)
+            # kc = kconserv[kk,kb,ki]
+            kcs = kconserv[:,kb,ki]
+            #:tmp = einsum('akcj,kibc->ijab',Wvovo[ka,kk,kc],t2[kk,ki,kb])
+            t2ij -= einsum('Kakcj,Kkibc->ijab',
+                           _gather(Wvovo, [(ka,kk,kcs[kk]) for kk in kkr]), t2[:,ki,kb])
+            Wvoov_a = Wvoov_b = tmp_voov = None
+        return t2ki
+
+    # t2new is kept on disk if t2 is.  Its (ki,kj,ka) blocks are read and
+    # written one at a time below.
+    if isinstance(t2, numpy.ndarray):
+        t2new = np.empty_like(t2)
+    else:
+        t2new = _new_t2(t2.shape, t2.dtype)
+    for ki, t2ki in lib.imap_processes(t2_ki, [(ki,) for ki in range(nkpts)],
+                                       nproc):
+        t2new[ki] = t2ki
+    Wvoov = Wvovo = None
+    if fimd is not None:
+        fimd.close()
+    time1 = log.timer_debug1('t2', *time1)
+
+    # Wvvvv term.  Each block Wvvvv[ka,kb,kc] is generated once and applied
+    # to all pairs (ki,kj) with ki + kj = ka + kb.  Each process computes the
+    # contributions to the slab t2new[:,:,ka].
+    def wvvvv_ka(ka):
+        t2a = np.zeros((nkpts,nkpts,nocc,nocc,nvir,nvir),dtype=t2.dtype)
+        for kb in range(nkpts):
+            # ka - ki + kb = kj
+            kjs = kconserv[ka,:,kb]
+            for kc in range(nkpts):
+                kd = kconserv[ka,kc,kb]
+                tau_term = np.empty((nkpts,nocc,nocc,nvir,nvir),dtype=t2.dtype)
+                for ki in range(nkpts):
+                    kj = kjs[ki]
+                    tau_term[ki] = t2[ki,kj,kc]
+                    if ki == kc and kj == kd:
+                        tau_term[ki] += einsum('ic,jd->ijcd',t1[ki],t1[kj])
+                Wabcd = imdk.cc_Wvvvv_block(cc,t1,t2,eris,ka,kb,kc)
+                #:t2new[ki,kj,ka] += einsum('abcd,ijcd->ijab',Wabcd,tau_term[ki])
+                tmp = np.dot(tau_term.reshape(-1,nvir**2),
+                             Wabcd.reshape(nvir**2,-1).T)
+                tmp = tmp.reshape(nkpts,nocc,nocc,nvir,nvir)
+                for ki in range(nkpts):
+                    t2a[ki,kjs[ki]] += tmp[ki]
+                Wabcd = tau_term = tmp = None
+        return t2a
+
+    for ka, t2a in lib.imap_processes(wvvvv_ka, [(ka,) for ka in range(nkpts)],
+                                      nproc):
+        t2new[:,:,ka] += t2a
+    time1 = log.timer_debug1('Wvvvv contraction', *time1)
 
     eia = numpy.zeros(shape=t1new.shape, dtype=t1new.dtype)
     for ki in range(nkpts):
@@ -259,23 +353,145 @@ def energy(cc, t1, t2, eris):
     e = 0.0 + 1j*0.0
     for ki in range(nkpts):
         e += 2*einsum('ia,ia', fock[ki,:nocc,nocc:], t1[ki])
-    t1t1 = numpy.zeros(shape=t2.shape,dtype=t2.dtype)
-    for ki in range(nkpts):
-        ka = ki
-        for kj in range(nkpts):
-            #kb = kj
-            t1t1[ki,kj,ka] = einsum('ia,jb->ijab',t1[ki],t1[kj])
-    tau = t2 + t1t1
     for ki in range(nkpts):
         for kj in range(nkpts):
             for ka in range(nkpts):
                 kb = kconserv[ki,ka,kj]
-                e += einsum('ijab,ijab', 2*tau[ki,kj,ka], eris.oovv[ki,kj,ka])
-                e += einsum('ijab,ijba',  -tau[ki,kj,ka], eris.oovv[ki,kj,kb])
+                tau = t2[ki,kj,ka].copy()
+                if ka == ki:  # => kb == kj
+                    tau += einsum('ia,jb->ijab',t1[ki],t1[kj])
+                e += einsum('ijab,ijab', 2*tau, eris.oovv[ki,kj,ka])
+                e += einsum('ijab,ijba',  -tau, eris.oovv[ki,kj,kb])
     e /= nkpts
     return e.real
 
 
+def _gather(a, kidx):
+    '''Stack the k-point blocks a[k1,k2,k3] for (k1,k2,k3) in kidx.  a can be
+    an ndarray or an h5py dataset.
+    '''
+    if isinstance(a, numpy.ndarray):
+        k1, k2, k3 = numpy.asarray(kidx).T
+        return a[k1,k2,k3]
+    else:
+        return numpy.asarray([a[k1,k2,k3] for k1, k2, k3 in kidx])
+
+def _norm_diff(a, b):
+    '''norm(a-b) computed slab by slab.  a and b can be ndarrays or h5py
+    datasets.
+    '''
+    if isinstance(a, numpy.ndarray) and isinstance(b, numpy.ndarray):
+        return numpy.linalg.norm(a-b)
+    else:
+        return numpy.sqrt(sum(numpy.linalg.norm(a[k]-b[k])**2
+                              for k in range(len(a))))
+
+def _new_t2(shape, dtype):
+    '''An h5py dataset in a temporary file for the out-of-core t2 amplitudes.
+    The dataset keeps the file open.  The file is released with the dataset.
+    '''
+    _tmpfile = tempfile.NamedTemporaryFile()
+    ft2 = h5py.File(_tmpfile.name, 'w')
+    return ft2.create_dataset('t2', shape, dtype, chunks=(1,1,1)+shape[3:])
+
+def _check_eris_incore(cc, method):
+    '''The EOM intermediates (see kintermediates_rhf) slice and copy the ERI
+    and t2 blocks as ndarrays.  The out-of-core ERIs and t2 (h5py datasets)
+    are not supported.
+    '''
+    if not (isinstance(cc.eris.oovv, numpy.ndarray) and
+            isinstance(cc.t2, numpy.ndarray)):
+        raise NotImplementedError('%s with the out-of-core ERIs or t2.  '
+                                  'Increase max_memory or set '
+                                  'cell.incore_anyway to hold the ERIs and '
+                                  'amplitudes in memory.' % method)
+
+
+class _OutcoreDIIS(lib.diis.DIIS):
+    '''DIIS for the amplitudes when t2 is an h5py dataset.  The trial vectors
+    and the error vectors (the difference to the previous extrapolated
+    amplitudes) are stored in the DIIS file and are read one slab t2[ki] at a
+    time.  t1 is small and kept in memory.
+    '''
+    def update_amps(self, t1, t2):
+        nkpts = len(t2)
+        f = self._diisfile
+        if 'xprev' not in f:
+            xprev = f.create_dataset('xprev', t2.shape, t2.dtype, chunks=t2.chunks)
+            for ki in range(nkpts):
+                xprev[ki] = t2[ki]
+            self._t1prev = t1.copy()
+            return t1, t2
+        xprev = f['xprev']
+
+        if self._head >= self.space:
+            self._head = 0
+        if len(self._bookkeep) >= self.space:
+            self._bookkeep.pop(0)
+        head = self._head
+        self._bookkeep.append(head)
+        xkey = 'x%d' % head
+        ekey = 'e%d' % head
+        if xkey not in f:
+            f.create_dataset(xkey, t2.shape, t2.dtype, chunks=t2.chunks)
+            f.create_dataset(ekey, t2.shape, t2.dtype, chunks=t2.chunks)
+        self._buffer[xkey] = t1.copy()
+        self._buffer[ekey] = t1 - self._t1prev
+        for ki in range(nkpts):
+            t2ki = t2[ki]
+            f[xkey][ki] = t2ki
+            f[ekey][ki] = t2ki - xprev[ki]
+        self._head += 1
+
+        nd = self.get_num_vec()
+        if nd < self.min_space:
+            return t1, t2
+
+        if self._H is None:
+            self._H = numpy.zeros((self.space+1,self.space+1), t2.dtype)
+            self._H[0,1:] = self._H[1:,0] = 1
+        for i in range(nd):
+            tmp = numpy.dot(self._buffer[ekey].ravel().conj(),
+                            self._buffer['e%d'%i].ravel())
+            for ki in range(nkpts):
+                tmp += numpy.dot(f[ekey][ki].ravel().conj(),
+                                 f['e%d'%i][ki].ravel())
+            self._H[self._head,i+1] = tmp
+            self._H[i+1,self._head] = tmp.conjugate()
+        h = self._H[:nd+1,:nd+1]
+        g = numpy.zeros(nd+1, t2.dtype)
+        g[0] = 1
+        w, v = scipy.linalg.eigh(h)
+        idx = abs(w)>1e-14
+        c = numpy.dot(v[:,idx]*(1/w[idx]), numpy.dot(v[:,idx].T.conj(), g))
+        logger.debug1(self, 'diis-c %s', c)
+
+        t1 = numpy.zeros_like(t1)
+        for i, ci in enumerate(c[1:]):
+            t1 += self._buffer['x%d'%i] * ci
+        self._t1prev = t1.copy()
+# The extrapolated t2 overwrites the input t2, like CCSD.diis does
+        for ki in range(nkpts):
+            t2ki = 0
+            for i, ci in enumerate(c[1:]):
+                t2ki = t2ki + f['x%d'%i][ki] * ci
+            t2[ki] = t2ki
+            xprev[ki] = t2ki
+        return t1, t2
+
+
+# The incore ERIs hold the full nkpts^3*nmo^4 array during the
+# transformation.  The amplitudes and the intermediates Wvoov, Wvovo in
+# update_amps are about 6 copies of t2.  t2 and the DIIS vectors are kept on
+# disk if they do not fit in max_memory.
+def _mem_usage(nkpts, nocc, nvir):
+    nmo = nocc + nvir
+    basic = nkpts**3 * nocc**2*nvir**2 * 6 * 16/1e6
+    incore = nkpts**3 * nmo**4 * 2 * 16/1e6 + basic
+    outcore = basic
+    return incore, outcore, basic
+
+
 class RCCSD(pyscf.cc.ccsd.CCSD):
 
     def __init__(self, mf, frozen=[], mo_energy=None, mo_coeff=None, mo_occ=None):
@@ -287,6 +503,8 @@ class RCCSD(pyscf.cc.ccsd.CCSD):
         self.made_ee_imds = False
         self.made_ip_imds = False
         self.made_ea_imds = False
+        # Number of processes for the loops over k-points in update_amps
+        self.nproc = 1
 
     def dump_flags(self):
         pyscf.cc.ccsd.CCSD.dump_flags(self)
@@ -299,12 +517,17 @@ class RCCSD(pyscf.cc.ccsd.CCSD):
         nvir = self.nmo() - nocc
         nkpts = self.nkpts
         t1 = numpy.zeros((nkpts,nocc,nvir), dtype=numpy.complex128)
-        t2 = numpy.zeros((nkpts,nkpts,nkpts,nocc,nocc,nvir,nvir), dtype=numpy.complex128)
-        woovv = numpy.empty((nkpts,nkpts,nkpts,nocc,nocc,nvir,nvir), dtype=numpy.complex128)
+        shape = (nkpts,nkpts,nkpts,nocc,nocc,nvir,nvir)
+        mem_now = lib.current_memory()[0]
+        if _mem_usage(nkpts, nocc, nvir)[2] + mem_now < self.max_memory:
+            t2 = numpy.zeros(shape, dtype=numpy.complex128)
+        else:
+            logger.debug1(self, 'max_memory %d MB (current use %d MB).  t2 '
+                          'is kept on disk', self.max_memory, mem_now)
+            t2 = _new_t2(shape, numpy.complex128)
         self.emp2 = 0
         foo = eris.fock[:,:nocc,:nocc].copy()
         fvv = eris.fock[:,nocc:,nocc:].copy()
-        eris_oovv = eris.oovv.copy()
         eia = numpy.zeros((nocc,nvir))
         eijab = numpy.zeros((nocc,nocc,nvir,nvir))
 
@@ -316,11 +539,12 @@ class RCCSD(pyscf.cc.ccsd.CCSD):
                 eia = np.diagonal(foo[ki]).reshape(-1,1) - np.diagonal(fvv[ka])
                 ejb = np.diagonal(foo[kj]).reshape(-1,1) - np.diagonal(fvv[kb])
                 eijab = pyscf.lib.direct_sum('ia,jb->ijab',eia,ejb)
-                woovv[ki,kj,ka] = (2*eris_oovv[ki,kj,ka] - eris_oovv[ki,kj,kb].transpose(0,1,3,2))
-                t2[ki,kj,ka] = eris_oovv[ki,kj,ka] / eijab
-
-        t2 = numpy.conj(t2)
-        self.emp2 = numpy.einsum('pqrijab,pqrijab',t2,woovv).real
+                # eris.oovv may be an h5py dataset.  Read one block at a time.
+                eris_oovv = numpy.asarray(eris.oovv[ki,kj,ka])
+                woovv = 2*eris_oovv - numpy.asarray(eris.oovv[ki,kj,kb]).transpose(0,1,3,2)
+                t2ijab = eris_oovv.conj() / eijab
+                t2[ki,kj,ka] = t2ijab
+                self.emp2 += numpy.einsum('ijab,ijab',t2ijab,woovv).real
         self.emp2 /= nkpts
         logger.info(self, 'Init t2, MP2 energy = %.15g', self.emp2)
         logger.timer(self, 'init mp2', *time0)
@@ -371,7 +595,17 @@ class RCCSD(pyscf.cc.ccsd.CCSD):
     def update_amps(self, t1, t2, eris, max_memory=2000):
         return update_amps(self, t1, t2, eris, max_memory)
 
+    def diis(self, t1, t2, istep, normt, de, adiis):
+        if not isinstance(adiis, _OutcoreDIIS):
+            return pyscf.cc.ccsd.CCSD.diis(self, t1, t2, istep, normt, de, adiis)
+        if (istep > self.diis_start_cycle and
+            abs(de) < self.diis_start_energy_diff):
+            t1, t2 = adiis.update_amps(t1, t2)
+            logger.debug(self, 'DIIS for step %d', istep)
+        return t1, t2
+
     def ipccsd(self, nroots=2*4, kptlist=None):
+        _check_eris_incore(self, 'IP-EOM-CCSD')
         time0 = time.clock(), time.time()
         log = logger.Logger(self.stdout, self.verbose)
         nocc = self.nocc()
@@ -528,6 +762,7 @@ class RCCSD(pyscf.cc.ccsd.CCSD):
         return vector
 
     def eaccsd(self, nroots=2*4, kptlist=None):
+        _check_eris_incore(self, 'EA-EOM-CCSD')
         time0 = time.clock(), time.time()
         log = logger.Logger(self.stdout, self.verbose)
         nocc = self.nocc()
@@ -716,7 +951,7 @@ class _ERIS:
         nocc = cc.nocc()
         nmo = cc.nmo()
         nvir = nmo - nocc
-        mem_incore, mem_outcore, mem_basic = pyscf.cc.ccsd._mem_usage(nocc, nvir)
+        mem_incore, mem_outcore, mem_basic = _mem_usage(nkpts, nocc, nvir)
         mem_now = pyscf.lib.current_memory()[0]
 
         log = logger.Logger(cc.stdout, cc.verbose)
@@ -798,8 +1033,56 @@ class _ERIS:
             self.vvov = eri[:,:,:,nocc:,nocc:,:nocc,nocc:].copy() / nkpts
             self.vooo = eri[:,:,:,nocc:,:nocc,:nocc,:nocc].copy() / nkpts
 
+        else:
+            # Each ERI block is a dataset indexed by (k1,k2,k3) in physicist's
+            # notation.  The fourth k-point is kconserv[k1,k3,k2].
+            cput1 = (time.clock(), time.time())
+            kconserv = cc.kconserv
+            khelper = cc.khelper
+            self.dtype = numpy.complex128
+            self._tmpfile = tempfile.NamedTemporaryFile()
+            self.feri = h5py.File(self._tmpfile.name, 'w')
+            orbspace = {'o': slice(0, nocc), 'v': slice(nocc, nmo)}
+            orbsize = {'o': nocc, 'v': nvir}
+            blocks = []
+            for key in ('oooo', 'ooov', 'ovoo', 'oovv', 'ovov', 'ovvv', 'vvvv',
+                        'voov', 'vovo', 'vovv', 'oovo', 'vvov', 'vooo'):
+                shape = tuple([orbsize[x] for x in key])
+                dset = self.feri.create_dataset(key, (nkpts,nkpts,nkpts)+shape,
+                                                'c16', chunks=(1,1,1)+shape)
+                setattr(self, key, dset)
+                blocks.append((dset, tuple([orbspace[x] for x in key])))
+
+            # All k-point triplets related to the same irreducible triplet
+            # are generated from one integral transformation.
+            equivalents = {}
+            for kp in range(nkpts):
+                for kq in range(nkpts):
+                    for kr in range(nkpts):
+                        irr = tuple(khelper.get_irrVec(kp,kq,kr))
+                        equivalents.setdefault(irr, []).append((kp,kq,kr))
+
+            for kp, kq, kr in numpy.asarray(khelper.get_uniqueList(), dtype=int):
+                ks = kconserv[kp,kq,kr]
+                eri_kpt = pyscf.pbc.ao2mo.general(cc._scf.cell,
+                            (mo_coeff[kp,:,:],mo_coeff[kq,:,:],mo_coeff[kr,:,:],mo_coeff[ks,:,:]),
+                            (cc.kpts[kp],cc.kpts[kq],cc.kpts[kr],cc.kpts[ks]))
+                eri_kpt = eri_kpt.reshape(nmo,nmo,nmo,nmo)
+                for k1, k2, k3 in equivalents[(kp,kq,kr)]:
+                    # Chemist -> physics notation
+                    eri = khelper.transform_irr2full(eri_kpt,k1,k2,k3)
+                    eri = eri.transpose(0,2,1,3) / nkpts
+                    for dset, idx in blocks:
+                        dset[k1,k3,k2] = eri[idx]
+                eri = eri_kpt = None
+                cput1 = log.timer_debug1('transforming (%d,%d,%d)' % (kp,kq,kr), *cput1)
+
         log.timer('CCSD integral transformation', *cput0)
 
+    def __del__(self):
+        if hasattr(self, 'feri'):
+            self.feri.close()
+
 
 class _IMDS:
     def __init__(self):
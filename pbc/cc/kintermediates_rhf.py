@@ -5,7 +5,8 @@
 #
 
 import numpy as np
-#from pyscf import lib
+import h5py
+from pyscf import lib
 from pyscf.pbc import lib as pbclib
 
 #einsum = np.einsum
@@ -18,42 +19,53 @@ dot = np.dot
 # J. Chem. Phys. 120, 2581 (2004)               #
 #################################################
 
+def _nproc(cc, eris, t2=None):
+    '''Number of processes for the loops over k-points.  The ERIs and t2 are
+    shared with the forked processes, unless they are stored in an HDF5 file
+    which cannot be read by the forked processes.
+    '''
+    if isinstance(eris.oovv, h5py.Dataset) or isinstance(t2, h5py.Dataset):
+        return 1
+    return getattr(cc, 'nproc', 1)
+
 ### Eqs. (37)-(39) "kappa"
 
 def cc_Foo(cc,t1,t2,eris):
     nkpts, nocc, nvir = t1.shape
     kconserv = cc.kconserv
     Fki = np.empty((nkpts,nocc,nocc),dtype=t2.dtype)
+    Soovv = np.empty((nkpts,nkpts,nocc,nocc,nvir,nvir),dtype=t2.dtype)
     for ki in range(nkpts):
         kk = ki
         Fki[ki] = eris.fock[ki,:nocc,:nocc].copy()
         for kl in range(nkpts):
             for kc in range(nkpts):
                 kd = kconserv[kk,kc,kl]
-                Soovv = 2*eris.oovv[kk,kl,kc] - eris.oovv[kk,kl,kd].transpose(0,1,3,2)
-                Fki[ki] += einsum('klcd,ilcd->ki',Soovv,t2[ki,kl,kc])
+                Soovv[kl,kc] = 2*eris.oovv[kk,kl,kc] - eris.oovv[kk,kl,kd].transpose(0,1,3,2)
+        #:for kl, kc: Fki[ki] += einsum('klcd,ilcd->ki',Soovv[kl,kc],t2[ki,kl,kc])
+        Fki[ki] += einsum('LCklcd,LCilcd->ki',Soovv,t2[ki])
+        for kl in range(nkpts):
             #if ki == kc:
-            kd = kconserv[kk,ki,kl]
-            Soovv = 2*eris.oovv[kk,kl,ki] - eris.oovv[kk,kl,kd].transpose(0,1,3,2)
-            Fki[ki] += einsum('klcd,ic,ld->ki',Soovv,t1[ki],t1[kl])
+            Fki[ki] += einsum('klcd,ic,ld->ki',Soovv[kl,ki],t1[ki],t1[kl])
     return Fki
 
 def cc_Fvv(cc,t1,t2,eris):
     nkpts, nocc, nvir = t1.shape
     kconserv = cc.kconserv
     Fac = np.empty((nkpts,nvir,nvir),dtype=t2.dtype)
+    Soovv = np.empty((nkpts,nkpts,nocc,nocc,nvir,nvir),dtype=t2.dtype)
     for ka in range(nkpts):
         kc = ka
         Fac[ka] = eris.fock[ka,nocc:,nocc:].copy()
-        for kl in range(nkpts):
-            for kk in range(nkpts):
+        for kk in range(nkpts):
+            for kl in range(nkpts):
                 kd = kconserv[kk,kc,kl]
-                Soovv = 2*eris.oovv[kk,kl,kc] - eris.oovv[kk,kl,kd].transpose(0,1,3,2)
-                Fac[ka] += -einsum('klcd,klad->ac',Soovv,t2[kk,kl,ka])
+                Soovv[kk,kl] = 2*eris.oovv[kk,kl,kc] - eris.oovv[kk,kl,kd].transpose(0,1,3,2)
+        #:for kk, kl: Fac[ka] += -einsum('klcd,klad->ac',Soovv[kk,kl],t2[kk,kl,ka])
+        Fac[ka] += -einsum('KLklcd,KLklad->ac',Soovv,t2[:,:,ka])
+        for kl in range(nkpts):
             #if kk == ka
-            kd = kconserv[ka,kc,kl]
-            Soovv = 2*eris.oovv[ka,kl,kc] - eris.oovv[ka,kl,kd].transpose(0,1,3,2)
-            Fac[ka] += -einsum('klcd,ka,ld->ac',Soovv,t1[ka],t1[kl])
+            Fac[ka] += -einsum('klcd,ka,ld->ac',Soovv[ka,kl],t1[ka],t1[kl])
     return Fac
 
 def cc_Fov(cc,t1,t2,eris):
@@ -135,12 +147,11 @@ def cc_Wvvvv(cc,t1,t2,eris):
     ## Slow:
     nkpts, nocc, nvir = t1.shape
     kconserv = cc.kconserv
-    Wabcd = np.array(eris.vvvv, copy=True)
+    Wabcd = np.empty((nkpts,nkpts,nkpts,nvir,nvir,nvir,nvir),dtype=t2.dtype)
     for ka in range(nkpts):
         for kb in range(ka+1):
             for kc in range(nkpts):
-                Wabcd[ka,kb,kc] += einsum('akcd,kb->abcd',eris.vovv[ka,kb,kc],-t1[kb])
-                Wabcd[ka,kb,kc] += einsum('kbcd,ka->abcd',eris.ovvv[ka,kb,kc],-t1[ka])
+                Wabcd[ka,kb,kc] = cc_Wvvvv_block(cc,t1,t2,eris,ka,kb,kc)
 
         ##########################################################################
         # Be careful about making this term only after all the others are created
@@ -162,17 +173,35 @@ def cc_Wvvvv(cc,t1,t2,eris):
 
     return Wabcd
 
+def cc_Wvvvv_block(cc,t1,t2,eris,ka,kb,kc):
+    '''The (ka,kb,kc) block of cc_Wvvvv.  It only reads the (ka,kb,kc)
+    blocks of the ERIs, so that update_amps can stream Wvvvv without holding
+    the nkpts^3*nvir^4 array.
+    '''
+    Wabcd = np.array(eris.vvvv[ka,kb,kc], dtype=t2.dtype)
+    Wabcd += einsum('akcd,kb->abcd',eris.vovv[ka,kb,kc],-t1[kb])
+    Wabcd += einsum('kbcd,ka->abcd',eris.ovvv[ka,kb,kc],-t1[ka])
+    return Wabcd
+
 #@profile
-def cc_Wvoov(cc,t1,t2,eris):
+def cc_Wvoov(cc,t1,t2,eris,out=None):
+    '''The intermediate is computed block by block.  out can be a
+    (nkpts,nkpts,nkpts,nvir,nocc,nocc,nvir) h5py dataset to keep it on disk.
+    '''
     nkpts, nocc, nvir = t1.shape
     kconserv = cc.kconserv
-    Wakic = np.array(eris.voov, copy=True)
-    for ka in range(nkpts):
+    if out is None:
+        out = np.empty((nkpts,nkpts,nkpts,nvir,nocc,nocc,nvir),dtype=t2.dtype)
+    Wakic = out
+
+    def wvoov_ka(ka):
+        Wka = np.empty((nkpts,nkpts,nvir,nocc,nocc,nvir),dtype=t2.dtype)
         for kk in range(nkpts):
             for ki in range(nkpts):
                 kc = kconserv[ka,ki,kk]
-                Wakic[ka,kk,ki] -= einsum('lkic,la->akic',eris.ooov[ka,kk,ki],t1[ka])
-                Wakic[ka,kk,ki] += einsum('akdc,id->akic',eris.vovv[ka,kk,ki],t1[ki])
+                Wblk = np.array(eris.voov[ka,kk,ki], dtype=t2.dtype)
+                Wblk -= einsum('lkic,la->akic',eris.ooov[ka,kk,ki],t1[ka])
+                Wblk += einsum('akdc,id->akic',eris.vovv[ka,kk,ki],t1[ki])
                 # ==== Beginning of change ====
                 #
                 #for kl in range(nkpts):
@@ -205,22 +234,37 @@ def cc_Wvoov(cc,t1,t2,eris):
                 Soovvf = Soovv.reshape(nkpts*nocc,nocc,nvir,nvir)
                 t2f    = t2[ki,:,ka].transpose(0,2,1,3,4).reshape(nkpts*nocc,nocc,nvir,nvir)
 
-                Wakic[ka,kk,ki] += 0.5*einsum('lkdc,liad->akic',Soovvf,t2f)
-                Wakic[ka,kk,ki] -= 0.5*einsum('lkdc,liad->akic',oovvf,t2f_1)
+                Wblk += 0.5*einsum('lkdc,liad->akic',Soovvf,t2f)
+                Wblk -= 0.5*einsum('lkdc,liad->akic',oovvf,t2f_1)
                 # =====   End of change  = ====
+                Wka[kk,ki] = Wblk
+        return Wka
+    # The slabs of different ka are independent.  They are distributed over
+    # the worker processes.
+    for ka, Wblk in lib.imap_processes(wvoov_ka, [(ka,) for ka in range(nkpts)],
+                                       _nproc(cc, eris, t2)):
+        Wakic[ka] = Wblk
     return Wakic
 
 #@profile
-def cc_Wvovo(cc,t1,t2,eris):
+def cc_Wvovo(cc,t1,t2,eris,out=None):
+    '''The intermediate is computed block by block.  out can be a
+    (nkpts,nkpts,nkpts,nvir,nocc,nvir,nocc) h5py dataset to keep it on disk.
+    '''
     nkpts, nocc, nvir = t1.shape
     kconserv = cc.kconserv
-    Wakci = np.array(eris.vovo, copy=True)
-    for ka in range(nkpts):
+    if out is None:
+        out = np.empty((nkpts,nkpts,nkpts,nvir,nocc,nvir,nocc),dtype=t2.dtype)
+    Wakci = out
+
+    def wvovo_ka(ka):
+        Wka = np.empty((nkpts,nkpts,nvir,nocc,nvir,nocc),dtype=t2.dtype)
         for kk in range(nkpts):
             for kc in range(nkpts):
                 ki = kconserv[ka,kc,kk]
-                Wakci[ka,kk,kc] -= einsum('lkci,la->akci',eris.oovo[ka,kk,kc],t1[ka])
-                Wakci[ka,kk,kc] += einsum('akcd,id->akci',eris.vovv[ka,kk,kc],t1[ki])
+                Wblk = np.array(eris.vovo[ka,kk,kc], dtype=t2.dtype)
+                Wblk -= einsum('lkci,la->akci',eris.oovo[ka,kk,kc],t1[ka])
+                Wblk += einsum('akcd,id->akci',eris.vovv[ka,kk,kc],t1[ki])
                 # ==== Beginning of change ====
                 #
                 #for kl in range(nkpts):
@@ -237,9 +281,13 @@ def cc_Wvovo(cc,t1,t2,eris):
                 t2f[ka] += 2*einsum('id,la->liad',t1[kd],t1[ka])
                 t2f = t2f.reshape(nkpts*nocc,nocc,nvir,nvir)
 
-                Wakci[ka,kk,kc] -= 0.5*einsum('lkcd,liad->akci',oovvf,t2f)
+                Wblk -= 0.5*einsum('lkcd,liad->akci',oovvf,t2f)
                 # =====   End of change  = ====
-
+                Wka[kk,kc] = Wblk
+        return Wka
+    for ka, Wblk in lib.imap_processes(wvovo_ka, [(ka,) for ka in range(nkpts)],
+                                       _nproc(cc, eris, t2)):
+        Wakci[ka] = Wblk
     return Wakci
 
 
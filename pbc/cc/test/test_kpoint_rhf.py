@@ -23,7 +23,7 @@ import ase.lattice
 import ase.dft.kpoints
 import test_make_cell
 
-def test_kcell(cell, ngs, nk):
+def test_kcell(cell, ngs, nk, max_memory=None):
     #############################################
     # Do a k-point calculation                  #
     #############################################
@@ -60,6 +60,8 @@ def test_kcell(cell, ngs, nk):
     cc = pyscf.pbc.cc.kccsd_rhf.RCCSD(kmf,abs_kpts)
     cc.conv_tol=1e-15
     cc.verbose = 7
+    if max_memory is not None:
+        cc.max_memory = max_memory
     ecc, t1, t2 = cc.kernel()
     print "cc energy (per unit cell) = %.17g" % ecc
     return ekpt, ecc
@@ -112,6 +114,59 @@ class KnowValues(unittest.TestCase):
         self.assertAlmostEqual(escf,hf_311, 9)
         self.assertAlmostEqual(ecc, cc_311, 9)
 
+    def test_311_n1_outcore(self):
+        L = 7.0
+        ngs = 4
+        cell = test_make_cell.test_cell_n1(L,ngs)
+        nk = (3, 1, 1)
+        hf_311 = -0.89797412589365655
+        cc_311 = -0.045952606749078105
+        # ERIs, t2, the DIIS vectors and the intermediates Wvoov, Wvovo are
+        # kept in HDF5 files
+        escf, ecc = test_kcell(cell,ngs,nk,max_memory=1)
+        self.assertAlmostEqual(escf,hf_311, 9)
+        self.assertAlmostEqual(ecc, cc_311, 9)
+
+    def test_eom_outcore(self):
+        L = 7.0
+        ngs = 4
+        cell = test_make_cell.test_cell_n1(L,ngs)
+        abs_kpts = cell.make_kpts((2,1,1))
+        kmf = pbchf.KRHF(cell, abs_kpts, exxdiv=None)
+        kmf.scf()
+        cc = pyscf.pbc.cc.kccsd_rhf.RCCSD(kmf,abs_kpts)
+        cc.max_memory = 1
+        cc.kernel()
+        self.assertFalse(isinstance(cc.t2, np.ndarray))
+        self.assertRaises(NotImplementedError, cc.ipccsd, 1)
+        self.assertRaises(NotImplementedError, cc.eaccsd, 1)
+
+    def test_nproc(self):
+        from pyscf.pbc.cc import kintermediates_rhf as imdk
+        L = 7.0
+        ngs = 4
+        cell = test_make_cell.test_cell_n1(L,ngs)
+        abs_kpts = cell.make_kpts((3,1,1))
+        kmf = pbchf.KRHF(cell, abs_kpts, exxdiv=None)
+        kmf.scf()
+        cc = pyscf.pbc.cc.kccsd_rhf.RCCSD(kmf,abs_kpts)
+        eris = cc.ao2mo()
+        t1, t2 = cc.init_amps(eris)[1:]
+        np.random.seed(1)
+        t1 += np.random.random(t1.shape) * .01
+        t2 += np.random.random(t2.shape) * .01
+
+        cc.nproc = 1
+        t1ref, t2ref = cc.update_amps(t1, t2, eris)
+        wvoov = imdk.cc_Wvoov(cc, t1, t2, eris)
+        wvovo = imdk.cc_Wvovo(cc, t1, t2, eris)
+        cc.nproc = 3
+        t1new, t2new = cc.update_amps(t1, t2, eris)
+        self.assertAlmostEqual(abs(t1new-t1ref).max(), 0, 12)
+        self.assertAlmostEqual(abs(t2new-t2ref).max(), 0, 12)
+        self.assertAlmostEqual(abs(imdk.cc_Wvoov(cc, t1, t2, eris)-wvoov).max(), 0, 12)
+        self.assertAlmostEqual(abs(imdk.cc_Wvovo(cc, t1, t2, eris)-wvovo).max(), 0, 12)
+
 if __name__ == '__main__':
     print("Full kpoint test")
     unittest.main()
@@ -6,6 +6,7 @@
 '''Density expansion on plane waves'''
 
 import sys
+import time
 import copy
 import numpy
 import h5py
@@ -22,6 +23,9 @@ from pyscf.pbc.df import fft_jk
 from pyscf.pbc.df import fft_ao2mo
 
 
+def _kpt_key(kpt):
+    return tuple(numpy.round(numpy.asarray(kpt)*1e8).astype(int))
+
 def get_nuc(mydf, kpts=None):
     cell = mydf.cell
     if kpts is None:
@@ -37,7 +41,7 @@ def get_nuc(mydf, kpts=None):
 
     coulG = tools.get_coulG(cell, gs=gs, Gv=Gv)
     vneG = rhoG * coulG
-    vneR = tools.ifft(vneG, mydf.gs).real
+    vneR = tools.irfft(tools.half_spectrum(vneG, gs), gs)
 
     vne = [lib.dot(aoR.T.conj()*vneR, aoR)
            for k, aoR in mydf.aoR_loop(cell, gs, kpts_lst)]
@@ -65,7 +69,7 @@ def get_pp(mydf, kpts=None):
     nao = cell.nao_nr()
 
     # vpploc evaluated in real-space
-    vpplocR = tools.ifft(vpplocG, cell.gs).real
+    vpplocR = tools.irfft(tools.half_spectrum(vpplocG, gs), gs)
     vpp = [lib.dot(aoR.T.conj()*vpplocR, aoR)
            for k, aoR in mydf.aoR_loop(cell, gs, kpts_lst)]
 
@@ -124,6 +128,17 @@ def get_pp(mydf, kpts=None):
 
 class DF(lib.StreamObject):
     '''Density expansion on plane waves
+
+    The AO values on the uniform grids are evaluated once for each k-point
+    and kept in memory (in the arrays shared with the forked processes) as
+    long as they fit in max_memory.  They are reused by the SCF iterations,
+    the integrals of the core Hamiltonian and the band structure calculations
+    (kpt_band).  If the memory is not enough, the AO values are cached on disk.
+
+    Attributes:
+        nproc : int
+            Number of processes to compute the k-point blocks of the J/K
+            matrices.  Default is 1.
     '''
     def __init__(self, cell, kpts=numpy.zeros((1,3))):
         self.cell = cell
@@ -133,10 +148,13 @@ class DF(lib.StreamObject):
 
         self.kpts = kpts
         self.gs = cell.gs
+        self.nproc = 1
 
 # Not input options
         self.exxdiv = None  # to mimic KRHF/KUHF object in function get_coulG
         self._numint = numint._KNumInt()
+        self._aoR_cache = {}
+        self._aoR_cache_key = None
         self._keys = set(self.__dict__.keys())
 
     def dump_flags(self):
@@ -146,23 +164,43 @@ class DF(lib.StreamObject):
         logger.info(self, 'gs = %s', self.gs)
         logger.info(self, 'len(kpts) = %d', len(self.kpts))
         logger.debug1(self, '    kpts = %s', self.kpts)
+        logger.info(self, 'nproc = %s', self.nproc)
 
     def aoR_loop(self, cell, gs=None, kpts=None, kpt_band=None):
         if kpts is None: kpts = self.kpts
-        kpts = numpy.asarray(kpts)
+        kpts = numpy.reshape(kpts, (-1,3))
 
         if gs is None:
             gs = self.gs
         else:
             self.gs = gs
-        ngrids = numpy.prod(numpy.asarray(gs)*2+1)
 
+        if kpt_band is None:
+            aoR_kpts = self.aoR_kpts_incore(cell, gs, kpts)
+            if aoR_kpts is not None:
+                for k, aoR in enumerate(aoR_kpts):
+                    yield k, aoR
+                return
+        else:
+            kpt_band = numpy.reshape(kpt_band, 3)
+            where = numpy.argmin(lib.norm(kpts-kpt_band,axis=1))
+            if abs(kpts[where]-kpt_band).sum() > 1e-9:
+# The AO values of the k-points off the mesh are not cached.  Otherwise the
+# cache keeps growing with the band k-points.
+                coords = gen_grid.gen_uniform_grids(cell, gs)
+                yield 0, numint.eval_ao(cell, coords, kpt_band, deriv=0)
+                return
+            aoR_kband = self.aoR_kpts_incore(cell, gs, kpt_band.reshape(1,3))
+            if aoR_kband is not None:
+                yield where, aoR_kband[0]
+                return
+
+        ngrids = numpy.prod(numpy.asarray(gs)*2+1)
         if (self._numint.cell is None or id(cell) != id(self._numint.cell) or
             self._numint._deriv != 0 or
             self._numint._kpts.shape != kpts.shape or
             abs(self._numint._kpts - kpts).sum() > 1e-9 or
-            self._numint._coords.shape[0] != ngrids or
-            (gs is not None and numpy.any(gs != self.gs))):
+            self._numint._coords.shape[0] != ngrids):
 
             nkpts = len(kpts)
             coords = gen_grid.gen_uniform_grids(cell, gs)
@@ -181,14 +219,59 @@ class DF(lib.StreamObject):
                     aoR = f['ao/%d'%k].value
                     yield k, aoR
             else:
-                kpt_band = numpy.reshape(kpt_band, 3)
-                where = numpy.argmin(pyscf.lib.norm(kpts-kpt_band,axis=1))
-                if abs(kpts[where]-kpt_band).sum() > 1e-9:
-                    where = None
-                    coords = gen_grid.gen_uniform_grids(cell, gs)
-                    yield 0, numint.eval_ao(cell, coords, kpt_band, deriv=deriv)
+                yield where, f['ao/%d'%where].value
+
+    def aoR_kpts_incore(self, cell, gs, kpts):
+        '''AO values of the given k-points on the uniform grids.  The AO
+        values are held in memory and the missing k-points are evaluated
+        together, sharing one lattice summation.  Returns None if the new
+        k-points do not fit in max_memory.  The band k-points off the SCF
+        mesh are not passed to this function (see aoR_loop) so that the
+        cache does not grow with the band structure calculations.
+        '''
+        cache_key = (id(cell), tuple(gs), cell._env.tobytes(),
+               numpy.asarray(cell.lattice_vectors()).tobytes())
+        if self._aoR_cache_key != cache_key:
+            self._aoR_cache = {}
+            self._aoR_cache_key = cache_key
+        cache = self._aoR_cache
+
+        kpts = numpy.reshape(kpts, (-1,3))
+        kpt_keys = [_kpt_key(k) for k in kpts]
+        new_keys = []
+        kpts_new = []
+        for key, kpt in zip(kpt_keys, kpts):
+            if key not in cache and key not in new_keys:
+                new_keys.append(key)
+                kpts_new.append(kpt)
+        if new_keys:
+            ngrids = numpy.prod(numpy.asarray(gs)*2+1)
+            nao = cell.nao_nr()
+            mem_avail = self.max_memory - lib.current_memory()[0]
+            if len(kpts_new) * ngrids * nao * 16e-6 > mem_avail * .5:
+                return None
+
+            cput0 = (time.clock(), time.time())
+            kpts_new = numpy.asarray(kpts_new)
+            coords = gen_grid.gen_uniform_grids(cell, gs)
+            aoR_new = []
+            for k in kpts_new:
+                if abs(k).sum() < 1e-9:  # gamma point
+                    aoR_new.append(lib.shared_array((ngrids,nao), numpy.double))
                 else:
-                    yield where, f['ao/%d'%where].value
+                    aoR_new.append(lib.shared_array((ngrids,nao), numpy.complex128))
+            blksize = int(max(mem_avail*.5, 16)*1e6 /
+                          (len(kpts_new)*nao*16*numint.BLKSIZE)) * numint.BLKSIZE
+            blksize = min(max(blksize, numint.BLKSIZE), ngrids)
+            for p0, p1 in lib.prange(0, ngrids, blksize):
+                ao = numint.eval_ao_kpts(cell, coords[p0:p1], kpts_new)
+                for k, aoR in enumerate(aoR_new):
+                    aoR[p0:p1] = ao[k]
+                ao = None
+            for key, aoR in zip(new_keys, aoR_new):
+                cache[key] = aoR
+            logger.timer(self, 'AO values of %d k-points' % len(kpts_new), *cput0)
+        return [cache[k] for k in kpt_keys]
 
     get_pp = get_pp
     get_nuc = get_nuc
@@ -26,8 +26,9 @@ def get_j_kpts(mydf, dm_kpts, hermi=1, kpts=np.zeros((1,3)), kpt_band=None):
         kpts : (nkpts, 3) ndarray
 
     Kwargs:
-        kpt_band : (3,) ndarray
-            An arbitrary "band" k-point at which to evalute the matrix.
+        kpt_band : (3,) or (nband,3) ndarray
+            Arbitrary "band" k-points at which to evalute the matrix.  The
+            potential on the grids is computed once for all band k-points.
 
     Returns:
         vj : (nkpts, nao, nao) ndarray
@@ -42,31 +43,57 @@ def get_j_kpts(mydf, dm_kpts, hermi=1, kpts=np.zeros((1,3)), kpt_band=None):
 
     coulG = tools.get_coulG(cell, gs=gs)
     ngs = len(coulG)
+    nproc = getattr(mydf, 'nproc', 1)
 
-    vR = rhoR = np.zeros((nset,ngs))
-    for k, aoR in mydf.aoR_loop(cell, gs, kpts):
-        for i in range(nset):
-            rhoR[i] += numint.eval_rho(cell, aoR, dms[i,k])
-    for i in range(nset):
-        rhoR[i] *= 1./nkpts
-        rhoG = tools.fft(rhoR[i], gs)
-        vG = coulG * rhoG
-        vR[i] = tools.ifft(vG, gs).real
+# The k-points are distributed over nproc processes if the AO values of all
+# k-points can be held in the shared memory.
+    aoR_kpts = _load_aoR_kpts(mydf, cell, gs, kpts, nproc)
+
+    rhoR = np.zeros((nset,ngs))
+    if aoR_kpts is None:
+        for k, aoR in mydf.aoR_loop(cell, gs, kpts):
+            for i in range(nset):
+                rhoR[i] += numint.eval_rho(cell, aoR, dms[i,k])
+    else:
+        def rho_k(k):
+            return [numint.eval_rho(cell, aoR_kpts[k], dms[i,k])
+                    for i in range(nset)]
+        for k, rho in lib.imap_processes(rho_k, [(k,) for k in range(nkpts)],
+                                         nproc):
+            rhoR += rho
+    # rhoR and vR are real.  Only half of the spectrum is needed.
+    rhoR *= 1./nkpts
+    rhoG = tools.rfft(rhoR, gs)
+    vR = tools.irfft(rhoG * tools.half_spectrum(coulG, gs), gs)
 
     if kpt_band is not None:
-        for k, aoR_kband in mydf.aoR_loop(cell, gs, kpts, kpt_band):
-            pass
-        vj_kpts = [cell.vol/ngs * lib.dot(aoR_kband.T.conj()*vR[i], aoR_kband)
-                   for i in range(nset)]
+# vR is computed once and contracted with the AO values of each band k-point
+        weight = cell.vol / ngs
+        vj_kpts = []
+        for kb, aoR_kband in _band_aoR_loop(mydf, cell, gs, kpts, kpt_band):
+            vj_kpts.append([weight * lib.dot(aoR_kband.T.conj()*vR[i], aoR_kband)
+                            for i in range(nset)])
+        vj_kpts = lib.asarray(vj_kpts).transpose(1,0,2,3)
+        if np.shape(kpt_band) == (3,):
+            vj_kpts = vj_kpts[:,0]
         if dm_kpts.ndim == 3:  # One set of dm_kpts for KRHF
             vj_kpts = vj_kpts[0]
-        return lib.asarray(vj_kpts)
+        return vj_kpts
     else:
-        vj_kpts = []
         weight = cell.vol / ngs
-        for k, aoR in mydf.aoR_loop(cell, gs, kpts):
-            for i in range(nset):
-                vj_kpts.append(weight * lib.dot(aoR.T.conj()*vR[i], aoR))
+        vj_kpts = []
+        if aoR_kpts is None:
+            for k, aoR in mydf.aoR_loop(cell, gs, kpts):
+                for i in range(nset):
+                    vj_kpts.append(weight * lib.dot(aoR.T.conj()*vR[i], aoR))
+        else:
+            def vj_k(k):
+                aoR = aoR_kpts[k]
+                return [weight * lib.dot(aoR.T.conj()*vR[i], aoR)
+                        for i in range(nset)]
+            for vj in lib.map_processes(vj_k, [(k,) for k in range(nkpts)],
+                                        nproc):
+                vj_kpts.extend(vj)
         vj_kpts = lib.asarray(vj_kpts).reshape(nkpts,nset,nao,nao)
         return vj_kpts.transpose(1,0,2,3).reshape(dm_kpts.shape)
 
@@ -80,8 +107,8 @@ def get_k_kpts(mydf, dm_kpts, hermi=1, kpts=np.zeros((1,3)), kpt_band=None,
         kpts : (nkpts, 3) ndarray
 
     Kwargs:
-        kpt_band : (3,) ndarray
-            An arbitrary "band" k-point at which to evalute the matrix.
+        kpt_band : (3,) or (nband,3) ndarray
+            Arbitrary "band" k-points at which to evalute the matrix.
 
     Returns:
         vj : (nkpts, nao, nao) ndarray
@@ -99,43 +126,98 @@ def get_k_kpts(mydf, dm_kpts, hermi=1, kpts=np.zeros((1,3)), kpt_band=None,
     nset, nkpts, nao = dms.shape[:3]
 
     weight = 1./nkpts * (cell.vol/ngs)
+    nproc = getattr(mydf, 'nproc', 1)
+
+# The AO values of all k-points are held in the shared memory.  The exchange
+# matrix of each k-point (or the contribution of each k2 for kpt_band) is
+# computed in one of the nproc processes.  For nproc=1 or if the AO values do
+# not fit in memory, they are read from the AO cache of mydf in serial.
+    aoR_kpts = _load_aoR_kpts(mydf, cell, gs, kpts, nproc)
+    if aoR_kpts is None:
+        nproc = 1
+        aoR_loop = lambda: mydf.aoR_loop(cell, gs, kpts)
+    else:
+        aoR_loop = lambda: enumerate(aoR_kpts)
 
     if kpt_band is not None:
-        for k, aoR_kband in mydf.aoR_loop(cell, gs, kpts, kpt_band):
-            pass
-        vk_kpts = [0] * nset
-        for k2, ao_k2 in mydf.aoR_loop(cell, gs, kpts):
+        kpts_band = np.reshape(kpt_band, (-1,3))
+# aoR_dm of each k2 is computed once and used for all band k-points.  If
+# they do not fit in memory, they are computed for each band k-point.
+        mem_avail = mydf.max_memory - lib.current_memory()[0]
+        if nset * nkpts * ngs * nao * 16e-6 < mem_avail * .5:
+            aoR_dms = [[lib.dot(ao_k2, dms[i,k2]) for i in range(nset)]
+                       for k2, ao_k2 in aoR_loop()]
+        else:
+            aoR_dms = None
+        def vk_k2(k2, ao_k2, aoR_kband, kptb):
             kpt2 = kpts[k2]
-            vkR_k1k2 = get_vkR(mydf, cell, aoR_kband, ao_k2, kpt_band, kpt2,
+            vkR_k1k2 = get_vkR(mydf, cell, aoR_kband, ao_k2, kptb, kpt2,
                                coords, gs, exxdiv)
             #:vk_kpts = 1./nkpts * (cell.vol/ngs) * np.einsum('rs,Rp,Rqs,Rr->pq',
             #:            dm_kpts[k2], aoR_kband.conj(), vkR_k1k2, ao_k2)
+            vk = []
             for i in range(nset):
-                aoR_dm = lib.dot(ao_k2, dms[i,k2])
+                if aoR_dms is None:
+                    aoR_dm = lib.dot(ao_k2, dms[i,k2])
+                else:
+                    aoR_dm = aoR_dms[k2][i]
                 tmp_Rq = np.einsum('Rqs,Rs->Rq', vkR_k1k2, aoR_dm)
-                vk_kpts[i] += weight * lib.dot(aoR_kband.T.conj(), tmp_Rq)
-            vkR_k1k2 = aoR_dm = tmp_Rq = None
+                vk.append(weight * lib.dot(aoR_kband.T.conj(), tmp_Rq))
+            return vk
+        vk_kpts = []
+        for kb, aoR_kband in _band_aoR_loop(mydf, cell, gs, kpts, kpts_band):
+            kptb = kpts_band[kb]
+            if nproc == 1:
+                vk = [vk_k2(k2, ao_k2, aoR_kband, kptb)
+                      for k2, ao_k2 in aoR_loop()]
+            else:
+                vk = lib.map_processes(lambda k2: vk_k2(k2, aoR_kpts[k2],
+                                                        aoR_kband, kptb),
+                                       [(k2,) for k2 in range(nkpts)], nproc)
+            vk_kpts.append(sum(np.asarray(x) for x in vk))
+        vk_kpts = lib.asarray(vk_kpts).transpose(1,0,2,3)
+        if np.shape(kpt_band) == (3,):
+            vk_kpts = vk_kpts[:,0]
         if dm_kpts.ndim == 3:
             vk_kpts = vk_kpts[0]
-        return lib.asarray(vk_kpts)
+        return vk_kpts
     else:
         if abs(kpts).sum() < 1e-9:
             vk_kpts = np.zeros((nset,nkpts,nao,nao), dtype=dms.dtype)
         else:
             vk_kpts = np.zeros((nset,nkpts,nao,nao), dtype=np.complex128)
-        for k2, ao_k2 in mydf.aoR_loop(cell, gs, kpts):
-            kpt2 = kpts[k2]
-            aoR_dms = [lib.dot(ao_k2, dms[i,k2]) for i in range(nset)]
-            for k1, ao_k1 in mydf.aoR_loop(cell, gs, kpts):
-                kpt1 = kpts[k1]
-                vkR_k1k2 = get_vkR(mydf, cell, ao_k1, ao_k2, kpt1, kpt2,
-                                   coords, gs, exxdiv)
-                for i in range(nset):
-                    tmp_Rq = np.einsum('Rqs,Rs->Rq', vkR_k1k2, aoR_dms[i])
-                    vk_kpts[i,k1] += weight * lib.dot(ao_k1.T.conj(), tmp_Rq)
-            vkR_k1k2 = aoR_dms = tmp_Rq = None
-        return vk_kpts.reshape(dm_kpts.shape)
 
+        if nproc == 1:
+            for k2, ao_k2 in aoR_loop():
+                kpt2 = kpts[k2]
+                aoR_dms = [lib.dot(ao_k2, dms[i,k2]) for i in range(nset)]
+                for k1, ao_k1 in aoR_loop():
+                    kpt1 = kpts[k1]
+                    vkR_k1k2 = get_vkR(mydf, cell, ao_k1, ao_k2, kpt1, kpt2,
+                                       coords, gs, exxdiv)
+                    for i in range(nset):
+                        tmp_Rq = np.einsum('Rqs,Rs->Rq', vkR_k1k2, aoR_dms[i])
+                        vk_kpts[i,k1] += weight * lib.dot(ao_k1.T.conj(), tmp_Rq)
+                vkR_k1k2 = aoR_dms = tmp_Rq = None
+        else:
+            # aoR_dm of each k2 is computed once in the parent process and
+            # shared with the forked processes
+            aoR_dms = [[lib.dot(ao_k2, dms[i,k2]) for i in range(nset)]
+                       for ao_k2 in aoR_kpts]
+            def vk_k1(k1):
+                ao_k1 = aoR_kpts[k1]
+                vk = np.zeros((nset,nao,nao), dtype=vk_kpts.dtype)
+                for k2, ao_k2 in enumerate(aoR_kpts):
+                    vkR_k1k2 = get_vkR(mydf, cell, ao_k1, ao_k2, kpts[k1],
+                                       kpts[k2], coords, gs, exxdiv)
+                    for i in range(nset):
+                        tmp_Rq = np.einsum('Rqs,Rs->Rq', vkR_k1k2, aoR_dms[k2][i])
+                        vk[i] += weight * lib.dot(ao_k1.T.conj(), tmp_Rq)
+                return vk
+            for k1, vk in lib.imap_processes(vk_k1, [(k1,) for k1 in range(nkpts)],
+                                             nproc):
+                vk_kpts[:,k1] = vk
+        return vk_kpts.reshape(dm_kpts.shape)
 
 def get_jk(mydf, dm, hermi=1, kpt=np.zeros(3), kpt_band=None):
     '''Get the Coulomb (J) and exchange (K) AO matrices for the given density matrix.
@@ -261,6 +343,66 @@ def get_vkR(mydf, cell, aoR_k1, aoR_k2, kpt1, kpt2, coords, gs, exxdiv):
     else:
         return vR
 
+def _load_aoR_kpts(mydf, cell, gs, kpts, nproc=1):
+    '''AO values of all k-points in the shared memory which can be accessed
+    by the forked processes.  Return None if the AO values do not fit in
+    mydf.max_memory or if there is only one process (the AO values are read
+    from mydf.aoR_loop in serial).
+    '''
+    if nproc <= 1:
+        return None
+    if hasattr(mydf, 'aoR_kpts_incore'):
+        return mydf.aoR_kpts_incore(cell, gs, kpts)
+    kpts = np.reshape(kpts, (-1,3))
+    ngs = np.prod(np.asarray(gs)*2+1)
+    nao = cell.nao_nr()
+    mem_avail = mydf.max_memory - lib.current_memory()[0]
+    if len(kpts) * ngs * nao * 16e-6 > mem_avail * .5:
+        return None
+    aoR_kpts = []
+    for k, aoR in mydf.aoR_loop(cell, gs, kpts):
+        buf = lib.shared_array(aoR.shape, aoR.dtype)
+        buf[:] = aoR
+        aoR_kpts.append(buf)
+    return aoR_kpts
+
+def _band_aoR_loop(mydf, cell, gs, kpts, kpts_band):
+    '''Loop over the AO values of the band k-points on the uniform grids.
+    The band k-points of the SCF mesh take the AO values of mydf.aoR_loop.
+    The others are evaluated in batches (one lattice summation per batch)
+    which take at most half of the free memory.  They are not added to the
+    AO cache of mydf.
+    '''
+    kpts = np.reshape(kpts, (-1,3))
+    kpts_band = np.reshape(kpts_band, (-1,3))
+    ngs = np.prod(np.asarray(gs)*2+1)
+    nao = cell.nao_nr()
+    mem_avail = max(mydf.max_memory - lib.current_memory()[0], 0)
+    # eval_ao_kpts needs two copies of the complex AO values
+    bandsize = max(1, int(mem_avail*.5e6 / (ngs*nao*32)))
+
+    coords = None
+    for b0, b1 in lib.prange(0, len(kpts_band), bandsize):
+        on_mesh = []
+        kpts_new = []
+        for kptb in kpts_band[b0:b1]:
+            if abs(kpts-kptb).sum(axis=1).min() < 1e-9:
+                on_mesh.append(True)
+            else:
+                on_mesh.append(False)
+                kpts_new.append(kptb)
+        if kpts_new:
+            if coords is None:
+                coords = gen_grid.gen_uniform_grids(cell, gs)
+            aoR_new = numint.eval_ao_kpts(cell, coords, kpts_new)[::-1]
+        for kb, in_mesh in zip(range(b0, b1), on_mesh):
+            if in_mesh:
+                for k, aoR in mydf.aoR_loop(cell, gs, kpts, kpts_band[kb]):
+                    yield kb, aoR
+            else:
+                yield kb, aoR_new.pop()
+        aoR_new = None
+
 def _format_dms(dm_kpts, kpts):
     nkpts = len(kpts)
     nao = dm_kpts.shape[-1]
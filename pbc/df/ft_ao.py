@@ -7,6 +7,7 @@
 Analytic Fourier transformation AO-pair value for PBC
 '''
 
+import copy
 import ctypes
 import numpy
 import scipy.linalg
@@ -126,6 +127,138 @@ def _ft_aopair_kpts(cell, Gv, shls_slice=None, aosym='s1',
     return out
 
 
+def estimate_gcut(cell, precision=None):
+    '''The cutoff |G| for each shell pair.  For the product of two primitive
+    Gaussians c_a exp(-a|r-A|^2) c_b exp(-b|r-B-L|^2) the Fourier transformed
+    value is bounded by
+
+        |c_a c_b| (pi/p)^{3/2} exp(-ab/p |A-B-L|^2) (G/2p)^l exp(-G^2/4p)
+
+    with p = a+b.  Beyond the cutoff the FT AO pair is smaller than
+    precision.  The cutoff of a shell pair is the largest cutoff of its
+    primitive pairs.  The contraction coefficient of a primitive is the
+    largest one of all contracted functions of the shell.
+
+    Returns:
+        (nbas,nbas) ndarray.  The pairs which are negligible for all lattice
+        images have cutoff -1.
+    '''
+    if precision is None:
+        precision = cell.precision
+    log_prec = numpy.log(precision)
+    Ls = cell.get_lattice_Ls(cell.nimgs)
+    atom_coords = cell.atom_coords()
+    # shortest distance between atom i and the images of atom j
+    rr = numpy.empty((cell.natm,cell.natm))
+    for ia in range(cell.natm):
+        d = atom_coords[ia] - atom_coords[:,None,:] - Ls
+        rr[ia] = numpy.einsum('jlx,jlx->jl', d, d).min(axis=1)
+
+    nbas = cell.nbas
+    nprim = cell._bas[:,gto.NPRIM_OF].max()
+    # Padded primitives have exponent 1 and log(|c|) = -inf
+    es = numpy.ones((nbas,nprim))
+    log_cs = numpy.empty((nbas,nprim))
+    log_cs[:] = -numpy.inf
+    for ib in range(nbas):
+        e = cell.bas_exp(ib)
+        cs = abs(cell._libcint_ctr_coeff(ib)).max(axis=1)
+        es[ib,:len(e)] = e
+        log_cs[ib,:len(e)] = numpy.log(numpy.maximum(cs, 1e-300))
+    ls = cell._bas[:,gto.ANG_OF]
+    atm_id = cell._bas[:,gto.ATOM_OF]
+
+    # (ish,jsh,iprim,jprim)
+    ei = es[:,None,:,None]
+    ej = es[None,:,None,:]
+    p = ei + ej
+    r2 = rr[atm_id[:,None],atm_id][:,:,None,None]
+    log_ovlp = (log_cs[:,None,:,None] + log_cs[None,:,None,:] +
+                1.5 * numpy.log(numpy.pi/p) - ei * ej / p * r2)
+    l = (ls[:,None] + ls)[:,:,None,None]
+    g2 = 4 * p * (log_ovlp - log_prec)
+    for i in range(3):
+        fac = .5 * l * numpy.log(numpy.maximum(g2/(4*p**2), 1))
+        g2 = 4 * p * (log_ovlp - log_prec + fac)
+    g2[log_ovlp < log_prec] = -1
+    g2 = g2.max(axis=(2,3))
+    gcut = numpy.sqrt(numpy.maximum(g2, 0))
+    gcut[g2 < 0] = -1
+    return gcut
+
+class AOPairs(object):
+    '''Sparse list of the significant AO shell pairs.  For a given |G|, only
+    the pairs whose cutoff (see :func:`estimate_gcut`) is larger than |G|
+    are kept.
+
+    Attributes:
+        gcut : (nbas,nbas) ndarray
+            The cutoff |G| of each shell pair
+    '''
+    def __init__(self, cell, precision=None):
+        self.cell = cell
+        self.gcut = estimate_gcut(cell, precision)
+        ao_loc = cell.ao_loc_nr()
+        self.ao_loc = ao_loc
+        self.nao = ao_loc[-1]
+        self._ao2shl = numpy.repeat(numpy.arange(cell.nbas),
+                                    ao_loc[1:]-ao_loc[:-1])
+
+    def select(self, gmin=0):
+        '''The pairs which are significant for |G| >= gmin
+
+        Returns:
+            shls : 1D int array
+                The shells which are involved in the significant pairs
+            pair_idx : 1D int array
+                The indices of the significant AO pairs in the (nao,nao)
+                square, in ascending order
+            sub_idx : 1D int array
+                The indices of the significant AO pairs in the (n,n) square
+                (Fortran order) of the sub-basis made by shls
+        '''
+        mask = self.gcut >= gmin
+        shls = numpy.where(mask.any(axis=0) | mask.any(axis=1))[0]
+        ao_mask = mask[self._ao2shl[:,None],self._ao2shl]
+        i, j = numpy.where(ao_mask)
+        pair_idx = i * self.nao + j
+
+        ao_loc = self.ao_loc
+        sub_ao = numpy.hstack([numpy.arange(ao_loc[ib], ao_loc[ib+1])
+                               for ib in shls] + [numpy.zeros(0, dtype=int)])
+        ao2sub = numpy.zeros(self.nao, dtype=int)
+        ao2sub[sub_ao] = numpy.arange(len(sub_ao))
+        sub_idx = ao2sub[i] + ao2sub[j] * len(sub_ao)
+        return shls, pair_idx, sub_idx
+
+def ft_aopair_screened(cell, Gv, aopairs, aosym='s1',
+                       invh=None, gxyz=None, gs=None,
+                       kpt=numpy.zeros(3), kptjs=numpy.zeros((1,3))):
+    '''FT AO pairs for the significant pairs of the given G vectors.  Only
+    the shells of the pairs whose cutoff is larger than min(|G+kpt|) are
+    evaluated.
+
+    Returns:
+        out : a list of (nG,npair) ndarray, one for each k-point of kptjs
+        pair_idx : the indices of the pairs in the (nao,nao) square
+    '''
+    kpt = numpy.reshape(kpt, 3)
+    kptjs = numpy.reshape(kptjs, (-1,3))
+    nGv = len(Gv)
+    gmin = numpy.sqrt(numpy.einsum('gx,gx->g', Gv+kpt, Gv+kpt).min())
+    shls, pair_idx, sub_idx = aopairs.select(gmin)
+    if len(pair_idx) == 0:
+        out = [numpy.zeros((nGv,0), dtype=numpy.complex128) for k in kptjs]
+        return out, pair_idx
+
+    # A fake cell of the shells in the significant pairs
+    subcell = copy.copy(cell)
+    subcell._bas = numpy.asarray(cell._bas[shls], order='C')
+    dat = _ft_aopair_kpts(subcell, Gv, None, aosym, invh, gxyz, gs, kpt, kptjs)
+    out = [x.reshape(nGv,-1,order='F')[:,sub_idx] for x in dat]
+    return out, pair_idx
+
+
 def ft_ao(mol, Gv, shls_slice=None,
           invh=None, gxyz=None, gs=None, kpt=numpy.zeros(3), verbose=None):
     if abs(kpt).sum() < 1e-9:
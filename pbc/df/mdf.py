@@ -317,6 +317,7 @@ class MDF(pwdf.PWDF):
         self.approx_sr_level = 0
         self.auxbasis = None
         self.eta = None
+        self.ft_aopair_tol = None
 
 # Not input options
         self.exxdiv = None  # to mimic KRHF/KUHF object in function get_coulG
@@ -326,6 +327,8 @@ class MDF(pwdf.PWDF):
         self._j_only = False
         self._cderi_file = tempfile.NamedTemporaryFile()
         self._cderi = None
+        self._aopairs = None
+        self._aopairs_key = None
         self._keys = set(self.__dict__.keys())
 
     def dump_flags(self):
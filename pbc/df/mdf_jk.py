@@ -173,8 +173,10 @@ def get_j_kpts(mydf, dm_kpts, hermi=1, kpts=numpy.zeros((1,3)), kpt_band=None):
             return vj_kpts[0,0]
         else:
             return vj_kpts[:,0]
-    else:
+    elif kpt_band is None:
         return vj_kpts.reshape(dm_kpts.shape)
+    else:
+        return vj_kpts.reshape(dm_kpts.shape[:-3]+(nband,nao,nao))
 
 
 def get_k_kpts(mydf, dm_kpts, hermi=1, kpts=numpy.zeros((1,3)), kpt_band=None,
@@ -369,8 +371,10 @@ def get_k_kpts(mydf, dm_kpts, hermi=1, kpts=numpy.zeros((1,3)), kpt_band=None,
             return vk_kpts[0,0]
         else:
             return vk_kpts[:,0]
-    else:
+    elif kpt_band is None:
         return vk_kpts.reshape(dm_kpts.shape)
+    else:
+        return vk_kpts.reshape(dm_kpts.shape[:-3]+(nband,nao,nao))
 
 
 ##################################################
@@ -46,17 +46,17 @@ def get_nuc(mydf, kpts=None):
     else:
         vne = numpy.zeros((nkpts,nao**2), dtype=numpy.complex128)
     max_memory = mydf.max_memory - lib.current_memory()[0]
-    for k, pqkR, pqkI, p0, p1 \
-            in mydf.ft_loop(cell, mydf.gs, kpt_allow, kpts_lst,
-                            max_memory=max_memory):
+    for k, pqkR, pqkI, pair_idx, Gidx \
+            in mydf.sparse_ft_loop(cell, mydf.gs, kpt_allow, kpts_lst,
+                                   max_memory=max_memory):
 # rho_ij(G) nuc(-G) / G^2
 # = [Re(rho_ij(G)) + Im(rho_ij(G))*1j] [Re(nuc(G)) - Im(nuc(G))*1j] / G^2
-        vG = vneG[p0:p1]
+        vG = vneG[Gidx]
         if not real:
-            vne[k] += numpy.einsum('k,xk->x', vG.real, pqkI) * 1j
-            vne[k] += numpy.einsum('k,xk->x', vG.imag, pqkR) *-1j
-        vne[k] += numpy.einsum('k,xk->x', vG.real, pqkR)
-        vne[k] += numpy.einsum('k,xk->x', vG.imag, pqkI)
+            vne[k,pair_idx] += numpy.einsum('k,xk->x', vG.real, pqkI) * 1j
+            vne[k,pair_idx] += numpy.einsum('k,xk->x', vG.imag, pqkR) *-1j
+        vne[k,pair_idx] += numpy.einsum('k,xk->x', vG.real, pqkR)
+        vne[k,pair_idx] += numpy.einsum('k,xk->x', vG.imag, pqkI)
     vne = vne.reshape(-1,nao,nao)
     t1 = log.timer_debug1('contracting Vnuc', *t1)
 
@@ -103,14 +103,15 @@ def get_pp_loc_part1(mydf, cell, kpts):
     else:
         vloc = numpy.zeros((nkpts,nao**2), dtype=numpy.complex128)
     max_memory = mydf.max_memory - lib.current_memory()[0]
-    for k, pqkR, pqkI, p0, p1 \
-            in mydf.ft_loop(cell, mydf.gs, kpt_allow, kpts, max_memory=max_memory):
-        vG = vpplocG[p0:p1]
+    for k, pqkR, pqkI, pair_idx, Gidx \
+            in mydf.sparse_ft_loop(cell, mydf.gs, kpt_allow, kpts,
+                                   max_memory=max_memory):
+        vG = vpplocG[Gidx]
         if not real:
-            vloc[k] += numpy.einsum('k,xk->x', vG.real, pqkI) * 1j
-            vloc[k] += numpy.einsum('k,xk->x', vG.imag, pqkR) *-1j
-        vloc[k] += numpy.einsum('k,xk->x', vG.real, pqkR)
-        vloc[k] += numpy.einsum('k,xk->x', vG.imag, pqkI)
+            vloc[k,pair_idx] += numpy.einsum('k,xk->x', vG.real, pqkI) * 1j
+            vloc[k,pair_idx] += numpy.einsum('k,xk->x', vG.imag, pqkR) *-1j
+        vloc[k,pair_idx] += numpy.einsum('k,xk->x', vG.real, pqkR)
+        vloc[k,pair_idx] += numpy.einsum('k,xk->x', vG.imag, pqkI)
         pqkR = pqkI = None
     t1 = log.timer_debug1('contracting vloc part1', *t1)
     return vloc.reshape(-1,nao,nao)
@@ -118,6 +119,15 @@ def get_pp_loc_part1(mydf, cell, kpts):
 
 class PWDF(lib.StreamObject):
     '''Density expansion on plane waves
+
+    Attributes:
+        nproc : int
+            Number of processes to compute the k-point blocks of the J/K
+            matrices.  Default is 1.
+        ft_aopair_tol : float
+            If set, the FT AO pairs which are estimated to be smaller than
+            ft_aopair_tol (see :func:`ft_ao.estimate_gcut`) are skipped for
+            each block of G vectors.  Default is None (no screening).
     '''
     def __init__(self, cell, kpts=numpy.zeros((1,3))):
         self.cell = cell
@@ -127,9 +137,13 @@ class PWDF(lib.StreamObject):
 
         self.kpts = kpts
         self.gs = cell.gs
+        self.nproc = 1
+        self.ft_aopair_tol = None
 
 # Not input options
         self.exxdiv = None  # to mimic KRHF/KUHF object in function get_coulG
+        self._aopairs = None
+        self._aopairs_key = None
         self._keys = set(self.__dict__.keys())
 
     def dump_flags(self):
@@ -139,6 +153,8 @@ class PWDF(lib.StreamObject):
         logger.info(self, 'gs = %s', self.gs)
         logger.info(self, 'len(kpts) = %d', len(self.kpts))
         logger.debug1(self, '    kpts = %s', self.kpts)
+        logger.info(self, 'nproc = %s', self.nproc)
+        logger.info(self, 'ft_aopair_tol = %s', self.ft_aopair_tol)
 
     def pw_loop(self, cell, gs=None, kpti_kptj=None, shls_slice=None,
                 max_memory=2000):
@@ -151,11 +167,7 @@ class PWDF(lib.StreamObject):
             kpti, kptj = kpti_kptj
 
         nao = cell.nao_nr()
-        gxyz = lib.cartesian_prod((numpy.append(range(gs[0]+1), range(-gs[0],0)),
-                                   numpy.append(range(gs[1]+1), range(-gs[1],0)),
-                                   numpy.append(range(gs[2]+1), range(-gs[2],0))))
-        invh = numpy.linalg.inv(cell._h)
-        Gv = 2*numpy.pi * numpy.dot(gxyz, invh)
+        gxyz, invh, Gv = _gen_Gv(cell, gs)
         ngs = gxyz.shape[0]
 
 # Theoretically, hermitian symmetry can be also found for kpti == kptj:
@@ -168,25 +180,24 @@ class PWDF(lib.StreamObject):
 
         blksize = min(max(16, int(max_memory*1e6*.75/16/nao**2)), 16384)
         sublk = max(16, int(blksize//4))
-        buf = [numpy.zeros(nao*nao*blksize, dtype=numpy.complex128)]
         pqkRbuf = numpy.empty(nao*nao*sublk)
         pqkIbuf = numpy.empty(nao*nao*sublk)
 
         for p0, p1 in self.prange(0, ngs, blksize):
-            #aoao = ft_ao.ft_aopair(cell, Gv[p0:p1], shls_slice, aosym, invh,
-            #                       gxyz[p0:p1], gs, (kpti, kptj))
-            aoao = ft_ao._ft_aopair_kpts(cell, Gv[p0:p1], shls_slice, aosym,
-                                         invh, gxyz[p0:p1], gs,
-                                         kptj-kpti, kptj.reshape(1,3), out=buf)[0]
+            dat, pair_idx = self._ft_aopair_block(cell, Gv[p0:p1], gxyz[p0:p1],
+                                                  gs, invh, aosym, kptj-kpti,
+                                                  kptj.reshape(1,3), shls_slice)
+            aoao = dat[0]
             for i0, i1 in lib.prange(0, p1-p0, sublk):
                 nG = i1 - i0
-                pqkR = numpy.ndarray((nao,nao,nG), buffer=pqkRbuf)
-                pqkI = numpy.ndarray((nao,nao,nG), buffer=pqkIbuf)
-                pqkR[:] = aoao[i0:i1].real.transpose(1,2,0)
-                pqkI[:] = aoao[i0:i1].imag.transpose(1,2,0)
-                yield (pqkR.reshape(-1,nG),
-                       pqkI.reshape(-1,nG), p0+i0, p0+i1)
-            aoao[:] = 0
+                pqkR = numpy.ndarray((nao*nao,nG), buffer=pqkRbuf)
+                pqkI = numpy.ndarray((nao*nao,nG), buffer=pqkIbuf)
+                pqkR[:] = 0
+                pqkI[:] = 0
+                pqkR[pair_idx] = aoao[i0:i1].real.T
+                pqkI[pair_idx] = aoao[i0:i1].imag.T
+                yield pqkR, pqkI, p0+i0, p0+i1
+            aoao = dat = None
 
     def ft_loop(self, cell, gs=None, kpt=numpy.zeros(3),
                 kpts=None, shls_slice=None, max_memory=4000):
@@ -201,11 +212,7 @@ class PWDF(lib.StreamObject):
         nkpts = len(kpts)
 
         nao = cell.nao_nr()
-        gxyz = lib.cartesian_prod((numpy.append(range(gs[0]+1), range(-gs[0],0)),
-                                   numpy.append(range(gs[1]+1), range(-gs[1],0)),
-                                   numpy.append(range(gs[2]+1), range(-gs[2],0))))
-        invh = numpy.linalg.inv(cell._h)
-        Gv = 2*numpy.pi * numpy.dot(gxyz, invh)
+        gxyz, invh, Gv = _gen_Gv(cell, gs)
         ngs = gxyz.shape[0]
 
 # Theoretically, hermitian symmetry can be also found for kpti == kptj:
@@ -217,24 +224,99 @@ class PWDF(lib.StreamObject):
             aosym = 's1'
 
         blksize = min(max(16, int(max_memory*.9e6/(nao**2*(nkpts+1)*16))), 16384)
-        buf = [numpy.zeros(nao*nao*blksize, dtype=numpy.complex128)
-               for k in range(nkpts)]
         pqkRbuf = numpy.empty(nao*nao*blksize)
         pqkIbuf = numpy.empty(nao*nao*blksize)
 
         for p0, p1 in self.prange(0, ngs, blksize):
-            ft_ao._ft_aopair_kpts(cell, Gv[p0:p1], shls_slice, aosym, invh,
-                                  gxyz[p0:p1], gs, kpt, kpts, out=buf)
+            dat, pair_idx = self._ft_aopair_block(cell, Gv[p0:p1], gxyz[p0:p1],
+                                                  gs, invh, aosym, kpt, kpts,
+                                                  shls_slice)
             nG = p1 - p0
             for k in range(nkpts):
-                aoao = numpy.ndarray((nG,nao,nao), dtype=numpy.complex128,
-                                     order='F', buffer=buf[k])
-                pqkR = numpy.ndarray((nao,nao,nG), buffer=pqkRbuf)
-                pqkI = numpy.ndarray((nao,nao,nG), buffer=pqkIbuf)
-                pqkR[:] = aoao.real.transpose(1,2,0)
-                pqkI[:] = aoao.imag.transpose(1,2,0)
-                yield (k, pqkR.reshape(-1,nG), pqkI.reshape(-1,nG), p0, p1)
-                aoao[:] = 0  # == buf[k][:] = 0
+                pqkR = numpy.ndarray((nao*nao,nG), buffer=pqkRbuf)
+                pqkI = numpy.ndarray((nao*nao,nG), buffer=pqkIbuf)
+                pqkR[:] = 0
+                pqkI[:] = 0
+                pqkR[pair_idx] = dat[k].real.T
+                pqkI[pair_idx] = dat[k].imag.T
+                yield (k, pqkR, pqkI, p0, p1)
+            dat = None
+
+    def sparse_ft_loop(self, cell, gs=None, kpt=numpy.zeros(3),
+                       kpts=None, max_memory=4000):
+        '''Similar to :func:`ft_loop`, but the G vectors are looped in the
+        order of |G+kpt|.  If ft_aopair_tol is set, only the significant AO
+        pairs of each block of G vectors are returned.
+
+        Returns:
+            A generator of (k, pqkR, pqkI, pair_idx, Gidx).  pqkR and pqkI
+            have the shape (len(pair_idx),len(Gidx)).  pair_idx are the
+            indices of the AO pairs in the (nao,nao) square.  Gidx are the
+            indices of the G vectors in the G vectors of gs.
+        '''
+        if gs is None: gs = self.gs
+        if kpts is None:
+            assert(gamma_point(kpt))
+            kpts = self.kpts
+        kpts = numpy.reshape(kpts, (-1,3))
+        nkpts = len(kpts)
+
+        gxyz, invh, Gv = _gen_Gv(cell, gs)
+        kG = Gv + kpt
+        Gidx_sorted = numpy.argsort(numpy.einsum('gx,gx->g', kG, kG))
+        kG = None
+
+        if gamma_point(kpt) and gamma_point(kpts):
+            aosym = 's1hermi'
+        else:
+            aosym = 's1'
+
+        aopairs = self._get_aopairs(cell)
+        if aopairs is None:
+            npair = cell.nao_nr()**2
+        else:
+            npair = len(aopairs.select(0)[1])
+        blksize = min(max(16, int(max_memory*.9e6/(max(npair,1)*(nkpts+1)*16))),
+                      16384)
+        for p0, p1 in self.prange(0, len(Gidx_sorted), blksize):
+            Gidx = Gidx_sorted[p0:p1]
+            dat, pair_idx = self._ft_aopair_block(cell, Gv[Gidx], gxyz[Gidx],
+                                                  gs, invh, aosym, kpt, kpts)
+            if len(pair_idx) == 0:
+                continue
+            for k in range(nkpts):
+                pqkR = numpy.asarray(dat[k].real.T, order='C')
+                pqkI = numpy.asarray(dat[k].imag.T, order='C')
+                yield (k, pqkR, pqkI, pair_idx, Gidx)
+                pqkR = pqkI = dat[k] = None
+
+    def _get_aopairs(self, cell):
+        '''The significant AO pairs (see :class:`ft_ao.AOPairs`) of cell,
+        cached until the cell or ft_aopair_tol is changed.  None if the
+        screening is not enabled.'''
+        tol = getattr(self, 'ft_aopair_tol', None)
+        if tol is None:
+            return None
+        key = (id(cell), tol, cell._env.tobytes(),
+               numpy.asarray(cell.lattice_vectors()).tobytes())
+        if getattr(self, '_aopairs_key', None) != key:
+            self._aopairs = ft_ao.AOPairs(cell, tol)
+            self._aopairs_key = key
+        return self._aopairs
+
+    def _ft_aopair_block(self, cell, Gv, gxyz, gs, invh, aosym, kpt, kpts,
+                         shls_slice=None):
+        '''FT AO pairs of a block of G vectors.  Returns a list of (nG,npair)
+        arrays (one for each k-point) and the indices of the pairs.'''
+        aopairs = self._get_aopairs(cell)
+        if shls_slice is None and aopairs is not None:
+            return ft_ao.ft_aopair_screened(cell, Gv, aopairs, aosym, invh,
+                                            gxyz, gs, kpt, kpts)
+        else:
+            dat = ft_ao._ft_aopair_kpts(cell, Gv, shls_slice, aosym, invh,
+                                        gxyz, gs, kpt, kpts)
+            nG, ni, nj = dat[0].shape
+            return [x.reshape(nG,ni*nj) for x in dat], numpy.arange(ni*nj)
 
     def prange(self, start, stop, step):
         return lib.prange(start, stop, step)
@@ -273,6 +355,14 @@ class PWDF(lib.StreamObject):
 def gamma_point(kpt):
     return abs(kpt).sum() < KPT_DIFF_TOL
 
+def _gen_Gv(cell, gs):
+    gxyz = lib.cartesian_prod((numpy.append(range(gs[0]+1), range(-gs[0],0)),
+                               numpy.append(range(gs[1]+1), range(-gs[1],0)),
+                               numpy.append(range(gs[2]+1), range(-gs[2],0))))
+    invh = numpy.linalg.inv(cell._h)
+    Gv = 2*numpy.pi * numpy.dot(gxyz, invh)
+    return gxyz, invh, Gv
+
 
 if __name__ == '__main__':
     from pyscf.pbc import gto as pbcgto
@@ -32,15 +32,16 @@ def get_j_kpts(mydf, dm_kpts, hermi=1, kpts=numpy.zeros((1,3)), kpt_band=None):
     vR = numpy.zeros((nset,ngs))
     vI = numpy.zeros((nset,ngs))
     max_memory = (mydf.max_memory - lib.current_memory()[0]) * .8
-    for k, pqkR, pqkI, p0, p1 \
-            in mydf.ft_loop(cell, mydf.gs, kpt_allow, kpts, max_memory=max_memory):
+    for k, pqkR, pqkI, pair_idx, Gidx \
+            in mydf.sparse_ft_loop(cell, mydf.gs, kpt_allow, kpts,
+                                   max_memory=max_memory):
         for i in range(nset):
-            rhoR = numpy.dot(dmsR[i,k], pqkR)
-            rhoR-= numpy.dot(dmsI[i,k], pqkI)
-            rhoI = numpy.dot(dmsR[i,k], pqkI)
-            rhoI+= numpy.dot(dmsI[i,k], pqkR)
-            vR[i,p0:p1] += rhoR * coulG[p0:p1]
-            vI[i,p0:p1] += rhoI * coulG[p0:p1]
+            rhoR = numpy.dot(dmsR[i,k,pair_idx], pqkR)
+            rhoR-= numpy.dot(dmsI[i,k,pair_idx], pqkI)
+            rhoI = numpy.dot(dmsR[i,k,pair_idx], pqkI)
+            rhoI+= numpy.dot(dmsI[i,k,pair_idx], pqkR)
+            vR[i,Gidx] += rhoR * coulG[Gidx]
+            vI[i,Gidx] += rhoI * coulG[Gidx]
     pqkR = pqkI = coulG = None
     weight = 1./len(kpts)
     vR *= weight
@@ -57,16 +58,16 @@ def get_j_kpts(mydf, dm_kpts, hermi=1, kpts=numpy.zeros((1,3)), kpt_band=None):
 
     vjR = numpy.zeros((nset,nband,nao*nao))
     vjI = numpy.zeros((nset,nband,nao*nao))
-    for k, pqkR, pqkI, p0, p1 \
-            in mydf.ft_loop(cell, mydf.gs, kpt_allow, kpts_band,
-                            max_memory=max_memory):
+    for k, pqkR, pqkI, pair_idx, Gidx \
+            in mydf.sparse_ft_loop(cell, mydf.gs, kpt_allow, kpts_band,
+                                   max_memory=max_memory):
         for i in range(nset):
-            vjR[i,k] += numpy.dot(pqkR, vR[i,p0:p1])
-            vjR[i,k] += numpy.dot(pqkI, vI[i,p0:p1])
+            vjR[i,k,pair_idx] += numpy.dot(pqkR, vR[i,Gidx])
+            vjR[i,k,pair_idx] += numpy.dot(pqkI, vI[i,Gidx])
         if not gamma_point:
             for i in range(nset):
-                vjI[i,k] += numpy.dot(pqkI, vR[i,p0:p1])
-                vjI[i,k] -= numpy.dot(pqkR, vI[i,p0:p1])
+                vjI[i,k,pair_idx] += numpy.dot(pqkI, vR[i,Gidx])
+                vjI[i,k,pair_idx] -= numpy.dot(pqkR, vI[i,Gidx])
     pqkR = pqkI = coulG = None
 
     if gamma_point:
@@ -81,8 +82,10 @@ def get_j_kpts(mydf, dm_kpts, hermi=1, kpts=numpy.zeros((1,3)), kpt_band=None):
             return vj_kpts[0,0]
         else:
             return vj_kpts[:,0]
-    else:
+    elif kpt_band is None:
         return vj_kpts.reshape(dm_kpts.shape)
+    else:
+        return vj_kpts.reshape(dm_kpts.shape[:-3]+(nband,nao,nao))
 
 def get_k_kpts(mydf, dm_kpts, hermi=1, kpts=numpy.zeros((1,3)), kpt_band=None,
                exxdiv=None):
@@ -99,24 +102,40 @@ def get_k_kpts(mydf, dm_kpts, hermi=1, kpts=numpy.zeros((1,3)), kpt_band=None,
         swap_2e = True
     else:
         kpts_band = numpy.reshape(kpt_band, (-1,3))
+        swap_2e = False
     nband = len(kpts_band)
     kk_table = kpts_band.reshape(-1,1,3) - kpts.reshape(1,-1,3)
     kk_todo = numpy.ones(kk_table.shape[:2], dtype=bool)
     vk_kpts = numpy.zeros((nset,nband,nao,nao), dtype=numpy.complex128)
 
     max_memory = (mydf.max_memory - lib.current_memory()[0]) * .8
+    nproc = getattr(mydf, 'nproc', 1)
+    if nproc is None:
+        nproc = lib.num_threads()
     # K_pq = ( p{k1} i{k2} | i{k2} q{k1} )
     def make_kpt(kpt):  # kpt = kptj - kpti
         # search for all possible ki and kj that has ki-kj+kpt=0
         kk_match = numpy.einsum('ijx->ij', abs(kk_table + kpt)) < 1e-9
         kpti_idx, kptj_idx = numpy.where(kk_todo & kk_match)
-        nkptj = len(kptj_idx)
         log.debug1('kpt = %s', kpt)
         log.debug1('kpti_idx = %s', kpti_idx)
         log.debug1('kptj_idx = %s', kptj_idx)
         kk_todo[kpti_idx,kptj_idx] = False
         if swap_2e and abs(kpt).sum() > 1e-9:
             kk_todo[kptj_idx,kpti_idx] = False
+        return kpt, kpti_idx, kptj_idx
+
+    def contract(kpt, kpti_idx, kptj_idx, max_memory):
+        '''The contributions of the k-point pairs (ki,kj) which have the
+        same momentum transfer kpt.  Only the blocks of the k-points in
+        kpti_idx (and kptj_idx if swap_2e) are returned.'''
+        if swap_2e:
+            kidx = numpy.unique(numpy.hstack((kpti_idx, kptj_idx)))
+        else:
+            kidx = numpy.unique(kpti_idx)
+        kmap = numpy.zeros(max(nband, nkpts), dtype=int)
+        kmap[kidx] = numpy.arange(len(kidx))
+        vk = numpy.zeros((nset,len(kidx),nao,nao), dtype=numpy.complex128)
 
         mydf.exxdiv = exxdiv
         vkcoulG = tools.get_coulG(cell, kpt, True, mydf, mydf.gs) / cell.vol
@@ -124,8 +143,8 @@ def get_k_kpts(mydf, dm_kpts, hermi=1, kpts=numpy.zeros((1,3)), kpt_band=None,
         for k, pqkR, pqkI, p0, p1 \
                 in mydf.ft_loop(cell, mydf.gs, kpt, kpts[kptj_idx],
                                 max_memory=max_memory):
-            ki = kpti_idx[k]
-            kj = kptj_idx[k]
+            ki = kmap[kpti_idx[k]]
+            kj = kmap[kptj_idx[k]]
             coulG = numpy.sqrt(vkcoulG[p0:p1])
 
 # case 1: k_pq = (pi|iq)
@@ -135,10 +154,10 @@ def get_k_kpts(mydf, dm_kpts, hermi=1, kpts=numpy.zeros((1,3)), kpt_band=None,
                   pqkI.reshape(nao,nao,-1).transpose(1,0,2)*1j)
             qpk = rsk.conj()
             for i in range(nset):
-                qsk = lib.dot(dms[i,kj], rsk.reshape(nao,-1)).reshape(nao,nao,-1)
-                #:vk_kpts[i,ki] += numpy.einsum('qpk,qsk->ps', qpk, qsk)
-                vk_kpts[i,ki] += lib.dot(qpk.transpose(1,0,2).reshape(nao,-1),
-                                         qsk.transpose(1,0,2).reshape(nao,-1).T)
+                qsk = lib.dot(dms[i,kptj_idx[k]], rsk.reshape(nao,-1)).reshape(nao,nao,-1)
+                #:vk[i,ki] += numpy.einsum('qpk,qsk->ps', qpk, qsk)
+                vk[i,ki] += lib.dot(qpk.transpose(1,0,2).reshape(nao,-1),
+                                    qsk.transpose(1,0,2).reshape(nao,-1).T)
                 qsk = None
             rsk = qpk = None
 
@@ -147,20 +166,27 @@ def get_k_kpts(mydf, dm_kpts, hermi=1, kpts=numpy.zeros((1,3)), kpt_band=None,
                 srk = pqkR - pqkI*1j
                 pqk = srk.reshape(nao,nao,-1).conj()
                 for i in range(nset):
-                    prk = lib.dot(dms[i,ki].T, srk.reshape(nao,-1)).reshape(nao,nao,-1)
-                    #:vk_kpts[i,kj] += numpy.einsum('prk,pqk->rq', prk, pqk)
-                    vk_kpts[i,kj] += lib.dot(prk.transpose(1,0,2).reshape(nao,-1),
-                                             pqk.transpose(1,0,2).reshape(nao,-1).T)
+                    prk = lib.dot(dms[i,kpti_idx[k]].T, srk.reshape(nao,-1)).reshape(nao,nao,-1)
+                    #:vk[i,kj] += numpy.einsum('prk,pqk->rq', prk, pqk)
+                    vk[i,kj] += lib.dot(prk.transpose(1,0,2).reshape(nao,-1),
+                                        pqk.transpose(1,0,2).reshape(nao,-1).T)
                     prk = None
                 srk = pqk = None
 
         pqkR = pqkI = coulG = None
-        return None
+        return kidx, vk
 
+    tasks = []
     for ki, kpti in enumerate(kpts_band):
         for kj, kptj in enumerate(kpts):
             if kk_todo[ki,kj]:
-                make_kpt(kptj-kpti)
+                tasks.append(make_kpt(kptj-kpti) + (max_memory/nproc,))
+
+# The groups of k-point pairs of different momentum transfer are independent.
+# They are distributed over nproc processes.
+    for n, (kidx, vk) in lib.imap_processes(contract, tasks, nproc):
+        vk_kpts[:,kidx] += vk
+    t1 = log.timer_debug1('get_k_kpts', *t1)
 
     vk_kpts *= 1./nkpts
     if abs(kpts).sum() < 1e-9 and abs(kpts_band).sum() < 1e-9:
@@ -171,8 +197,10 @@ def get_k_kpts(mydf, dm_kpts, hermi=1, kpts=numpy.zeros((1,3)), kpt_band=None,
             return vk_kpts[0,0]
         else:
             return vk_kpts[:,0]
-    else:
+    elif kpt_band is None:
         return vk_kpts.reshape(dm_kpts.shape)
+    else:
+        return vk_kpts.reshape(dm_kpts.shape[:-3]+(nband,nao,nao))
 
 
 ##################################################
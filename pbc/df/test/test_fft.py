@@ -628,6 +628,37 @@ class KnowValues(unittest.TestCase):
         self.assertAlmostEqual(ej1, 2.2785994326264971, 9)
         self.assertAlmostEqual(ek1, 7.5122832961825941, 9)
 
+        df.nproc = 2
+        vj2, vk2 = df.get_jk(dms, kpts=kpts, exxdiv=None)
+        self.assertTrue(np.allclose(vj1, vj2, atol=1e-9, rtol=1e-9))
+        self.assertTrue(np.allclose(vk1, vk2, atol=1e-9, rtol=1e-9))
+
+    def test_aoR_cache(self):
+        df = fft.DF(cell)
+        coords = gen_grid.gen_uniform_grids(cell)
+        ao_ref = numint.eval_ao_kpts(cell, coords, kpts)
+        aoR_kpts = [aoR for k, aoR in df.aoR_loop(cell, cell.gs, kpts)]
+        for k in range(len(kpts)):
+            self.assertAlmostEqual(abs(aoR_kpts[k]-ao_ref[k]).max(), 0, 12)
+        # The AO values are reused by the next call and by kpt_band
+        k, aoR = list(df.aoR_loop(cell, cell.gs, kpts, kpts[2]))[0]
+        self.assertEqual(k, 2)
+        self.assertTrue(aoR is aoR_kpts[2])
+        kband = kpts[0] + .1
+        k, aoR = list(df.aoR_loop(cell, cell.gs, kpts, kband))[0]
+        ao_ref = numint.eval_ao(cell, coords, kband)
+        self.assertAlmostEqual(abs(aoR-ao_ref).max(), 0, 12)
+        # The AO values of the band k-points off the mesh are not cached
+        self.assertEqual(len(df._aoR_cache), len(kpts))
+        k, aoR = list(df.aoR_loop(cell, cell.gs, kpts, kband+.1))[0]
+        self.assertEqual(len(df._aoR_cache), len(kpts))
+
+        df.max_memory = 0
+        aoR1 = [aoR for k, aoR in df.aoR_loop(cell, cell.gs, kpts[:2]+.2)]
+        self.assertEqual(len(df._aoR_cache), len(kpts))
+        ao_ref = numint.eval_ao_kpts(cell, coords, kpts[:2]+.2)
+        self.assertAlmostEqual(abs(aoR1[1]-ao_ref[1]).max(), 0, 12)
+
     def test_get_ao_eri(self):
         df = fft.DF(cell)
         eri0 = get_ao_eri(cell)
@@ -93,6 +93,25 @@ class KnowValues(unittest.TestCase):
         dat = ft_ao.ft_aopair(cell, Gv)
         self.assertAlmostEqual(finger(dat), (1.2534723618134684+1.830086071817564j), 9)
 
+    def test_ft_aopair_screened(self):
+        numpy.random.seed(1)
+        kpts = numpy.random.random((2,3))
+        kpt = numpy.random.random(3)
+        Gv = cell.get_Gv([5]*3)
+        nao = cell.nao_nr()
+        aopairs = ft_ao.AOPairs(cell)
+        ref = ft_ao._ft_aopair_kpts(cell, Gv, kpt=kpt, kptjs=kpts)
+        Gnorm = numpy.linalg.norm(Gv+kpt, axis=1)
+        for g0, g1 in ((0, 3), (8, 12), (20, 100)):
+            mask = (Gnorm >= g0) & (Gnorm < g1)
+            dat, pair_idx = ft_ao.ft_aopair_screened(cell, Gv[mask], aopairs,
+                                                     kpt=kpt, kptjs=kpts)
+            for k in range(2):
+                v = numpy.zeros((mask.sum(),nao*nao), dtype=numpy.complex128)
+                v[:,pair_idx] = dat[k]
+                self.assertAlmostEqual(abs(v-ref[k][mask].reshape(-1,nao*nao)).max(), 0, 7)
+        self.assertTrue(len(aopairs.select(20)[1]) < nao**2)
+
 
 if __name__ == '__main__':
     print('Full Tests for ft_ao')
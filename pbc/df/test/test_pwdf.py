@@ -338,6 +338,24 @@ class KnowValues(unittest.TestCase):
         self.assertAlmostEqual(finger(v1[2]), (-6.05309001635+0.281728966125j), 8)
         self.assertAlmostEqual(finger(v1[3]), (-5.60115438406+0.275973062578j), 8)
 
+    def test_ft_aopair_tol(self):
+        df = pwdf.PWDF(cell)
+        v0 = df.get_nuc(kpts[:2])
+        df.ft_aopair_tol = 1e-10
+        v1 = df.get_nuc(kpts[:2])
+        self.assertAlmostEqual(abs(v1-v0).max(), 0, 7)
+
+        nao = cell.nao_nr()
+        np.random.seed(1)
+        dm = np.random.random((2,nao,nao))
+        dm = dm + dm.transpose(0,2,1)
+        df.ft_aopair_tol = None
+        vj0, vk0 = df.get_jk(dm, kpts=kpts[:2], exxdiv=None)
+        df.ft_aopair_tol = 1e-10
+        vj1, vk1 = df.get_jk(dm, kpts=kpts[:2], exxdiv=None)
+        self.assertAlmostEqual(abs(vj1-vj0).max(), 0, 7)
+        self.assertAlmostEqual(abs(vk1-vk0).max(), 0, 7)
+
     def test_pwdf_get_ao_eri(self):
         df0 = fft.DF(cell)
         df = pwdf.PWDF(cell)
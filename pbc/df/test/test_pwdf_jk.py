@@ -67,6 +67,20 @@ class KnowValues(unittest.TestCase):
         self.assertAlmostEqual(finger(vk[6]), (7.3743790120272408-0.096290683129384574j)/8, 9)
         self.assertAlmostEqual(finger(vk[7]), (6.8144379626901443+0.08071261392857812j) /8, 9)
 
+    def test_pwdf_k_nproc(self):
+        kpts = cell.make_kpts((2,2,2))
+        numpy.random.seed(1)
+        nao = cell.nao_nr()
+        dm = numpy.random.random((8,nao,nao))
+        dm = dm + dm.transpose(0,2,1)
+        mydf = pwdf.PWDF(cell)
+        mydf.kpts = kpts
+        vk0 = pwdf_jk.get_k_kpts(mydf, dm, 1, mydf.kpts)
+        mydf.nproc = 2
+        vk1 = pwdf_jk.get_k_kpts(mydf, dm, 1, mydf.kpts)
+        self.assertAlmostEqual(abs(vk1-vk0).max(), 0, 9)
+        vk1 = pwdf_jk.get_k_kpts(mydf, dm, 1, mydf.kpts, kpts[1]+.1)
+        self.assertEqual(vk1.shape, (nao,nao))
 
 
 if __name__ == '__main__':
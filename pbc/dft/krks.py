@@ -55,13 +55,22 @@ def get_veff(ks, cell=None, dm=None, dm_last=0, vhf_last=0, hermi=1,
     dm = np.asarray(dm)
     nao = dm.shape[-1]
     ground_state = (dm.ndim == 3 and kpt_band is None)
-    nkpts = len(kpts)
+    weights = khf.kpts_weights(ks, len(kpts))
+
+    # The numerical integration needs all k-points (or the weights of the
+    # irreducible k-points) to construct the density
+    kpts_symm = getattr(ks, '_kpts_symm', None)
+    if kpts_symm is not None and kpts_symm.check_kpts(kpts):
+        xc_kpts = kpts_symm
+    else:
+        kpts_symm = None
+        xc_kpts = kpts
 
     if hermi == 2:  # because rho = 0
         n, ks._exc, vx = 0, 0, 0
     else:
         n, ks._exc, vx = ks._numint.nr_rks(cell, ks.grids, ks.xc, dm, 1,
-                                           kpts, kpt_band)
+                                           xc_kpts, kpt_band)
         logger.debug(ks, 'nelec by numeric integration = %s', n)
         t0 = logger.timer(ks, 'vxc', *t0)
 
@@ -73,15 +82,20 @@ def get_veff(ks, cell=None, dm=None, dm_last=0, vhf_last=0, hermi=1,
         vhf = vj - vk * (hyb * .5)
 
         if ground_state:
-            ks._exc -= (1./nkpts) * np.einsum('Kij,Kji', dm, vk).real * .5 * hyb*.5
+            ks._exc -= np.einsum('K,Kij,Kji', weights, dm, vk).real * .5 * hyb*.5
 
     if ground_state:
-        ks._ecoul = (1./nkpts) * np.einsum('Kij,Kji', dm, vj).real * .5
+        ks._ecoul = np.einsum('K,Kij,Kji', weights, dm, vj).real * .5
 
     if small_rho_cutoff > 1e-20 and ground_state:
         # Filter grids the first time setup grids
-        idx = ks._numint.large_rho_indices(cell, dm, ks.grids,
-                                           small_rho_cutoff, kpts)
+        if kpts_symm is not None:
+            idx = ks._numint.large_rho_indices(cell, kpts_symm.transform_dm(dm),
+                                               ks.grids, small_rho_cutoff,
+                                               kpts_symm.kpts)
+        else:
+            idx = ks._numint.large_rho_indices(cell, dm, ks.grids,
+                                               small_rho_cutoff, kpts)
         logger.debug(ks, 'Drop grids %d',
                      ks.grids.weights.size - np.count_nonzero(idx))
         ks.grids.coords  = np.asarray(ks.grids.coords [idx], order='C')
@@ -103,7 +117,7 @@ class KRKS(khf.KRHF):
         self._ecoul = 0
         self._exc = 0
         # Note Do not refer to .with_df._numint because gs/coords may be different
-        self._numint = numint._KNumInt(kpts)
+        self._numint = numint._KNumInt(self.kpts)
         self._keys = self._keys.union(['xc', 'grids', 'small_rho_cutoff'])
 
     def dump_flags(self):
@@ -117,8 +131,8 @@ class KRKS(khf.KRHF):
         if h1e_kpts is None: h1e_kpts = self.get_hcore(self.cell, self.kpts)
         if dm_kpts is None: dm_kpts = self.make_rdm1()
 
-        nkpts = len(h1e_kpts)
-        e1 = 1./nkpts * np.einsum('kij,kji', h1e_kpts, dm_kpts).real
+        weights = khf.kpts_weights(self, len(h1e_kpts))
+        e1 = np.einsum('k,kij,kji', weights, h1e_kpts, dm_kpts).real
 
         tot_e = e1 + self._ecoul + self._exc
         logger.debug(self, 'E1 = %s  Ecoul = %s  Exc = %s', e1, self._ecoul, self._exc)
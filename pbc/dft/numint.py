@@ -12,6 +12,7 @@ from pyscf.dft.numint import _dot_ao_ao, _dot_ao_dm, BLKSIZE
 import pyscf.lib
 import pyscf.dft
 from pyscf.pbc import tools
+from pyscf.pbc.lib import kpts_symm
 
 libpbc = pyscf.lib.load_library('libpbc')
 
@@ -130,6 +131,66 @@ def eval_ao_kpts(cell, coords, kpts=None, deriv=0, relativity=0,
     return ao_kpts
 
 
+def make_mask(cell, coords, relativity=0, shls_slice=None, verbose=None):
+    '''Mask to indicate whether a shell is zero on particular grid.  A shell
+    is zero on a block of grids if all its periodic images are farther than
+    its cutoff radius (determined by cell.precision) from the grids.
+
+    Args:
+        cell : an instance of :class:`Cell`
+
+        coords : 2D array, shape (N,3)
+            The coordinates of the grids.
+
+    Kwargs:
+        relativity : bool
+            No effects.
+        shls_slice : 2-element list
+            (shl_start, shl_end).
+            If given, only part of AOs (shl_start <= shell_id < shl_end) are
+            evaluated.  By default, all shells defined in cell will be evaluated.
+        verbose : int or object of :class:`Logger`
+            No effects.
+
+    Returns:
+        2D int8 array of shape ((N+BLKSIZE-1)//BLKSIZE,nbas)
+    '''
+    if shls_slice is None:
+        shls_slice = (0, cell.nbas)
+    coords = numpy.asarray(coords)
+    ngrids = len(coords)
+    nblk = (ngrids+BLKSIZE-1) // BLKSIZE
+
+    # The bounding sphere of each block of grids
+    centers = numpy.empty((nblk,3))
+    radii = numpy.empty(nblk)
+    for i, (p0, p1) in enumerate(prange(0, ngrids, BLKSIZE)):
+        c = coords[p0:p1]
+        centers[i] = (c.max(axis=0) + c.min(axis=0)) * .5
+        radii[i] = pyscf.lib.norm(c - centers[i], axis=1).max()
+
+    Ls = cell.get_lattice_Ls(cell.nimgs)
+    atom_coords = cell.atom_coords()
+    # The shortest distance between the blocks and the images of each atom
+    dist = numpy.empty((cell.natm,nblk))
+    for ia in range(cell.natm):
+        rL = atom_coords[ia] + Ls
+        for i0, i1 in prange(0, nblk, 1024):
+            d = centers[i0:i1,None,:] - rL
+            dist[ia,i0:i1] = numpy.sqrt(numpy.einsum('ijx,ijx->ij', d, d).min(axis=1))
+    dist -= radii
+
+    non0tab = numpy.zeros((nblk,cell.nbas), dtype=numpy.int8)
+    log_prec = numpy.log(cell.precision)
+    for ib in range(shls_slice[0], shls_slice[1]):
+        alpha = cell.bas_exp(ib).min()
+        # Solve log(4 pi r^2) - alpha r^2 = log(precision), see get_nimgs
+        rcut = numpy.sqrt((5-log_prec)/alpha)
+        for i in range(3):
+            rcut = numpy.sqrt(max(numpy.log(4*numpy.pi*rcut**2)-log_prec, 1.)/alpha)
+        non0tab[:,ib] = dist[cell.bas_atom(ib)] < rcut
+    return non0tab
+
 def eval_rho(cell, ao, dm, non0tab=None, xctype='LDA', verbose=None):
     '''Collocate the *real* density (opt. gradients) on the real-space grid.
 
@@ -366,8 +427,8 @@ def nr_rks(ni, cell, grids, xc_code, dm, spin=0, relativity=0, hermi=1,
             No effects.
         kpt_or_kpts : (3,) ndarray or (nkpts,3) ndarray
             Single or multiple k-points sampled for the DM.  Default is gamma point.
-        kpt_band : (3,) ndarray
-            An arbitrary "band" k-point at which to evaluate the XC matrix.
+        kpt_band : (3,) ndarray or (nband,3) ndarray
+            Arbitrary "band" k-points at which to evaluate the XC matrix.
 
     Returns:
         nelec, excsum, vmat.
@@ -465,8 +526,8 @@ def nr_uks(ni, cell, grids, xc_code, dm, spin=1, relativity=0, hermi=1,
             No effects.
         kpt_or_kpts : (3,) ndarray or (nkpts,3) ndarray
             Single or multiple k-points sampled for the DM.  Default is gamma point.
-        kpt_band : (3,) ndarray
-            An arbitrary "band" k-point at which to evaluate the XC matrix.
+        kpt_band : (3,) ndarray or (nband,3) ndarray
+            Arbitrary "band" k-points at which to evaluate the XC matrix.
 
     Returns:
         nelec, excsum, vmat.
@@ -733,6 +794,10 @@ class _KNumInt(pyscf.dft.numint._NumInt):
         return eval_ao_kpts(cell, coords, kpts, deriv,
                             relativity, shl_slice, non0tab, out, verbose)
 
+    def make_mask(self, cell, coords, relativity=0, shls_slice=None,
+                  verbose=None):
+        return make_mask(cell, coords, relativity, shls_slice, verbose)
+
     def eval_rho(self, cell, ao_kpts, dm_kpts, non0tab=None, xctype='LDA',
                  verbose=None):
         '''
@@ -747,11 +812,50 @@ class _KNumInt(pyscf.dft.numint._NumInt):
            rhoR : (ngs,) ndarray
         '''
         nkpts = len(ao_kpts)
-        ngs = ao_kpts[0].shape[-2]
-        rhoR = 0
+        if xctype == 'LDA':
+            ngrids, nao = ao_kpts[0].shape
+            ao_kpts = [ao[None] for ao in ao_kpts]
+        else:
+            ngrids, nao = ao_kpts[0][0].shape
+        idx = _non0_ao_idx(cell, non0tab, ngrids)
+
+        # rho_k(r) = Re sum_ij conj(bra_i(r)) (ket(r) DM_k)_i
+        def dot_bra(bra, c0):
+            rho = numpy.einsum('pi,pi->p', bra.real, c0.real)
+            if numpy.iscomplexobj(bra) and numpy.iscomplexobj(c0):
+                rho += numpy.einsum('pi,pi->p', bra.imag, c0.imag)
+            return rho
+
+        if xctype == 'LDA':
+            rhoR = numpy.zeros(ngrids)
+        elif xctype == 'GGA':
+            rhoR = numpy.zeros((4,ngrids))
+        else:
+            rhoR = numpy.zeros((6,ngrids))
         for k in range(nkpts):
-            rhoR += 1./nkpts*eval_rho(cell, ao_kpts[k], dm_kpts[k], non0tab,
-                                      xctype, verbose)
+            ao = ao_kpts[k]
+            dm = dm_kpts[k]
+            if idx is not None:
+                ao = ao[:,:,idx]
+                dm = dm[idx[:,None],idx]
+            c0 = pyscf.lib.dot(ao[0], dm)
+            if xctype == 'LDA':
+                rhoR += dot_bra(ao[0], c0)
+                continue
+
+            rhoR[0] += dot_bra(ao[0], c0)
+            for i in range(1, 4):
+                rhoR[i] += dot_bra(ao[i], c0) * 2  # *2 for +c.c.
+            if xctype != 'GGA':
+                # rho[4] = \nabla^2 rho, rho[5] = 1/2 |nabla f|^2
+                tau = 0
+                for i in range(1, 4):
+                    tau += dot_bra(ao[i], pyscf.lib.dot(ao[i], dm))
+                XX, YY, ZZ = 4, 7, 9
+                ao2 = ao[XX] + ao[YY] + ao[ZZ]
+                rhoR[4] += (dot_bra(ao2, c0) + tau) * 2
+                rhoR[5] += tau * .5
+        rhoR *= 1./nkpts
         return rhoR
 
     def eval_rho2(self, cell, ao, dm, non0tab=None, xctype='LDA', verbose=None):
@@ -779,6 +883,9 @@ class _KNumInt(pyscf.dft.numint._NumInt):
                 kpts = kpt
             else:
                 kpts = self.kpts
+        if isinstance(kpts, kpts_symm.KPoints):
+            return self._nr_vxc_ibz(nr_rks, cell, grids, xc_code, dms, 0, hermi,
+                                    kpts, kpt_band, max_memory, verbose)
         kpts = kpts.reshape(-1,3)
 
         return nr_rks(self, cell, grids, xc_code, dms, 0, 0,
@@ -794,18 +901,93 @@ class _KNumInt(pyscf.dft.numint._NumInt):
                 kpts = kpt
             else:
                 kpts = self.kpts
+        if isinstance(kpts, kpts_symm.KPoints):
+            return self._nr_vxc_ibz(nr_uks, cell, grids, xc_code, dms, 1, hermi,
+                                    kpts, kpt_band, max_memory, verbose)
         kpts = kpts.reshape(-1,3)
 
         return nr_uks(self, cell, grids, xc_code, dms, 1, 0,
                       hermi, kpts, kpt_band, max_memory, verbose)
 
+    def _nr_vxc_ibz(self, fvxc, cell, grids, xc_code, dms, spin, hermi,
+                    kpts, kpt_band, max_memory, verbose):
+        '''XC functional and potential for the DMs of the irreducible
+        k-points.  kpts is a :class:`KPoints` object.
+        '''
+        dms = numpy.asarray(dms)
+        if not kpts.space_group_symmetry:
+# rho_{-k}(r) = rho_k(r).  The density is the weighted sum over the
+# irreducible k-points.  The 1/nkpts factor of eval_rho is compensated here.
+            w = kpts.weights_ibz * kpts.nkpts_ibz
+            return fvxc(self, cell, grids, xc_code, dms*w[:,None,None], spin,
+                        0, hermi, kpts.kpts_ibz, kpt_band, max_memory, verbose)
+
+        n, exc, vmat = fvxc(self, cell, grids, xc_code, kpts.transform_dm(dms),
+                            spin, 0, hermi, kpts.kpts, kpt_band, max_memory,
+                            verbose)
+        if kpt_band is None:
+            vmat = numpy.asarray(vmat)[...,kpts.ibz2bz,:,:]
+        return n, exc, vmat
+
     def eval_mat(self, cell, ao_kpts, weight, rho, vxc,
                  non0tab=None, xctype='LDA', spin=0, verbose=None):
+        '''XC potential matrices of all k-points.  The XC potential is
+        weighted once on the grids and contracted with the AO values of each
+        k-point.  See :func:`eval_mat` for the arguments.
+        '''
         nkpts = len(ao_kpts)
-        mat = [eval_mat(cell, ao_kpts[k], weight, rho, vxc,
-                        non0tab, xctype, spin, verbose)
-               for k in range(nkpts)]
-        return pyscf.lib.asarray(mat)
+        if xctype == 'LDA':
+            ngrids, nao = ao_kpts[0].shape
+            ao_kpts = [ao[None] for ao in ao_kpts]
+        else:
+            ngrids, nao = ao_kpts[0][0].shape
+        idx = _non0_ao_idx(cell, non0tab, ngrids)
+
+        # *.5 because return mat + mat.T
+        if xctype == 'LDA':
+            if not isinstance(vxc, numpy.ndarray) or vxc.ndim == 2:
+                vrho = vxc[0]
+            else:
+                vrho = vxc
+            wv = (.5*weight*vrho).reshape(1,ngrids)
+        else:
+            vrho, vsigma = vxc[:2]
+            wv = numpy.empty((4,ngrids))
+            if spin == 0:
+                wv[0]  = weight * vrho * .5
+                wv[1:4] = rho[1:4] * (weight * vsigma * 2)
+            else:
+                rho_a, rho_b = rho
+                wv[0]  = weight * vrho * .5
+                wv[1:4] = rho_a[1:4] * (weight * vsigma[0] * 2)  # sigma_uu
+                wv[1:4]+= rho_b[1:4] * (weight * vsigma[1])      # sigma_ud
+        if xctype == 'MGGA':
+            vlapl, vtau = vxc[2:]
+            if vlapl is None:
+                vlapl = 0
+            wtau = weight * (.25*vtau+vlapl)
+            wlapl = .5 * weight * vlapl
+
+        mat = numpy.zeros((nkpts,nao,nao),
+                          dtype=numpy.result_type(*[ao.dtype for ao in ao_kpts]))
+        for k in range(nkpts):
+            ao = ao_kpts[k]
+            if idx is not None:
+                ao = ao[:,:,idx]
+            aow = numpy.einsum('npi,np->pi', ao[:len(wv)], wv)
+            v = pyscf.lib.dot(ao[0].T.conj(), aow)
+            if xctype == 'MGGA':
+                for i in range(1, 4):
+                    v += pyscf.lib.dot(ao[i].T.conj(), ao[i]*wtau[:,None])
+                XX, YY, ZZ = 4, 7, 9
+                ao2 = ao[XX] + ao[YY] + ao[ZZ]
+                v += pyscf.lib.dot(ao[0].T.conj(), ao2*wlapl[:,None])
+            v = v + v.T.conj()
+            if idx is None:
+                mat[k] = v
+            else:
+                mat[k,idx[:,None],idx] = v
+        return mat
 
     def block_loop(self, cell, grids, nao, deriv=0, kpts=numpy.zeros((1,3)),
                    kpt_band=None, max_memory=2000, non0tab=None, blksize=None):
@@ -814,21 +996,23 @@ class _KNumInt(pyscf.dft.numint._NumInt):
         ngrids = grids.weights.size
         nkpts = len(kpts)
         comp = (deriv+1)*(deriv+2)*(deriv+3)//6
+        if kpt_band is None:
+            nband_new = 0
+        else:
+# The band k-points on the k-point mesh take the cached AO values.  The AO
+# values of the other band k-points are evaluated together for each block of
+# grids, so that rho and vxc of the block are shared by all band k-points.
+            kpts_band = numpy.reshape(kpt_band, (-1,3))
+            where = [numpy.argmin(pyscf.lib.norm(kpts-k1,axis=1))
+                     for k1 in kpts_band]
+            where = [k if abs(kpts[k]-k1).sum() < 1e-9 else None
+                     for k, k1 in zip(where, kpts_band)]
+            kpts_new = [k1 for k, k1 in zip(where, kpts_band) if k is None]
+            nband_new = len(kpts_new)
 # NOTE to index ni.non0tab, the blksize needs to be the integer multiplier of BLKSIZE
         if blksize is None:
-            blksize = min(int(max_memory*1e6/(comp*2*nkpts*nao*16*BLKSIZE))*BLKSIZE, ngrids)
+            blksize = min(int(max_memory*1e6/(comp*2*(nkpts+nband_new)*nao*16*BLKSIZE))*BLKSIZE, ngrids)
             blksize = max(blksize, BLKSIZE)
-        if non0tab is None:
-            non0tab = numpy.ones(((ngrids+BLKSIZE-1)//BLKSIZE,cell.nbas),
-                                 dtype=numpy.int8)
-        if kpt_band is None:
-            kpt1 = kpt2 = kpts
-        else:
-            kpt1 = kpt_band
-            kpt2 = kpts
-            where = numpy.argmin(pyscf.lib.norm(kpts-kpt1,axis=1))
-            if abs(kpts[where]-kpt1).sum() > 1e-9:
-                where = None
 
         if (self.cell is None or id(cell) != id(self.cell) or
             self._deriv < deriv or
@@ -836,7 +1020,14 @@ class _KNumInt(pyscf.dft.numint._NumInt):
             abs(self._kpts - kpts).sum() > 1e-9 or
             self._coords.shape != grids.coords.shape or
             abs(self._coords[::64] - grids.coords[::64]).sum() > 1e-7):
-            self.cache_ao(cell, kpts, deriv, grids.coords, nao, blksize)
+# Shells which are zero (including their periodic images) on the grids
+            self.non0tab = self.make_mask(cell, grids.coords)
+            self.cache_ao(cell, kpts, deriv, grids.coords, nao, blksize,
+                          self.non0tab)
+        elif self.non0tab is None:
+            self.non0tab = self.make_mask(cell, grids.coords)
+        if non0tab is None:
+            non0tab = self.non0tab
 
         with h5py.File(self._ao.name, 'r') as f:
             for p0, p1 in prange(0, ngrids, blksize):
@@ -854,14 +1045,17 @@ class _KNumInt(pyscf.dft.numint._NumInt):
                 if kpt_band is None:
                     ao_k1 = ao_k2
                 else:
-                    if where is None:
-                        ao_k1 = self.eval_ao(cell, coords, kpt1, deriv=deriv)
-                    else:
-                        ao_k1 = [ao_k2[where]]
+                    if nband_new > 0:
+                        ao_new = self.eval_ao(cell, coords, kpts_new,
+                                              deriv=deriv, non0tab=non0)[::-1]
+                    ao_k1 = [ao_new.pop() if k is None else ao_k2[k]
+                             for k in where]
+                    ao_new = None
                 yield ao_k1, ao_k2, non0, weight, coords
                 ao_k1 = ao_k2 = None
 
-    def cache_ao(self, cell, kpts, deriv, coords, nao, blksize=BLKSIZE):
+    def cache_ao(self, cell, kpts, deriv, coords, nao, blksize=BLKSIZE,
+                 non0tab=None):
         with h5py.File(self._ao.name, 'w') as f:
             self.cell = cell
             self._kpts = kpts
@@ -881,7 +1075,12 @@ class _KNumInt(pyscf.dft.numint._NumInt):
                 else:
                     f.create_dataset('ao/%d'%k, shape, 'c16')
             for p0, p1 in prange(0, ngrids, blksize):
-                ao_kpts = self.eval_ao(cell, coords[p0:p1], kpts, deriv=deriv)
+                if non0tab is None:
+                    non0 = None
+                else:
+                    non0 = numpy.asarray(non0tab[p0//BLKSIZE:], order='C')
+                ao_kpts = self.eval_ao(cell, coords[p0:p1], kpts, deriv=deriv,
+                                       non0tab=non0)
                 for k in range(nkpts):
                     if comp == 1:
                         f['ao/%d'%k][p0:p1] = ao_kpts[k]
@@ -903,6 +1102,19 @@ class _KNumInt(pyscf.dft.numint._NumInt):
     large_rho_indices = large_rho_indices
 
 
+def _non0_ao_idx(cell, non0tab, ngrids):
+    '''Indices of the AOs which are not zero on the grids.  None if all AOs
+    are needed.'''
+    if non0tab is None:
+        return None
+    non0tab = non0tab[:(ngrids+BLKSIZE-1)//BLKSIZE]
+    shls = numpy.where(non0tab.any(axis=0))[0]
+    if len(shls) == cell.nbas:
+        return None
+    ao_loc = cell.ao_loc_nr()
+    idx = [numpy.arange(ao_loc[i], ao_loc[i+1]) for i in shls]
+    return numpy.hstack(idx + [numpy.zeros(0, dtype=int)])
+
 def prange(start, end, step):
     for i in range(start, end, step):
         yield i, min(i+step, end)
@@ -226,6 +226,55 @@ class KnowValues(unittest.TestCase):
         mat1 = numint.eval_mat(cell, ao, weight, rho, vxc, xctype='GGA')
         self.assertTrue(numpy.allclose(mat0, mat1))
 
+    def test_knumint_eval_rho_mat(self):
+        cell, grids = make_grids(30)
+        numpy.random.seed(10)
+        nao = cell.nao_nr()
+        ngrids = 500
+        nkpts = 3
+        dms = (numpy.random.random((nkpts,nao,nao)) +
+               numpy.random.random((nkpts,nao,nao))*1j)
+        dms = dms + dms.transpose(0,2,1).conj()
+        ao_kpts =(numpy.random.random((nkpts,4,ngrids,nao)) +
+                  numpy.random.random((nkpts,4,ngrids,nao))*1j)
+        ni = numint._KNumInt()
+        rho0 = sum([numint.eval_rho(cell, ao_kpts[k], dms[k], xctype='GGA')
+                    for k in range(nkpts)]) / nkpts
+        rho1 = ni.eval_rho(cell, ao_kpts, dms, xctype='GGA')
+        self.assertTrue(numpy.allclose(rho0, rho1))
+
+        rho = numpy.random.random((4,ngrids))
+        vxc = numpy.random.random((4,ngrids))
+        weight = numpy.random.random(ngrids)
+        mat0 = [numint.eval_mat(cell, ao_kpts[k], weight, rho, vxc, xctype='GGA')
+                for k in range(nkpts)]
+        mat1 = ni.eval_mat(cell, ao_kpts, weight, rho, vxc, xctype='GGA')
+        self.assertTrue(numpy.allclose(mat0, mat1))
+
+        # The second shell is zero on the grids
+        non0tab = numpy.ones(((ngrids+numint.BLKSIZE-1)//numint.BLKSIZE,cell.nbas),
+                             dtype=numpy.int8)
+        non0tab[:,1] = 0
+        ao_kpts[:,:,:,1] = 0
+        rho0 = sum([numint.eval_rho(cell, ao_kpts[k], dms[k], xctype='GGA')
+                    for k in range(nkpts)]) / nkpts
+        rho1 = ni.eval_rho(cell, ao_kpts, dms, non0tab, xctype='GGA')
+        self.assertTrue(numpy.allclose(rho0, rho1))
+        mat0 = [numint.eval_mat(cell, ao_kpts[k], weight, rho, vxc, xctype='GGA')
+                for k in range(nkpts)]
+        mat1 = ni.eval_mat(cell, ao_kpts, weight, rho, vxc, non0tab, xctype='GGA')
+        self.assertTrue(numpy.allclose(mat0, mat1))
+
+    def test_make_mask(self):
+        cell, grids = make_grids(30)
+        non0tab = numint.make_mask(cell, grids.coords)
+        ao = numint.eval_ao(cell, grids.coords)
+        ngrids = grids.weights.size
+        for i, (p0, p1) in enumerate(numint.prange(0, ngrids, numint.BLKSIZE)):
+            for ib in numpy.where(non0tab[i] == 0)[0]:
+                self.assertTrue(abs(ao[p0:p1,ib]).max() < 1e-6)
+        self.assertTrue(non0tab.sum() < non0tab.size)
+
 if __name__ == '__main__':
     print("Full Tests for pbc.dft.numint")
     unittest.main()
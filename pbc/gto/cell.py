@@ -7,6 +7,7 @@
 
 import sys
 import json
+import weakref
 import ctypes
 import numpy as np
 import scipy.linalg
@@ -225,6 +226,10 @@ def intor_cross(intor, cell1, cell2, comp=1, hermi=0, kpts=None, kpt=None):
     .. math::
 
         \langle \mu | intor | \nu \rangle, \mu \in cell1, \nu \in cell2
+
+    Except the 2c2e Coulomb integrals, the lattice sum only includes the
+    images which are significant for each group of shells (see
+    :func:`get_lattice_images`).
     '''
     if kpts is None:
         if kpt is not None:
@@ -235,21 +240,10 @@ def intor_cross(intor, cell1, cell2, comp=1, hermi=0, kpts=None, kpt=None):
         kpts_lst = np.reshape(kpts, (-1,3))
     nkpts = len(kpts_lst)
 
-    atm, bas, env = conc_env(cell1._atm, cell1._bas, cell1._env,
-                             cell2._atm, cell2._bas, cell2._env)
-    atm = np.asarray(atm, dtype=np.int32)
-    bas = np.asarray(bas, dtype=np.int32)
-    env = np.asarray(env, dtype=np.double)
-    natm = len(atm)
-    nbas = len(bas)
-    shls_slice = (0, cell1.nbas, cell1.nbas, nbas)
-    ao_loc = moleintor.make_loc(bas, intor)
-    ni = ao_loc[shls_slice[1]] - ao_loc[shls_slice[0]]
-    nj = ao_loc[shls_slice[3]] - ao_loc[shls_slice[2]]
-    out = [np.zeros((ni,nj,comp), order='F', dtype=np.complex128)
-           for k in range(nkpts)]
-    out_ptrs = (ctypes.c_void_p*nkpts)(
-            *[x.ctypes.data_as(ctypes.c_void_p) for x in out])
+    ao_loc1 = moleintor.make_loc(cell1._bas, intor)
+    ao_loc2 = moleintor.make_loc(cell2._bas, intor)
+    ni = ao_loc1[-1]
+    nj = ao_loc2[-1]
 
     if hermi == 0:
         aosym = 's1'
@@ -261,25 +255,24 @@ def intor_cross(intor, cell1, cell2, comp=1, hermi=0, kpts=None, kpt=None):
         assert('2e' not in intor)
         fill = getattr(libpbc, 'PBCnr2c_fill_'+aosym)
 
-    fintor = getattr(moleintor.libcgto, intor)
-    intopt = lib.c_null_ptr()
-
     nimgs = np.max((cell1.nimgs, cell2.nimgs), axis=0)
-    Ls = np.asarray(cell1.get_lattice_Ls(nimgs), order='C')
-    expLk = np.asarray(np.exp(1j*np.dot(Ls, kpts_lst.T)), order='C')
-    xyz = np.asarray(cell2.atom_coords(), order='C')
-    ptr_coords = np.asarray(atm[cell1.natm:,mole.PTR_COORD],
-                            dtype=np.int32, order='C')
-    drv = libpbc.PBCnr2c_drv
-    drv(fintor, fill, out_ptrs, xyz.ctypes.data_as(ctypes.c_void_p),
-        ptr_coords.ctypes.data_as(ctypes.c_void_p), ctypes.c_int(cell2.natm),
-        Ls.ctypes.data_as(ctypes.c_void_p), ctypes.c_int(len(Ls)),
-        expLk.ctypes.data_as(ctypes.c_void_p), ctypes.c_int(nkpts),
-        ctypes.c_int(comp), (ctypes.c_int*4)(*(shls_slice[:4])),
-        ao_loc.ctypes.data_as(ctypes.c_void_p), intopt,
-        atm.ctypes.data_as(ctypes.c_void_p), ctypes.c_int(natm),
-        bas.ctypes.data_as(ctypes.c_void_p), ctypes.c_int(nbas),
-        env.ctypes.data_as(ctypes.c_void_p))
+    if '2c2e' in intor:
+# The long-range Coulomb integrals are not screened
+        Ls = cell1.get_lattice_Ls(nimgs)
+        out = _lattice_sum(intor, fill, cell1, cell2, Ls, kpts_lst, comp)
+    else:
+        out = [np.zeros((ni,nj,comp), order='F', dtype=np.complex128)
+               for k in range(nkpts)]
+        for Ls, ish, jsh in get_lattice_images(cell1, cell2, nimgs):
+            if hermi != 0:
+                ish = jsh = np.union1d(ish, jsh)
+            dat = _lattice_sum(intor, fill, _sub_cell(cell1, ish),
+                               _sub_cell(cell2, jsh), Ls, kpts_lst, comp)
+            idx1 = _shl2ao(ao_loc1, ish)
+            idx2 = _shl2ao(ao_loc2, jsh)
+            for k in range(nkpts):
+                out[k][idx1[:,None],idx2] += dat[k]
+            dat = None
 
     def trans(out):
         out = out.transpose(2,0,1)
@@ -310,6 +303,143 @@ def intor_cross(intor, cell1, cell2, comp=1, hermi=0, kpts=None, kpt=None):
         out = out[0]
     return out
 
+def _lattice_sum(intor, fill, cell1, cell2, Ls, kpts_lst, comp):
+    r'''\sum_L <i|intor|j(L)> exp(ikL) for the given lattice vectors Ls'''
+    nkpts = len(kpts_lst)
+    atm, bas, env = conc_env(cell1._atm, cell1._bas, cell1._env,
+                             cell2._atm, cell2._bas, cell2._env)
+    atm = np.asarray(atm, dtype=np.int32)
+    bas = np.asarray(bas, dtype=np.int32)
+    env = np.asarray(env, dtype=np.double)
+    natm = len(atm)
+    nbas = len(bas)
+    shls_slice = (0, cell1.nbas, cell1.nbas, nbas)
+    ao_loc = moleintor.make_loc(bas, intor)
+    ni = ao_loc[shls_slice[1]] - ao_loc[shls_slice[0]]
+    nj = ao_loc[shls_slice[3]] - ao_loc[shls_slice[2]]
+    out = [np.zeros((ni,nj,comp), order='F', dtype=np.complex128)
+           for k in range(nkpts)]
+    out_ptrs = (ctypes.c_void_p*nkpts)(
+            *[x.ctypes.data_as(ctypes.c_void_p) for x in out])
+
+    fintor = getattr(moleintor.libcgto, intor)
+    intopt = lib.c_null_ptr()
+
+    Ls = np.asarray(Ls, order='C')
+    expLk = np.asarray(np.exp(1j*np.dot(Ls, kpts_lst.T)), order='C')
+    xyz = np.asarray(cell2.atom_coords(), order='C')
+    ptr_coords = np.asarray(atm[cell1.natm:,mole.PTR_COORD],
+                            dtype=np.int32, order='C')
+    drv = libpbc.PBCnr2c_drv
+    drv(fintor, fill, out_ptrs, xyz.ctypes.data_as(ctypes.c_void_p),
+        ptr_coords.ctypes.data_as(ctypes.c_void_p), ctypes.c_int(cell2.natm),
+        Ls.ctypes.data_as(ctypes.c_void_p), ctypes.c_int(len(Ls)),
+        expLk.ctypes.data_as(ctypes.c_void_p), ctypes.c_int(nkpts),
+        ctypes.c_int(comp), (ctypes.c_int*4)(*(shls_slice[:4])),
+        ao_loc.ctypes.data_as(ctypes.c_void_p), intopt,
+        atm.ctypes.data_as(ctypes.c_void_p), ctypes.c_int(natm),
+        bas.ctypes.data_as(ctypes.c_void_p), ctypes.c_int(nbas),
+        env.ctypes.data_as(ctypes.c_void_p))
+    return out
+
+def _sub_cell(cell, shls):
+    '''A shallow copy of cell which only has the given shells'''
+    import copy
+    cell1 = copy.copy(cell)
+    cell1._bas = np.asarray(cell._bas[shls], order='C')
+    return cell1
+
+def _shl2ao(ao_loc, shls):
+    return np.hstack([np.arange(ao_loc[i], ao_loc[i+1]) for i in shls] +
+                     [np.zeros(0, dtype=int)])
+
+def _shell_rcut(cell, precision):
+    '''The radius of each shell beyond which the shell is smaller than
+    precision.  The precision is scaled by the Schwarz factor
+    sqrt(|<i|T|i>|) of the shell, so that the bound also holds for the
+    kinetic and the derivative integrals.'''
+    kin = moleintor.getints('cint1e_kin_sph', cell._atm, cell._bas, cell._env,
+                            hermi=1)
+    ao_loc = cell.ao_loc_nr()
+    log_prec = np.log(precision)
+    rcut = np.empty(cell.nbas)
+    for ib in range(cell.nbas):
+        diag = kin.diagonal()[ao_loc[ib]:ao_loc[ib+1]]
+        q = max(np.sqrt(abs(diag).max()), 1.)
+        alpha = cell.bas_exp(ib).min()
+        l = cell.bas_angular(ib)
+        # Solve log(4 pi r^2 r^l) - alpha r^2 = log(precision/q), see get_nimgs
+        lp = log_prec - np.log(q)
+        r = np.sqrt((5-lp)/alpha)
+        for i in range(3):
+            r = np.sqrt(max(np.log(4*np.pi*r**2)+l*np.log(r)-lp, 1.)/alpha)
+        rcut[ib] = r
+    return rcut
+
+# The image lists of the cells.  The entry is released with the cell.
+_IMAGES_CACHE = weakref.WeakKeyDictionary()
+
+def get_lattice_images(cell1, cell2=None, nimgs=None, precision=None):
+    r'''Significant lattice images of the lattice sum \sum_L <i|O|j(L)>.
+
+    The pair of shells i and j(L) is negligible if the distance between
+    them is larger than the sum of their radii (see :func:`_shell_rcut`).
+    The images of the same significant shells are put in one group.  The
+    result is computed once for each cell and reused by all integrals at
+    all k-points.
+
+    Returns:
+        A list of (Ls, ish, jsh).  Ls are the lattice vectors of the images
+        in the group.  ish and jsh are the shells of cell1 and cell2 which
+        have significant pairs for these images.
+    '''
+    if cell2 is None:
+        cell2 = cell1
+    if precision is None:
+        precision = cell1.precision
+    if nimgs is None:
+        nimgs = np.max((cell1.nimgs, cell2.nimgs), axis=0)
+    key = (tuple(nimgs), precision, cell1.lattice_vectors().tobytes(),
+           cell1._atm.tobytes(), cell1._bas.tobytes(), cell1._env.tobytes(),
+           cell2._atm.tobytes(), cell2._bas.tobytes(), cell2._env.tobytes())
+    cache = _IMAGES_CACHE.get(cell1)
+    if cache is not None and cache[0] == key:
+        return cache[1]
+
+    rcut1 = _shell_rcut(cell1, precision)
+    if cell2 is cell1:
+        rcut2 = rcut1
+    else:
+        rcut2 = _shell_rcut(cell2, precision)
+    atm1 = cell1._bas[:,mole.ATOM_OF]
+    atm2 = cell2._bas[:,mole.ATOM_OF]
+    rmax1 = np.zeros(cell1.natm)
+    rmax2 = np.zeros(cell2.natm)
+    np.maximum.at(rmax1, atm1, rcut1)
+    np.maximum.at(rmax2, atm2, rcut2)
+
+    Ls = cell1.get_lattice_Ls(nimgs)
+    coords1 = cell1.atom_coords()
+    coords2 = cell2.atom_coords()
+    groups = {}
+    for l0, l1 in lib.prange(0, len(Ls), 64):
+        # distance between the atoms of cell1 and the images of cell2
+        d = coords1[:,None,:] - coords2 - Ls[l0:l1,None,None,:]
+        d = np.sqrt(np.einsum('lijx,lijx->lij', d, d))
+        mask1 = (d[:,atm1,:] < rcut1[:,None] + rmax2).any(axis=2)
+        mask2 = (d[:,:,atm2] < rmax1[:,None] + rcut2).any(axis=1)
+        for l in range(l1-l0):
+            if mask1[l].any() and mask2[l].any():
+                k = mask1[l].tobytes() + mask2[l].tobytes()
+                if k not in groups:
+                    groups[k] = (mask1[l], mask2[l], [])
+                groups[k][2].append(l0+l)
+    groups = sorted(groups.values(), key=lambda x: x[2][0])
+    images = [(Ls[idx], np.where(m1)[0], np.where(m2)[0])
+              for m1, m2, idx in groups]
+    _IMAGES_CACHE[cell1] = (key, images)
+    return images
+
 
 def get_nimgs(cell, precision=None):
     r'''Choose number of basis function images in lattice sums
@@ -432,6 +562,9 @@ def get_SI(cell, Gv=None):
     SI = np.exp(-1j*np.dot(coords, Gv.T))
     return SI
 
+# erfc(6) ~ 2e-17, exp(-36) ~ 2e-16
+EWALD_XCUT = 6.
+
 def ewald(cell, ew_eta=None, ew_cut=None):
     '''Perform real (R) and reciprocal (G) space Ewald sum for the energy.
 
@@ -449,42 +582,28 @@ def ewald(cell, ew_eta=None, ew_cut=None):
     chargs = cell.atom_charges()
     coords = cell.atom_coords()
 
-    ewovrl = 0.
-
     # set up real-space lattice indices [-ewcut ... ewcut]
     ewxrange = np.arange(-ew_cut[0],ew_cut[0]+1)
     ewyrange = np.arange(-ew_cut[1],ew_cut[1]+1)
     ewzrange = np.arange(-ew_cut[2],ew_cut[2]+1)
-    ewxyz = lib.cartesian_prod((ewxrange,ewyrange,ewzrange)).T
+    ewxyz = lib.cartesian_prod((ewxrange,ewyrange,ewzrange))
+    Lall = np.dot(ewxyz, cell._h.T)
 
-    nx = len(ewxrange)
-    ny = len(ewyrange)
-    nz = len(ewzrange)
-    Lall = np.einsum('ij,jk->ik', cell._h, ewxyz).reshape(3,nx,ny,nz)
-    #exclude the point where Lall == 0
-    Lall[:,ew_cut[0],ew_cut[1],ew_cut[2]] = 1e200
-    Lall = Lall.reshape(3,nx*ny*nz)
-    Lall = Lall.T
-
-    for ia in range(cell.natm):
-        qi = chargs[ia]
-        ri = coords[ia]
-        for ja in range(ia):
-            qj = chargs[ja]
-            rj = coords[ja]
-            r = np.linalg.norm(ri-rj)
-            ewovrl += 2 * qi * qj / r * scipy.special.erfc(ew_eta * r)
+    # The short-range part erfc(eta r)/r is negligible when erfc(eta r) <
+    # erfc(EWALD_XCUT) ~ 1e-17.  Only the images within the sphere are summed.
+    rcut = EWALD_XCUT / ew_eta
+    rr = coords[:,None,:] - coords
+    rmax = np.sqrt(np.einsum('ijx,ijx->ij', rr, rr)).max()
+    Lall = Lall[lib.norm(Lall, axis=1) < rcut + rmax]
 
+    ewovrl = 0.
     for ia in range(cell.natm):
-        qi = chargs[ia]
-        ri = coords[ia]
-        for ja in range(cell.natm):
-            qj = chargs[ja]
-            rj = coords[ja]
-            r1 = ri-rj + Lall
-            r = np.sqrt(np.einsum('ji,ji->j', r1, r1))
-            ewovrl += (qi * qj / r * scipy.special.erfc(ew_eta * r)).sum()
-
+        r1 = coords[ia] - coords[:,None,:] + Lall
+        r = np.sqrt(np.einsum('jlx,jlx->jl', r1, r1))
+        r[ia,r[ia] < 1e-16] = 1e200  # exclude the point charge itself
+        mask = r < rcut
+        qq = chargs[ia] * chargs[:,None] * np.ones_like(r)
+        ewovrl += (qq[mask] / r[mask] * scipy.special.erfc(ew_eta * r[mask])).sum()
     ewovrl *= 0.5
 
     # last line of Eq. (F.5) in Martin
@@ -492,7 +611,14 @@ def ewald(cell, ew_eta=None, ew_cut=None):
     ewself += -1./2. * np.sum(chargs)**2 * np.pi/(ew_eta**2 * cell.vol)
 
     # g-space sum (using g grid) (Eq. (F.6) in Martin, but note errors as below)
-    SI = cell.get_SI()
+    # The long-range part is negligible when exp(-G^2/(4 eta^2)) <
+    # exp(-EWALD_XCUT^2).  Only the G vectors within the sphere are summed.
+    Gv = cell.Gv
+    absG2 = np.einsum('gi,gi->g', Gv, Gv)
+    mask = absG2 < (2 * EWALD_XCUT * ew_eta)**2
+    Gv = Gv[mask]
+    absG2 = absG2[mask]
+    SI = cell.get_SI(Gv)
     ZSI = np.einsum("i,ij->j", chargs, SI)
 
     # Eq. (F.6) in Martin is off by a factor of 2, the
@@ -505,8 +631,7 @@ def ewald(cell, ew_eta=None, ew_cut=None):
     # See also Eq. (32) of ewald.pdf at
     #   http://www.fisica.uniud.it/~giannozz/public/ewald.pdf
 
-    coulG = pbctools.get_coulG(cell)
-    absG2 = np.einsum('gi,gi->g', cell.Gv, cell.Gv)
+    coulG = pbctools.get_coulG(cell)[mask]
 
     ZSIG2 = np.abs(ZSI)**2
     expG2 = np.exp(-absG2/(4*ew_eta**2))
@@ -521,21 +646,39 @@ def ewald(cell, ew_eta=None, ew_cut=None):
 energy_nuc = ewald
 
 
-def make_kpts(cell, nks):
+def make_kpts(cell, nks, space_group_symmetry=False,
+              time_reversal_symmetry=False):
     '''Given number of kpoints along x,y,z , generate kpoints
 
     Args:
         nks : (3,) ndarray
 
+    Kwargs:
+        space_group_symmetry : bool
+            Whether to reduce the k-points by the space group symmetry of
+            the cell
+        time_reversal_symmetry : bool
+            Whether to reduce the k-points by the time-reversal symmetry
+
     Returns:
-        kpts in absolute value (unit 1/Bohr)
+        kpts in absolute value (unit 1/Bohr).  If any symmetry is
+        requested, a :class:`KPoints` object which holds the k-points of
+        the mesh and the irreducible k-points.  The KPoints object can be
+        passed to KRHF and KRKS, which then solve the SCF on the irreducible
+        k-points only.
 
     Examples:
     >>> cell.make_kpts((4,4,4))
+    >>> kpts = cell.make_kpts((4,4,4), time_reversal_symmetry=True)
+    >>> kpts.kpts_ibz
     '''
     ks_each_axis = [(np.arange(n)+.5)/n-.5 for n in nks]
     scaled_kpts = lib.cartesian_prod(ks_each_axis)
     kpts = cell.get_abs_kpts(scaled_kpts)
+    if space_group_symmetry or time_reversal_symmetry:
+        from pyscf.pbc.lib import kpts_symm
+        kpts = kpts_symm.KPoints(cell, kpts, space_group_symmetry,
+                                 time_reversal_symmetry)
     return kpts
 
 
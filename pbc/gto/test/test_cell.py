@@ -10,6 +10,7 @@ import numpy as np
 from pyscf.pbc import gto as pgto
 import pyscf.gto
 import pyscf.gto.moleintor
+from pyscf import lib
 
 
 L = 1.5
@@ -207,6 +208,51 @@ class KnowValues(unittest.TestCase):
         s1 = cl1.pbc_intor('cint1e_ovlp_sph', hermi=1, kpts=kpts[0])
         self.assertAlmostEqual(finger(s1), 492.28169269619838, 10)
 
+    def test_lattice_images(self):
+        cell = pgto.Cell()
+        cell.build(h = numpy.diag([3., 3., 12.]),
+                   gs = [5,5,20],
+                   atom = '''He 0 0 0; He 1 1 3; He 0 1 6; He 1 0 9''',
+                   unit = 'B',
+                   basis = {'He': [[0, (.2, 1.)], [0, (2., 1.)], [1, (4., 1.)]]})
+        images = pgto.cell.get_lattice_images(cell)
+        self.assertTrue(sum([len(x[0]) for x in images]) <=
+                        len(cell.get_lattice_Ls(cell.nimgs)))
+        self.assertTrue(pgto.cell.get_lattice_images(cell) is images)
+
+        numpy.random.seed(12)
+        kpts = numpy.random.random((3,3))
+        for intor in ('cint1e_ovlp_sph', 'cint1e_kin_sph'):
+            ref = intor_cross(intor, cell, cell, kpts=kpts)
+            dat = cell.pbc_intor(intor, kpts=kpts)
+            for k in range(3):
+                self.assertAlmostEqual(abs(dat[k]-ref[k]).max(), 0, 8)
+            dat = cell.pbc_intor(intor, hermi=1, kpts=kpts[0])
+            self.assertAlmostEqual(abs(dat-ref[0]).max(), 0, 8)
+
+    def test_make_kpts_symm(self):
+        a = 3.5668 / 0.52917721092
+        cell = pgto.Cell()
+        cell.build(h = (numpy.ones((3,3)) - numpy.eye(3)) * a / 2,
+                   gs = [5]*3,
+                   atom = 'C 0 0 0; C %f %f %f' % ((a/4,)*3),
+                   unit = 'B',
+                   basis = {'C': [[0, (1., 1.)], [1, (.8, 1.)], [2, (.6, 1.)]]})
+        kpts = cell.make_kpts((2,2,2), time_reversal_symmetry=True)
+        self.assertEqual(kpts.nkpts_ibz, 4)
+        self.assertAlmostEqual(kpts.weights_ibz.sum(), 1, 12)
+
+        kpts = cell.make_kpts((4,4,4), space_group_symmetry=True,
+                              time_reversal_symmetry=True)
+        self.assertEqual(len(kpts.ops), 48)
+        self.assertEqual(kpts.nkpts_ibz, 10)
+        self.assertAlmostEqual(kpts.weights_ibz.sum(), 1, 12)
+        # The overlap matrices of the full mesh are generated from the
+        # irreducible k-points
+        s = cell.pbc_intor('cint1e_ovlp_sph', hermi=1, kpts=kpts.kpts)
+        s1 = kpts.transform_dm(numpy.asarray(s)[kpts.ibz2bz])
+        self.assertAlmostEqual(abs(s1 - numpy.asarray(s)).max(), 0, 9)
+
 
 if __name__ == '__main__':
     print("Full Tests for pbc.gto.cell")
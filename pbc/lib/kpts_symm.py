@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+#
+# Author: Qiming Sun <osirpt.sun@gmail.com>
+#
+
+'''
+k-points in the irreducible Brillouin zone (IBZ)
+
+The Monkhorst-Pack mesh is reduced by the time-reversal symmetry (k -> -k)
+and the symmetry operations of the space group of the cell.  A symmetry
+operation g = {R|t} maps the fractional coordinates s of the atoms to W s + t,
+where W is an integer matrix in the basis of the lattice vectors.  The AO
+Bloch functions at R k are related to those at k by
+
+    O_g phi^k_mu = \sum_nu phi^{Rk}_nu U_{nu,mu}
+
+    U_{nu,mu} = exp(-i Rk.T_a) D^l_{nu,mu}(R)
+
+where mu is an AO of atom a, nu is the AO of the same shell on the image atom
+b of a, R A_a + t = A_b + T_a, and D^l is the rotation matrix of the real
+spherical harmonics.  Density matrices and Fock matrices transform as
+X^{Rk} = U X^k U^dagger, and X^{-k} = conj(X^k) for the time-reversal
+symmetry.
+'''
+
+import numpy
+from pyscf import lib
+from pyscf import gto
+
+SYMPREC = 1e-6
+
+def lattice_point_group(h, tol=SYMPREC):
+    '''Point group operations of the lattice, as integer matrices W in the
+    basis of the lattice vectors (the columns of h).  The Cartesian rotation
+    is R = h W h^{-1}.
+    '''
+    h = numpy.asarray(h)
+    metric = numpy.dot(h.T, h)
+    ws = lib.cartesian_prod([(-1,0,1)]*9).reshape(-1,3,3)
+    # W^T G W = G for the rotation which preserves the lattice
+    gw = numpy.einsum('nji,jk,nkl->nil', ws, metric, ws)
+    idx = abs(gw - metric).reshape(-1,9).max(axis=1) < tol * abs(metric).max()
+    ws = ws[idx]
+    # identity first
+    ws = sorted(ws, key=lambda w: abs(w-numpy.eye(3)).sum())
+    return numpy.asarray(ws, dtype=int)
+
+def space_group_ops(cell, tol=SYMPREC):
+    '''Symmetry operations {W|t} of the cell in fractional coordinates.
+
+    Returns:
+        ops : a list of (W, t).  W is (3,3) integer array, t is (3,) array.
+        atom_maps : a list of (image, shift) for each op.  image[a] is the
+            atom which atom a is mapped to.  shift[a] is the lattice vector
+            (in fractional coordinates) of W s_a + t - s_b.
+    '''
+    h = cell.lattice_vectors()
+    coords = numpy.dot(cell.atom_coords(), numpy.linalg.inv(h).T)
+    symbols = [cell.atom_symbol(ia) for ia in range(cell.natm)]
+    ops = []
+    atom_maps = []
+    for w in lattice_point_group(h, tol):
+        wcoords = numpy.dot(coords, w.T)
+        for ib in range(cell.natm):
+            if symbols[ib] != symbols[0]:
+                continue
+            t = coords[ib] - wcoords[0]
+            t -= numpy.round(t)
+            image = []
+            shift = []
+            for ia in range(cell.natm):
+                d = wcoords[ia] + t - coords
+                n = numpy.round(d)
+                match = numpy.where((abs(d-n).max(axis=1) < tol) &
+                                    [s == symbols[ia] for s in symbols])[0]
+                if len(match) == 0:
+                    break
+                image.append(match[0])
+                shift.append(n[match[0]])
+            else:
+                ops.append((w, t))
+                atom_maps.append((numpy.asarray(image),
+                                  numpy.asarray(shift, dtype=int)))
+    return ops, atom_maps
+
+def cart_rotation_matrix(l, rot):
+    '''Transformation of the Cartesian GTOs of angular momentum l under the
+    rotation rot:  c_q(rot^{-1} x) = \sum_p c_p(x) M_{pq}
+    '''
+    lx, ly, lz = _cart_powers(l)
+    x = numpy.random.RandomState(7).random_sample((len(lx)*2+4, 3)) - .5
+    x1 = numpy.dot(x, rot)  # rot^{-1} x for orthogonal rot
+    def monomials(x):
+        return x[:,0:1]**lx * x[:,1:2]**ly * x[:,2:3]**lz
+    return numpy.linalg.lstsq(monomials(x), monomials(x1), rcond=-1)[0]
+
+def sph_rotation_matrix(l, rot):
+    '''Transformation of the real spherical GTOs of angular momentum l under
+    the rotation rot:  Y_m(rot^{-1} x) = \sum_n Y_n(x) D_{nm}
+    '''
+    c2s = gto.cart2sph(l)
+    mcart = cart_rotation_matrix(l, rot)
+    return numpy.linalg.lstsq(c2s, numpy.dot(mcart, c2s), rcond=-1)[0]
+
+def _cart_powers(l):
+    lx = []
+    ly = []
+    lz = []
+    for x in reversed(range(l+1)):
+        for y in reversed(range(l+1-x)):
+            lx.append(x)
+            ly.append(y)
+            lz.append(l-x-y)
+    return numpy.asarray(lx), numpy.asarray(ly), numpy.asarray(lz)
+
+
+class KPoints(object):
+    '''k-points of the Monkhorst-Pack mesh and their reduction to the IBZ
+
+    Attributes:
+        kpts : (nkpts,3) ndarray
+            All k-points of the mesh (in 1/Bohr)
+        kpts_ibz : (nkpts_ibz,3) ndarray
+            The irreducible k-points
+        weights_ibz : (nkpts_ibz,) ndarray
+            The weights of the irreducible k-points, normalized to 1
+        ibz2bz : (nkpts_ibz,) int array
+            The index of the irreducible k-points in kpts
+        bz2ibz : (nkpts,) int array
+            For each k-point of kpts, the index of its irreducible k-point
+        bz2op : (nkpts,) int array
+            The symmetry operation (index of ops) which maps the irreducible
+            k-point to the k-point of kpts
+        time_reversal : (nkpts,) bool array
+            Whether the time-reversal is applied after the operation bz2op
+        ops : list of (W, t)
+            The space group operations.  If space group symmetry is not
+            used, it has only the identity.
+
+    Examples:
+
+    >>> kpts = cell.make_kpts((4,4,4), space_group_symmetry=True,
+    ...                       time_reversal_symmetry=True)
+    >>> mf = pbc.scf.KRHF(cell, kpts)
+    '''
+    def __init__(self, cell, kpts, space_group_symmetry=False,
+                 time_reversal_symmetry=True):
+        self.cell = cell
+        self.kpts = numpy.reshape(kpts, (-1,3))
+        self.space_group_symmetry = space_group_symmetry
+        self.time_reversal_symmetry = time_reversal_symmetry
+        self.build()
+
+    @property
+    def nkpts(self):
+        return len(self.kpts)
+
+    @property
+    def nkpts_ibz(self):
+        return len(self.ibz2bz)
+
+    @property
+    def kpts_ibz(self):
+        return self.kpts[self.ibz2bz]
+
+    def build(self):
+        cell = self.cell
+        if self.space_group_symmetry:
+            self.ops, self._atom_maps = space_group_ops(cell)
+        else:
+            self.ops = [(numpy.eye(3, dtype=int), numpy.zeros(3))]
+            self._atom_maps = [(numpy.arange(cell.natm),
+                                numpy.zeros((cell.natm,3), dtype=int))]
+        h = cell.lattice_vectors()
+        self._rots = [numpy.dot(h, numpy.dot(w, numpy.linalg.inv(h)))
+                      for w, t in self.ops]
+
+        nkpts = self.nkpts
+        scaled_kpts = cell.get_scaled_kpts(self.kpts)
+        bz2ibz = -numpy.ones(nkpts, dtype=int)
+        bz2op = numpy.zeros(nkpts, dtype=int)
+        time_reversal = numpy.zeros(nkpts, dtype=bool)
+        ibz2bz = []
+        if self.time_reversal_symmetry:
+            signs = (1, -1)
+        else:
+            signs = (1,)
+        for k in range(nkpts):
+            if bz2ibz[k] >= 0:
+                continue
+            ibz2bz.append(k)
+            for iop, rot in enumerate(self._rots):
+                # scaled coordinates of R k
+                rk = cell.get_scaled_kpts(numpy.dot(rot, self.kpts[k]))
+                for sign in signs:
+                    d = scaled_kpts - sign * rk
+                    match = numpy.where(abs(d-numpy.round(d)).max(axis=1) < SYMPREC)[0]
+                    for j in match:
+                        if bz2ibz[j] < 0:
+                            bz2ibz[j] = len(ibz2bz) - 1
+                            bz2op[j] = iop
+                            time_reversal[j] = sign < 0
+        self.ibz2bz = numpy.asarray(ibz2bz)
+        self.bz2ibz = bz2ibz
+        self.bz2op = bz2op
+        self.time_reversal = time_reversal
+        self.weights_ibz = (numpy.bincount(bz2ibz, minlength=len(ibz2bz)) /
+                            float(nkpts))
+        self._umats = {}
+        return self
+
+    def ao_transform_matrix(self, iop, kpt):
+        '''The AO representation U of operation iop for the Bloch functions
+        at k-point kpt:  O_g phi^kpt = phi^{R kpt} U
+        '''
+        cell = self.cell
+        rot = self._rots[iop]
+        image, shift = self._atom_maps[iop]
+        h = cell.lattice_vectors()
+        rk = numpy.dot(rot, kpt)
+        ao_loc = cell.ao_loc_nr()
+        nao = ao_loc[-1]
+        # shells of each atom, in the order of _bas
+        atm_shls = [[] for ia in range(cell.natm)]
+        for ib in range(cell.nbas):
+            atm_shls[cell.bas_atom(ib)].append(ib)
+        dmats = {}
+        u = numpy.zeros((nao,nao), dtype=numpy.complex128)
+        for ia in range(cell.natm):
+            ja = image[ia]
+            phase = numpy.exp(-1j * numpy.dot(rk, numpy.dot(h, shift[ia])))
+            for ish, jsh in zip(atm_shls[ia], atm_shls[ja]):
+                l = cell.bas_angular(ish)
+                if l not in dmats:
+                    dmats[l] = sph_rotation_matrix(l, rot)
+                d = dmats[l]
+                nd = d.shape[0]
+                for n in range(cell.bas_nctr(ish)):
+                    i0 = ao_loc[ish] + n * nd
+                    j0 = ao_loc[jsh] + n * nd
+                    u[j0:j0+nd,i0:i0+nd] = d * phase
+        return u
+
+    def transform_dm(self, dm_ibz):
+        '''Unfold the density matrices (or Fock matrices) of the irreducible
+        k-points to all k-points.  The k-point is the third last dimension of
+        dm_ibz.
+        '''
+        dm_ibz = numpy.asarray(dm_ibz)
+        nao = dm_ibz.shape[-1]
+        dms = dm_ibz.reshape(-1,self.nkpts_ibz,nao,nao)
+        out = numpy.empty((len(dms),self.nkpts,nao,nao), dtype=numpy.complex128)
+        for k in range(self.nkpts):
+            kibz = self.bz2ibz[k]
+            iop = self.bz2op[k]
+            x = dms[:,kibz]
+            if iop != 0:  # identity is the first op
+                if (iop, kibz) not in self._umats:
+                    self._umats[iop,kibz] = \
+                            self.ao_transform_matrix(iop, self.kpts_ibz[kibz])
+                u = self._umats[iop,kibz]
+                x = numpy.einsum('pi,nij,qj->npq', u, x, u.conj())
+            if self.time_reversal[k]:
+                x = x.conj()
+            out[:,k] = x
+        if numpy.allclose(self.kpts, 0) and numpy.isrealobj(dm_ibz):
+            out = out.real
+        return out.reshape(dm_ibz.shape[:-3]+(self.nkpts,nao,nao))
+
+    def check_kpts(self, kpts):
+        '''Whether kpts are the irreducible k-points'''
+        if kpts is None:
+            return True
+        kpts = numpy.reshape(kpts, (-1,3))
+        return (kpts.shape == (self.nkpts_ibz,3) and
+                abs(kpts - self.kpts_ibz).max() < 1e-9)
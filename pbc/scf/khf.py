@@ -21,6 +21,7 @@ from pyscf.scf import hf
 from pyscf.lib import logger
 from pyscf.pbc.scf import addons
 from pyscf.pbc.scf import chkfile
+from pyscf.pbc.lib import kpts_symm
 
 
 def get_ovlp(mf, cell=None, kpts=None):
@@ -62,8 +63,8 @@ def get_j(mf, cell, dm_kpts, kpts, kpt_band=None):
         kpts : (nkpts, 3) ndarray
 
     Kwargs:
-        kpt_band : (3,) ndarray
-            An arbitrary "band" k-point at which to evalute the matrix.
+        kpt_band : (3,) or (nband,3) ndarray
+            Arbitrary "band" k-points at which to evalute the matrix.
 
     Returns:
         vj : (nkpts, nao, nao) ndarray
@@ -82,8 +83,8 @@ def get_jk(mf, cell, dm_kpts, kpts, kpt_band=None):
         kpts : (nkpts, 3) ndarray
 
     Kwargs:
-        kpt_band : (3,) ndarray
-            An arbitrary "band" k-point at which to evalute the matrix.
+        kpt_band : (3,) or (nband,3) ndarray
+            Arbitrary "band" k-points at which to evalute the matrix.
 
     Returns:
         vj : (nkpts, nao, nao) ndarray
@@ -119,22 +120,28 @@ def get_occ(mf, mo_energy_kpts=None, mo_coeff_kpts=None):
     if mo_energy_kpts is None: mo_energy_kpts = mf.mo_energy
     mo_occ_kpts = np.zeros_like(mo_energy_kpts)
 
-    nkpts = mo_energy_kpts.shape[0]
-    nocc = (mf.cell.nelectron * nkpts) // 2
+    nkpts, nmo = mo_energy_kpts.shape
+    # The orbitals of the irreducible k-points are counted as many times as
+    # the k-points they represent
+    mult = np.rint(kpts_weights(mf, nkpts) * get_nkpts_bz(mf, nkpts)).astype(int)
+    nocc = (mf.cell.nelectron * mult.sum()) // 2
 
     # TODO: implement Fermi smearing and print mo_energy kpt by kpt
-    mo_energy = np.sort(mo_energy_kpts.ravel())
-    fermi = mo_energy[nocc-1]
+    e_idx = np.argsort(mo_energy_kpts.ravel())
+    mo_energy = mo_energy_kpts.ravel()[e_idx]
+    nelec_cum = np.cumsum(np.repeat(mult, nmo)[e_idx])
+    homo = np.searchsorted(nelec_cum, nocc)
+    fermi = mo_energy[homo]
     mo_occ_kpts[mo_energy_kpts <= fermi] = 2
 
-    if nocc < mo_energy.size:
+    if homo+1 < mo_energy.size:
         logger.info(mf, 'HOMO = %.12g  LUMO = %.12g',
-                    mo_energy[nocc-1], mo_energy[nocc])
-        if mo_energy[nocc-1]+1e-3 > mo_energy[nocc]:
+                    mo_energy[homo], mo_energy[homo+1])
+        if mo_energy[homo]+1e-3 > mo_energy[homo+1]:
             logger.warn(mf, '!! HOMO %.12g == LUMO %.12g',
-                        mo_energy[nocc-1], mo_energy[nocc])
+                        mo_energy[homo], mo_energy[homo+1])
     else:
-        logger.info(mf, 'HOMO = %.12g', mo_energy[nocc-1])
+        logger.info(mf, 'HOMO = %.12g', mo_energy[homo])
 
     if mf.verbose >= logger.DEBUG:
         np.set_printoptions(threshold=len(mo_energy))
@@ -168,9 +175,9 @@ def energy_elec(mf, dm_kpts=None, h1e_kpts=None, vhf_kpts=None):
     if h1e_kpts is None: h1e_kpts = mf.get_hcore()
     if vhf_kpts is None: vhf_kpts = mf.get_veff(mf.cell, dm_kpts)
 
-    nkpts = len(dm_kpts)
-    e1 = 1./nkpts * np.einsum('kij,kji', dm_kpts, h1e_kpts)
-    e_coul = 1./nkpts * np.einsum('kij,kji', dm_kpts, vhf_kpts) * 0.5
+    weights = kpts_weights(mf, len(dm_kpts))
+    e1 = np.einsum('k,kij,kji', weights, dm_kpts, h1e_kpts)
+    e_coul = np.einsum('k,kij,kji', weights, dm_kpts, vhf_kpts) * 0.5
     if abs(e_coul.imag > 1.e-7):
         raise RuntimeError("Coulomb energy has imaginary part, "
                            "something is wrong!", e_coul.imag)
@@ -180,6 +187,116 @@ def energy_elec(mf, dm_kpts=None, h1e_kpts=None, vhf_kpts=None):
     return e1+e_coul, e_coul
 
 
+def kpts_weights(mf, nkpts):
+    '''Weights of the k-points in the BZ integration.  If the SCF is solved
+    on the irreducible k-points, they are the weights of the IBZ k-points.
+    Otherwise 1/nkpts for each k-point.
+    '''
+    ks = getattr(mf, '_kpts_symm', None)
+    if ks is not None and nkpts == ks.nkpts_ibz:
+        return ks.weights_ibz
+    else:
+        return np.ones(nkpts) / nkpts
+
+def get_nkpts_bz(mf, nkpts):
+    '''Number of k-points of the full mesh'''
+    ks = getattr(mf, '_kpts_symm', None)
+    if ks is not None and nkpts == ks.nkpts_ibz:
+        return ks.nkpts
+    else:
+        return nkpts
+
+
+def interpolate_bands(mf, kpts_band, cell=None, dm_kpts=None, kpts=None):
+    r'''Energy bands at arbitrary k-points by the Fourier interpolation of
+    the converged potential on the k-point mesh.
+
+    The potential matrices of the k-point mesh are transformed to the lattice
+    vectors of the Born-von Karman supercell,
+    V(L) = 1/N \sum_k exp(-ikL) V(k), and back to the band k-points
+    V(k') = \sum_L exp(ik'L) V(L).  The AO Bloch functions are smooth in k,
+    so V(L) decays with |L| like the matrix elements of Wannier functions and
+    no gauge needs to be fixed.  The core Hamiltonian and the overlap are
+    computed exactly at the band k-points.  The interpolation is exact on
+    the k-point mesh.  Its error at the other k-points decreases with the
+    size of the mesh (fast for insulators).
+
+    Args:
+        kpts_band : (3,) or (nband,3) ndarray
+
+    Returns:
+        mo_energy : (nao,) or (nband,nao) ndarray
+            Bands energies E_n(k)
+        mo_coeff : (nao,nao) or (nband,nao,nao) ndarray
+            Band orbitals psi_n(k)
+    '''
+    if cell is None: cell = mf.cell
+    if dm_kpts is None: dm_kpts = mf.make_rdm1()
+    if kpts is None: kpts = mf.kpts
+    cput0 = (time.clock(), time.time())
+    kpts_band = np.asarray(kpts_band)
+    single_kpt_band = (kpts_band.ndim == 1)
+    kpts_band = kpts_band.reshape(-1,3)
+    nband = len(kpts_band)
+
+    veff = np.asarray(mf.get_veff(cell, dm_kpts, kpts=kpts))
+    ks = getattr(mf, '_kpts_symm', None)
+    if ks is not None and ks.check_kpts(kpts):
+        veff = ks.transform_dm(veff)
+        kpts = ks.kpts
+    kpts = np.reshape(kpts, (-1,3))
+    nkpts = len(kpts)
+    nao = veff.shape[-1]
+
+    Ls, weights = _bvk_lattice_Ls(cell, kpts)
+    expkL = np.exp(1j*np.dot(kpts, Ls.T))
+    expkL_band = np.exp(1j*np.dot(kpts_band, Ls.T)) * weights
+    vband = []
+    for v in veff.reshape(-1,nkpts,nao*nao):
+        vL = lib.dot(expkL.T.conj(), v) * (1./nkpts)
+        vband.append(lib.dot(expkL_band, vL))
+    vband = np.asarray(vband).reshape(veff.shape[:-3]+(nband,nao,nao))
+    logger.timer_debug1(mf, 'interpolate veff', *cput0)
+
+    fock = mf.get_hcore(cell, kpts_band) + vband
+    s1e = mf.get_ovlp(cell, kpts_band)
+    mo_energy, mo_coeff = mf.eig(fock, s1e)
+    if single_kpt_band:
+        mo_energy = mo_energy[...,0,:]
+        mo_coeff = mo_coeff[...,0,:,:]
+    logger.timer(mf, 'interpolate_bands', *cput0)
+    return mo_energy, mo_coeff
+
+def _bvk_lattice_Ls(cell, kpts):
+    '''Lattice vectors of the Born-von Karman supercell of the k-point mesh
+    (centered at the origin) and their weights in the Fourier interpolation.
+    The two boundary images of an even mesh dimension share the weight.
+    '''
+    scaled_kpts = cell.get_scaled_kpts(kpts)
+    mesh = [len(np.unique(np.round(x % 1, 6) % 1)) for x in scaled_kpts.T]
+    h = cell.lattice_vectors()
+    nkpts = len(kpts)
+
+    Ls = np.dot(lib.cartesian_prod([np.arange(n) for n in mesh]), h.T)
+    expkL = np.exp(1j*np.dot(kpts, Ls.T))
+    if (nkpts != len(Ls) or
+        abs(np.dot(expkL.T.conj(), expkL) - np.eye(nkpts)*nkpts).max() > 1e-6):
+        raise ValueError('kpts %s is not a regular k-point mesh' % mesh)
+
+    ms = []
+    ws = []
+    for n in mesh:
+        m = np.arange(-(n//2), n//2+1)
+        w = np.ones(len(m))
+        if n % 2 == 0:
+            w[0] = w[-1] = .5
+        ms.append(m)
+        ws.append(w)
+    Ls = np.dot(lib.cartesian_prod(ms), h.T)
+    weights = np.einsum('i,j,k->ijk', *ws).ravel()
+    return Ls, weights
+
+
 def init_guess_by_chkfile(cell, chkfile_name, project=True, kpts=None):
     '''Read the KHF results from checkpoint file, then project it to the
     basis defined by ``cell``
@@ -246,6 +363,9 @@ class KRHF(hf.RHF):
     Attributes:
         kpts : (nks,3) ndarray
             The sampling k-points in Cartesian coordinates, in units of 1/Bohr.
+            It can be assigned with a :class:`KPoints` object (see
+            :func:`Cell.make_kpts`).  Then the SCF is solved on the
+            irreducible k-points and kpts returns the irreducible k-points.
     '''
     def __init__(self, cell, kpts=np.zeros((1,3)), exxdiv='ewald'):
         from pyscf.pbc import df
@@ -261,14 +381,23 @@ class KRHF(hf.RHF):
         self.direct_scf = False
 
         self.exx_built = False
-        self._keys = self._keys.union(['cell', 'exx_built', 'exxdiv', 'with_df'])
+        self._keys = self._keys.union(['cell', 'exx_built', 'exxdiv', 'with_df',
+                                       '_kpts_symm'])
 
     @property
     def kpts(self):
+        if getattr(self, '_kpts_symm', None) is not None:
+            return self._kpts_symm.kpts_ibz
         return self.with_df.kpts
     @kpts.setter
     def kpts(self, x):
-        self.with_df.kpts = np.reshape(x, (-1,3))
+        if isinstance(x, kpts_symm.KPoints):
+            # The DF object works on the full k-point mesh
+            self._kpts_symm = x
+            self.with_df.kpts = x.kpts
+        else:
+            self._kpts_symm = None
+            self.with_df.kpts = np.reshape(x, (-1,3))
 
     @property
     def mo_energy_kpts(self):
@@ -287,6 +416,12 @@ class KRHF(hf.RHF):
         logger.info(self, '\n')
         logger.info(self, '******** PBC SCF flags ********')
         logger.info(self, 'N kpts = %d', len(self.kpts))
+        if getattr(self, '_kpts_symm', None) is not None:
+            logger.info(self, 'N kpts in the full mesh = %d',
+                        self._kpts_symm.nkpts)
+            logger.info(self, 'space group symmetry = %s  time reversal = %s',
+                        self._kpts_symm.space_group_symmetry,
+                        self._kpts_symm.time_reversal_symmetry)
         logger.debug(self, 'kpts = %s', self.kpts)
         logger.info(self, 'DF object = %s', self.with_df)
         logger.info(self, 'Exchange divergence treatment (exxdiv) = %s', self.exxdiv)
@@ -329,24 +464,79 @@ class KRHF(hf.RHF):
         if kpts is None: kpts = self.kpts
         if dm_kpts is None: dm_kpts = self.make_rdm1()
         cpu0 = (time.clock(), time.time())
-        vj = self.with_df.get_jk(dm_kpts, hermi, kpts, kpt_band,
-                                 with_k=False)[0]
+        ks = getattr(self, '_kpts_symm', None)
+        if ks is not None and ks.check_kpts(kpts):
+            vj = self._get_jk_ibz(dm_kpts, hermi, kpt_band, with_k=False)[0]
+        else:
+            vj = self.with_df.get_jk(dm_kpts, hermi, kpts, kpt_band,
+                                     with_k=False)[0]
         logger.timer(self, 'vj', *cpu0)
         return vj
 
     def get_k(self, cell=None, dm_kpts=None, hermi=1, kpts=None, kpt_band=None):
-        return self.get_jk(cell, dm_kpts, hermi, kpts, kpt_band)[1]
+        if cell is None: cell = self.cell
+        if kpts is None: kpts = self.kpts
+        if dm_kpts is None: dm_kpts = self.make_rdm1()
+        cpu0 = (time.clock(), time.time())
+        ks = getattr(self, '_kpts_symm', None)
+        if ks is not None and ks.check_kpts(kpts):
+            vk = self._get_jk_ibz(dm_kpts, hermi, kpt_band, with_j=False)[1]
+        else:
+            vk = self.with_df.get_jk(dm_kpts, hermi, kpts, kpt_band,
+                                     with_j=False, exxdiv=self.exxdiv)[1]
+        logger.timer(self, 'vk', *cpu0)
+        return vk
 
     def get_jk(self, cell=None, dm_kpts=None, hermi=1, kpts=None, kpt_band=None):
         if cell is None: cell = self.cell
         if kpts is None: kpts = self.kpts
         if dm_kpts is None: dm_kpts = self.make_rdm1()
         cpu0 = (time.clock(), time.time())
-        vj, vk = self.with_df.get_jk(dm_kpts, hermi, kpts, kpt_band,
-                                     exxdiv=self.exxdiv)
+        ks = getattr(self, '_kpts_symm', None)
+        if ks is not None and ks.check_kpts(kpts):
+            vj, vk = self._get_jk_ibz(dm_kpts, hermi, kpt_band)
+        else:
+            vj, vk = self.with_df.get_jk(dm_kpts, hermi, kpts, kpt_band,
+                                         exxdiv=self.exxdiv)
         logger.timer(self, 'vj and vk', *cpu0)
         return vj, vk
 
+    def _get_jk_ibz(self, dm_kpts, hermi=1, kpt_band=None,
+                    with_j=True, with_k=True):
+        '''J and K matrices for the DMs of the irreducible k-points.
+
+        K needs the DMs of all k-points of the mesh.  They are unfolded from
+        the irreducible k-points, and only the rows of the irreducible
+        k-points (or of kpt_band) are computed, as band k-points.  If only
+        the time-reversal symmetry is used and the DMs are hermitian, the
+        source density of J is the weighted sum of the densities of the
+        irreducible k-points since rho_{-k}(r) = rho_k(r).
+        '''
+        ks = self._kpts_symm
+        dm_kpts = np.asarray(dm_kpts)
+        if kpt_band is None:
+            kpts_band = ks.kpts_ibz
+        else:
+            kpts_band = kpt_band
+
+        if with_k or ks.space_group_symmetry or hermi != 1:
+            dm_bz = ks.transform_dm(dm_kpts)
+
+        vj = vk = None
+        if with_j:
+            if not ks.space_group_symmetry and hermi == 1:
+# The 1/nkpts factor of the DF J-builder is compensated by the weights
+                w = ks.weights_ibz * ks.nkpts_ibz
+                vj = self.with_df.get_jk(dm_kpts*w[:,None,None], hermi,
+                                         ks.kpts_ibz, kpt_band, with_k=False)[0]
+            else:
+                vj = self.with_df.get_jk(dm_bz, hermi, ks.kpts, kpts_band,
+                                         with_k=False)[0]
+        if with_k:
+            vk = self.with_df.get_jk(dm_bz, hermi, ks.kpts, kpts_band,
+                                     with_j=False, exxdiv=self.exxdiv)[1]
+        return vj, vk
+
     def get_veff(self, cell=None, dm_kpts=None, dm_last=0, vhf_last=0, hermi=1,
                  kpts=None, kpt_band=None):
         '''Hartree-Fock potential matrix for the given density matrix.
@@ -393,25 +583,42 @@ class KRHF(hf.RHF):
 
         return make_rdm1(mo_coeff_kpts, mo_occ_kpts)
 
-    def get_bands(self, kpt_band, cell=None, dm_kpts=None, kpts=None):
-        '''Get energy bands at a given (arbitrary) 'band' k-point.
+    def get_bands(self, kpts_band, cell=None, dm_kpts=None, kpts=None):
+        '''Get energy bands at the given (arbitrary) 'band' k-points.
+
+        The Fock matrices of all band k-points are built in one pass.  The
+        potential of the SCF density on the grids (or in the auxiliary
+        basis), the AO values of the SCF k-points and the DF integrals are
+        computed once and shared by all band k-points.
+
+        Args:
+            kpts_band : (3,) or (nband,3) ndarray
 
         Returns:
-            mo_energy : (nao,) ndarray
+            mo_energy : (nao,) or (nband,nao) ndarray
                 Bands energies E_n(k)
-            mo_coeff : (nao, nao) ndarray
+            mo_coeff : (nao,nao) or (nband,nao,nao) ndarray
                 Band orbitals psi_n(k)
         '''
         if cell is None: cell = self.cell
         if dm_kpts is None: dm_kpts = self.make_rdm1()
         if kpts is None: kpts = self.kpts
 
-        fock = self.get_hcore(cell, kpt_band)
-        fock = fock + self.get_veff(cell, dm_kpts, kpts=kpts, kpt_band=kpt_band)
-        s1e = self.get_ovlp(cell, kpt_band)
-        mo_energy, mo_coeff = hf.eig(fock, s1e)
+        kpts_band = np.asarray(kpts_band)
+        single_kpt_band = (kpts_band.ndim == 1)
+        kpts_band = kpts_band.reshape(-1,3)
+
+        fock = self.get_hcore(cell, kpts_band)
+        fock = fock + self.get_veff(cell, dm_kpts, kpts=kpts, kpt_band=kpts_band)
+        s1e = self.get_ovlp(cell, kpts_band)
+        mo_energy, mo_coeff = self.eig(fock, s1e)
+        if single_kpt_band:
+            mo_energy = mo_energy[...,0,:]
+            mo_coeff = mo_coeff[...,0,:,:]
         return mo_energy, mo_coeff
 
+    interpolate_bands = interpolate_bands
+
     def init_guess_by_chkfile(self, chk=None, project=True, kpts=None):
         if chk is None: chk = self.chkfile
         if kpts is None: kpts = self.kpts
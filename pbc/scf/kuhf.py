@@ -19,6 +19,7 @@ from pyscf.pbc.scf import khf
 from pyscf import lib
 from pyscf.lib import logger
 from pyscf.pbc.scf import addons
+from pyscf.pbc.lib import kpts_symm
 
 
 def make_rdm1(mo_coeff_kpts, mo_occ_kpts):
@@ -207,6 +208,10 @@ class KUHF(uhf.UHF, khf.KRHF):
         return self.with_df.kpts
     @kpts.setter
     def kpts(self, x):
+        if isinstance(x, kpts_symm.KPoints):
+            raise TypeError('KUHF on the irreducible k-points.  Pass '
+                            'kpts.kpts to solve KUHF on the full k-point '
+                            'mesh.')
         self.with_df.kpts = np.reshape(x, (-1,3))
 
     def dump_flags(self):
@@ -277,25 +282,34 @@ class KUHF(uhf.UHF, khf.KRHF):
         if mo_occ_kpts is None: mo_occ_kpts = self.mo_occ
         return make_rdm1(mo_coeff_kpts, mo_occ_kpts)
 
-    def get_bands(self, kpt_band, cell=None, dm_kpts=None, kpts=None):
-        '''Get energy bands at a given (arbitrary) 'band' k-point.
+    def get_bands(self, kpts_band, cell=None, dm_kpts=None, kpts=None):
+        '''Get energy bands at the given (arbitrary) 'band' k-points.
 
         Returns:
-            mo_energy : (nao,) ndarray
+            mo_energy : (2,nao) or (2,nband,nao) ndarray
                 Bands energies E_n(k)
-            mo_coeff : (nao, nao) ndarray
+            mo_coeff : (2,nao,nao) or (2,nband,nao,nao) ndarray
                 Band orbitals psi_n(k)
         '''
         if cell is None: cell = self.cell
         if dm_kpts is None: dm_kpts = self.make_rdm1()
         if kpts is None: kpts = self.kpts
 
-        fock = self.get_hcore(cell, kpt_band)
-        fock = fock + self.get_veff(cell, dm_kpts, kpts=kpts, kpt_band=kpt_band)
-        s1e = self.get_ovlp(cell, kpt_band)
-        mo_energy, mo_coeff = uhf.eig(fock, s1e)
+        kpts_band = np.asarray(kpts_band)
+        single_kpt_band = (kpts_band.ndim == 1)
+        kpts_band = kpts_band.reshape(-1,3)
+
+        fock = self.get_hcore(cell, kpts_band)
+        fock = fock + self.get_veff(cell, dm_kpts, kpts=kpts, kpt_band=kpts_band)
+        s1e = self.get_ovlp(cell, kpts_band)
+        mo_energy, mo_coeff = self.eig(fock, s1e)
+        if single_kpt_band:
+            mo_energy = mo_energy[:,0]
+            mo_coeff = mo_coeff[:,0]
         return mo_energy, mo_coeff
 
+    interpolate_bands = khf.interpolate_bands
+
     def init_guess_by_chkfile(self, chk=None, project=True, kpts=None):
         if chk is None: chk = self.chkfile
         if kpts is None: kpts = self.kpts
@@ -11,6 +11,9 @@ from pyscf.pbc import gto as pbcgto
 from pyscf.pbc import scf as pbchf
 from pyscf.pbc.scf import khf
 from pyscf.pbc.scf import kuhf
+from pyscf.pbc.dft import krks
+from pyscf.pbc.df import pwdf
+from pyscf.pbc.df import mdf
 import pyscf.pbc.tools
 import pyscf.pbc.tools.pyscf_ase as pyscf_ase
 
@@ -36,6 +39,25 @@ def make_primitive_cell(ngs):
     cell.build()
     return cell
 
+def make_distorted_cell(ngs):
+    # Diamond with the second atom moved off its site.  Only the inversion
+    # through the midpoint of the two atoms is left.
+    cell = pbcgto.Cell()
+    cell.unit = 'A'
+    cell.atom = 'C 0 0 0; C .95 .85 .90'
+    cell.h = [[0, 1.7834, 1.7834],
+              [1.7834, 0, 1.7834],
+              [1.7834, 1.7834, 0]]
+
+    cell.basis = 'gth-szv'
+    cell.pseudo = 'gth-pade'
+    cell.gs = np.array([ngs,ngs,ngs])
+
+    cell.verbose = 5
+    cell.output = '/dev/null'
+    cell.build()
+    return cell
+
 class KnowValues(unittest.TestCase):
     def test_kpt_vs_supercell(self):
         # For large ngs, agreement is always achieved
@@ -113,6 +135,115 @@ class KnowValues(unittest.TestCase):
         ekpt = kmf1.scf()
         self.assertAlmostEqual(ekpt, -11.221426555985234, 8)
 
+    def test_get_bands(self):
+        ngs = 4
+        cell = make_primitive_cell(ngs)
+        kpts = cell.make_kpts((3,1,1))
+        kmf = khf.KRHF(cell, kpts, exxdiv='vcut_sph')
+        kmf.scf()
+        kpts_band = cell.get_abs_kpts([[.1,.2,.3], [1./3,0,0], [.5,.5,0]])
+        e_kn = kmf.get_bands(kpts_band)[0]
+        self.assertEqual(e_kn.shape, (3,cell.nao_nr()))
+        for k, kpt in enumerate(kpts_band):
+            e1 = kmf.get_bands(kpt)[0]
+            self.assertAlmostEqual(abs(e_kn[k]-e1).max(), 0, 9)
+
+        # Fourier interpolation is exact on the k-point mesh
+        e_ref = kmf.get_bands(kpts)[0]
+        e_kn = kmf.interpolate_bands(kpts)[0]
+        self.assertAlmostEqual(abs(e_kn-e_ref).max(), 0, 8)
+        e_kn = kmf.interpolate_bands(kpts_band)[0]
+        self.assertAlmostEqual(abs(e_kn[1]-e_ref[1]).max(), 0, 8)
+
+    def test_interpolate_bands_off_mesh(self):
+        ngs = 4
+        cell = make_primitive_cell(ngs)
+        kpts = cell.make_kpts((4,1,1))
+        kmf = khf.KRHF(cell, kpts, exxdiv='vcut_sph')
+        kmf.scf()
+        # The k-points between the mesh points along the first reciprocal
+        # vector.  The interpolation error is small but not zero.
+        kpts_band = cell.get_abs_kpts([[.125,0,0], [.375,0,0]])
+        nocc = cell.nelectron // 2
+        e_ref = kmf.get_bands(kpts_band)[0]
+        e_kn = kmf.interpolate_bands(kpts_band)[0]
+        self.assertAlmostEqual(abs(e_kn[:,:nocc]-e_ref[:,:nocc]).max(), 0, 2)
+
+    def _check_multi_bands(self, kmf):
+        kmf.scf()
+        cell = kmf.cell
+        kpts_band = cell.get_abs_kpts([[.1,.2,.3], [1./3,0,0], [.5,.5,0]])
+        e_kn = kmf.get_bands(kpts_band)[0]
+        self.assertEqual(e_kn.shape, (3,cell.nao_nr()))
+        for k, kpt in enumerate(kpts_band):
+            e1 = kmf.get_bands(kpt)[0]
+            self.assertAlmostEqual(abs(e_kn[k]-e1).max(), 0, 9)
+
+    def test_get_bands_krks(self):
+        cell = make_primitive_cell(4)
+        kmf = krks.KRKS(cell, cell.make_kpts((3,1,1)))
+        kmf.xc = 'lda,vwn'
+        self._check_multi_bands(kmf)
+
+    def test_get_bands_pwdf(self):
+        cell = make_primitive_cell(4)
+        kpts = cell.make_kpts((3,1,1))
+        kmf = khf.KRHF(cell, kpts, exxdiv='vcut_sph')
+        kmf.with_df = pwdf.PWDF(cell, kpts)
+        self._check_multi_bands(kmf)
+
+    def test_get_bands_mdf(self):
+        cell = make_primitive_cell(4)
+        kpts = cell.make_kpts((3,1,1))
+        kmf = khf.KRHF(cell, kpts, exxdiv='vcut_sph')
+        kmf.with_df = mdf.MDF(cell, kpts)
+        kmf.with_df.auxbasis = 'weigend'
+        self._check_multi_bands(kmf)
+
+    def test_jk_ibz(self):
+        ngs = 4
+        cell = make_primitive_cell(ngs)
+        nao = cell.nao_nr()
+        for space_group_symmetry in (False, True):
+            kpts = cell.make_kpts((2,2,2), time_reversal_symmetry=True,
+                                  space_group_symmetry=space_group_symmetry)
+            np.random.seed(1)
+            dm = (np.random.random((kpts.nkpts_ibz,nao,nao)) +
+                  np.random.random((kpts.nkpts_ibz,nao,nao)) * 1j)
+            dm = dm + dm.transpose(0,2,1).conj()
+            kmf = khf.KRHF(cell, kpts, exxdiv='vcut_sph')
+            vj, vk = kmf.get_jk(cell, dm)
+            kmf1 = khf.KRHF(cell, kpts.kpts, exxdiv='vcut_sph')
+            vj1, vk1 = kmf1.get_jk(cell, kpts.transform_dm(dm))
+            self.assertAlmostEqual(abs(vj-vj1[kpts.ibz2bz]).max(), 0, 9)
+            self.assertAlmostEqual(abs(vk-vk1[kpts.ibz2bz]).max(), 0, 9)
+            self.assertAlmostEqual(abs(kmf.get_j(cell, dm)-vj).max(), 0, 9)
+            self.assertAlmostEqual(abs(kmf.get_k(cell, dm)-vk).max(), 0, 9)
+
+        self.assertRaises(TypeError, kuhf.KUHF, cell, kpts)
+
+    def test_kpts_ibz_energy(self):
+        nks = []
+        for cell in (make_distorted_cell(4), make_primitive_cell(4)):
+            kpts = cell.make_kpts((2,2,2), space_group_symmetry=True,
+                                  time_reversal_symmetry=True)
+            self.assertTrue(kpts.nkpts_ibz < kpts.nkpts)
+            nks.append(kpts.nkpts_ibz)
+
+            e_ibz = khf.KRHF(cell, kpts, exxdiv='vcut_sph').scf()
+            e_bz = khf.KRHF(cell, kpts.kpts, exxdiv='vcut_sph').scf()
+            self.assertAlmostEqual(e_ibz, e_bz, 8)
+
+            kmf = krks.KRKS(cell, kpts)
+            kmf.xc = 'lda,vwn'
+            e_ibz = kmf.scf()
+            kmf = krks.KRKS(cell, kpts.kpts)
+            kmf.xc = 'lda,vwn'
+            e_bz = kmf.scf()
+            self.assertAlmostEqual(e_ibz, e_bz, 8)
+        # The diamond cell has more symmetry operations than the distorted cell
+        self.assertTrue(nks[1] < nks[0])
+
 if __name__ == '__main__':
     print("Full Tests for pbc.scf.khf")
     unittest.main()
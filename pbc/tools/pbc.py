@@ -6,16 +6,59 @@ import scipy.linalg
 from pyscf import lib
 
 nproc = lib.num_threads()
+
+# The FFT plans are created once for each shape of the (batched) 3D grids and
+# reused afterwards.  With pyfftw, the FFTW plans are cached explicitly.
+# Otherwise scipy.fft (which keeps its own plan cache and supports threads)
+# or numpy.fft is used.
+FFT_PLAN_CACHE_SIZE = 32
 try:
     import pyfftw
     pyfftw.interfaces.cache.enable()
-    fftn_wrapper = pyfftw.interfaces.numpy_fft.fftn
-    ifftn_wrapper = pyfftw.interfaces.numpy_fft.ifftn
+    _fft_plans = {}
+    def _get_plan(kind, shape, dtype, s=None):
+        key = (kind, shape, dtype, s)
+        if key not in _fft_plans:
+            if len(_fft_plans) >= FFT_PLAN_CACHE_SIZE:
+                _fft_plans.pop(next(iter(_fft_plans)))
+            a = pyfftw.empty_aligned(shape, dtype=dtype)
+            builder = getattr(pyfftw.builders, kind)
+            if s is None:
+                plan = builder(a, axes=(1,2,3), threads=nproc,
+                               planner_effort='FFTW_MEASURE')
+            else:
+                plan = builder(a, s=s, axes=(1,2,3), threads=nproc,
+                               planner_effort='FFTW_MEASURE')
+            _fft_plans[key] = plan
+        return _fft_plans[key]
+    def _fftn(a):
+        return _get_plan('fftn', a.shape, a.dtype)(a).copy()
+    def _ifftn(a):
+        return _get_plan('ifftn', a.shape, a.dtype)(a).copy()
+    def _rfftn(a):
+        return _get_plan('rfftn', a.shape, a.dtype)(a).copy()
+    def _irfftn(a, s):
+        return _get_plan('irfftn', a.shape, a.dtype, tuple(s))(a).copy()
 except ImportError:
-    def fftn_wrapper(a, s=None, axes=None, norm=None, **kwargs):
-        return np.fft.fftn(a, s, axes)
-    def ifftn_wrapper(a, s=None, axes=None, norm=None, **kwargs):
-        return np.fft.ifftn(a, s, axes)
+    try:
+        import scipy.fft
+        def _fftn(a):
+            return scipy.fft.fftn(a, axes=(1,2,3), workers=nproc)
+        def _ifftn(a):
+            return scipy.fft.ifftn(a, axes=(1,2,3), workers=nproc)
+        def _rfftn(a):
+            return scipy.fft.rfftn(a, axes=(1,2,3), workers=nproc)
+        def _irfftn(a, s):
+            return scipy.fft.irfftn(a, s, axes=(1,2,3), workers=nproc)
+    except ImportError:
+        def _fftn(a):
+            return np.fft.fftn(a, axes=(1,2,3))
+        def _ifftn(a):
+            return np.fft.ifftn(a, axes=(1,2,3))
+        def _rfftn(a):
+            return np.fft.rfftn(a, axes=(1,2,3))
+        def _irfftn(a, s):
+            return np.fft.irfftn(a, s, axes=(1,2,3))
 
 def fft(f, gs):
     '''Perform the 3D FFT from real (R) to reciprocal (G) space.
@@ -27,10 +70,14 @@ def fft(f, gs):
 
     FFT normalization factor is 1., as in MH and in `numpy.fft`.
 
+    If f is a real array, the real-to-complex FFT is used and the other half
+    of the spectrum is generated by the Hermitian symmetry.
+
     Args:
         f : (nx*ny*nz,) ndarray
             The function to be FFT'd, flattened to a 1D array corresponding
-            to the index order of :func:`cartesian_prod`.
+            to the index order of :func:`cartesian_prod`.  It can be a 2D
+            array (n,nx*ny*nz) to transform n functions together.
         gs : (3,) ndarray of ints
             The number of *positive* G-vectors along each direction.
 
@@ -40,8 +87,12 @@ def fft(f, gs):
             numpy.fft).
 
     '''
-    f3d = f.reshape([-1] + [2*x+1 for x in gs])
-    g3d = fftn_wrapper(f3d, axes=(1,2,3), threads=nproc)
+    mesh = [2*x+1 for x in gs]
+    f3d = f.reshape([-1] + mesh)
+    if np.iscomplexobj(f3d):
+        g3d = _fftn(f3d)
+    else:
+        g3d = _half_to_full(_rfftn(f3d), mesh)
     if f.ndim == 1:
         return g3d.ravel()
     else:
@@ -56,7 +107,8 @@ def ifft(g, gs):
     Args:
         g : (nx*ny*nz,) ndarray
             The function to be inverse FFT'd, flattened to a 1D array
-            corresponding to the index order of `span3`.
+            corresponding to the index order of `span3`.  It can be a 2D
+            array (n,nx*ny*nz) to transform n functions together.
         gs : (3,) ndarray of ints
             The number of *positive* G-vectors along each direction.
 
@@ -67,12 +119,67 @@ def ifft(g, gs):
 
     '''
     g3d = g.reshape([-1] + [2*x+1 for x in gs])
-    f3d = ifftn_wrapper(g3d, axes=(1,2,3), threads=nproc)
+    f3d = _ifftn(np.asarray(g3d, dtype=np.complex128))
     if g.ndim == 1:
         return f3d.ravel()
     else:
         return f3d.reshape(g.shape[0], -1)
 
+def rfft(f, gs):
+    '''The 3D FFT of a real function.  Only the non-redundant half of the
+    spectrum (the last dimension is nz//2+1) is returned.  See also
+    :func:`half_spectrum`.
+
+    Args:
+        f : (nx*ny*nz,) or (n,nx*ny*nz) real ndarray
+
+    Returns:
+        (nx*ny*(nz//2+1),) or (n,nx*ny*(nz//2+1)) ndarray
+    '''
+    g3d = _rfftn(np.asarray(f).reshape([-1] + [2*x+1 for x in gs]))
+    if f.ndim == 1:
+        return g3d.ravel()
+    else:
+        return g3d.reshape(f.shape[0], -1)
+
+def irfft(g, gs):
+    '''The 3D inverse FFT which generates a real function from the half of
+    the spectrum given by :func:`rfft` (or :func:`half_spectrum`).
+
+    Returns:
+        (nx*ny*nz,) or (n,nx*ny*nz) real ndarray
+    '''
+    mesh = [2*x+1 for x in gs]
+    g3d = g.reshape([-1] + mesh[:2] + [mesh[2]//2+1])
+    f3d = _irfftn(g3d, mesh)
+    if g.ndim == 1:
+        return f3d.ravel()
+    else:
+        return f3d.reshape(g.shape[0], -1)
+
+def half_spectrum(g, gs):
+    '''Extract the half of the full spectrum g (in the order of Gv) which
+    is used by :func:`rfft` and :func:`irfft`.'''
+    mesh = [2*x+1 for x in gs]
+    g3d = np.asarray(g).reshape([-1] + mesh)[:,:,:,:mesh[2]//2+1]
+    if g.ndim == 1:
+        return g3d.ravel()
+    else:
+        return g3d.reshape(g.shape[0], -1)
+
+def _half_to_full(h, mesh):
+    '''The full spectrum from the output of rfftn:  g(-G) = g(G)^*'''
+    nx, ny, nz = mesh
+    nh = h.shape[-1]
+    g = np.empty(h.shape[:-1] + (nz,), dtype=np.complex128)
+    g[...,:nh] = h
+    if nz > nh:
+        ix = (-np.arange(nx)) % nx
+        iy = (-np.arange(ny)) % ny
+        iz = nz - np.arange(nh, nz)
+        g[...,nh:] = h.take(ix, axis=-3).take(iy, axis=-2)[...,iz].conj()
+    return g
+
 
 def fftk(f, gs, expmikr):
     '''Perform the 3D FFT of a real-space function which is (periodic*e^{ikr}).
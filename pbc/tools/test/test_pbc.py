@@ -47,6 +47,24 @@ class KnowValues(unittest.TestCase):
         coulG = tools.get_coulG(cell, kpt)
         self.assertAlmostEqual(finger(coulG), 62.75448804333378, 9)
 
+    def test_fft(self):
+        numpy.random.seed(2)
+        gs = [3,4,2]
+        mesh = [2*x+1 for x in gs]
+        f = numpy.random.random((5,numpy.prod(mesh)))
+        ref = numpy.fft.fftn(f.reshape([-1]+mesh), axes=(1,2,3)).reshape(5,-1)
+        self.assertAlmostEqual(abs(tools.fft(f, gs) - ref).max(), 0, 12)
+        self.assertAlmostEqual(abs(tools.fft(f[0], gs) - ref[0]).max(), 0, 12)
+        self.assertAlmostEqual(abs(tools.ifft(ref, gs) - f).max(), 0, 12)
+
+        fc = f + numpy.random.random(f.shape) * 1j
+        ref = numpy.fft.fftn(fc.reshape([-1]+mesh), axes=(1,2,3)).reshape(5,-1)
+        self.assertAlmostEqual(abs(tools.fft(fc, gs) - ref).max(), 0, 12)
+
+        g = tools.rfft(f, gs)
+        self.assertAlmostEqual(abs(tools.irfft(g, gs) - f).max(), 0, 12)
+        g = tools.half_spectrum(tools.fft(f[1], gs), gs)
+        self.assertAlmostEqual(abs(tools.irfft(g, gs) - f[1]).max(), 0, 12)
 
 
 if __name__ == '__main__':
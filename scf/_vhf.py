@@ -14,13 +14,19 @@ def _fpointer(name):
 
 class VHFOpt(object):
     def __init__(self, mol, intor,
-                 prescreen='CVHFnoscreen', qcondname=None, dmcondname=None):
+                 prescreen='CVHFnoscreen', qcondname=None, dmcondname=None,
+                 cintopt=None):
+        '''cintopt (the libcint optimizer) only depends on the basis set.  It
+        can be shared by the molecules which have the same basis functions.
+        '''
         self._this = ctypes.POINTER(_CVHFOpt)()
         #print self._this.contents, expect ValueError: NULL pointer access
         self._intor = _fpointer(intor)
         self._cintopt = pyscf.lib.c_null_ptr()
         self._dmcondname = dmcondname
-        self.init_cvhf_direct(mol, intor, prescreen, qcondname)
+        # to rebuild the optimizer with the same settings for a new geometry
+        self._args = (intor, prescreen, qcondname, dmcondname)
+        self.init_cvhf_direct(mol, intor, prescreen, qcondname, cintopt)
 
         # Python sets libcvhf and ctypes to None before calling __del__
         # keep track of them in local stack, so that they can be correctly
@@ -33,13 +39,16 @@ class VHFOpt(object):
     def __del__(self):
         self.__to_del()
 
-    def init_cvhf_direct(self, mol, intor, prescreen, qcondname):
+    def init_cvhf_direct(self, mol, intor, prescreen, qcondname, cintopt=None):
         c_atm = numpy.asarray(mol._atm, dtype=numpy.int32, order='C')
         c_bas = numpy.asarray(mol._bas, dtype=numpy.int32, order='C')
         c_env = numpy.asarray(mol._env, dtype=numpy.double, order='C')
         natm = ctypes.c_int(c_atm.shape[0])
         nbas = ctypes.c_int(c_bas.shape[0])
-        self._cintopt = make_cintopt(c_atm, c_bas, c_env, intor)
+        if cintopt is None:
+            self._cintopt = make_cintopt(c_atm, c_bas, c_env, intor)
+        else:
+            self._cintopt = cintopt
 
 #        libcvhf.CVHFnr_optimizer(ctypes.byref(self._this),
 #                                 c_atm.ctypes.data_as(ctypes.c_void_p), natm,
@@ -15,22 +15,30 @@ from pyscf.lib import logger
 
 
 def solve(fvind, mo_energy, mo_occ, h1, s1=None,
-          max_cycle=20, tol=1e-9, hermi=False, verbose=logger.WARN):
+          max_cycle=20, tol=1e-9, hermi=False, verbose=logger.WARN,
+          block=False):
     '''
     Args:
         fvind : function
             Given density matrix, compute (ij|kl)D_{lk}*2 - (ij|kl)D_{jk}
+
+    Kwargs:
+        block : bool
+            Solve all perturbations in one block Krylov subspace.  fvind is
+            then called with an arbitrary number of trial vectors and must
+            return as many vectors as it receives.
     '''
     if s1 is None:
         return solve_nos1(fvind, mo_energy, mo_occ, h1,
-                          max_cycle, tol, hermi, verbose)
+                          max_cycle, tol, hermi, verbose, block)
     else:
         return solve_withs1(fvind, mo_energy, mo_occ, h1, s1,
-                            max_cycle, tol, hermi, verbose)
+                            max_cycle, tol, hermi, verbose, block)
 
 # h1 shape is (:,nvir,nocc)
 def solve_nos1(fvind, mo_energy, mo_occ, h1,
-               max_cycle=20, tol=1e-9, hermi=False, verbose=logger.WARN):
+               max_cycle=20, tol=1e-9, hermi=False, verbose=logger.WARN,
+               block=False):
     if isinstance(verbose, logger.Logger):
         log = verbose
     else:
@@ -46,6 +54,18 @@ def solve_nos1(fvind, mo_energy, mo_occ, h1,
 
     mo1base = h1 * -e_ai
 
+    if block and h1.ndim == 3 and h1.shape[0] > 1:
+        # All perturbations share one block Krylov subspace.  fvind is called
+        # once per iteration for the whole block of trial vectors.
+        def vind_vo(mo1):
+            v = fvind(mo1.reshape(-1,nvir,nocc)).reshape(-1,nvir,nocc)
+            v *= e_ai
+            return v.reshape(len(mo1),-1)
+        mo1 = lib.krylov_block(vind_vo, mo1base.reshape(len(h1),-1),
+                               tol=tol, max_cycle=max_cycle, verbose=log)
+        log.timer('block krylov solver in CPHF', *t0)
+        return mo1.reshape(h1.shape), None
+
     def vind_vo(mo1):
         v = fvind(mo1.reshape(h1.shape)).reshape(h1.shape)
         v *= e_ai
@@ -57,7 +77,8 @@ def solve_nos1(fvind, mo_energy, mo_occ, h1,
 
 # h1 shape is (:,nvir+nocc,nocc)
 def solve_withs1(fvind, mo_energy, mo_occ, h1, s1,
-                 max_cycle=20, tol=1e-9, hermi=False, verbose=logger.WARN):
+                 max_cycle=20, tol=1e-9, hermi=False, verbose=logger.WARN,
+                 block=False):
     ''' C^1_{ij} = -1/2 S1
     e1 = h1 - s1*e0 + (e0_j-e0_i)*c1 + vhf[c1]
     '''
@@ -84,15 +105,28 @@ def solve_withs1(fvind, mo_energy, mo_occ, h1, s1,
     mo1base[:,viridx] *= -e_ai
     mo1base[:,occidx] = -s1[:,occidx] * .5
 
-    def vind_vo(mo1):
-        v = fvind(mo1.reshape(h1.shape)).reshape(-1,nmo,nocc)
-        v[:,viridx,:] *= e_ai
-        v[:,occidx,:] = 0
-        return v.ravel()
-    mo1 = lib.krylov(vind_vo, mo1base.ravel(),
-                     tol=tol, max_cycle=max_cycle, hermi=hermi, verbose=log)
-    mo1 = mo1.reshape(mo1base.shape)
-    log.timer('krylov solver in CPHF', *t0)
+    if block and len(mo1base) > 1:
+        # All perturbations share one block Krylov subspace.  fvind is called
+        # once per iteration for the whole block of trial vectors.
+        def vind_vo(mo1):
+            v = fvind(mo1.reshape(-1,nmo,nocc)).reshape(-1,nmo,nocc)
+            v[:,viridx,:] *= e_ai
+            v[:,occidx,:] = 0
+            return v.reshape(len(mo1),-1)
+        mo1 = lib.krylov_block(vind_vo, mo1base.reshape(len(mo1base),-1),
+                               tol=tol, max_cycle=max_cycle, verbose=log)
+        mo1 = mo1.reshape(mo1base.shape)
+        log.timer('block krylov solver in CPHF', *t0)
+    else:
+        def vind_vo(mo1):
+            v = fvind(mo1.reshape(h1.shape)).reshape(-1,nmo,nocc)
+            v[:,viridx,:] *= e_ai
+            v[:,occidx,:] = 0
+            return v.ravel()
+        mo1 = lib.krylov(vind_vo, mo1base.ravel(),
+                         tol=tol, max_cycle=max_cycle, hermi=hermi, verbose=log)
+        mo1 = mo1.reshape(mo1base.shape)
+        log.timer('krylov solver in CPHF', *t0)
 
     v_mo = fvind(mo1.reshape(h1.shape)).reshape(-1,nmo,nocc)
     mo1[:,viridx] = mo1base[:,viridx] - v_mo[:,viridx]*e_ai
@@ -115,8 +149,8 @@ if __name__ == '__main__':
     a = a + a.T
     def fvind(x):
         v = numpy.dot(a,x[:,nocc:].reshape(-1,nocc*nvir).T)
-        v1 = numpy.zeros((nd,nmo,nocc))
-        v1[:,nocc:] = v.T.reshape(nd,nvir,nocc)
+        v1 = numpy.zeros((len(x),nmo,nocc))
+        v1[:,nocc:] = v.T.reshape(-1,nvir,nocc)
         return v1
     mo_energy = numpy.sort(numpy.random.random(nmo)) * 10
     mo_occ = numpy.zeros(nmo)
@@ -131,13 +165,14 @@ if __name__ == '__main__':
 
     x = solve(fvind, mo_energy, mo_occ, h1, s1, max_cycle=30)[0]
     print(numpy.linalg.norm(x)-6.272581531366389)
+    print(abs(solve(fvind, mo_energy, mo_occ, h1, s1, max_cycle=30, block=True)[0]-x).max())
     hs = h1.reshape(-1,nmo,nocc) - s1.reshape(-1,nmo,nocc)*e_i
     print(abs(hs[:,nocc:] + fvind(x)[:,nocc:]+x[:,nocc:]/e_ai).sum())
 
 ################
     xref = solve(fvind, mo_energy, mo_occ, h1, s1*0, max_cycle=30)[0][:,mo_occ==0]
     def fvind(x):
-        return numpy.dot(a,x.reshape(nd,nocc*nvir).T).T.reshape(nd,nvir,nocc)
+        return numpy.dot(a,x.reshape(-1,nocc*nvir).T).T.reshape(-1,nvir,nocc)
     h1 = h1[:,nocc:]
     x0 = numpy.linalg.solve(numpy.diag(1/e_ai.ravel())+a, -h1.reshape(nd,-1).T).T.reshape(nd,nvir,nocc)
     x1 = solve(fvind, mo_energy, mo_occ, h1, max_cycle=30)[0]
@@ -60,7 +60,8 @@ def kernel(mf, conv_tol=1e-9, conv_tol_grad=None,
                      callback=callback)
 
 def get_jk_coulomb(mol, dm, hermi=1, coulomb_allow='SSSS',
-                   opt_llll=None, opt_ssll=None, opt_ssss=None):
+                   opt_llll=None, opt_ssll=None, opt_ssss=None,
+                   ssss_approx=None):
     if coulomb_allow.upper() == 'LLLL':
         logger.info(mol, 'Coulomb integral: (LL|LL)')
         j1, k1 = _call_veff_llll(mol, dm, hermi, opt_llll)
@@ -84,9 +85,16 @@ def get_jk_coulomb(mol, dm, hermi=1, coulomb_allow='SSSS',
         n2c = j1.shape[1]
         vj[...,:n2c,:n2c] += j1
         vk[...,:n2c,:n2c] += k1
-        j1, k1 = _call_veff_ssss(mol, dm, hermi, opt_ssss)
-        vj[...,n2c:,n2c:] += j1
-        vk[...,n2c:,n2c:] += k1
+        if _ssss_negligible(dm, opt_ssss):
+            logger.debug(mol, '(SS|SS) contribution is negligible, skipped')
+        else:
+            if str(ssss_approx).upper() == 'VISSCHER':
+                logger.debug(mol, 'one-center (SS|SS) + interatomic SS charge correction')
+                j1, k1 = _call_veff_ssss_visscher(mol, dm, hermi)
+            else:
+                j1, k1 = _call_veff_ssss(mol, dm, hermi, opt_ssss)
+            vj[...,n2c:,n2c:] += j1
+            vk[...,n2c:,n2c:] += k1
     return vj, vk
 
 def get_jk(mol, dm, hermi=1, coulomb_allow='SSSS'):
@@ -246,6 +254,11 @@ class UHF(hf.SCF):
             Default is False.
         with_breit : bool, for Dirac-Hartree-Fock only
             Gaunt + gauge term.  Default is False.
+        ssss_approx : str, for Dirac-Hartree-Fock only
+            None to compute all (SS|SS) integrals.  'Visscher' to compute the
+            one-center (SS|SS) integrals only and to approximate the
+            interatomic (SS|SS) Coulomb interaction by the atomic small
+            component charges (Theor Chem Acc, 98, 68).  Default is None.
 
     Examples:
 
@@ -264,6 +277,7 @@ class UHF(hf.SCF):
         self._coulomb_now = 'SSSS' # 'SSSS' ~ LLLL+LLSS+SSSS
         self.with_gaunt = False
         self.with_breit = False
+        self.ssss_approx = None
 
         self.opt = (None, None, None, None) # (opt_llll, opt_ssll, opt_ssss, opt_gaunt)
         self._keys = set(self.__dict__.keys())
@@ -272,6 +286,8 @@ class UHF(hf.SCF):
         hf.SCF.dump_flags(self)
         logger.info(self, 'with_ssss %s, with_gaunt %s, with_breit %s',
                     self.with_ssss, self.with_gaunt, self.with_breit)
+        if self.with_ssss:
+            logger.info(self, 'ssss_approx %s', self.ssss_approx)
         return self
 
     def get_hcore(self, mol=None):
@@ -373,7 +389,7 @@ class UHF(hf.SCF):
         opt_llll, opt_ssll, opt_ssss, opt_gaunt = self.opt
 
         vj, vk = get_jk_coulomb(mol, dm, hermi, self._coulomb_now,
-                                opt_llll, opt_ssll, opt_ssss)
+                                opt_llll, opt_ssll, opt_ssss, self.ssss_approx)
 
         if self.with_breit:
             if 'SSSS' in self._coulomb_now.upper() or not self.with_ssss:
@@ -562,6 +578,84 @@ def _call_veff_ssss(mol, dm, hermi=1, mf_opt=None):
                                 mol._atm, mol._bas, mol._env, mf_opt) * c1**4
     return _jk_triu_(vj, vk, hermi)
 
+def _call_veff_ssss_visscher(mol, dm, hermi=1):
+    '''(SS|SS) contributions with Visscher's simple Coulombic correction.
+    The one-center (SS|SS) integrals are computed exactly.  The interatomic
+    Coulomb interaction is approximated by the interaction between the atomic
+    small component (Mulliken) charges.  The interatomic exchange is ignored.
+    '''
+    c1 = .5/mol.light_speed
+    if isinstance(dm, numpy.ndarray) and dm.ndim == 2:
+        n_dm = 1
+        n2c = dm.shape[0] // 2
+        dms = dm[n2c:,n2c:].reshape(1,n2c,n2c)
+    else:
+        n_dm = len(dm)
+        n2c = dm[0].shape[0] // 2
+        dms = numpy.asarray([dmi[n2c:,n2c:] for dmi in dm])
+    vj = numpy.zeros((n_dm,n2c,n2c), dtype=numpy.complex)
+    vk = numpy.zeros((n_dm,n2c,n2c), dtype=numpy.complex)
+
+    aoslices = mol.offset_2c_by_atom()
+    for b0, b1, p0, p1 in aoslices:
+        # The spinor AO offsets of the sub-basis start from 0.  Time-reversal
+        # partners are within the same atom, so the s8 time-reversal
+        # symmetry of rdirect_mapdm holds for the one-center blocks.
+        dmsub = [numpy.asarray(dmi[p0:p1,p0:p1], order='C') for dmi in dms]
+        j1, k1 = _vhf.rdirect_mapdm('cint2e_spsp1spsp2', 's8',
+                                    ('ji->s2kl', 'jk->s1il'), dmsub, 1,
+                                    mol._atm, mol._bas[b0:b1], mol._env)
+        vj[:,p0:p1,p0:p1] = j1.reshape(n_dm,p1-p0,p1-p0)
+        vk[:,p0:p1,p0:p1] = k1.reshape(n_dm,p1-p0,p1-p0)
+    vj *= c1**4
+    vk *= c1**4
+    vj, vk = _jk_triu_(vj, vk, hermi)
+
+    # Small component overlap, in the normalization of get_ovlp
+    s = mol.intor_symmetric('cint1e_spsp') * c1**2
+    coords = mol.atom_coords()
+    atm_id = [mol.bas_atom(b0) for b0, b1, p0, p1 in aoslices]
+    rr = coords[atm_id,None] - coords[atm_id]
+    rr = numpy.sqrt(numpy.einsum('abx,abx->ab', rr, rr))
+    rr[numpy.diag_indices_from(rr)] = 1e200
+    for i in range(n_dm):
+        sd = numpy.einsum('ij,ji->i', s, dms[i])
+        ds = numpy.einsum('ij,ji->i', dms[i], s)
+        q = numpy.asarray([(sd[p0:p1]+ds[p0:p1]).sum() * .5
+                           for b0, b1, p0, p1 in aoslices])
+        phi = numpy.dot(1/rr, q)
+        phi_ao = numpy.empty(n2c, dtype=phi.dtype)
+        for k, (b0, b1, p0, p1) in enumerate(aoslices):
+            phi_ao[p0:p1] = phi[k]
+        vj[i] += s * (phi_ao[:,None] + phi_ao) * .5
+
+    if n_dm == 1:
+        vj = vj.reshape(n2c,n2c)
+        vk = vk.reshape(n2c,n2c)
+    return vj, vk
+
+def _ssss_negligible(dm, opt_ssss):
+    '''Whether the entire (SS|SS) block can be skipped.  The upper bound of
+    the (SS|SS) contributions is estimated with the largest Schwarz
+    condition of opt_ssss and the largest element of the small component
+    density matrix.  In the incremental direct SCF, the small component of
+    the density difference becomes tiny after the first few iterations.
+    '''
+    if opt_ssss is None or not opt_ssss._this.contents.q_cond:
+        return False
+    nbas = opt_ssss._this.contents.nbas
+    q_cond = numpy.ctypeslib.as_array(
+        ctypes.cast(opt_ssss._this.contents.q_cond,
+                    ctypes.POINTER(ctypes.c_double)), shape=(nbas,nbas))
+    # q_cond ~ 1/sqrt((ij|ij)) with the c^{-4} factor of (SS|SS)
+    qmin = q_cond.min()
+    n2c = numpy.asarray(dm[0]).shape[-1] // 2
+    if isinstance(dm, numpy.ndarray) and dm.ndim == 2:
+        dmax = abs(dm[n2c:,n2c:]).max()
+    else:
+        dmax = max([abs(dmi[n2c:,n2c:]).max() for dmi in dm])
+    return dmax < opt_ssss.direct_scf_tol * qmin**2
+
 def _call_veff_gaunt_breit(mol, dm, hermi=1, mf_opt=None, with_breit=False):
     if with_breit:
         intor_prefix = 'cint2e_breit_'
@@ -9,6 +9,7 @@ Non-relativistic analytical nuclear gradients
 
 import time
 import numpy
+import scipy.linalg
 from pyscf import lib
 from pyscf.lib import logger
 from pyscf.scf import _vhf
@@ -28,16 +29,22 @@ def grad_elec(grad_mf, mo_energy=None, mo_coeff=None, mo_occ=None, atmlst=None):
 
     t0 = (time.clock(), time.time())
     log.debug('Compute Gradients of NR Hartree-Fock Coulomb repulsion')
-    vhf = grad_mf.get_veff(mol, dm0)
+    if atmlst is None:
+        atmlst = range(mol.natm)
+# The DF integrals are only used here, where the auxiliary basis terms are
+# added to complete the gradients
+    with_df = _df_enabled(mf)
+    vhf = grad_mf.get_veff(mol, dm0, atmlst, with_df)
     log.timer('gradients of 2e part', *t0)
 
     f1 = h1 + vhf
     dme0 = grad_mf.make_rdm1e(mo_energy, mo_coeff, mo_occ)
 
-    if atmlst is None:
-        atmlst = range(mol.natm)
     offsetdic = mol.offset_nr_by_atom()
     de = numpy.zeros((len(atmlst),3))
+    if with_df:
+# The derivatives of the auxiliary basis
+        de += grad_mf.get_veff_aux(mol, dm0, atmlst)
     for k, ia in enumerate(atmlst):
         shl0, shl1, p0, p1 = offsetdic[ia]
 # h1, s1, vhf are \nabla <i|h|j>, the nuclear gradients = -\nabla
@@ -75,20 +82,186 @@ def get_hcore(mol):
 def get_ovlp(mol):
     return -mol.intor('cint1e_ipovlp_sph', comp=3)
 
-def get_jk(mol, dm):
+def get_jk(mol, dm, atmlst=None, vhfopt=None, nproc=1,
+           with_j=True, with_k=True):
     '''J = ((-nabla i) j| kl) D_lk
     K = ((-nabla i) j| kl) D_jk
+
+    Only the rows of the basis functions on the atoms in atmlst are computed,
+    the other rows are zero.  The atoms are distributed over nproc processes.
+    vhfopt is the integral screening object (see :func:`make_vhfopt`).
     '''
-    vj, vk = _vhf.direct_mapdm('cint2e_ip1_sph',  # (nabla i,j|k,l)
-                               's2kl', # ip1_sph has k>=l,
-                               ('lk->s1ij', 'jk->s1il'),
-                               dm, 3, # xyz, 3 components
-                               mol._atm, mol._bas, mol._env)
-    return -vj, -vk
+    dm = numpy.asarray(dm, order='C')
+    nao = dm.shape[-1]
+    if atmlst is None:
+        atmlst = range(mol.natm)
+    atmlst = list(atmlst)
+    offsetdic = mol.offset_nr_by_atom()
+    descr = []
+    if with_j:
+        descr.append('lk->s1ij')
+    if with_k:
+        descr.append('jk->s1il')
 
-def get_veff(mf_grad, mol, dm):
+    def jk_atom(ia):
+        shl0, shl1, p0, p1 = offsetdic[ia]
+        shls_slice = (shl0, shl1) + (0, mol.nbas) * 3
+        vs = _vhf.direct_mapdm('cint2e_ip1_sph',  # (nabla i,j|k,l)
+                               's2kl', # ip1_sph has k>=l,
+                               descr, dm, 3, # xyz, 3 components
+                               mol._atm, mol._bas, mol._env,
+                               vhfopt=vhfopt, shls_slice=shls_slice)
+        if len(descr) == 1:
+            vs = [vs]
+        return vs
+
+    vs = numpy.zeros((len(descr),)+dm.shape[:-2]+(3,nao,nao))
+    for k, v1 in lib.imap_processes(jk_atom, [(ia,) for ia in atmlst], nproc):
+        p0, p1 = offsetdic[atmlst[k]][2:]
+        for i in range(len(descr)):
+            vs[i,...,p0:p1,:] = v1[i]
+    vs *= -1
+    vj = vk = None
+    if with_j:
+        vj = vs[0]
+    if with_k:
+        vk = vs[-1]
+    return vj, vk
+
+def make_vhfopt(mol, direct_scf_tol=1e-13):
+    '''Density weighted Schwarz screening for the (nabla i j|kl) integrals.
+    The bound is max|(nabla i j|nabla i j)|^{1/2} max|(kl|kl)|^{1/2} times the
+    largest density matrix element of the shell pairs (lk), (jk), (jl).
+    '''
+    vhfopt = _vhf.VHFOpt(mol, 'cint2e_ip1_sph', 'CVHFgrad_jk_prescreen',
+                         'CVHFgrad_jk_direct_scf', 'CVHFgrad_jk_direct_scf_dm')
+    vhfopt.direct_scf_tol = direct_scf_tol
+    return vhfopt
+
+def _df_fit(mf_grad, mol, dm, with_k=True):
+    '''The fitted densities of density fitting SCF
+
+    Returns:
+        auxmol
+        cj : c_P = (V^{-1})_{PQ} (Q|kl) D_lk
+        dcmn : [j,P,l] = D_jk (V^{-1})_{PQ} (Q|kl)
+        dcmnd : [j,P,i] = D_jk (V^{-1})_{PQ} (Q|kl) D_li
+        m2c : M_PQ = D_jk (V^{-1})_{PR} (R|kl) D_li (V^{-1})_{QS} (S|ij)
+    '''
+    from pyscf import df
+    with_df = mf_grad._scf.with_df
+    auxmol = with_df.auxmol
+    if auxmol is None:
+        auxmol = df.incore.format_aux_basis(mol, with_df.auxbasis)
+    dm = numpy.asarray(dm)
+    nao = mol.nao_nr()
+    naux = auxmol.nao_nr()
+
+    int3c = df.incore.aux_e2(mol, auxmol, 'cint3c2e_sph', aosym='s1')
+    int3c = int3c.reshape(nao*nao,naux)
+    low = scipy.linalg.cholesky(auxmol.intor('cint2c2e_sph', hermi=1),
+                                lower=True)
+    cj = scipy.linalg.cho_solve((low, True), numpy.dot(dm.T.ravel(), int3c))
+    if not with_k:
+        return auxmol, cj, None, None, None
+
+    cmn = scipy.linalg.cho_solve((low, True), int3c.T).reshape(naux,nao,nao)
+    int3c = None
+    dcmn = lib.dot(dm, _cp(cmn.transpose(1,0,2)).reshape(nao,-1))
+    cmn = None
+    dcmn = dcmn.reshape(nao,naux,nao)
+    dcmnd = lib.dot(dcmn.reshape(-1,nao), dm).reshape(nao,naux,nao)
+    m2c = lib.dot(_cp(dcmn.transpose(1,0,2)).reshape(naux,-1),
+                  _cp(dcmn.transpose(1,2,0)).reshape(naux,-1).T)
+    return auxmol, cj, dcmn, dcmnd, m2c
+
+def get_jk_df(mf_grad, mol, dm, atmlst=None, with_k=True):
+    '''J and K derivatives of the AO basis for density fitting SCF,
+    (ij|kl) = \sum_PQ (ij|P) (V^{-1})_{PQ} (Q|kl).  See also :func:`get_jk`.
+    vk is None if with_k is False.
+    '''
+    from pyscf import df
+    from pyscf.df import _ri
+    dm = numpy.asarray(dm)
+    if dm.ndim == 3:
+        vjk = [get_jk_df(mf_grad, mol, x, atmlst, with_k) for x in dm]
+        vj = numpy.asarray([v[0] for v in vjk])
+        if with_k:
+            vk = numpy.asarray([v[1] for v in vjk])
+        else:
+            vk = None
+        return vj, vk
+    if atmlst is None:
+        atmlst = range(mol.natm)
+    auxmol, cj, dcmn = _df_fit(mf_grad, mol, dm, with_k)[:3]
+    nao = mol.nao_nr()
+    naux = auxmol.nao_nr()
+    nbas = mol.nbas
+    atm, bas, env, ao_loc = df.incore._env_and_aoloc('cint3c2e_ip1_sph',
+                                                     mol, auxmol)
+    offsetdic = mol.offset_nr_by_atom()
+    vj = numpy.zeros((3,nao,nao))
+    if with_k:
+        vk = numpy.zeros((3,nao,nao))
+    else:
+        vk = None
+    for ia in atmlst:
+# 3-center integrals (nabla mu nu|P), mu on atom ia
+        shl0, shl1, p0, p1 = offsetdic[ia]
+        shls_slice = (shl0, shl1, 0, nbas, nbas, nbas+auxmol.nbas)
+        eri1 = _ri.nr_auxe2('cint3c2e_ip1_sph', atm, bas, env, shls_slice,
+                            ao_loc, 's1', 3).reshape(3*(p1-p0),-1)
+        vj[:,p0:p1] = -lib.dot(eri1.reshape(-1,naux), cj).reshape(3,p1-p0,nao)
+        if with_k:
+            vk[:,p0:p1] = -lib.dot(eri1, dcmn.reshape(-1,nao)).reshape(3,p1-p0,nao)
+        eri1 = None
+    return vj, vk
+
+def get_jk_df_aux(mf_grad, mol, dm, atmlst=None, with_k=True):
+    '''The derivatives of the auxiliary basis of density fitting SCF, the
+    3-center (ij|nabla P) and the 2-center (nabla P|Q) terms, contracted
+    with the (symmetric) density matrix dm.
+
+    Returns:
+        ej, ek : (len(atmlst),3) arrays, the auxiliary basis contributions to
+        the nuclear gradients of 1/2 tr(D J) and 1/2 tr(D K).  ek is None if
+        with_k is False
+    '''
+    from pyscf import df
+    from pyscf.df import _ri
+    if atmlst is None:
+        atmlst = range(mol.natm)
+    auxmol, cj, _, dcmnd, m2c = _df_fit(mf_grad, mol, dm, with_k)
+    dm = numpy.asarray(dm)
+    nao = mol.nao_nr()
+    nbas = mol.nbas
+    atm, bas, env, ao_loc = df.incore._env_and_aoloc('cint3c2e_ip2_sph',
+                                                     mol, auxmol)
+    int2c = auxmol.intor('cint2c2e_ip1_sph', comp=3)
+    aux_offset = auxmol.offset_nr_by_atom()
+    ej = numpy.zeros((len(atmlst),3))
+    if with_k:
+        ek = numpy.zeros((len(atmlst),3))
+    else:
+        ek = None
+    for k, ia in enumerate(atmlst):
+# 3-center integrals (mu nu|nabla P) and 2-center integrals (nabla P|Q),
+# P on atom ia
+        ash0, ash1, q0, q1 = aux_offset[ia]
+        shls_slice = (0, nbas, 0, nbas, nbas+ash0, nbas+ash1)
+        eri1 = _ri.nr_auxe2('cint3c2e_ip2_sph', atm, bas, env, shls_slice,
+                            ao_loc, 's1', 3).reshape(3,nao,nao,q1-q0)
+        ej[k] -= numpy.einsum('xijp,ji,p->x', eri1, dm, cj[q0:q1])
+        ej[k] += numpy.einsum('xpq,p,q->x', int2c[:,q0:q1], cj[q0:q1], cj)
+        if with_k:
+            ek[k] -= numpy.einsum('xijp,jpi->x', eri1, dcmnd[:,q0:q1])
+            ek[k] += numpy.einsum('xpq,pq->x', int2c[:,q0:q1], m2c[q0:q1])
+        eri1 = None
+    return ej, ek
+
+def get_veff(mf_grad, mol, dm, atmlst=None, with_df=False):
     '''NR Hartree-Fock Coulomb repulsion'''
-    vj, vk = mf_grad.get_jk(mol, dm)
+    vj, vk = mf_grad.get_jk(mol, dm, atmlst=atmlst, with_df=with_df)
     return vj - vk * .5
 
 def make_rdm1e(mo_energy, mo_coeff, mo_occ):
@@ -97,9 +270,28 @@ def make_rdm1e(mo_energy, mo_coeff, mo_occ):
     mo0e = mo0 * (mo_energy[mo_occ>0] * mo_occ[mo_occ>0])
     return numpy.dot(mo0e, mo0.T.conj())
 
+def _df_enabled(mf):
+    from pyscf import df
+    with_df = getattr(mf, 'with_df', None)
+    return isinstance(with_df, df.DF) and not isinstance(with_df, df.DF4C)
+
+def _cp(a):
+    return numpy.array(a, copy=False, order='C')
+
 
 class Gradients(lib.StreamObject):
-    '''Non-relativistic restricted Hartree-Fock gradients'''
+    '''Non-relativistic restricted Hartree-Fock gradients
+
+    Attributes:
+        nproc : int
+            Number of processes to compute the (nabla i j|kl) integrals.  The
+            atoms are distributed over the processes.  Default is 1.
+
+    get_jk, get_j, get_k and get_veff compute the exact integrals unless
+    with_df=True is given.  The density fitting integrals of a DF SCF object
+    are only used in grad_elec, which adds the auxiliary basis terms
+    (get_veff_aux).
+    '''
     def __init__(self, scf_method):
         self.verbose = scf_method.verbose
         self.stdout = scf_method.stdout
@@ -107,6 +299,7 @@ class Gradients(lib.StreamObject):
         self._scf = scf_method
         self.chkfile = scf_method.chkfile
         self.max_memory = self.mol.max_memory
+        self.nproc = 1
 
         self.de = numpy.zeros((0,3))
         self._keys = set(self.__dict__.keys())
@@ -119,6 +312,7 @@ class Gradients(lib.StreamObject):
         log.info('******** %s for %s ********',
                  self.__class__, self._scf.__class__)
         log.info('chkfile = %s', self.chkfile)
+        log.info('nproc = %d', self.nproc)
         log.info('max_memory %d MB (current use %d MB)',
                  self.max_memory, lib.current_memory()[0])
         return self
@@ -132,31 +326,53 @@ class Gradients(lib.StreamObject):
         return get_ovlp(mol)
 
     @lib.with_doc(get_jk.__doc__)
-    def get_jk(self, mol=None, dm=None, hermi=0):
+    def get_jk(self, mol=None, dm=None, hermi=0, atmlst=None, with_df=False):
         if mol is None: mol = self.mol
         if dm is None: dm = self._scf.make_rdm1()
         cpu0 = (time.clock(), time.time())
-        #TODO: direct_scf opt
-        vj, vk = get_jk(mol, dm)
+        if with_df:
+            vj, vk = get_jk_df(self, mol, dm, atmlst)
+        else:
+            vj, vk = get_jk(mol, dm, atmlst, self._make_vhfopt(mol), self.nproc)
         logger.timer(self, 'vj and vk', *cpu0)
         return vj, vk
 
-    def get_j(self, mol=None, dm=None, hermi=0):
+    def get_j(self, mol=None, dm=None, hermi=0, atmlst=None, with_df=False):
+        if mol is None: mol = self.mol
+        if dm is None: dm = self._scf.make_rdm1()
+        if with_df:
+            return get_jk_df(self, mol, dm, atmlst, with_k=False)[0]
+        else:
+            return get_jk(mol, dm, atmlst, self._make_vhfopt(mol), self.nproc,
+                          with_k=False)[0]
+
+    def get_k(self, mol=None, dm=None, hermi=0, atmlst=None, with_df=False):
         if mol is None: mol = self.mol
         if dm is None: dm = self._scf.make_rdm1()
-        return -_vhf.direct_mapdm('cint2e_ip1_sph', 's2kl', 'lk->s1ij', dm, 3,
-                                  mol._atm, mol._bas, mol._env)
+        if with_df:
+            return get_jk_df(self, mol, dm, atmlst)[1]
+        else:
+            return get_jk(mol, dm, atmlst, self._make_vhfopt(mol), self.nproc,
+                          with_j=False)[1]
 
-    def get_k(self, mol=None, dm=None, hermi=0):
+    def get_veff(self, mol=None, dm=None, atmlst=None, with_df=False):
         if mol is None: mol = self.mol
         if dm is None: dm = self._scf.make_rdm1()
-        return -_vhf.direct_mapdm('cint2e_ip1_sph', 's2kl', 'jk->s1il', dm, 3,
-                                  mol._atm, mol._bas, mol._env)
+        return get_veff(self, mol, dm, atmlst, with_df)
 
-    def get_veff(self, mol=None, dm=None):
+    def get_veff_aux(self, mol=None, dm=None, atmlst=None):
+        '''The auxiliary basis contributions of density fitting SCF to the
+        nuclear gradients, see :func:`get_jk_df_aux`'''
         if mol is None: mol = self.mol
         if dm is None: dm = self._scf.make_rdm1()
-        return get_veff(self, mol, dm)
+        ej, ek = get_jk_df_aux(self, mol, dm, atmlst)
+        return ej - ek * .5
+
+    def _make_vhfopt(self, mol):
+        if getattr(self._scf, 'direct_scf', False):
+            return make_vhfopt(mol, self._scf.direct_scf_tol)
+        else:
+            return None
 
     def make_rdm1e(self, mo_energy=None, mo_coeff=None, mo_occ=None):
         if mo_energy is None: mo_energy = self._scf.mo_energy
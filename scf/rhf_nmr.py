@@ -116,7 +116,7 @@ def make_rdm1_1(mo1occ, mo0, occ):
     ''' DM^1 = (i * C_occ^1 C_occ^{0,dagger}) + c.c.  on AO'''
     mocc = mo0[:,occ>0] * occ[occ>0]
     dm1 = []
-    for i in range(3):
+    for i in range(len(mo1occ)):
         tmp = reduce(numpy.dot, (mo0, mo1occ[i], mocc.T.conj()))
         # note the minus sign due to the phase i
         dm1.append(tmp - tmp.T)
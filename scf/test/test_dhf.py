@@ -135,6 +135,36 @@ class KnowValues(unittest.TestCase):
         self.assertTrue(numpy.allclose(vj0, vj1))
         self.assertTrue(numpy.allclose(vk0, vk1))
 
+    def test_ssss_visscher(self):
+        # For one atom, all (SS|SS) integrals are one-center integrals
+        mol1 = gto.M(atom='Ne', basis='cc-pvdz', verbose=0)
+        n4c = mol1.nao_2c() * 2
+        numpy.random.seed(1)
+        dm = numpy.random.random((n4c,n4c))+numpy.random.random((n4c,n4c))*1j
+        dm = dm + dm.T.conj()
+        vj0, vk0 = scf.dhf._call_veff_ssss(mol1, dm)
+        vj1, vk1 = scf.dhf._call_veff_ssss_visscher(mol1, dm)
+        self.assertTrue(numpy.allclose(vj0, vj1))
+        self.assertTrue(numpy.allclose(vk0, vk1))
+
+        mf1 = scf.dhf.UHF(mol)
+        mf1.conv_tol_grad = 1e-5
+        mf1.ssss_approx = 'Visscher'
+        self.assertAlmostEqual(mf1.kernel(), mf.e_tot, 5)
+
+    def test_ssss_screen(self):
+        n2c = mol.nao_2c()
+        n4c = n2c * 2
+        opt_ssss = mf.init_direct_scf(mol)[2]
+        numpy.random.seed(1)
+        dm = numpy.random.random((n4c,n4c))+numpy.random.random((n4c,n4c))*1j
+        dm = dm + dm.T.conj()
+        self.assertFalse(scf.dhf._ssss_negligible(dm, opt_ssss))
+        dm[n2c:,n2c:] *= 1e-16
+        self.assertTrue(scf.dhf._ssss_negligible(dm, opt_ssss))
+        self.assertTrue(scf.dhf._ssss_negligible([dm,dm], opt_ssss))
+        self.assertFalse(scf.dhf._ssss_negligible(dm, None))
+
     def test_time_rev_matrix(self):
         s = mol.intor_symmetric('cint1e_ovlp')
         ts = scf.dhf.time_reversal_matrix(mol, s)